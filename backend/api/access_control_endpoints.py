@@ -253,6 +253,33 @@ async def emergency_restore(
     )
 
 
+@router.get("/emergency/dispatch/{dispatch_id}")
+async def get_emergency_dispatch(
+    dispatch_id: str,
+    current_user: User | None = Depends(get_current_user_optional)
+) -> Dict[str, Any]:
+    """
+    Get per-access-point acknowledgement status for an emergency dispatch.
+    Live progress is also streamed over WebSocket as `emergency_dispatch_progress`.
+    """
+    data = await AccessControlService.get_emergency_dispatch(dispatch_id)
+    return {"data": data}
+
+
+@router.get("/anomalies")
+async def get_access_anomalies(
+    property_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User | None = Depends(get_current_user_optional)
+) -> Dict[str, Any]:
+    """
+    Get recently detected access anomalies (repeated denials, impossible travel, after-hours spikes).
+    New anomalies are also pushed over WebSocket as `access_anomaly`.
+    """
+    data = await AccessControlService.get_access_anomalies(property_id, limit)
+    return {"data": data}
+
+
 @router.post("/ai-behavior-analysis")
 async def ai_behavior_analysis() -> Dict[str, Any]:
     return {"anomalies": []}
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from pydantic import TypeAdapter, ValidationError
 from typing import List, Optional
 from datetime import datetime
+import json
 import logging
 
-from api.auth_dependencies import get_current_user, require_security_manager_or_admin
+from api.auth_dependencies import get_current_user, get_current_user_optional, require_security_manager_or_admin, verify_hardware_ingest_key
+from models import User
 from services.iot_environmental_service import IoTEnvironmentalService
 from schemas import (
     IoTEnvironmentalDataCreate,
     IoTEnvironmentalDataResponse,
+    IoTSensorBatchResponse,
+    IoTSensorSeriesResponse,
     SensorAlertCreate,
     SensorAlertUpdate,
     SensorAlertResponse,
@@ -19,6 +24,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/iot", tags=["IoT & Environmental Monitoring"])
 
+_reading_list_adapter = TypeAdapter(List[IoTEnvironmentalDataCreate])
+MAX_BATCH_READINGS = 10000
+
 @router.post("/sensors/data", response_model=IoTEnvironmentalDataResponse, status_code=201)
 async def record_sensor_data(payload: IoTEnvironmentalDataCreate, current_user=Depends(get_current_user)):
     service = IoTEnvironmentalService()
@@ -59,6 +67,60 @@ async def record_sensor_data(payload: IoTEnvironmentalDataCreate, current_user=D
     finally:
         service.close()
 
+@router.post("/sensors/data/batch", response_model=IoTSensorBatchResponse, status_code=201)
+async def record_sensor_data_batch(
+    request: Request,
+    x_api_key: Optional[str] = Header(default=None, alias="x-api-key"),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+):
+    """
+    Ingest many sensor readings in one request (gateway buffers).
+    Auth: JWT or X-API-Key (hardware).
+
+    Body is either a JSON array of readings (or {"readings": [...]}) or, with
+    Content-Type text/csv, a header row followed by one reading per line.
+    Connected dashboards receive one coalesced `environmental_data_batch` message.
+    """
+    if current_user is None and not x_api_key:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if current_user is None and x_api_key:
+        await verify_hardware_ingest_key(x_api_key)
+
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    try:
+        if "csv" in content_type:
+            raw = IoTEnvironmentalService.parse_sensor_batch_csv(body.decode("utf-8"))
+        else:
+            raw = json.loads(body or b"[]")
+            if isinstance(raw, dict):
+                raw = raw.get("readings", [])
+        if len(raw) > MAX_BATCH_READINGS:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_READINGS} readings")
+        readings = _reading_list_adapter.validate_python(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        # json.JSONDecodeError and pydantic ValidationError are both ValueErrors
+        detail = e.errors(include_url=False) if isinstance(e, ValidationError) else str(e)
+        raise HTTPException(status_code=422, detail=detail)
+
+    service = IoTEnvironmentalService()
+    try:
+        result = service.record_sensor_data_batch(readings, str(current_user.user_id) if current_user else None)
+    finally:
+        service.close()
+
+    # One coalesced broadcast with the newest reading per sensor
+    try:
+        from main import manager
+        if manager and manager.active_connections and result["sensors"]:
+            await manager.broadcast_message({
+                "type": "environmental_data_batch",
+                "sensor_data": result["sensors"]
+            })
+    except Exception as e:
+        logger.warning(f"Failed to broadcast sensor batch via WebSocket: {e}")
+    return result
+
 @router.get("/sensors/readings", response_model=List[IoTEnvironmentalDataResponse])
 def get_sensor_readings(current_user=Depends(get_current_user)):
     service = IoTEnvironmentalService()
@@ -80,6 +142,22 @@ def get_environmental_report(
     finally:
         service.close()
 
+@router.get("/environmental/series", response_model=IoTSensorSeriesResponse)
+def get_environmental_series(
+    start_date: datetime,
+    end_date: datetime,
+    sensor_ids: Optional[List[str]] = Query(None),
+    points: int = Query(1000, ge=3, le=5000),
+    method: str = Query("lttb", pattern="^(lttb|average)$"),
+    current_user=Depends(get_current_user),
+):
+    """Downsampled history for charts: about ``points`` points per sensor whatever the range."""
+    service = IoTEnvironmentalService()
+    try:
+        return service.get_sensor_series(sensor_ids, start_date, end_date, points, method, str(current_user.user_id))
+    finally:
+        service.close()
+
 @router.get("/environmental", response_model=List[IoTEnvironmentalDataResponse])
 def list_environmental_data(current_user=Depends(get_current_user)):
     service = IoTEnvironmentalService()
@@ -139,6 +217,7 @@ async def create_environmental_alert(payload: SensorAlertCreate, current_user=De
                     "location": result.location,
                     "status": result.status,
                     "resolved": result.resolved,
+                    "occurrence_count": result.occurrence_count,
                     "timestamp": result.created_at.isoformat() if hasattr(result.created_at, 'isoformat') else str(result.created_at),
                     "resolved_at": result.resolved_at.isoformat() if result.resolved_at and hasattr(result.resolved_at, 'isoformat') else (str(result.resolved_at) if result.resolved_at else None),
                     "camera_id": result.camera_id,
@@ -179,6 +258,7 @@ async def update_environmental_alert(alert_id: str, payload: SensorAlertUpdate,
                     "location": result.location,
                     "status": result.status,
                     "resolved": result.resolved,
+                    "occurrence_count": result.occurrence_count,
                     "timestamp": result.created_at.isoformat() if hasattr(result.created_at, 'isoformat') else str(result.created_at),
                     "resolved_at": result.resolved_at.isoformat() if result.resolved_at and hasattr(result.resolved_at, 'isoformat') else (str(result.resolved_at) if result.resolved_at else None),
                     "camera_id": result.camera_id,
@@ -0,0 +1,130 @@
+"""
+Media Response
+File responses for evidence, exports and HLS segments.
+
+Adds to Starlette's FileResponse (which already answers Range / If-Range requests):
+  - a strong ETag from the stored SHA-256 when the caller has one, else a weak one from
+    mtime and size
+  - conditional GET: If-None-Match / If-Modified-Since answer 304 without touching the file
+  - handoff to the front web server: with MEDIA_OFFLOAD=x-accel (nginx) or x-sendfile
+    (Apache/lighttpd), files under MEDIA_OFFLOAD_ROOT are sent by the server via
+    X-Accel-Redirect / X-Sendfile, so a long video playback never occupies a Python worker
+  - zero-copy without a front server when the ASGI server supports the
+    http.response.pathsend extension (FileResponse hands it the path)
+Python-served range bodies use larger chunks than Starlette's default, so scrubbing
+through a large clip costs fewer event-loop round trips.
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import quote
+import os
+import stat
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+MEDIA_OFFLOAD = os.getenv("MEDIA_OFFLOAD", "").lower()  # "", "x-accel" or "x-sendfile"
+MEDIA_OFFLOAD_ROOT = Path(os.getenv(
+    "MEDIA_OFFLOAD_ROOT", os.path.join(os.path.dirname(__file__), "..", "storage")
+)).resolve()
+MEDIA_X_ACCEL_PREFIX = os.getenv("MEDIA_X_ACCEL_PREFIX", "/protected-media/")
+
+# Evidence content never changes under a file_id, so browsers may reuse it for a day
+IMMUTABLE_CACHE_CONTROL = "private, max-age=86400"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+class MediaFileResponse(FileResponse):
+    """FileResponse with bigger read chunks for range (video scrubbing) requests."""
+
+    chunk_size = 256 * 1024
+
+
+def _etag(stat_result: os.stat_result, content_hash: Optional[str]) -> str:
+    if content_hash:
+        return f'"{content_hash}"'
+    return f'W/"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as RFC 9110 requires for If-None-Match."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _not_modified(request: Request, etag: str, stat_result: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have whole-second resolution
+        return int(stat_result.st_mtime) <= since
+    return False
+
+
+def _offload_header(path: Path) -> Optional[Dict[str, str]]:
+    if MEDIA_OFFLOAD not in ("x-accel", "x-sendfile"):
+        return None
+    resolved = path.resolve()
+    if not resolved.is_relative_to(MEDIA_OFFLOAD_ROOT):
+        return None
+    if MEDIA_OFFLOAD == "x-sendfile":
+        return {"X-Sendfile": str(resolved)}
+    relative = resolved.relative_to(MEDIA_OFFLOAD_ROOT).as_posix()
+    return {"X-Accel-Redirect": MEDIA_X_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative)}
+
+
+def media_response(
+    request: Request,
+    path: str,
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    cache_control: str = REVALIDATE_CACHE_CONTROL,
+    content_disposition_type: str = "attachment",
+) -> Response:
+    """
+    Serve a file with validators, conditional GET, ranges and web-server offload.
+    content_hash (the stored SHA-256) makes the ETag strong, so If-Range works with it.
+    """
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = _etag(stat_result, content_hash)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+    }
+    if _not_modified(request, etag, stat_result):
+        return Response(status_code=304, headers=headers)
+
+    offload = _offload_header(Path(path))
+    if offload is not None:
+        response = FileResponse(
+            path, headers=headers, media_type=media_type, filename=filename,
+            stat_result=stat_result, content_disposition_type=content_disposition_type,
+        )
+        # The web server sends the body (and handles Range) from its internal location
+        offload_headers = {
+            key: value for key, value in response.headers.items()
+            if key in ("content-type", "content-disposition", "etag", "last-modified", "cache-control")
+        }
+        return Response(status_code=200, headers={**offload_headers, **offload})
+
+    return MediaFileResponse(
+        path, headers=headers, media_type=media_type, filename=filename,
+        stat_result=stat_result, content_disposition_type=content_disposition_type,
+    )
@@ -4,7 +4,7 @@ Handles data submission from mobile agent applications.
 All data is persisted to the database.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Body
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Body, Query
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 import json
@@ -13,11 +13,13 @@ import logging
 from sqlalchemy.orm import Session
 
 from database import get_db
-from api.auth_dependencies import get_current_user
+from api.auth_dependencies import get_current_user, get_user_properties, require_security_manager_or_admin
 from models import User
 from services.evidence_file_service import evidence_file_service
 from services.analytics_engine_service import analytics_engine
+from services.agent_location_buffer import get_location_buffer
 from services.mobile_agent_service import MobileAgentService
+from services.patrol_sync_service import PatrolSyncService
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -47,9 +49,8 @@ async def submit_patrol_data(
         for i, photo in enumerate(photos):
             try:
                 evidence_id = f"patrol-{patrol_id}-photo-{i}"
-                photo_data = await photo.read()
-                file_record = await evidence_file_service.upload_evidence_file(
-                    file_data=photo_data,
+                file_record = await evidence_file_service.upload_evidence_stream(
+                    stream=photo,
                     filename=photo.filename or f"patrol_photo_{i}.jpg",
                     evidence_id=evidence_id,
                     uploaded_by=agent_id,
@@ -60,7 +61,7 @@ async def submit_patrol_data(
                     "file_id": file_record["file_id"],
                     "filename": photo.filename,
                     "file_url": evidence_file_service.get_file_url(file_record["file_id"]),
-                    "thumbnail_url": evidence_file_service.get_thumbnail_url(file_record["file_id"]),
+                    "thumbnail_url": evidence_file_service.get_thumbnail_url(file_record["file_id"], file_record),
                 })
             except Exception as e:
                 logger.error("Failed to process photo %s: %s", i, e)
@@ -135,9 +136,8 @@ async def submit_incident_report(
     for i, (evidence_file, file_type) in enumerate(evidence_inputs):
         try:
             evidence_id = f"incident-{incident_id}-{file_type}-{i}"
-            file_data = await evidence_file.read()
-            file_record = await evidence_file_service.upload_evidence_file(
-                file_data=file_data,
+            file_record = await evidence_file_service.upload_evidence_stream(
+                stream=evidence_file,
                 filename=evidence_file.filename or f"incident_{file_type}_{i}",
                 evidence_id=evidence_id,
                 uploaded_by=agent_id,
@@ -155,7 +155,7 @@ async def submit_incident_report(
                 "file_type": file_type,
                 "filename": evidence_file.filename,
                 "file_url": evidence_file_service.get_file_url(file_record["file_id"]),
-                "thumbnail_url": evidence_file_service.get_thumbnail_url(file_record["file_id"]),
+                "thumbnail_url": evidence_file_service.get_thumbnail_url(file_record["file_id"], file_record),
             })
         except Exception as e:
             logger.error("Failed to process evidence file %s: %s", i, e)
@@ -282,6 +282,65 @@ def update_agent_location(
         raise HTTPException(status_code=500, detail="Location update failed")
 
 
+def _caller_agent_id(payload: Dict[str, Any], current_user: User) -> str:
+    """The payload's agent_id, which may only name the caller."""
+    agent_id = str(payload.get("agent_id") or current_user.user_id)
+    if agent_id != str(current_user.user_id):
+        raise HTTPException(status_code=403, detail="agent_id must be the authenticated user")
+    return agent_id
+
+
+@router.post("/locations")
+def record_agent_locations(
+    payload: Dict[str, Any] = Body(...),
+    current_user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Record a batch of GPS fixes for an agent.
+    Payload: fixes (list of {latitude, longitude, accuracy?, altitude?, speed?, heading?, timestamp?}),
+    optional agent_id (the caller), battery_level (0-100) and app_version.
+    """
+    fixes = payload.get("fixes")
+    if not isinstance(fixes, list):
+        raise HTTPException(status_code=400, detail="fixes must be a list")
+    agent_id = _caller_agent_id(payload, current_user)
+    try:
+        result = get_location_buffer().record(
+            agent_id, fixes, battery_level=payload.get("battery_level"), app_version=payload.get("app_version")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "accepted", "agent_id": agent_id, "accepted": result["accepted"]}
+
+
+@router.post("/sync")
+def sync_journal(
+    payload: Dict[str, Any] = Body(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_security_manager_or_admin),
+) -> Dict[str, Any]:
+    """
+    Apply a device's offline journal in one round-trip.
+    Payload: device_id, operations (ordered, each with seq and type), optional agent_id (the
+    caller) and patrol_versions ({patrol_id: version the device last saw}). Only patrols of
+    the caller's properties are changed.
+    """
+    device_id = payload.get("device_id")
+    if not device_id:
+        raise HTTPException(status_code=400, detail="device_id required")
+    patrol_versions = payload.get("patrol_versions") or {}
+    if not isinstance(patrol_versions, dict):
+        raise HTTPException(status_code=400, detail="patrol_versions must be an object")
+    service = PatrolSyncService(
+        db,
+        device_id=str(device_id),
+        agent_id=_caller_agent_id(payload, current_user),
+        user_id=str(current_user.user_id),
+        property_ids=get_user_properties(current_user),
+    )
+    return service.sync(payload.get("operations") or [], patrol_versions)
+
+
 @router.get("/patrol-submissions")
 def list_patrol_submissions(
     agent_id: Optional[str] = None,
@@ -325,6 +384,30 @@ def get_agent_status(
     return {"data": [s.model_dump() for s in items]}
 
 
+@router.get("/nearest")
+def find_nearest_agents(
+    latitude: float,
+    longitude: float,
+    k: Optional[int] = 5,
+    radius_m: Optional[float] = None,
+    status: Optional[List[str]] = Query(None),
+    max_age_seconds: Optional[float] = 600,
+    current_user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Nearest agents to a point, closest first, for dispatch.
+    k limits the count, radius_m the distance (either may be omitted, not both);
+    status defaults to active and idle agents seen within max_age_seconds.
+    """
+    try:
+        items = MobileAgentService.find_nearest_agents(
+            latitude, longitude, k=k, radius_m=radius_m, statuses=status, max_age_seconds=max_age_seconds
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"data": [a.model_dump() for a in items]}
+
+
 @router.get("/agent-locations/{agent_id}")
 def get_agent_location_history(
     agent_id: str,
@@ -337,6 +420,37 @@ def get_agent_location_history(
     return {"data": [loc.model_dump() for loc in items]}
 
 
+@router.get("/agent-locations/{agent_id}/trajectory")
+def get_agent_trajectory(
+    agent_id: str,
+    hours: int = 24,
+    tolerance: float = 5.0,
+    method: str = "douglas-peucker",
+    encoding: str = "json",
+    stationary_radius: float = 15.0,
+    min_dwell: float = 60.0,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Simplified location track for map replay.
+    tolerance/stationary_radius in metres (stationary_radius=0 disables stop clustering),
+    method douglas-peucker|visvalingam, encoding json|polyline.
+    """
+    try:
+        return MobileAgentService.get_agent_trajectory(
+            db=db,
+            agent_id=agent_id,
+            hours=hours,
+            tolerance=tolerance,
+            method=method,
+            encoding=encoding,
+            stationary_radius=stationary_radius,
+            min_dwell=min_dwell,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 async def process_patrol_observations(
     observations: Dict[str, Any],
     location: Dict[str, Any],
@@ -18,13 +18,18 @@ from schemas import (
     SystemLogResponse
 )
 from services.patrol_service import PatrolService
+from services.patrol_route_optimizer import get_route_optimizer
+from services.patrol_assignment_service import get_patrol_assignment_engine
 from api.auth_dependencies import (
+    check_user_has_property_access,
     get_current_user as get_current_active_user,
     get_current_user_optional,
     require_security_manager_or_admin as get_current_security_officer,
     verify_hardware_ingest_key,
 )
+import asyncio
 import logging
+from datetime import date, datetime
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -345,6 +350,23 @@ async def delete_template(
     """Delete a template"""
     return await PatrolService.delete_template(template_id=template_id, user_id=str(current_user.user_id))
 
+@router.post("/templates/validate-week")
+async def validate_week_schedule(
+    payload: Dict[str, Any] = Body(...),
+    current_user: User = Depends(get_current_security_officer),
+    db: Session = Depends(get_db)
+):
+    """
+    Validate a week of template schedules in one call.
+    Payload: templates (list of {template_id?, name?, route_id, assigned_officers, schedule}) and
+    optional property_id. Items with a template_id are checked as replacements of that template.
+    """
+    templates = payload.get("templates")
+    if not isinstance(templates, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="templates must be a list")
+    property_id = _accessible_property_id(payload, current_user, db)
+    return PatrolService.validate_week_schedule(db, property_id, templates)
+
 @router.get("/settings", response_model=PatrolSettingsResponse)
 async def get_settings(
     property_id: Optional[str] = None,
@@ -417,55 +439,60 @@ async def get_audit_logs(
         property_id=str(property_id) if property_id else None
     )
 
+def _accessible_property_id(payload: Dict[str, Any], current_user: User, db: Session) -> str:
+    """The payload's property_id (default: the caller's), which the caller must have access to."""
+    property_id = str(payload.get("property_id") or PatrolService._get_default_property_id(db, str(current_user.user_id)))
+    if not check_user_has_property_access(current_user, property_id):
+        logger.warning(f"User {current_user.user_id} attempted to access patrol data for property {property_id} without access")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied to this property")
+    return property_id
+
 # AI Endpoint Stubs - Now formally defined to replace mocks
 @router.post("/ai-match-officer")
 async def ai_match_officer(
     payload: Dict[str, Any] = Body(...),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
 ):
     """
-    AI Endpoint: Recommend best officer for a patrol based on specialized heuristics.
-    Receives 'patrol' and 'officers' list.
+    AI Endpoint: Recommend best officer for a patrol.
+    Receives 'patrol' (requiredSpecializations, checkpoints) and optionally 'officers' to
+    restrict the candidates; officer data itself (specializations, workload, location,
+    fatigue, heartbeat) is loaded server-side.
     """
-    # In a full implementation, this calls a dedicated AI service. 
-    # For now, we return a structured (but calculated) response to replace the frontend mock.
     logger.info(f"AI Match Request for User: {current_user.username}")
-    
-    # 1. Parse Payload
     patrol = payload.get("patrol", {})
-    officers = payload.get("officers", [])
-    
-    matches = []
-    
-    # 2. Heuristic Logic (Ported from frontend logic to backend for security/validity)
-    for officer in officers:
-        score = 60 # Base score
-        reasoning = []
-        
-        # Skill Match
-        req_specs = patrol.get("requiredSpecializations", [])
-        off_specs = officer.get("specializations", [])
-        
-        if any(spec in off_specs for spec in req_specs):
-            score += 25
-            reasoning.append("Matches required specialization")
-            
-        # Workload Check
-        active_patrols = officer.get("activePatrols", 0)
-        if active_patrols == 0:
-            score += 15
-            reasoning.append("Currently available")
-        elif active_patrols > 2:
-            score -= 20
-            reasoning.append("High workload detected")
-            
-        matches.append({
-            "officerId": officer.get("id"),
-            "matchScore": min(100, max(0, score)),
-            "reasoning": reasoning
-        })
-        
-    return {"matches": sorted(matches, key=lambda x: x['matchScore'], reverse=True)}
+    candidates = {str(o.get("id")) for o in payload.get("officers", []) if isinstance(o, dict) and o.get("id")}
+
+    property_id = _accessible_property_id(payload, current_user, db)
+    matches = get_patrol_assignment_engine().rank_officers(db, property_id, patrol)
+    if candidates:
+        matches = [m for m in matches if m["officerId"] in candidates]
+    return {"matches": matches}
+
+
+@router.post("/shift-assignments")
+async def solve_shift_assignments(
+    payload: Dict[str, Any] = Body(...),
+    current_user: User = Depends(get_current_security_officer),
+    db: Session = Depends(get_db)
+):
+    """
+    Assign officers to all patrol templates of a shift at minimum total cost.
+    Payload: date (YYYY-MM-DD, default today), optional startTime/endTime (HH:MM) and property_id.
+    """
+    try:
+        shift_day = date.fromisoformat(payload["date"]) if payload.get("date") else datetime.utcnow().date()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="date must be YYYY-MM-DD")
+    property_id = _accessible_property_id(payload, current_user, db)
+    try:
+        result = get_patrol_assignment_engine().solve_shift(
+            db, property_id, shift_day, payload.get("startTime"), payload.get("endTime")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"date": shift_day.isoformat(), **result}
 
 
 @router.post("/ai-optimize-route")
@@ -475,6 +502,10 @@ async def ai_optimize_route(
 ):
     """
     AI Endpoint: Optimize checkpoint sequence.
+
+    Minimizes walking time (distance plus floor changes) while reaching critical
+    checkpoints within their time windows. Optional payload keys: returnToStart,
+    startCheckpointId, criticalWithinMinutes.
     """
     route = payload.get("route", {})
     checkpoints = route.get("checkpoints", [])
@@ -482,17 +513,16 @@ async def ai_optimize_route(
     if not checkpoints:
         return {"optimization": {"optimizedSequence": [], "timeLeft": 0}}
 
-    # Simple Optimization: Sort Critical First
-    critical = [cp['id'] for cp in checkpoints if cp.get('isCritical')]
-    standard = [cp['id'] for cp in checkpoints if not cp.get('isCritical')]
-    
-    return {
-        "optimization": {
-            "optimizedSequence": critical + standard,
-            "timeSaved": 15,
-            "reasoning": ["Prioritized critical checkpoints", "Minimized backtracking"]
-        }
+    options = {
+        key: payload[key]
+        for key in ("returnToStart", "startCheckpointId", "criticalWithinMinutes")
+        if payload.get(key) is not None
     }
+    try:
+        optimization = await asyncio.to_thread(get_route_optimizer().optimize, route, options)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"optimization": optimization}
 
 
 @router.post("/ai-prioritize-alerts")
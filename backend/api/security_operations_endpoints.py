@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Body, File, UploadFile, Form, Header, Request
-from fastapi.responses import RedirectResponse, Response, FileResponse, StreamingResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from typing import List, Any, Dict, Optional
 from datetime import datetime, timezone
 import asyncio
@@ -15,6 +15,8 @@ from services.security_operations_service import CameraService
 from services.stream_proxy_service import HLS_GATEWAY_BASE_URL
 from services.stream_manager_service import stream_manager
 from services.evidence_file_service import evidence_file_service
+from services.evidence_preview_service import DEFAULT_PREVIEW_SIZE, PREVIEW_SIZES
+from api.media_response import IMMUTABLE_CACHE_CONTROL, media_response
 from services.recording_export_service import recording_export_service
 from services.analytics_engine_service import analytics_engine
 from database import SessionLocal, engine
@@ -206,11 +208,8 @@ async def proxy_camera_hls(
         result = stream_manager.serve_stream_file(camera_id, path)
         if result:
             file_path, media_type = result
-            return FileResponse(
-                path=str(file_path),
-                media_type=media_type,
-                headers={"Cache-Control": "no-cache, no-store"},
-            )
+            # Revalidated on every poll; unchanged manifests/segments answer 304
+            return media_response(request, str(file_path), media_type=media_type)
         # Segment/manifest missing: stream may have died — restart with shorter wait so we don't block 20s
         ok2, _ = await asyncio.to_thread(
             stream_manager.ensure_stream_running,
@@ -223,11 +222,7 @@ async def proxy_camera_hls(
             result2 = stream_manager.serve_stream_file(camera_id, path)
             if result2:
                 file_path, media_type = result2
-                return FileResponse(
-                    path=str(file_path),
-                    media_type=media_type,
-                    headers={"Cache-Control": "no-cache, no-store"},
-                )
+                return media_response(request, str(file_path), media_type=media_type)
         raise HTTPException(
             status_code=503,
             detail="Stream segment not ready. Retry in a moment.",
@@ -301,6 +296,11 @@ def list_recordings(
     return {"data": recordings}
 
 
+def _recording_source(recording: Dict[str, Any]) -> Optional[str]:
+    """File path or URL ffmpeg exports a recording from (None: look in recordings storage)."""
+    return recording.get("file_path") or recording.get("source_url") or recording.get("url")
+
+
 @router.post("/recordings/{recording_id}/export")
 async def export_recording(
     recording_id: str,
@@ -315,16 +315,20 @@ async def export_recording(
         raise HTTPException(status_code=404, detail="Recording not found")
     
     try:
+        # Queued for the export workers; poll status_url for progress
         export_result = await recording_export_service.export_recording(
             recording_id=recording_id,
             format=format,
             quality=quality,
-            user_id=str(current_user.user_id)
+            user_id=str(current_user.user_id),
+            source=_recording_source(recording)
         )
         
         return {
             "export_id": export_result["export_id"],
             "status": export_result["status"],
+            "mode": export_result["mode"],
+            "status_url": f"/security-operations/exports/{export_result['export_id']}/status",
             "download_url": f"/security-operations/exports/{export_result['export_id']}"
         }
         
@@ -350,8 +354,8 @@ async def export_recordings_batch(
         raise HTTPException(status_code=400, detail="Too many recordings (max 50)")
     
     # Verify all recordings exist
-    existing_ids = {r["id"] for r in _RECORDINGS}
-    missing_ids = set(recording_ids) - existing_ids
+    recordings = {r["id"]: r for r in _RECORDINGS}
+    missing_ids = set(recording_ids) - set(recordings)
     if missing_ids:
         raise HTTPException(status_code=404, detail=f"Recordings not found: {list(missing_ids)}")
     
@@ -360,7 +364,8 @@ async def export_recordings_batch(
             recording_ids=recording_ids,
             format=format,
             quality=quality,
-            user_id=str(current_user.user_id)
+            user_id=str(current_user.user_id),
+            sources={recording_id: _recording_source(recordings[recording_id]) for recording_id in recording_ids}
         )
         
         return {
@@ -369,9 +374,14 @@ async def export_recordings_batch(
             "total_count": batch_result["total_count"],
             "completed_count": batch_result["completed_count"],
             "failed_count": batch_result["failed_count"],
-            "download_url": f"/security-operations/exports/batch/{batch_result['batch_id']}" if batch_result.get("archive_path") else None
+            "export_ids": [job["export_id"] for job in batch_result["exports"]],
+            "status_url": f"/security-operations/exports/batch/{batch_result['batch_id']}/status",
+            # Streams immediately; exports still running are added as they complete
+            "download_url": f"/security-operations/exports/batch/{batch_result['batch_id']}"
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Batch export failed: {e}")
         raise HTTPException(status_code=500, detail="Batch export failed")
@@ -380,8 +390,9 @@ async def export_recordings_batch(
 @router.get("/exports/{export_id}")
 def download_export(
     export_id: str,
+    request: Request,
     current_user=Depends(get_current_user)
-) -> FileResponse:
+) -> Response:
     """Download an exported recording file."""
     export_job = recording_export_service.get_export_status(export_id)
     
@@ -394,8 +405,9 @@ def download_export(
     if not export_job.get("file_path") or not os.path.exists(export_job["file_path"]):
         raise HTTPException(status_code=404, detail="Export file not found")
     
-    return FileResponse(
-        path=export_job["file_path"],
+    return media_response(
+        request,
+        export_job["file_path"],
         filename=f"recording_{export_job['recording_id']}.{export_job['format']}",
         media_type="video/mp4"
     )
@@ -404,22 +416,89 @@ def download_export(
 @router.get("/exports/batch/{batch_id}")
 def download_batch_export(
     batch_id: str,
+    compression: str = "stored",
     current_user=Depends(get_current_user)
-) -> FileResponse:
-    """Download a batch export archive."""
-    # Find batch job (simplified lookup)
-    batch_path = os.path.join(recording_export_service.EXPORTS_STORAGE_PATH, f"batch_{batch_id}.zip")
+) -> Response:
+    """
+    Download a batch as a ZIP streamed from the export files (compression: stored or
+    deflate). Available (409 before) once one recording has finished exporting; the
+    others are added as they finish.
+    """
+    batch = recording_export_service.get_batch_status(batch_id)
     
-    if not os.path.exists(batch_path):
+    if not batch:
         raise HTTPException(status_code=404, detail="Batch export not found")
     
-    return FileResponse(
-        path=batch_path,
-        filename=f"recordings_batch_{batch_id}.zip",
-        media_type="application/zip"
+    if batch["status"] not in ("pending", "processing", "completed"):
+        raise HTTPException(status_code=400, detail=f"Batch export status: {batch['status']}")
+    
+    if not batch["completed_count"]:
+        raise HTTPException(status_code=409, detail="Batch export not ready; no recording has finished exporting")
+    
+    try:
+        chunks = recording_export_service.stream_batch_archive(batch_id, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # No Content-Length: the size is known only once the last entry is written
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="recordings_batch_{batch_id}.zip"'}
     )
 
 
+@router.get("/exports/{export_id}/status")
+def get_export_status(
+    export_id: str,
+    current_user=Depends(get_current_user)
+) -> Dict[str, Any]:
+    """Export job status and progress (percent)."""
+    export_job = recording_export_service.get_export_status(export_id)
+    if not export_job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return export_job
+
+
+@router.post("/exports/{export_id}/cancel")
+def cancel_export(
+    export_id: str,
+    current_user=Depends(require_security_manager_or_admin)
+) -> Dict[str, Any]:
+    """Cancel a queued or running export (stops its ffmpeg)."""
+    try:
+        export_job = recording_export_service.cancel_export(export_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not export_job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return export_job
+
+
+@router.get("/exports/batch/{batch_id}/status")
+def get_batch_export_status(
+    batch_id: str,
+    current_user=Depends(get_current_user)
+) -> Dict[str, Any]:
+    """Batch status, per-recording export jobs and overall progress."""
+    batch = recording_export_service.get_batch_status(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch export not found")
+    return batch
+
+
+@router.post("/exports/batch/{batch_id}/cancel")
+def cancel_batch_export(
+    batch_id: str,
+    current_user=Depends(require_security_manager_or_admin)
+) -> Dict[str, Any]:
+    """Cancel every export of a batch that has not finished yet."""
+    batch = recording_export_service.cancel_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch export not found")
+    return batch
+
+
 @router.get("/exports")
 def list_user_exports(
     current_user=Depends(get_current_user)
@@ -549,7 +628,7 @@ def _evidence_with_status() -> List[Dict[str, Any]]:
         if e["id"] in _evidence_files:
             file_record = _evidence_files[e["id"]]
             copied["fileUrl"] = evidence_file_service.get_file_url(file_record["file_id"])
-            copied["thumbnailUrl"] = evidence_file_service.get_thumbnail_url(file_record["file_id"])
+            copied["thumbnailUrl"] = evidence_file_service.get_thumbnail_url(file_record["file_id"], file_record)
         out.append(copied)
     return out
 
@@ -563,12 +642,9 @@ async def upload_evidence_file(
 ) -> Dict[str, Any]:
     """Upload a file as evidence (photo, video, document)."""
     try:
-        # Read file data
-        file_data = await file.read()
-        
-        # Upload through evidence file service
-        file_record = await evidence_file_service.upload_evidence_file(
-            file_data=file_data,
+        # Stream through evidence file service (never read whole into memory)
+        file_record = await evidence_file_service.upload_evidence_stream(
+            stream=file,
             filename=file.filename or "unknown",
             evidence_id=evidence_id,
             uploaded_by=str(current_user.user_id),
@@ -602,7 +678,7 @@ async def upload_evidence_file(
             "filename": file.filename,
             "file_size": file_record["file_size"],
             "file_url": evidence_file_service.get_file_url(file_record["file_id"]),
-            "thumbnail_url": evidence_file_service.get_thumbnail_url(file_record["file_id"]),
+            "thumbnail_url": evidence_file_service.get_thumbnail_url(file_record["file_id"], file_record),
             "uploaded_at": file_record["uploaded_at"]
         }
         
@@ -616,8 +692,9 @@ async def upload_evidence_file(
 @router.get("/evidence/files/{file_id}")
 def download_evidence_file(
     file_id: str,
+    request: Request,
     current_user=Depends(get_current_user)
-) -> FileResponse:
+) -> Response:
     """Download an evidence file by ID."""
     # Find file record
     file_record = None
@@ -629,24 +706,30 @@ def download_evidence_file(
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Verify file integrity
-    if not evidence_file_service.verify_file_integrity(file_record):
+    # Verify file integrity (re-hashed only if the file changed since its last check, so
+    # each range request of a video scrub does not re-read the whole clip)
+    if not evidence_file_service.verify_file_integrity(file_record, trust_unchanged=True):
         raise HTTPException(status_code=410, detail="File integrity compromised")
-    
-    file_path = file_record["file_path"]
-    return FileResponse(
-        path=file_path,
+
+    # Strong ETag from the stored SHA-256; ranges, conditional GET and offload via media_response
+    return media_response(
+        request,
+        file_record["file_path"],
         filename=file_record["original_filename"],
-        media_type=file_record["mime_type"]
+        media_type=file_record["mime_type"],
+        content_hash=file_record["file_hash"],
+        cache_control=IMMUTABLE_CACHE_CONTROL,
     )
 
 
 @router.get("/evidence/thumbnails/{file_id}")
-def get_evidence_thumbnail(
+async def get_evidence_thumbnail(
     file_id: str,
+    request: Request,
+    size: str = DEFAULT_PREVIEW_SIZE,
     current_user=Depends(get_current_user)
-) -> FileResponse:
-    """Get thumbnail for an evidence file."""
+) -> Response:
+    """Get a thumbnail/preview for an evidence file (size: thumb, medium or large)."""
     # Find file record
     file_record = None
     for evidence_id, record in _evidence_files.items():
@@ -656,14 +739,49 @@ def get_evidence_thumbnail(
     
     if not file_record or not file_record.get("thumbnail_path"):
         raise HTTPException(status_code=404, detail="Thumbnail not found")
-    
-    thumbnail_path = file_record["thumbnail_path"]
-    return FileResponse(
-        path=thumbnail_path,
-        media_type="image/jpeg"
+    if size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(PREVIEW_SIZES)}")
+
+    # Rendered by the preview workers on first request, then served from cache
+    thumbnail_path = await evidence_file_service.get_preview(file_record, size)
+    if not thumbnail_path:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return media_response(
+        request,
+        thumbnail_path,
+        media_type="image/jpeg",
+        cache_control=IMMUTABLE_CACHE_CONTROL,
     )
 
 
+@router.get("/evidence/integrity")
+def get_evidence_integrity_status(current_user=Depends(get_current_user)) -> Dict[str, Any]:
+    """Background integrity scan progress (cursor, passes) and any corrupt evidence objects."""
+    return evidence_file_service.integrity.get_status()
+
+
+@router.post("/evidence/integrity/scan")
+async def run_evidence_integrity_scan(current_user=Depends(require_security_manager_or_admin)) -> Dict[str, Any]:
+    """Verify the next batch of evidence objects now (same budget as the scheduled scan)."""
+    return await asyncio.to_thread(evidence_file_service.integrity.scan)
+
+
+@router.get("/evidence/cases/{case_id}/integrity-proof")
+def get_case_integrity_proof(
+    case_id: str,
+    file_id: Optional[str] = None,
+    current_user=Depends(get_current_user)
+) -> Dict[str, Any]:
+    """Merkle manifest root, scan status per file and (with file_id) that file's audit path."""
+    try:
+        proof = evidence_file_service.integrity.case_proof(case_id, file_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if proof is None:
+        raise HTTPException(status_code=404, detail="No evidence files recorded for this case")
+    return proof
+
+
 @router.get("/evidence/{evidence_id}/chain-of-custody")
 def get_evidence_chain_of_custody(
     evidence_id: str,
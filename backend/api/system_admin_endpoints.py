@@ -1,8 +1,9 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from database import get_db
-from api.auth_dependencies import get_current_user
+from api.auth_dependencies import get_current_user, require_admin_role
 from models import User
 from schemas import (
     UserCreate, UserUpdate, UserResponse,
@@ -13,6 +14,7 @@ from schemas import (
     SystemSettingCreate, SystemSettingResponse
 )
 from services.system_admin_service import SystemAdminService
+from services.data_retention_service import get_data_retention_service
 
 router = APIRouter(prefix="/system-admin", tags=["System Administration"])
 
@@ -202,3 +204,24 @@ async def update_settings(
     for s in settings:
         updated_settings.append(service.upsert_setting(s, current_user.user_id))
     return updated_settings
+
+# --- Data Retention ---
+
+@router.get("/retention", response_model=dict)
+async def get_retention_status(
+    current_user: User = Depends(get_current_user)
+):
+    """Retention policies and per-policy metrics (rows purged, rows rolled up, bytes reclaimed)."""
+    return get_data_retention_service().get_status()
+
+@router.post("/retention/run", response_model=dict)
+async def run_retention(
+    policies: Optional[List[str]] = Query(None),
+    current_user: User = Depends(require_admin_role)
+):
+    """Run retention now for all or the given policies (admin only; purges data)."""
+    try:
+        report = await asyncio.to_thread(get_data_retention_service().run, policies)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"policies": report}
@@ -7,6 +7,7 @@ import os
 import sys
 import time
 import json
+import asyncio
 import logging
 from typing import Dict, List, Optional
 from contextlib import asynccontextmanager
@@ -37,6 +38,11 @@ from models import User
 from services.camera_health_service import CameraHealthService
 from services.auth_service import AuthService
 from services.chat_service import ChatService
+from services.access_point_heartbeat_buffer import get_heartbeat_buffer
+from services.agent_location_buffer import get_location_buffer
+from services.evidence_file_service import evidence_file_service
+from services.recording_export_service import recording_export_service
+from services.data_retention_service import get_data_retention_service
 from schemas import ChatMessageCreate
 
 # Configure logging
@@ -82,8 +88,23 @@ async def lifespan(app: FastAPI):
     # Startup
     init_db()
     # CameraHealthService.start_background_service()
+    heartbeat_buffer = get_heartbeat_buffer()
+    heartbeat_buffer.start()
+    location_buffer = get_location_buffer()
+    location_buffer.start()
+    retention_service = get_data_retention_service()
+    retention_service.start()
+    evidence_file_service.integrity.start()
+    recording_export_service.start()
     yield
-    # Shutdown (optional cleanup can go here)
+    # Shutdown: persist buffered heartbeats and agent locations
+    await retention_service.stop()
+    await evidence_file_service.integrity.stop()
+    # Running exports go back to pending and resume on the next start
+    await asyncio.to_thread(recording_export_service.stop)
+    await location_buffer.stop()
+    await heartbeat_buffer.stop()
+    evidence_file_service.previews.shutdown()
 
 
 # Create FastAPI app
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, JSON, ForeignKey, Enum, Float, Index
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text, JSON, ForeignKey, Enum, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -277,6 +277,47 @@ class Patrol(Base):
     property = relationship("Property", foreign_keys=[property_id], back_populates="patrols")
     guard = relationship("User", foreign_keys=[guard_id], back_populates="patrols")
 
+class PatrolCheckpointProgress(Base):
+    """Check-in state of one checkpoint of a patrol; merged over Patrol.checkpoints when responding."""
+    __tablename__ = "patrol_checkpoint_progress"
+
+    progress_id = Column(Integer, primary_key=True, autoincrement=True)
+    patrol_id = Column(String(36), ForeignKey("patrols.patrol_id", ondelete="CASCADE"), nullable=False)
+    checkpoint_id = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False, default="completed")
+    completed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    completed_by = Column(String(100), nullable=True)
+    method = Column(String(20), nullable=True)
+    device_id = Column(String(100), nullable=True)
+    request_id = Column(String(100), nullable=True)
+    notes = Column(Text, nullable=True)
+    location = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("patrol_id", "checkpoint_id", name="uq_patrol_checkpoint_progress"),
+        # A client request id identifies one check-in per patrol, when given
+        Index(
+            "uq_patrol_checkpoint_progress_request", "patrol_id", "request_id", unique=True,
+            sqlite_where=Column("request_id").isnot(None),
+            postgresql_where=Column("request_id").isnot(None),
+        ),
+    )
+
+
+class PatrolSyncCursor(Base):
+    """Highest client journal sequence applied per device and stream (a patrol_id, or "agent")."""
+    __tablename__ = "patrol_sync_cursors"
+
+    cursor_id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String(100), nullable=False)
+    stream = Column(String(36), nullable=False)
+    last_seq = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("device_id", "stream", name="uq_patrol_sync_cursor"),
+    )
+
 class PatrolRoute(Base):
     __tablename__ = "patrol_routes"
     
@@ -695,12 +736,20 @@ class IoTEnvironmentalAlert(Base):
     noise_level = Column(Float, nullable=True)
     status = Column(String(20), default="active")
     resolved = Column(Boolean, default=False)
+    # Repeat occurrences roll up into the open alert instead of new rows
+    occurrence_count = Column(Integer, default=1)
+    last_occurred_at = Column(DateTime(timezone=True), nullable=True)
+    last_notified_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     resolved_at = Column(DateTime(timezone=True), nullable=True)
     
     property = relationship("Property")
     camera = relationship("Camera")
 
+    __table_args__ = (
+        Index("ix_iot_environmental_alerts_sensor_type", "property_id", "sensor_id", "alert_type"),
+    )
+
 
 class IoTEnvironmentalSettings(Base):
     __tablename__ = "iot_environmental_settings"
@@ -719,6 +768,86 @@ class IoTEnvironmentalSettings(Base):
     
     property = relationship("Property")
 
+class IoTSensorLatest(Base):
+    """Latest value per sensor. sensor_key is the compact integer key used by iot_sensor_readings."""
+    __tablename__ = "iot_sensor_latest"
+
+    sensor_key = Column(Integer, primary_key=True, autoincrement=True)
+    property_id = Column(String(36), ForeignKey("properties.property_id", ondelete="CASCADE"), nullable=False)
+    sensor_id = Column(String(100), nullable=False)
+    sensor_type = Column(Enum(SensorType), nullable=False)
+    ts = Column(DateTime(timezone=True), nullable=True)
+    value = Column(Float, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("property_id", "sensor_id", name="uq_iot_sensor_latest_property_sensor"),
+    )
+
+
+class IoTSensorReading(Base):
+    """Append-only sensor reading history.
+
+    Range-partitioned by ts on PostgreSQL; on SQLite rows live in monthly chunk tables
+    cloned from this definition (see services/iot_timeseries_store.py).
+    """
+    __tablename__ = "iot_sensor_readings"
+
+    sensor_key = Column(Integer, primary_key=True, autoincrement=False)
+    ts = Column(DateTime(timezone=True), primary_key=True)
+    value = Column(Float, nullable=True)
+
+    __table_args__ = {"postgresql_partition_by": "RANGE (ts)"}
+
+
+class DataRollup(Base):
+    """Hourly/daily aggregates of high-volume tables, written before raw rows are pruned
+    (see services/data_retention_service.py)."""
+    __tablename__ = "data_rollups"
+
+    rollup_id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String(50), nullable=False)
+    granularity = Column(String(10), nullable=False)  # hour, day
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    dimension_key = Column(String(255), nullable=False)
+    dimensions = Column(JSON, nullable=False)
+    count = Column(Integer, nullable=False)
+    value_sum = Column(Float, nullable=True)
+    value_min = Column(Float, nullable=True)
+    value_max = Column(Float, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("source", "granularity", "bucket_start", "dimension_key", name="uq_data_rollups_bucket"),
+    )
+
+class RecordingExportJob(Base):
+    """One recording export (ffmpeg stream copy or transcode), queued and run by
+    RecordingExportService's workers; rows survive restarts (see services/recording_export_service.py)."""
+    __tablename__ = "recording_export_jobs"
+
+    export_id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    batch_id = Column(String(36), nullable=True, index=True)
+    recording_id = Column(String(100), nullable=False)
+    user_id = Column(String(36), nullable=True, index=True)
+    source = Column(Text, nullable=True)  # file path or URL ffmpeg reads from
+    format = Column(String(10), nullable=False)
+    quality = Column(String(20), nullable=False)
+    mode = Column(String(10), nullable=False)  # copy, transcode
+    status = Column(String(20), nullable=False, default="pending")  # pending, processing, completed, failed, cancelled
+    progress = Column(Float, nullable=False, default=0.0)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(100), nullable=True)  # host:pid running the job
+    file_path = Column(Text, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_recording_export_jobs_status_created", "status", "created_at"),
+    )
+
 class HandoverPriority(str, enum.Enum):
     LOW = "low"
     MEDIUM = "medium"
@@ -285,6 +285,8 @@ class IncidentResponse(IncidentBase):
     assignee_name: Optional[str] = None
     property_name: Optional[str] = None
     idempotency_key: Optional[str] = None
+    # Nearest available agents to the incident's coordinates (set on creation)
+    suggested_responders: Optional[List[Dict[str, Any]]] = None
 
 # Patrol schemas
 class PatrolBase(BaseModel):
@@ -809,6 +811,7 @@ class AccessControlEmergencyResponse(BaseModel):
     timestamp: str
     timeout_minutes: Optional[int] = None
     expires_at: Optional[str] = None
+    dispatch_id: Optional[str] = None
 
 class AccessControlSyncEventsRequest(BaseModel):
     access_point_id: str
@@ -1032,6 +1035,7 @@ class IoTEnvironmentalDataCreate(BaseModel):
     signal_strength: Optional[float] = None
     threshold_min: Optional[float] = None
     threshold_max: Optional[float] = None
+    timestamp: Optional[datetime] = None  # Reading time from the device; defaults to receipt time
 
 class IoTEnvironmentalDataResponse(BaseModel):
     data_id: UUID
@@ -1061,6 +1065,27 @@ class IoTEnvironmentalDataResponse(BaseModel):
     alerts_triggered: Optional[List[str]] = None
     status: str
 
+class IoTSensorBatchResponse(BaseModel):
+    property_id: UUID
+    accepted: int
+    sensors: List[Dict[str, Any]]
+
+class IoTSensorSeries(BaseModel):
+    sensor_id: str
+    sensor_type: SensorType
+    method: str
+    raw_count: int
+    timestamps: List[datetime]
+    values: List[float]
+    min_values: Optional[List[float]] = None
+    max_values: Optional[List[float]] = None
+
+class IoTSensorSeriesResponse(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    points: int
+    series: List[IoTSensorSeries]
+
 class SensorAlertCreate(BaseModel):
     sensor_id: str
     alert_type: str
@@ -1089,6 +1114,8 @@ class SensorAlertResponse(BaseModel):
     noise_level: Optional[float] = None
     status: str
     resolved: bool
+    occurrence_count: int = 1
+    last_occurred_at: Optional[datetime] = None
     created_at: datetime
     resolved_at: Optional[datetime] = None
 
@@ -1946,6 +1973,10 @@ class AgentStatusResponse(BaseModel):
         from_attributes = True
 
 
+class NearbyAgentResponse(AgentStatusResponse):
+    distance_m: float
+
+
 # System Admin Schemas
 
 class RoleSchema(BaseModel):
@@ -0,0 +1,97 @@
+"""
+Latency benchmark for emergency-mode propagation to access points.
+
+Simulates a hardware bridge fronting N access point controllers (default 500) with
+realistic per-command latency and a small failure rate, then measures how long it
+takes for every controller to acknowledge a lockdown. Commands go through the real
+HardwareBridgeClient (httpx, request handling, error mapping); only the bridge's HTTP
+transport is simulated in-process. --offline-points makes that many controllers
+return 503 on every attempt, as a dead rack would.
+
+Usage:
+  python backend/scripts/benchmark_emergency_dispatch.py --points 500 --concurrency 64
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+# Add the backend directory to sys.path
+current_dir = Path(__file__).parent.absolute()
+backend_dir = current_dir.parent
+sys.path.insert(0, str(backend_dir))
+
+from services.emergency_dispatch_service import EmergencyDispatchEngine, HardwareBridgeClient
+
+SIMULATED_BRIDGE_URL = "http://bridge.simulated"
+
+
+def simulated_bridge(
+    min_latency_ms: float, max_latency_ms: float, failure_rate: float, offline_points: set
+) -> httpx.MockTransport:
+    """Bridge transport with per-controller latency, random failures and dead controllers."""
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(random.uniform(min_latency_ms, max_latency_ms) / 1000)
+        point_id = request.url.path.split("/")[-2]
+        if point_id in offline_points or random.random() < failure_rate:
+            return httpx.Response(503, json={"detail": "controller timeout"})
+        return httpx.Response(200, json={"acknowledged": True})
+
+    return httpx.MockTransport(handle)
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    point_ids = [f"ap-{i:04d}" for i in range(args.points)]
+    offline = set(point_ids[:args.offline_points])
+    transport = simulated_bridge(args.min_latency_ms, args.max_latency_ms, args.failure_rate, offline)
+
+    def client_factory():
+        return HardwareBridgeClient(SIMULATED_BRIDGE_URL, transport=transport)
+
+    print(f"Dispatching lockdown to {args.points} simulated access points "
+          f"(latency {args.min_latency_ms}-{args.max_latency_ms} ms, failure rate {args.failure_rate:.0%}, "
+          f"{len(offline)} offline)")
+    runs = (1, args.concurrency) if args.with_serial else (args.concurrency,)
+    for concurrency in runs:
+        engine = EmergencyDispatchEngine(
+            client_factory=client_factory,
+            concurrency=concurrency,
+            max_attempts=args.max_attempts,
+            retry_backoff_seconds=args.backoff_ms / 1000,
+        )
+        dispatch = engine.create_dispatch("benchmark-property", "lockdown", point_ids)
+        started = time.perf_counter()
+        await engine.run(dispatch, target_statuses={point_id: "disabled" for point_id in point_ids})
+        elapsed = time.perf_counter() - started
+        latencies = sorted(entry["latency_ms"] for entry in dispatch.points.values())
+        counts = dispatch.counts
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(
+            f"  concurrency={concurrency:<4} total={elapsed * 1000:8.1f} ms  "
+            f"ack={counts['acknowledged']} failed={counts['failed']}  "
+            f"per-point median={statistics.median(latencies):.1f} ms p95={p95:.1f} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--min-latency-ms", type=float, default=20)
+    parser.add_argument("--max-latency-ms", type=float, default=120)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--offline-points", type=int, default=0, help="Controllers that never acknowledge")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--backoff-ms", type=float, default=50)
+    parser.add_argument("--with-serial", action="store_true", help="Also run a concurrency=1 baseline (slow)")
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Memory benchmark for evidence uploads: streaming vs. read-whole-file.
+
+Runs N concurrent uploads of S MB synthetic videos through EvidenceFileService into a
+scratch directory, once the old way (await file.read() then upload_evidence_file) and
+once through upload_evidence_stream, and reports peak Python heap (tracemalloc) and peak
+RSS for each. The synthetic uploads behave like Starlette's UploadFile (async read(size))
+but generate their bytes on demand, so the only large buffers are the ones the upload
+path itself creates.
+
+Usage:
+  python backend/scripts/benchmark_evidence_upload_memory.py --uploads 4 --size-mb 200
+"""
+import argparse
+import asyncio
+import hashlib
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add the backend directory to sys.path
+current_dir = Path(__file__).parent.absolute()
+backend_dir = current_dir.parent
+sys.path.insert(0, str(backend_dir))
+
+from services.evidence_file_service import EvidenceFileService
+
+BLOCK = hashlib.sha256(b"evidence").digest() * 2048  # 64 KB pattern
+
+
+class SyntheticUpload:
+    """UploadFile stand-in producing ``size`` bytes without holding them."""
+
+    def __init__(self, size: int, filename: str):
+        self.size = size
+        self.filename = filename
+        self._remaining = size
+
+    async def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self._remaining
+        size = min(size, self._remaining)
+        self._remaining -= size
+        await asyncio.sleep(0)
+        return (BLOCK * (size // len(BLOCK) + 1))[:size]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _buffered(service: EvidenceFileService, upload: SyntheticUpload, i: int):
+    data = await upload.read()
+    return await service.upload_evidence_file(data, upload.filename, f"bench-{i}", "bench")
+
+
+async def _streamed(service: EvidenceFileService, upload: SyntheticUpload, i: int):
+    return await service.upload_evidence_stream(upload, upload.filename, f"bench-{i}", "bench")
+
+
+async def _run(mode, service: EvidenceFileService, uploads: int, size: int):
+    files = [SyntheticUpload(size, f"video-{i}.mp4") for i in range(uploads)]
+    return await asyncio.gather(*(mode(service, upload, i) for i, upload in enumerate(files)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=200)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    scratch = Path(tempfile.mkdtemp(prefix="evidence-bench-"))
+    service = EvidenceFileService.__new__(EvidenceFileService)
+    service.EVIDENCE_STORAGE_PATH = str(scratch / "evidence")
+    service.THUMBNAIL_STORAGE_PATH = str(scratch / "thumbnails")
+    service.__init__()
+
+    print(f"{args.uploads} concurrent uploads x {args.size_mb} MB")
+    try:
+        # Streaming first: ru_maxrss only ever grows, so the buffered run cannot hide it
+        for label, mode in (("streamed", _streamed), ("read whole", _buffered)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            records = asyncio.run(_run(mode, service, args.uploads, size))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert all(record["file_size"] == size for record in records)
+            assert len({record["file_hash"] for record in records}) == 1
+            print(
+                f"{label:>10}: peak heap {peak / 1024 / 1024:8.1f} MB, peak RSS {_peak_rss_mb():8.1f} MB, "
+                f"{args.uploads * args.size_mb / elapsed:7.1f} MB/s"
+            )
+            shutil.rmtree(service.EVIDENCE_STORAGE_PATH)
+            service._ensure_directories()
+    finally:
+        service.previews.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
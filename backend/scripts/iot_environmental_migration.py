@@ -70,6 +70,9 @@ def main() -> None:
             add_column(connection, "iot_environmental_data", "noise_level", "DOUBLE PRECISION")
             add_column(connection, "iot_environmental_alerts", "light_level", "DOUBLE PRECISION")
             add_column(connection, "iot_environmental_alerts", "noise_level", "DOUBLE PRECISION")
+            add_column(connection, "iot_environmental_alerts", "occurrence_count", "INTEGER DEFAULT 1")
+            add_column(connection, "iot_environmental_alerts", "last_occurred_at", "TIMESTAMP WITH TIME ZONE")
+            add_column(connection, "iot_environmental_alerts", "last_notified_at", "TIMESTAMP WITH TIME ZONE")
 
             # Ensure enum supports light/noise
             for enum_name in ["sensortype", "sensor_type"]:
@@ -86,6 +89,9 @@ def main() -> None:
             add_column(connection, "iot_environmental_data", "noise_level", "REAL")
             add_column(connection, "iot_environmental_alerts", "light_level", "REAL")
             add_column(connection, "iot_environmental_alerts", "noise_level", "REAL")
+            add_column(connection, "iot_environmental_alerts", "occurrence_count", "INTEGER DEFAULT 1")
+            add_column(connection, "iot_environmental_alerts", "last_occurred_at", "DATETIME")
+            add_column(connection, "iot_environmental_alerts", "last_notified_at", "DATETIME")
         else:
             add_column(connection, "iot_environmental_data", "value", "FLOAT")
             add_column(connection, "iot_environmental_data", "unit", "VARCHAR(50)")
@@ -97,6 +103,15 @@ def main() -> None:
             add_column(connection, "iot_environmental_data", "noise_level", "FLOAT")
             add_column(connection, "iot_environmental_alerts", "light_level", "FLOAT")
             add_column(connection, "iot_environmental_alerts", "noise_level", "FLOAT")
+            add_column(connection, "iot_environmental_alerts", "occurrence_count", "INTEGER DEFAULT 1")
+            add_column(connection, "iot_environmental_alerts", "last_occurred_at", "TIMESTAMP")
+            add_column(connection, "iot_environmental_alerts", "last_notified_at", "TIMESTAMP")
+
+        # Lookup of the latest alert per (sensor, alert_type) for alert roll-up
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_iot_environmental_alerts_sensor_type "
+            "ON iot_environmental_alerts (property_id, sensor_id, alert_type)"
+        ))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+"""
+Access Anomaly Detector
+Streaming anomaly stage for access control events.
+
+Keeps sliding-window counters per user, per access point and per card in fixed-size
+time-bucketed ring counters (constant memory per key, no database queries) and flags:
+  - repeated denials (per user, per card, per access point)
+  - impossible travel between distant readers
+  - after-hours activity spikes at an access point
+"""
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 10
+DENIAL_WINDOW_SECONDS = 300
+AFTER_HOURS_WINDOW_SECONDS = 900
+USER_DENIAL_THRESHOLD = int(os.getenv("ACCESS_ANOMALY_USER_DENIALS", "5"))
+CARD_DENIAL_THRESHOLD = int(os.getenv("ACCESS_ANOMALY_CARD_DENIALS", "5"))
+POINT_DENIAL_THRESHOLD = int(os.getenv("ACCESS_ANOMALY_POINT_DENIALS", "10"))
+AFTER_HOURS_THRESHOLD = int(os.getenv("ACCESS_ANOMALY_AFTER_HOURS_EVENTS", "20"))
+# "start-end" in UTC hours; the window wraps midnight when start > end
+AFTER_HOURS = os.getenv("ACCESS_ANOMALY_AFTER_HOURS", "22-6")
+# Faster than a running person between two readers is treated as impossible travel
+MAX_TRAVEL_SPEED_MPS = float(os.getenv("ACCESS_ANOMALY_MAX_SPEED_MPS", "8"))
+MIN_TRAVEL_DISTANCE_METERS = 50.0
+ALERT_COOLDOWN_SECONDS = 300
+MAX_TRACKED_KEYS = 50000
+RECENT_ANOMALY_LIMIT = 200
+
+
+class RingCounter:
+    """Sliding-window event counter made of fixed time buckets reused in a ring."""
+
+    __slots__ = ("bucket_seconds", "counts", "epochs", "latest")
+
+    def __init__(self, window_seconds: int, bucket_seconds: int = BUCKET_SECONDS):
+        size = max(1, math.ceil(window_seconds / bucket_seconds))
+        self.bucket_seconds = bucket_seconds
+        self.counts = [0] * size
+        self.epochs = [-1] * size
+        self.latest = float("-inf")
+
+    def add(self, ts: float, amount: int = 1) -> int:
+        """Count an event at ``ts`` (epoch seconds) and return the window total.
+
+        Late events (replayed offline caches) count only while their bucket is still in
+        the window ending at the newest event seen; they never reset a newer bucket.
+        """
+        self.latest = max(self.latest, ts)
+        epoch = int(ts // self.bucket_seconds)
+        if epoch > int(self.latest // self.bucket_seconds) - len(self.counts):
+            index = epoch % len(self.counts)
+            if self.epochs[index] < epoch:
+                self.epochs[index] = epoch
+                self.counts[index] = 0
+            if self.epochs[index] == epoch:
+                self.counts[index] += amount
+        return self.total(self.latest)
+
+    def total(self, ts: float) -> int:
+        epoch = int(ts // self.bucket_seconds)
+        oldest = epoch - len(self.counts) + 1
+        return sum(count for count, bucket in zip(self.counts, self.epochs) if oldest <= bucket <= epoch)
+
+
+class _KeyedCounters:
+    """Bounded LRU map of key -> RingCounter."""
+
+    def __init__(self, window_seconds: int, max_keys: int = MAX_TRACKED_KEYS):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, RingCounter]" = OrderedDict()
+
+    def add(self, key: str, ts: float) -> int:
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = RingCounter(self.window_seconds)
+            self._counters[key] = counter
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+        return counter.add(ts)
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+def _parse_after_hours(spec: str) -> Tuple[int, int]:
+    try:
+        start, end = (int(part) for part in spec.split("-", 1))
+        return start % 24, end % 24
+    except ValueError:
+        logger.warning(f"Invalid ACCESS_ANOMALY_AFTER_HOURS '{spec}', using 22-6")
+        return 22, 6
+
+
+def _haversine_meters(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lng1 = map(math.radians, a)
+    lat2, lng2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(h))
+
+
+def _coordinates(location: Any) -> Optional[Tuple[float, float]]:
+    if not isinstance(location, dict):
+        return None
+    lat = location.get("lat", location.get("latitude"))
+    lng = location.get("lng", location.get("lon", location.get("longitude")))
+    try:
+        return (float(lat), float(lng)) if lat is not None and lng is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _epoch_seconds(timestamp: Optional[datetime]) -> float:
+    if timestamp is None:
+        return datetime.now(timezone.utc).timestamp()
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class AccessAnomalyDetector:
+    """Streaming detector fed with every ingested access event."""
+
+    def __init__(self, after_hours: str = AFTER_HOURS):
+        self._lock = threading.Lock()
+        self._user_denials = _KeyedCounters(DENIAL_WINDOW_SECONDS)
+        self._card_denials = _KeyedCounters(DENIAL_WINDOW_SECONDS)
+        self._point_denials = _KeyedCounters(DENIAL_WINDOW_SECONDS)
+        self._point_after_hours = _KeyedCounters(AFTER_HOURS_WINDOW_SECONDS)
+        # user -> (epoch seconds, access point, coordinates) of the last located event
+        self._last_seen: "OrderedDict[str, Tuple[float, str, Tuple[float, float]]]" = OrderedDict()
+        self._last_fired: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_ANOMALY_LIMIT)
+        self.after_hours_start, self.after_hours_end = _parse_after_hours(after_hours)
+
+    def is_after_hours(self, ts: float) -> bool:
+        hour = datetime.fromtimestamp(ts, timezone.utc).hour
+        if self.after_hours_start <= self.after_hours_end:
+            return self.after_hours_start <= hour < self.after_hours_end
+        return hour >= self.after_hours_start or hour < self.after_hours_end
+
+    def observe(
+        self,
+        property_id: Optional[str],
+        access_point: Optional[str],
+        user_id: Optional[str] = None,
+        card_id: Optional[str] = None,
+        is_authorized: bool = True,
+        timestamp: Optional[datetime] = None,
+        location: Any = None,
+        event_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Feed one access event through the detector and return any anomalies it raised."""
+        ts = _epoch_seconds(timestamp)
+        candidates: List[Tuple[str, str, str, Dict[str, Any]]] = []
+        with self._lock:
+            if not is_authorized:
+                if user_id:
+                    count = self._user_denials.add(user_id, ts)
+                    if count >= USER_DENIAL_THRESHOLD:
+                        candidates.append(("repeated_denials", "user", user_id, {"count": count}))
+                if card_id:
+                    count = self._card_denials.add(card_id, ts)
+                    if count >= CARD_DENIAL_THRESHOLD:
+                        candidates.append(("repeated_denials", "card", card_id, {"count": count}))
+                if access_point:
+                    count = self._point_denials.add(access_point, ts)
+                    if count >= POINT_DENIAL_THRESHOLD:
+                        candidates.append(("repeated_denials", "access_point", access_point, {"count": count}))
+
+            if access_point and self.is_after_hours(ts):
+                count = self._point_after_hours.add(access_point, ts)
+                if count >= AFTER_HOURS_THRESHOLD:
+                    candidates.append(("after_hours_spike", "access_point", access_point, {"count": count}))
+
+            coordinates = _coordinates(location)
+            if user_id and access_point and coordinates:
+                previous = self._last_seen.get(user_id)
+                if previous and previous[1] != access_point and ts > previous[0]:
+                    distance = _haversine_meters(previous[2], coordinates)
+                    speed = distance / (ts - previous[0])
+                    if distance >= MIN_TRAVEL_DISTANCE_METERS and speed > MAX_TRAVEL_SPEED_MPS:
+                        candidates.append(("impossible_travel", "user", user_id, {
+                            "from_access_point": previous[1],
+                            "distance_meters": round(distance, 1),
+                            "seconds": round(ts - previous[0], 1),
+                            "speed_mps": round(speed, 1)
+                        }))
+                if not previous or ts >= previous[0]:
+                    self._last_seen[user_id] = (ts, access_point, coordinates)
+                    self._last_seen.move_to_end(user_id)
+                    if len(self._last_seen) > MAX_TRACKED_KEYS:
+                        self._last_seen.popitem(last=False)
+
+            anomalies = []
+            for anomaly_type, key_type, key, details in candidates:
+                fired_key = (anomaly_type, f"{key_type}:{key}")
+                last_fired = self._last_fired.get(fired_key)
+                if last_fired is not None and ts - last_fired < ALERT_COOLDOWN_SECONDS:
+                    continue
+                self._last_fired[fired_key] = ts
+                self._last_fired.move_to_end(fired_key)
+                if len(self._last_fired) > MAX_TRACKED_KEYS:
+                    self._last_fired.popitem(last=False)
+                anomaly = {
+                    "type": anomaly_type,
+                    "key_type": key_type,
+                    "key": key,
+                    "property_id": property_id,
+                    "access_point": access_point,
+                    "event_id": event_id,
+                    "timestamp": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+                    **details
+                }
+                self._recent.appendleft(anomaly)
+                anomalies.append(anomaly)
+        return anomalies
+
+    def get_recent(self, property_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                anomaly for anomaly in self._recent
+                if property_id is None or anomaly["property_id"] == property_id
+            ][:limit]
+
+
+_detector: Optional[AccessAnomalyDetector] = None
+
+
+def get_access_anomaly_detector() -> AccessAnomalyDetector:
+    global _detector
+    if _detector is None:
+        _detector = AccessAnomalyDetector()
+    return _detector
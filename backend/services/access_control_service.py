@@ -18,6 +18,9 @@ from models import (
     Property
 )
 from schemas import AccessControlEventCreate, AccessControlEventResponse, DigitalKeyCreate, DigitalKeyResponse, AccessControlAuditCreate, AccessControlAuditResponse
+from services.emergency_dispatch_service import get_emergency_dispatch_engine, broadcast_dispatch_progress
+from services.access_point_heartbeat_buffer import get_heartbeat_buffer
+from services.access_anomaly_detector import get_access_anomaly_detector
 from fastapi import HTTPException, status
 import logging
 import hashlib
@@ -26,6 +29,12 @@ import json
 
 logger = logging.getLogger(__name__)
 
+# Access point status applied for each emergency mode
+EMERGENCY_MODE_STATUSES = {
+    "lockdown": "disabled",
+    "unlock": "active",
+}
+
 class AccessControlService:
     """Service for managing access control operations"""
     
@@ -71,6 +80,16 @@ class AccessControlService:
             # Trigger alerts if unauthorized access
             if not event.is_authorized:
                 await AccessControlService._trigger_unauthorized_alert(db_event)
+            await AccessControlService._detect_anomalies(
+                db_event.property_id,
+                db_event.access_point,
+                db_event.user_id,
+                db_event.device_info,
+                db_event.is_authorized,
+                db_event.timestamp,
+                db_event.location,
+                db_event.event_id
+            )
             
             return AccessControlEventResponse(
                 event_id=db_event.event_id,
@@ -490,6 +509,7 @@ class AccessControlService:
             db.add(point)
             db.commit()
             db.refresh(point)
+            get_heartbeat_buffer().observe(point)
             return AccessControlService._map_access_point(point)
         finally:
             db.close()
@@ -539,6 +559,7 @@ class AccessControlService:
                 point.last_status_change = datetime.fromisoformat(payload["lastStatusChange"])
             db.commit()
             db.refresh(point)
+            get_heartbeat_buffer().observe(point)
             return AccessControlService._map_access_point(point)
         finally:
             db.close()
@@ -552,6 +573,7 @@ class AccessControlService:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Access point not found")
             db.delete(point)
             db.commit()
+            get_heartbeat_buffer().discard(point_id)
         finally:
             db.close()
 
@@ -742,6 +764,7 @@ class AccessControlService:
         db = SessionLocal()
         try:
             resolved_property_id = property_id or AccessControlService._get_default_property_id(db, user_id)
+            db_events = []
             for event in events:
                 db_event = AccessControlEvent(
                     property_id=resolved_property_id,
@@ -756,12 +779,24 @@ class AccessControlService:
                     photo_capture=None
                 )
                 db.add(db_event)
+                db_events.append((db_event, event))
             point = db.query(AccessPoint).filter(AccessPoint.access_point_id == access_point_id).first()
             if point:
                 point.access_count = (point.access_count or 0) + len(events)
                 point.last_access = datetime.utcnow()
                 point.cached_events = []
             db.commit()
+            for db_event, event in db_events:
+                await AccessControlService._detect_anomalies(
+                    resolved_property_id,
+                    access_point_id,
+                    db_event.user_id,
+                    {"card_id": event.get("cardId")},
+                    db_event.is_authorized,
+                    AccessControlService._parse_event_timestamp(event.get("timestamp")) or db_event.timestamp,
+                    db_event.location,
+                    db_event.event_id
+                )
             return await AccessControlService.get_access_events_summary(resolved_property_id, user_id)
         finally:
             db.close()
@@ -823,44 +858,83 @@ class AccessControlService:
         db = SessionLocal()
         try:
             resolved_property_id = property_id or AccessControlService._get_default_property_id(db, user_id)
-            points = db.query(AccessPoint).filter(AccessPoint.property_id == resolved_property_id).all()
+            points = db.query(AccessPoint.access_point_id, AccessPoint.status).filter(
+                AccessPoint.property_id == resolved_property_id
+            ).all()
             state = db.query(AccessControlEmergencyState).filter(
                 AccessControlEmergencyState.property_id == resolved_property_id
             ).first()
             if not state:
                 state = AccessControlEmergencyState(property_id=resolved_property_id)
                 db.add(state)
+            now = datetime.utcnow()
+            target_statuses: Dict[str, str] = {}
             if mode == "restore":
                 previous_statuses = {entry["id"]: entry["status"] for entry in (state.previous_statuses or [])}
-                for point in points:
-                    if point.access_point_id in previous_statuses:
-                        point.status = previous_statuses[point.access_point_id]
+                target_statuses = {
+                    point_id: previous_statuses[point_id]
+                    for point_id, _ in points if point_id in previous_statuses
+                }
+                if target_statuses:
+                    db.bulk_update_mappings(AccessPoint, [
+                        {"access_point_id": point_id, "status": point_status, "last_status_change": now}
+                        for point_id, point_status in target_statuses.items()
+                    ])
                 state.mode = "normal"
             else:
-                state.previous_statuses = [{"id": point.access_point_id, "status": point.status} for point in points]
-                if mode == "lockdown":
-                    for point in points:
-                        point.status = "disabled"
-                if mode == "unlock":
-                    for point in points:
-                        point.status = "active"
+                state.previous_statuses = [{"id": point_id, "status": point_status} for point_id, point_status in points]
+                target_status = EMERGENCY_MODE_STATUSES.get(mode)
+                if target_status:
+                    # Single set-based UPDATE instead of loading and dirtying every row
+                    db.query(AccessPoint).filter(
+                        AccessPoint.property_id == resolved_property_id
+                    ).update(
+                        {AccessPoint.status: target_status, AccessPoint.last_status_change: now},
+                        synchronize_session=False
+                    )
+                    target_statuses = {point_id: target_status for point_id, _ in points}
                 state.mode = mode
             state.initiated_by = user_id
             state.reason = reason
-            state.timestamp = datetime.utcnow()
+            state.timestamp = now
             state.timeout_minutes = timeout_minutes
-            state.expires_at = datetime.utcnow() + timedelta(minutes=timeout_minutes) if timeout_minutes else None
+            state.expires_at = now + timedelta(minutes=timeout_minutes) if timeout_minutes else None
             db.commit()
+
+            # Push to the physical controllers concurrently; the response does not wait for acks
+            dispatch_id = None
+            if target_statuses:
+                engine = get_emergency_dispatch_engine()
+                dispatch = engine.create_dispatch(resolved_property_id, mode, list(target_statuses), user_id)
+                engine.start(
+                    dispatch,
+                    target_statuses=target_statuses,
+                    payload={"reason": reason, "timeout_minutes": timeout_minutes},
+                    on_progress=broadcast_dispatch_progress
+                )
+                dispatch_id = dispatch.dispatch_id
             return {
                 "mode": state.mode,
                 "initiated_by": state.initiated_by,
                 "reason": state.reason,
                 "timestamp": state.timestamp.isoformat(),
                 "timeout_minutes": state.timeout_minutes,
-                "expires_at": state.expires_at.isoformat() if state.expires_at else None
+                "expires_at": state.expires_at.isoformat() if state.expires_at else None,
+                "dispatch_id": dispatch_id
             }
         finally:
             db.close()
+
+    @staticmethod
+    async def get_emergency_dispatch(dispatch_id: str) -> Dict[str, Any]:
+        """Get acknowledgement progress for an emergency dispatch"""
+        dispatch = get_emergency_dispatch_engine().get_dispatch(dispatch_id)
+        if not dispatch:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Emergency dispatch {dispatch_id} not found"
+            )
+        return dispatch.to_dict(include_points=True)
     
     @staticmethod
     async def _validate_access_permission(
@@ -922,6 +996,62 @@ class AccessControlService:
         except Exception as e:
             logger.error(f"Error triggering unauthorized alert: {str(e)}")
     
+    @staticmethod
+    def _parse_event_timestamp(value: Any) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+
+    @staticmethod
+    async def _detect_anomalies(
+        property_id: Optional[str],
+        access_point: Optional[str],
+        user_id: Optional[str],
+        device_info: Optional[Dict[str, Any]],
+        is_authorized: bool,
+        timestamp: Optional[datetime],
+        location: Any,
+        event_id: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Run an ingested event through the streaming anomaly detector (no DB access)"""
+        try:
+            device_info = device_info or {}
+            anomalies = get_access_anomaly_detector().observe(
+                property_id,
+                access_point,
+                user_id=user_id,
+                card_id=device_info.get("card_id") or device_info.get("credential_id"),
+                is_authorized=is_authorized,
+                timestamp=timestamp,
+                location=location,
+                event_id=event_id
+            )
+            for anomaly in anomalies:
+                await AccessControlService._trigger_anomaly_alert(anomaly)
+            return anomalies
+        except Exception as e:
+            logger.error(f"Error running access anomaly detection: {str(e)}")
+            return []
+
+    @staticmethod
+    async def _trigger_anomaly_alert(anomaly: Dict[str, Any]) -> None:
+        """Trigger alert for a detected access anomaly"""
+        try:
+            logger.warning(f"Access anomaly alert: {json.dumps(anomaly)}")
+            from main import manager
+            if manager and manager.active_connections:
+                await manager.broadcast_message({"type": "access_anomaly", "anomaly": anomaly})
+        except Exception as e:
+            logger.error(f"Error triggering anomaly alert: {str(e)}")
+
+    @staticmethod
+    async def get_access_anomalies(property_id: Optional[str], limit: int = 50) -> List[Dict[str, Any]]:
+        """Get recently detected access anomalies"""
+        return get_access_anomaly_detector().get_recent(property_id, limit)
+    
     @staticmethod
     async def get_biometric_data(user_id: str) -> Dict[str, Any]:
         """Get biometric data for user (mock implementation)"""
@@ -1604,101 +1734,44 @@ class AccessControlService:
         battery_level: Optional[int],
         sensor_status: Optional[str]
     ) -> Dict[str, Any]:
-        """Record heartbeat from access point hardware device"""
-        db = SessionLocal()
+        """Record heartbeat from access point hardware device (write-behind, see AccessPointHeartbeatBuffer)"""
         try:
-            point = db.query(AccessPoint).filter(AccessPoint.access_point_id == point_id).first()
-            if not point:
+            entry = get_heartbeat_buffer().record(
+                point_id,
+                device_id=device_id,
+                firmware_version=firmware_version,
+                battery_level=battery_level,
+                sensor_status=sensor_status
+            )
+            if entry is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Access point {point_id} not found"
                 )
             
-            # Update heartbeat timestamp and device info
-            now = datetime.utcnow()
-            details = point.details or {}
-            details["last_heartbeat"] = now.isoformat()
-            details["isOnline"] = True
-            if device_id:
-                details["device_id"] = device_id
-            if firmware_version:
-                details["firmware_version"] = firmware_version
-            if battery_level is not None:
-                details["battery_level"] = battery_level
-            if sensor_status:
-                details["sensor_status"] = sensor_status
-            
-            point.details = details
-            db.commit()
-            db.refresh(point)
-            
-            logger.info(f"Heartbeat recorded for access point {point_id}")
+            logger.debug(f"Heartbeat recorded for access point {point_id}")
             return {
                 "point_id": point_id,
-                "last_heartbeat": now.isoformat(),
+                "last_heartbeat": entry["last_heartbeat"].isoformat(),
                 "isOnline": True
             }
         except HTTPException:
             raise
         except Exception as e:
-            db.rollback()
             logger.error(f"Error recording heartbeat: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to record heartbeat"
             )
-        finally:
-            db.close()
 
     @staticmethod
     async def get_access_points_health(property_id: Optional[str]) -> Dict[str, Dict[str, Any]]:
-        """Get health status for all access points (heartbeat data)"""
-        db = SessionLocal()
+        """Get health status for all access points (heartbeat data, served from memory)"""
         try:
-            query = db.query(AccessPoint)
-            if property_id:
-                query = query.filter(AccessPoint.property_id == property_id)
-            
-            points = query.all()
-            health_data = {}
-            
-            for point in points:
-                details = point.details or {}
-                last_heartbeat = details.get("last_heartbeat")
-                is_online = details.get("isOnline", True)
-                
-                # Determine connection status based on heartbeat
-                connection_status = "unknown"
-                if last_heartbeat:
-                    try:
-                        last_hb_time = datetime.fromisoformat(last_heartbeat.replace('Z', '+00:00'))
-                        elapsed = (datetime.utcnow() - last_hb_time.replace(tzinfo=None)).total_seconds()
-                        # 15 minute threshold
-                        connection_status = "online" if elapsed < 900 else "offline"
-                    except:
-                        connection_status = "unknown"
-                elif is_online:
-                    connection_status = "online"
-                else:
-                    connection_status = "offline"
-                
-                health_data[point.access_point_id] = {
-                    "point_id": point.access_point_id,
-                    "name": point.name,
-                    "last_heartbeat": last_heartbeat,
-                    "connection_status": connection_status,
-                    "isOnline": is_online,
-                    "device_id": details.get("device_id"),
-                    "firmware_version": details.get("firmware_version"),
-                    "battery_level": details.get("battery_level")
-                }
-            
-            return health_data
+            return get_heartbeat_buffer().get_health(property_id)
         except Exception as e:
             logger.error(f"Error getting access points health: {e}")
             return {}
-        finally:
-            db.close()
 
     @staticmethod
     async def register_hardware_device(payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -1736,6 +1809,11 @@ class AccessControlService:
                 existing.type = payload.get("device_type", existing.type)
                 db.commit()
                 db.refresh(existing)
+                # Keep unflushed heartbeat state; the registration itself counts as a heartbeat
+                get_heartbeat_buffer().observe(existing)
+                get_heartbeat_buffer().record(
+                    existing.access_point_id, device_id=device_id, firmware_version=payload.get("firmware_version")
+                )
                 
                 logger.info(f"Hardware device {device_id} updated")
                 return AccessControlService._map_access_point(existing)
@@ -1763,6 +1841,7 @@ class AccessControlService:
             db.add(new_point)
             db.commit()
             db.refresh(new_point)
+            get_heartbeat_buffer().observe(new_point)
             
             logger.info(f"Hardware device {device_id} registered as access point {new_point.access_point_id}")
             return AccessControlService._map_access_point(new_point)
@@ -0,0 +1,285 @@
+"""
+Access Point Heartbeat Buffer
+Write-behind buffering for access point controller heartbeats.
+
+Heartbeat state is kept in memory and flushed to AccessPoint in periodic bulk UPDATEs.
+Online/offline transitions are persisted immediately, and the health view is served
+straight from memory. State is per-process: run a single API worker (or a sticky
+load balancer for heartbeat routes) so every controller reports to the same buffer.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime
+import asyncio
+import logging
+import os
+import threading
+
+from database import SessionLocal
+from models import AccessPoint
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL_SECONDS", "10"))
+# A point that has not reported for this long is considered offline
+OFFLINE_AFTER_SECONDS = float(os.getenv("HEARTBEAT_OFFLINE_AFTER_SECONDS", "900"))
+
+HEARTBEAT_FIELDS = ("device_id", "firmware_version", "battery_level", "sensor_status")
+
+
+class AccessPointHeartbeatBuffer:
+    """In-memory heartbeat state with write-behind persistence to access_points."""
+
+    def __init__(self, session_factory=SessionLocal, flush_interval_seconds: float = FLUSH_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.flush_interval_seconds = flush_interval_seconds
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._hydrated = False
+        self._task: Optional[asyncio.Task] = None
+
+    # --- state management -------------------------------------------------
+
+    @staticmethod
+    def _state_from_point(point: Any) -> Dict[str, Any]:
+        details = point.details or {}
+        last_heartbeat = details.get("last_heartbeat")
+        parsed = None
+        if last_heartbeat:
+            try:
+                parsed = datetime.fromisoformat(last_heartbeat.replace('Z', '+00:00')).replace(tzinfo=None)
+            except (TypeError, ValueError):
+                parsed = None
+        return {
+            "point_id": point.access_point_id,
+            "property_id": point.property_id,
+            "name": point.name,
+            "last_heartbeat": parsed,
+            "isOnline": details.get("isOnline", True),
+            "device_id": details.get("device_id"),
+            "firmware_version": details.get("firmware_version"),
+            "battery_level": details.get("battery_level"),
+            "sensor_status": details.get("sensor_status"),
+        }
+
+    def hydrate(self) -> None:
+        """Load heartbeat state for every access point (once per process)."""
+        if self._hydrated:
+            return
+        db = self.session_factory()
+        try:
+            points = db.query(
+                AccessPoint.access_point_id,
+                AccessPoint.property_id,
+                AccessPoint.name,
+                AccessPoint.details
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            for point in points:
+                self._state.setdefault(point.access_point_id, self._state_from_point(point))
+            self._hydrated = True
+
+    def observe(self, point: Any) -> None:
+        """Track a created or updated access point without waiting for its first heartbeat."""
+        with self._lock:
+            entry = self._state.get(point.access_point_id)
+            if entry is None:
+                self._state[point.access_point_id] = self._state_from_point(point)
+            else:
+                entry["name"] = point.name
+                entry["property_id"] = point.property_id
+
+    def discard(self, point_id: str) -> None:
+        with self._lock:
+            self._state.pop(point_id, None)
+            self._dirty.discard(point_id)
+
+    def _load_point(self, point_id: str) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            point = db.query(
+                AccessPoint.access_point_id,
+                AccessPoint.property_id,
+                AccessPoint.name,
+                AccessPoint.details
+            ).filter(AccessPoint.access_point_id == point_id).first()
+        finally:
+            db.close()
+        if not point:
+            return None
+        entry = self._state_from_point(point)
+        with self._lock:
+            return self._state.setdefault(point_id, entry)
+
+    # --- ingest -----------------------------------------------------------
+
+    def record(
+        self,
+        point_id: str,
+        device_id: Optional[str] = None,
+        firmware_version: Optional[str] = None,
+        battery_level: Optional[int] = None,
+        sensor_status: Optional[str] = None,
+        now: Optional[datetime] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Record a heartbeat in memory. Returns None if the access point does not exist.
+
+        Only the first heartbeat after a point was offline touches the database.
+        """
+        now = now or datetime.utcnow()
+        entry = self._state.get(point_id) or self._load_point(point_id)
+        if entry is None:
+            return None
+        with self._lock:
+            came_online = not entry["isOnline"] or self._is_stale(entry, now)
+            entry["last_heartbeat"] = now
+            entry["isOnline"] = True
+            for field, value in zip(HEARTBEAT_FIELDS, (device_id, firmware_version, battery_level, sensor_status)):
+                if value is not None and value != "":
+                    entry[field] = value
+            self._dirty.add(point_id)
+        if came_online:
+            logger.info(f"Access point {point_id} came online")
+            self.flush([point_id])
+        return entry
+
+    @staticmethod
+    def _is_stale(entry: Dict[str, Any], now: datetime) -> bool:
+        last_heartbeat = entry["last_heartbeat"]
+        return last_heartbeat is not None and (now - last_heartbeat).total_seconds() >= OFFLINE_AFTER_SECONDS
+
+    def mark_stale_offline(self, now: Optional[datetime] = None) -> List[str]:
+        """Flip points that stopped reporting to offline and persist the change immediately."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            went_offline = [
+                point_id for point_id, entry in self._state.items()
+                if entry["isOnline"] and self._is_stale(entry, now)
+            ]
+            for point_id in went_offline:
+                self._state[point_id]["isOnline"] = False
+                self._dirty.add(point_id)
+        if went_offline:
+            logger.warning(f"Access points went offline: {', '.join(went_offline)}")
+            self.flush(went_offline)
+        return went_offline
+
+    # --- persistence ------------------------------------------------------
+
+    def flush(self, point_ids: Optional[Iterable[str]] = None) -> int:
+        """Write dirty heartbeat state to the database in one bulk UPDATE."""
+        with self._lock:
+            if point_ids is None:
+                batch_ids = list(self._dirty)
+            else:
+                batch_ids = [point_id for point_id in point_ids if point_id in self._dirty]
+            self._dirty.difference_update(batch_ids)
+            snapshot = {point_id: dict(self._state[point_id]) for point_id in batch_ids if point_id in self._state}
+        if not snapshot:
+            return 0
+
+        db = self.session_factory()
+        try:
+            # details is shared with other writers, so merge into the current value
+            current = dict(db.query(AccessPoint.access_point_id, AccessPoint.details).filter(
+                AccessPoint.access_point_id.in_(list(snapshot))
+            ).all())
+            mappings = []
+            for point_id, entry in snapshot.items():
+                if point_id not in current:
+                    continue
+                details = dict(current[point_id] or {})
+                details["last_heartbeat"] = entry["last_heartbeat"].isoformat() if entry["last_heartbeat"] else None
+                details["isOnline"] = entry["isOnline"]
+                for field in HEARTBEAT_FIELDS:
+                    if entry[field] is not None:
+                        details[field] = entry[field]
+                mapping = {
+                    "access_point_id": point_id,
+                    "details": details,
+                    "is_online": entry["isOnline"],
+                }
+                if entry["battery_level"] is not None:
+                    mapping["battery_level"] = entry["battery_level"]
+                if entry["sensor_status"] is not None:
+                    mapping["sensor_status"] = entry["sensor_status"]
+                mappings.append(mapping)
+            if mappings:
+                db.bulk_update_mappings(AccessPoint, mappings)
+                db.commit()
+            return len(mappings)
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self._dirty.update(snapshot)
+            logger.error(f"Error flushing access point heartbeats: {e}")
+            return 0
+        finally:
+            db.close()
+
+    # --- reads ------------------------------------------------------------
+
+    def get_health(self, property_id: Optional[str] = None, now: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """Health view for all access points, served from memory."""
+        self.hydrate()
+        now = now or datetime.utcnow()
+        with self._lock:
+            entries = [
+                dict(entry) for entry in self._state.values()
+                if property_id is None or entry["property_id"] == property_id
+            ]
+        health_data = {}
+        for entry in entries:
+            last_heartbeat = entry["last_heartbeat"]
+            if last_heartbeat:
+                connection_status = "offline" if self._is_stale(entry, now) else "online"
+            else:
+                connection_status = "online" if entry["isOnline"] else "offline"
+            health_data[entry["point_id"]] = {
+                "point_id": entry["point_id"],
+                "name": entry["name"],
+                "last_heartbeat": last_heartbeat.isoformat() if last_heartbeat else None,
+                "connection_status": connection_status,
+                "isOnline": entry["isOnline"],
+                "device_id": entry["device_id"],
+                "firmware_version": entry["firmware_version"],
+                "battery_level": entry["battery_level"]
+            }
+        return health_data
+
+    # --- background loop --------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                await asyncio.to_thread(self.mark_stale_offline)
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Heartbeat flush loop error: {e}")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+
+_buffer: Optional[AccessPointHeartbeatBuffer] = None
+
+
+def get_heartbeat_buffer() -> AccessPointHeartbeatBuffer:
+    global _buffer
+    if _buffer is None:
+        _buffer = AccessPointHeartbeatBuffer()
+    return _buffer
@@ -0,0 +1,488 @@
+"""
+Agent Location Buffer
+Write-behind ingestion for mobile agent GPS fixes.
+
+Fixes are accepted in batches and kept in memory: the current AgentStatus of every agent
+is updated in place and served from memory, and history rows are written to
+agent_locations in one bulk INSERT every FLUSH_INTERVAL_SECONDS or as soon as
+FLUSH_MAX_ROWS are pending.
+
+Until a flush commits, accepted fixes live only in memory, so every batch is first
+appended to a JSON-lines segment in LOG_DIR. A flush seals the current segment and deletes
+it once its rows are committed; on startup, segments left behind by a crash are replayed
+(rows already committed are skipped by id). Like the access point heartbeat buffer, state
+is per-process: run a single API worker for the location routes.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+from pathlib import Path
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from database import SessionLocal
+from models import AgentLocation, AgentStatus
+from services.agent_spatial_index import AgentSpatialIndex
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("AGENT_LOCATION_FLUSH_INTERVAL_SECONDS", "5"))
+FLUSH_MAX_ROWS = int(os.getenv("AGENT_LOCATION_FLUSH_MAX_ROWS", "500"))
+LOG_DIR = Path(os.getenv(
+    "AGENT_LOCATION_LOG_DIR", os.path.join(os.path.dirname(__file__), "..", "storage", "agent_locations")
+)).resolve()
+# fsync every appended batch; off trades the last few seconds on power loss for throughput
+LOG_FSYNC = os.getenv("AGENT_LOCATION_LOG_FSYNC", "true").lower() == "true"
+MAX_FIXES_PER_BATCH = 1000
+# Column sizes of agent_id and app_version
+AGENT_ID_MAX_LENGTH = 36
+APP_VERSION_MAX_LENGTH = 50
+# Errors caused by the rows themselves; writing the same rows again can never succeed
+ROW_ERRORS = (DataError, IntegrityError)
+
+FIX_FIELDS = ("accuracy", "altitude", "speed", "heading")
+
+
+def as_utc(value: datetime) -> datetime:
+    """SQLite hands back naive datetimes; treat them as UTC."""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def parse_fix(fix: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate one GPS fix into a location row (without agent_id and id)."""
+    try:
+        latitude = float(fix["latitude"])
+        longitude = float(fix["longitude"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("latitude and longitude required")
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError("latitude/longitude out of range")
+    row = {"latitude": latitude, "longitude": longitude}
+    for field in FIX_FIELDS:
+        if fix.get(field) is not None:
+            try:
+                row[field] = float(fix[field])
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} must be a number")
+    timestamp = fix.get("timestamp")
+    if timestamp is not None and not isinstance(timestamp, datetime):
+        try:
+            timestamp = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError("timestamp must be an ISO 8601 timestamp")
+    row["timestamp"] = as_utc(timestamp) if timestamp else datetime.now(timezone.utc)
+    return row
+
+
+def parse_battery_level(value: Any) -> Optional[int]:
+    """Validate a reported battery level (percent)."""
+    if value is None:
+        return None
+    try:
+        level = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("battery_level must be an integer")
+    if not 0 <= level <= 100:
+        raise ValueError("battery_level must be between 0 and 100")
+    return level
+
+
+class AgentLocationBuffer:
+    """In-memory agent status plus write-behind location history with an append log."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        flush_interval_seconds: float = FLUSH_INTERVAL_SECONDS,
+        max_pending_rows: int = FLUSH_MAX_ROWS,
+        log_dir: Path = LOG_DIR,
+        fsync: bool = LOG_FSYNC,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_pending_rows = max_pending_rows
+        self.log_dir = Path(log_dir)
+        self.fsync = fsync
+        self._status: Dict[str, Dict[str, Any]] = {}
+        # Current positions, kept in step with _status for nearest-agent queries
+        self.spatial_index = AgentSpatialIndex()
+        self._dirty: set = set()
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._hydrated = False
+        self._task: Optional[asyncio.Task] = None
+        self._log = None
+        self._log_path: Optional[Path] = None
+        # Sealed segments whose rows are pending or being flushed
+        self._sealed: List[Path] = []
+        self._segment = self._last_segment_number()
+
+    # --- append log -------------------------------------------------------
+
+    def _segments(self) -> List[Path]:
+        if not self.log_dir.is_dir():
+            return []
+        return sorted(self.log_dir.glob("segment-*.jsonl"), key=lambda path: int(path.stem.split("-")[1]))
+
+    def _last_segment_number(self) -> int:
+        segments = self._segments()
+        return int(segments[-1].stem.split("-")[1]) if segments else 0
+
+    def _append_log(self, rows: List[Dict[str, Any]]) -> None:
+        """Append rows to the current segment; caller holds _lock."""
+        if self._log is None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            self._segment += 1
+            self._log_path = self.log_dir / f"segment-{self._segment}.jsonl"
+            self._log = open(self._log_path, "a", encoding="utf-8")
+        self._log.write("".join(
+            json.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n" for row in rows
+        ))
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    def _seal_log(self) -> List[Path]:
+        """Close the current segment; caller holds _lock. Returns every unflushed segment."""
+        if self._log is not None:
+            self._log.close()
+            self._sealed.append(self._log_path)
+            self._log = None
+            self._log_path = None
+        sealed, self._sealed = self._sealed, []
+        return sealed
+
+    def recover(self) -> int:
+        """Replay segments left by a previous process; returns the rows re-queued."""
+        with self._lock:
+            known = set(self._sealed) | ({self._log_path} if self._log_path else set())
+        segments = [path for path in self._segments() if path not in known]
+        if not segments:
+            return 0
+        rows = []
+        for path in segments:
+            with open(path, encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        row = json.loads(line)
+                        row["timestamp"] = as_utc(datetime.fromisoformat(row["timestamp"]))
+                    except (ValueError, KeyError):
+                        # A torn final line from the crash
+                        continue
+                    rows.append(row)
+        db = self.session_factory()
+        try:
+            committed = set()
+            ids = [row["id"] for row in rows]
+            for start in range(0, len(ids), 500):
+                committed.update(
+                    location_id for (location_id,) in db.query(AgentLocation.id).filter(
+                        AgentLocation.id.in_(ids[start:start + 500])
+                    )
+                )
+        finally:
+            db.close()
+        rows = [row for row in rows if row["id"] not in committed]
+        with self._lock:
+            self._sealed.extend(segments)
+        for row in rows:
+            self._touch_status(row["agent_id"], row)
+        with self._lock:
+            self._pending.extend(rows)
+        logger.info(f"Recovered {len(rows)} buffered agent locations from {len(segments)} log segments")
+        self.flush()
+        return len(rows)
+
+    # --- state management -------------------------------------------------
+
+    @staticmethod
+    def _state_from_status(row: Any) -> Dict[str, Any]:
+        return {
+            "agent_id": row.agent_id,
+            "last_seen": as_utc(row.last_seen) if row.last_seen else None,
+            "current_latitude": row.current_latitude,
+            "current_longitude": row.current_longitude,
+            "status": row.status,
+            "battery_level": row.battery_level,
+            "app_version": row.app_version,
+        }
+
+    def hydrate(self) -> None:
+        """Load every agent's status (once per process)."""
+        if self._hydrated:
+            return
+        db = self.session_factory()
+        try:
+            rows = db.query(AgentStatus).all()
+            states = [self._state_from_status(row) for row in rows]
+        finally:
+            db.close()
+        with self._lock:
+            for state in states:
+                self._index(self._status.setdefault(state["agent_id"], state))
+            self._hydrated = True
+
+    def _load_status(self, agent_id: str) -> Dict[str, Any]:
+        db = self.session_factory()
+        try:
+            row = db.query(AgentStatus).filter(AgentStatus.agent_id == agent_id).first()
+            state = self._state_from_status(row) if row else {
+                "agent_id": agent_id, "last_seen": None, "current_latitude": None, "current_longitude": None,
+                "status": "active", "battery_level": None, "app_version": None,
+            }
+        finally:
+            db.close()
+        with self._lock:
+            state = self._status.setdefault(agent_id, state)
+            self._index(state)
+            return state
+
+    def _touch_status(self, agent_id: str, latest: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+        state = self._status.get(agent_id) or self._load_status(agent_id)
+        with self._lock:
+            # Replayed (offline) fixes older than what the agent already reported keep the status
+            if state["last_seen"] is None or latest["timestamp"] >= state["last_seen"]:
+                state["last_seen"] = latest["timestamp"]
+                state["current_latitude"] = latest["latitude"]
+                state["current_longitude"] = latest["longitude"]
+                state["status"] = "active"
+            for field, value in extra.items():
+                if value is not None:
+                    state[field] = value
+            self._index(state)
+            self._dirty.add(agent_id)
+            return dict(state)
+
+    def _index(self, state: Dict[str, Any]) -> None:
+        self.spatial_index.update(
+            state["agent_id"], state["current_latitude"], state["current_longitude"],
+            status=state["status"], last_seen=state["last_seen"],
+        )
+
+    # --- ingest -----------------------------------------------------------
+
+    def record(
+        self,
+        agent_id: str,
+        fixes: Iterable[Dict[str, Any]],
+        battery_level: Optional[int] = None,
+        app_version: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Accept a batch of fixes for one agent; raises ValueError if any fix or field is invalid."""
+        if not agent_id or len(agent_id) > AGENT_ID_MAX_LENGTH:
+            raise ValueError(f"agent_id must be 1-{AGENT_ID_MAX_LENGTH} characters")
+        battery_level = parse_battery_level(battery_level)
+        if app_version is not None:
+            app_version = str(app_version)
+            if len(app_version) > APP_VERSION_MAX_LENGTH:
+                raise ValueError(f"app_version must be at most {APP_VERSION_MAX_LENGTH} characters")
+        rows = [parse_fix(fix) for fix in fixes]
+        if len(rows) > MAX_FIXES_PER_BATCH:
+            raise ValueError(f"At most {MAX_FIXES_PER_BATCH} fixes per batch")
+        if not rows:
+            raise ValueError("At least one fix is required")
+        for row in rows:
+            row["id"] = str(uuid.uuid4())
+            row["agent_id"] = agent_id
+        with self._lock:
+            self._append_log(rows)
+            self._pending.extend(rows)
+            pending = len(self._pending)
+        state = self._touch_status(
+            agent_id, max(rows, key=lambda row: row["timestamp"]),
+            battery_level=battery_level, app_version=app_version
+        )
+        if pending >= self.max_pending_rows:
+            self.flush()
+        return {"accepted": len(rows), "status": state}
+
+    # --- persistence ------------------------------------------------------
+
+    def flush(self) -> int:
+        """Bulk-insert pending history rows and write dirty agent statuses."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                agent_ids = list(self._dirty)
+                self._dirty.clear()
+                statuses = {agent_id: dict(self._status[agent_id]) for agent_id in agent_ids if agent_id in self._status}
+                sealed = self._seal_log()
+            if rows or statuses:
+                retry_rows, retry_statuses = self._write_isolating(rows, statuses)
+                if retry_rows or retry_statuses:
+                    with self._lock:
+                        self._pending[:0] = retry_rows
+                        self._dirty.update(retry_statuses)
+                        self._sealed = sealed + self._sealed
+                    return len(rows) - len(retry_rows)
+
+        # Nothing in these segments is pending any more
+        for path in sealed:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        return len(rows)
+
+    def _write_isolating(
+        self, rows: List[Dict[str, Any]], statuses: Dict[str, Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """
+        Write a flush; returns the rows and statuses to retry later. When the database
+        rejects the batch because of its data, rows and statuses are written one at a time
+        and the ones it rejects are dropped, so one bad row cannot hold back the rest.
+        """
+        try:
+            self._commit(rows, statuses)
+            return [], {}
+        except ROW_ERRORS as e:
+            logger.warning(f"Agent location flush rejected, writing rows one at a time: {e}")
+        except Exception as e:
+            logger.error(f"Error flushing agent locations: {e}")
+            return rows, statuses
+        retry_rows = [
+            row for row in rows
+            if self._write_alone([row], {}, f"location {row['id']} of agent {row['agent_id']}")
+        ]
+        retry_statuses = {
+            agent_id: state for agent_id, state in statuses.items()
+            if self._write_alone([], {agent_id: state}, f"status of agent {agent_id}")
+        }
+        return retry_rows, retry_statuses
+
+    def _write_alone(self, rows: List[Dict[str, Any]], statuses: Dict[str, Dict[str, Any]], label: str) -> bool:
+        """Write one row or status on its own; True if it should be retried later."""
+        try:
+            self._commit(rows, statuses)
+        except ROW_ERRORS as e:
+            logger.error(f"Dropping agent {label} rejected by the database: {e}")
+        except Exception as e:
+            logger.error(f"Error flushing agent {label}: {e}")
+            return True
+        return False
+
+    def _commit(self, rows: List[Dict[str, Any]], statuses: Dict[str, Dict[str, Any]]) -> None:
+        """Insert rows and upsert statuses in one transaction; rolls back and re-raises on error."""
+        db = self.session_factory()
+        try:
+            if rows:
+                db.bulk_insert_mappings(AgentLocation, rows)
+            if statuses:
+                existing = dict(db.query(AgentStatus.agent_id, AgentStatus.id).filter(
+                    AgentStatus.agent_id.in_(list(statuses))
+                ).all())
+                now = datetime.now(timezone.utc)
+                updates, inserts = [], []
+                for agent_id, state in statuses.items():
+                    if state["last_seen"] is None:
+                        continue
+                    mapping = {
+                        "agent_id": agent_id,
+                        "last_seen": state["last_seen"],
+                        "current_latitude": state["current_latitude"],
+                        "current_longitude": state["current_longitude"],
+                        "status": state["status"],
+                        "updated_at": now,
+                    }
+                    for field in ("battery_level", "app_version"):
+                        if state[field] is not None:
+                            mapping[field] = state[field]
+                    if agent_id in existing:
+                        updates.append({**mapping, "id": existing[agent_id]})
+                    else:
+                        inserts.append({**mapping, "id": str(uuid.uuid4())})
+                if updates:
+                    db.bulk_update_mappings(AgentStatus, updates)
+                if inserts:
+                    db.bulk_insert_mappings(AgentStatus, inserts)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # --- reads ------------------------------------------------------------
+
+    def get_status(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        state = self._status.get(agent_id) or self._load_status(agent_id)
+        with self._lock:
+            return dict(state) if state["last_seen"] else None
+
+    def get_all_status(self) -> List[Dict[str, Any]]:
+        """Current status of every agent, served from memory."""
+        self.hydrate()
+        with self._lock:
+            return [dict(state) for state in self._status.values() if state["last_seen"]]
+
+    def nearest_agents(
+        self,
+        latitude: float,
+        longitude: float,
+        k: Optional[int] = None,
+        radius_m: Optional[float] = None,
+        statuses: Optional[Iterable[str]] = None,
+        max_age_seconds: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Status of the agents nearest a point, closest first, each with distance_m."""
+        self.hydrate()
+        matches = self.spatial_index.query(
+            latitude, longitude, k=k, radius_m=radius_m, statuses=statuses, max_age_seconds=max_age_seconds
+        )
+        with self._lock:
+            return [
+                {**self._status[agent_id], "distance_m": round(distance, 1)}
+                for distance, agent_id in matches if agent_id in self._status
+            ]
+
+    def pending_locations(self, agent_id: str, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Accepted fixes of an agent not yet flushed to agent_locations."""
+        with self._lock:
+            return [
+                dict(row) for row in self._pending
+                if row["agent_id"] == agent_id and (since is None or row["timestamp"] > since)
+            ]
+
+    # --- background loop --------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Agent location flush loop error: {e}")
+
+    def start(self) -> None:
+        try:
+            self.recover()
+        except Exception as e:
+            logger.error(f"Agent location log recovery failed: {e}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+
+_buffer: Optional[AgentLocationBuffer] = None
+
+
+def get_location_buffer() -> AgentLocationBuffer:
+    global _buffer
+    if _buffer is None:
+        _buffer = AgentLocationBuffer()
+    return _buffer
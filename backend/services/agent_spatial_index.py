@@ -0,0 +1,182 @@
+"""
+Agent Spatial Index
+In-memory grid index of current agent positions for nearest-responder queries.
+
+Positions are bucketed into fixed lat/lng cells (geohash-style, ~110 m at the default
+size). A moving agent is a dict update plus at most one cell move, so the index can be
+kept current from every ingested fix; k-nearest and within-radius queries only visit the
+rings of cells around the query point until nothing closer can remain, instead of
+measuring every agent.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import math
+import threading
+
+EARTH_RADIUS_M = 6371008.8
+DEFAULT_CELL_DEGREES = 0.001
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def coordinates(location: Any) -> Optional[Tuple[float, float]]:
+    """(lat, lng) from a location dict using lat/latitude and lng/lon/longitude keys."""
+    if not isinstance(location, dict):
+        return None
+    lat = location.get("lat", location.get("latitude"))
+    lng = location.get("lng", location.get("lon", location.get("longitude")))
+    try:
+        return (float(lat), float(lng)) if lat is not None and lng is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _Entry:
+    __slots__ = ("agent_id", "latitude", "longitude", "status", "last_seen", "cell")
+
+    def __init__(self, agent_id: str, latitude: float, longitude: float, status: str, last_seen: Optional[datetime], cell):
+        self.agent_id = agent_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.status = status
+        self.last_seen = last_seen
+        self.cell = cell
+
+
+class AgentSpatialIndex:
+    """Uniform grid of agent positions supporting nearest / within-radius queries."""
+
+    def __init__(self, cell_degrees: float = DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells: Dict[Tuple[int, int], Dict[str, _Entry]] = {}
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def update(
+        self,
+        agent_id: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        status: str = "active",
+        last_seen: Optional[datetime] = None,
+    ) -> None:
+        """Insert or move an agent; an agent without a position is removed."""
+        if latitude is None or longitude is None:
+            self.remove(agent_id)
+            return
+        cell = self._cell(latitude, longitude)
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is None:
+                entry = _Entry(agent_id, latitude, longitude, status, last_seen, cell)
+                self._entries[agent_id] = entry
+            elif entry.cell != cell:
+                self._detach(entry)
+            entry.latitude, entry.longitude, entry.cell = latitude, longitude, cell
+            entry.status, entry.last_seen = status, last_seen
+            self._cells.setdefault(cell, {})[agent_id] = entry
+
+    def remove(self, agent_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(agent_id, None)
+            if entry is not None:
+                self._detach(entry)
+
+    def _detach(self, entry: _Entry) -> None:
+        bucket = self._cells.get(entry.cell)
+        if bucket is not None:
+            bucket.pop(entry.agent_id, None)
+            if not bucket:
+                del self._cells[entry.cell]
+
+    def _ring(self, center: Tuple[int, int], radius: int) -> Iterable[Tuple[int, int]]:
+        """Cells at Chebyshev distance exactly ``radius`` from center."""
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for dc in range(-radius, radius + 1):
+            yield row - radius, col + dc
+            yield row + radius, col + dc
+        for dr in range(-radius + 1, radius):
+            yield row + dr, col - radius
+            yield row + dr, col + radius
+
+    def _ring_clearance_m(self, latitude: float, rings: int) -> float:
+        """Lower bound on the distance to any cell outside the first ``rings`` rings."""
+        # Longitude cells shrink with latitude; use the narrower side (and the pole-ward
+        # edge of the searched band) so the bound never over-estimates
+        edge = min(89.9, abs(latitude) + rings * self.cell_degrees)
+        return rings * self.cell_degrees * METRES_PER_DEGREE * math.cos(math.radians(edge))
+
+    def query(
+        self,
+        latitude: float,
+        longitude: float,
+        k: Optional[int] = None,
+        radius_m: Optional[float] = None,
+        statuses: Optional[Iterable[str]] = None,
+        max_age_seconds: Optional[float] = None,
+        now: Optional[datetime] = None,
+    ) -> List[Tuple[float, str]]:
+        """
+        (distance_m, agent_id) of the nearest agents, closest first. At least one of k and
+        radius_m bounds the search; statuses and max_age_seconds filter candidates.
+        """
+        if k is None and radius_m is None:
+            raise ValueError("k or radius_m is required")
+        if k is not None and k <= 0:
+            return []
+        allowed = set(statuses) if statuses else None
+        cutoff = None
+        if max_age_seconds is not None:
+            cutoff = (now or datetime.now(timezone.utc)) - timedelta(seconds=max_age_seconds)
+        center = self._cell(latitude, longitude)
+        found: List[Tuple[float, str]] = []
+
+        def visit(entries: Iterable[_Entry]) -> None:
+            for entry in entries:
+                if allowed is not None and entry.status not in allowed:
+                    continue
+                if cutoff is not None and (entry.last_seen is None or entry.last_seen < cutoff):
+                    continue
+                distance = haversine_m(latitude, longitude, entry.latitude, entry.longitude)
+                if radius_m is None or distance <= radius_m:
+                    found.append((distance, entry.agent_id))
+
+        with self._lock:
+            rings = 0
+            while self._entries:
+                if (2 * rings + 1) ** 2 > len(self._entries):
+                    # Far from everyone (or few agents): probing empty cells would cost
+                    # more than measuring every agent once
+                    found.clear()
+                    visit(self._entries.values())
+                    break
+                for cell in self._ring(center, rings):
+                    bucket = self._cells.get(cell)
+                    if bucket:
+                        visit(bucket.values())
+                # Anything not yet visited is at least this far away
+                clearance = self._ring_clearance_m(latitude, rings)
+                if radius_m is not None and clearance > radius_m:
+                    break
+                if k is not None and len(found) >= k and sorted(found)[k - 1][0] <= clearance:
+                    break
+                rings += 1
+        found.sort()
+        return found[:k] if k is not None else found
@@ -211,25 +211,22 @@ class PredictionService:
         """Apply anomaly detection algorithms."""
         if not data:
             return []
-        # Simple statistical anomaly detection
-        values = [d['value'] for d in data]
-        mean_val = np.mean(values)
-        std_val = np.std(values)
+        # Simple statistical anomaly detection, one vectorized pass over the values
+        values = np.fromiter((d['value'] for d in data), dtype=float, count=len(data))
+        std_val = values.std()
         if std_val == 0 or np.isnan(std_val):
             return []
         
-        anomalies = []
-        for i, point in enumerate(data):
-            z_score = abs((point['value'] - mean_val) / std_val)
-            if z_score > 2.5:  # Threshold for anomaly
-                anomalies.append({
-                    'timestamp': point['timestamp'],
-                    'value': point['value'],
-                    'z_score': z_score,
-                    'anomaly_type': 'statistical_outlier'
-                })
-        
-        return anomalies
+        z_scores = np.abs(values - values.mean()) / std_val
+        return [
+            {
+                'timestamp': data[i]['timestamp'],
+                'value': data[i]['value'],
+                'z_score': float(z_scores[i]),
+                'anomaly_type': 'statistical_outlier'
+            }
+            for i in np.flatnonzero(z_scores > 2.5)  # Threshold for anomaly
+        ]
     
     def _get_guest_history(self, guest_id: str, property_id: str) -> List[Dict[str, Any]]:
         """Get guest historical data."""
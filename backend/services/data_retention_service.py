@@ -0,0 +1,457 @@
+"""
+Data Retention Service
+Retention, rollup and compaction for high-volume tables.
+
+Each policy names a table, its timestamp column, how long raw rows are kept and which
+columns identify a series. A run, per policy:
+  1. takes raw rows older than the cutoff in chunks of RETENTION_CHUNK_SIZE rows,
+  2. adds each chunk to its hourly and daily DataRollup buckets and deletes it in the
+     same transaction, committing between chunks so no statement holds a long lock (IoT
+     reading chunks that lie entirely before the cutoff are rolled up and dropped whole
+     instead),
+  3. records rows purged, rows rolled up and bytes reclaimed.
+
+Cutoffs are aligned to UTC midnight so hourly and daily buckets are complete when first
+written. Rows that arrive late for an already rolled-up bucket (offline-synced agent
+locations, say) are added to it on the next run; since a row is rolled up and deleted
+together, an interrupted run never counts the same row twice.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import Integer, Table, cast, delete, func, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import AccessControlEvent, AgentLocation, DataRollup, ParkingOccupancyEvent, SystemLog
+from services.iot_timeseries_store import (
+    READINGS_TABLE, chunk_bounds, get_sensor_reading_store, time_bucket, to_utc_naive
+)
+
+logger = logging.getLogger(__name__)
+
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", "5000"))
+# Pause between delete chunks so other writers get the database
+RETENTION_CHUNK_PAUSE_SECONDS = float(os.getenv("RETENTION_CHUNK_PAUSE_SECONDS", "0.05"))
+ROLLUP_INSERT_BATCH = 5000
+HOUR_SECONDS = 3600
+
+
+def _days(name: str, default: int) -> int:
+    return int(os.getenv(f"RETENTION_{name.upper()}_DAYS", str(default)))
+
+
+class RetentionPolicy:
+    """How long raw rows of one table are kept and how they are summarized first."""
+
+    def __init__(
+        self,
+        name: str,
+        table: Table,
+        timestamp_column: str,
+        retention_days: int,
+        dimensions: Sequence[str] = (),
+        value: Any = None,
+        rollup: bool = True,
+        where: Any = None,
+    ):
+        self.name = name
+        self.table = table
+        self.timestamp_column = timestamp_column
+        self.retention_days = retention_days
+        self.dimensions = tuple(dimensions)
+        self.value = value
+        self.rollup = rollup
+        self.where = where
+
+    def value_expression(self, table: Table) -> Any:
+        if self.value is None:
+            return None
+        return self.value(table) if callable(self.value) else table.c[self.value]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "table": self.table.name,
+            "retention_days": self.retention_days,
+            "dimensions": list(self.dimensions),
+            "rollup": self.rollup,
+        }
+
+
+def default_policies() -> List[RetentionPolicy]:
+    return [
+        RetentionPolicy(
+            "iot_sensor_readings", READINGS_TABLE, "ts", _days("iot_sensor_readings", 90),
+            dimensions=("sensor_key",), value="value"
+        ),
+        RetentionPolicy(
+            "access_control_events", AccessControlEvent.__table__, "timestamp", _days("access_control_events", 365),
+            dimensions=("property_id", "access_point", "event_type", "is_authorized")
+        ),
+        RetentionPolicy(
+            "agent_locations", AgentLocation.__table__, "timestamp", _days("agent_locations", 7),
+            dimensions=("agent_id",), value="speed"
+        ),
+        RetentionPolicy(
+            # value sum = number of "occupied" events in the bucket
+            "parking_occupancy_events", ParkingOccupancyEvent.__table__, "timestamp", _days("parking_occupancy_events", 90),
+            dimensions=("space_id",), value=lambda table: cast(table.c.value, Integer)
+        ),
+        RetentionPolicy(
+            "system_logs", SystemLog.__table__, "timestamp", _days("system_logs", 90),
+            dimensions=("service", "log_level")
+        ),
+        RetentionPolicy(
+            "hourly_rollups", DataRollup.__table__, "bucket_start", _days("hourly_rollups", 730),
+            rollup=False, where=DataRollup.__table__.c.granularity == "hour"
+        ),
+    ]
+
+
+def purge_before(
+    db: Session,
+    table: Table,
+    timestamp_column: Any,
+    cutoff: datetime,
+    chunk_size: int = RETENTION_CHUNK_SIZE,
+    where: Any = None,
+    pause_seconds: float = 0.0,
+) -> int:
+    """Delete rows older than ``cutoff`` in chunks, committing after each one."""
+    key_columns = list(table.primary_key.columns)
+    deleted = 0
+    while True:
+        keys = select(*key_columns).where(timestamp_column < cutoff)
+        if where is not None:
+            keys = keys.where(where)
+        keys = keys.limit(chunk_size)
+        if len(key_columns) == 1:
+            stmt = delete(table).where(key_columns[0].in_(keys.scalar_subquery()))
+        else:
+            stmt = delete(table).where(tuple_(*key_columns).in_(keys))
+        count = db.execute(stmt).rowcount or 0
+        db.commit()
+        deleted += count
+        if count < chunk_size:
+            return deleted
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+
+def _floor_day(ts: datetime) -> datetime:
+    return datetime(ts.year, ts.month, ts.day)
+
+
+def _merge_bucket(bucket: Dict[str, Any], count: int, value_sum: Any, value_min: Any, value_max: Any) -> None:
+    """Add one aggregate into a rollup bucket."""
+    bucket["count"] += count
+    if value_sum is not None:
+        bucket["value_sum"] = (bucket["value_sum"] or 0.0) + value_sum
+        bucket["value_min"] = value_min if bucket["value_min"] is None else min(bucket["value_min"], value_min)
+        bucket["value_max"] = value_max if bucket["value_max"] is None else max(bucket["value_max"], value_max)
+
+
+def _json_safe(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return getattr(value, "value", str(value))
+
+
+class DataRetentionService:
+    """Runs retention policies on a schedule and keeps per-policy metrics."""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        policies: Optional[List[RetentionPolicy]] = None,
+        chunk_size: int = RETENTION_CHUNK_SIZE,
+        interval_hours: float = RETENTION_INTERVAL_HOURS,
+        pause_seconds: float = RETENTION_CHUNK_PAUSE_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.policies = policies if policies is not None else default_policies()
+        self.chunk_size = max(1, chunk_size)
+        self.interval_hours = interval_hours
+        self.pause_seconds = pause_seconds
+        self.metrics: Dict[str, Dict[str, Any]] = {
+            policy.name: {
+                "runs": 0,
+                "rows_purged": 0,
+                "rows_rolled_up": 0,
+                "rollup_rows_written": 0,
+                "chunks_dropped": 0,
+                "bytes_reclaimed": 0,
+                "last_run_at": None,
+                "last_cutoff": None,
+                "last_duration_ms": None,
+                "last_error": None,
+            }
+            for policy in self.policies
+        }
+        self._run_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- running ----------------------------------------------------------
+
+    def run(self, policy_names: Optional[Iterable[str]] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Run the selected (default: all) policies once and return what each one did."""
+        now = now or datetime.utcnow()
+        selected = set(policy_names) if policy_names is not None else None
+        unknown = (selected or set()) - {policy.name for policy in self.policies}
+        if unknown:
+            raise ValueError(f"Unknown retention policies: {', '.join(sorted(unknown))}")
+        report = {}
+        with self._run_lock:
+            for policy in self.policies:
+                if selected is not None and policy.name not in selected:
+                    continue
+                report[policy.name] = self._run_policy(policy, now)
+        return report
+
+    def _run_policy(self, policy: RetentionPolicy, now: datetime) -> Dict[str, Any]:
+        cutoff = _floor_day(now - timedelta(days=policy.retention_days))
+        started = time.perf_counter()
+        result = {"cutoff": cutoff.isoformat(), "rows_purged": 0, "rows_rolled_up": 0,
+                  "rollup_rows_written": 0, "chunks_dropped": 0, "bytes_reclaimed": 0}
+        metrics = self.metrics[policy.name]
+        db = self.session_factory()
+        try:
+            used_before = self._used_bytes(db, policy)
+            if policy.table is READINGS_TABLE:
+                self._run_readings_policy(db, policy, cutoff, result)
+            elif policy.rollup:
+                self._rollup_and_purge(db, policy, policy.table, cutoff, result)
+            else:
+                result["rows_purged"] += purge_before(
+                    db, policy.table, policy.table.c[policy.timestamp_column], cutoff,
+                    self.chunk_size, policy.where, self.pause_seconds
+                )
+            used_after = self._used_bytes(db, policy)
+            if used_before is not None and used_after is not None:
+                result["bytes_reclaimed"] = max(0, used_before - used_after)
+            metrics["last_error"] = None
+        except Exception as e:
+            db.rollback()
+            metrics["last_error"] = str(e)
+            result["error"] = str(e)
+            logger.error(f"Retention policy {policy.name} failed: {e}")
+        finally:
+            db.close()
+
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        metrics["runs"] += 1
+        for field in ("rows_purged", "rows_rolled_up", "rollup_rows_written", "chunks_dropped", "bytes_reclaimed"):
+            metrics[field] += result[field]
+        metrics["last_run_at"] = now.isoformat()
+        metrics["last_cutoff"] = result["cutoff"]
+        metrics["last_duration_ms"] = result["duration_ms"]
+        if result["rows_purged"]:
+            logger.info(
+                f"Retention {policy.name}: purged {result['rows_purged']} rows older than {result['cutoff']}, "
+                f"rolled up {result['rows_rolled_up']}, reclaimed {result['bytes_reclaimed']} bytes"
+            )
+        return result
+
+    def _run_readings_policy(self, db: Session, policy: RetentionPolicy, cutoff: datetime, result: Dict[str, Any]) -> None:
+        """IoT readings: drop whole monthly chunks past the cutoff, chunk-delete the rest."""
+        store = get_sensor_reading_store()
+        dialect = db.get_bind().dialect.name
+        if dialect not in ("sqlite", "postgresql"):
+            self._rollup_and_purge(db, policy, READINGS_TABLE, cutoff, result)
+            return
+        for name in store.existing_chunks(db):
+            chunk_start, chunk_end = chunk_bounds(name)
+            if chunk_start >= cutoff:
+                break
+            table = store._chunk_table(name)
+            if chunk_end <= cutoff:
+                rows = db.execute(select(func.count()).select_from(table)).scalar() or 0
+                # Rollup and drop commit together
+                self._rollup(db, policy, table, [], result)
+                db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                db.commit()
+                store.forget_chunk(name)
+                result["rows_purged"] += rows
+                result["chunks_dropped"] += 1
+            else:
+                self._rollup_and_purge(db, policy, table, cutoff, result)
+
+    # --- rollups ----------------------------------------------------------
+
+    def _rollup_and_purge(
+        self, db: Session, policy: RetentionPolicy, table: Table, cutoff: datetime, result: Dict[str, Any]
+    ) -> None:
+        """Roll up and delete raw rows older than ``cutoff`` chunk by chunk, one commit per chunk."""
+        ts_column = table.c[policy.timestamp_column]
+        key_columns = list(table.primary_key.columns)
+        key = key_columns[0] if len(key_columns) == 1 else tuple_(*key_columns)
+        while True:
+            query = select(*key_columns).where(ts_column < cutoff)
+            if policy.where is not None:
+                query = query.where(policy.where)
+            keys = [
+                row[0] if len(key_columns) == 1 else tuple(row)
+                for row in db.execute(query.limit(self.chunk_size))
+            ]
+            if not keys:
+                return
+            in_chunk = key.in_(keys)
+            self._rollup(db, policy, table, [in_chunk], result)
+            result["rows_purged"] += db.execute(delete(table).where(in_chunk)).rowcount or 0
+            db.commit()
+            if len(keys) < self.chunk_size:
+                return
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+
+    def _rollup(
+        self, db: Session, policy: RetentionPolicy, table: Table, conditions: List[Any], result: Dict[str, Any]
+    ) -> None:
+        """Add raw rows matching ``conditions`` to their hourly and daily rollups; the caller commits."""
+        ts_column = table.c[policy.timestamp_column]
+        hour = time_bucket(db, ts_column, HOUR_SECONDS)
+        dimension_columns = [table.c[name] for name in policy.dimensions]
+        value = policy.value_expression(table)
+        aggregates = [func.count()]
+        if value is not None:
+            aggregates += [func.sum(value), func.min(value), func.max(value)]
+        query = select(*dimension_columns, hour, *aggregates)
+        for condition in conditions:
+            query = query.where(condition)
+        if policy.where is not None:
+            query = query.where(policy.where)
+        rows = db.execute(query.group_by(*dimension_columns, hour)).all()
+        if not rows:
+            return
+
+        width = len(dimension_columns)
+        buckets: Dict[Tuple[str, datetime, str], Dict[str, Any]] = {}
+        rolled_up = 0
+        for row in rows:
+            dimensions = {name: _json_safe(v) for name, v in zip(policy.dimensions, row[:width])}
+            dimension_key = "|".join("" if v is None else str(v) for v in dimensions.values())[:255]
+            bucket_start = datetime.utcfromtimestamp(int(row[width]) * HOUR_SECONDS)
+            count = row[width + 1]
+            aggregate = (count, *(row[width + 2:width + 5] if value is not None else (None, None, None)))
+            rolled_up += count
+            for granularity, start in (("hour", bucket_start), ("day", _floor_day(bucket_start))):
+                bucket = buckets.get((granularity, start, dimension_key))
+                if bucket is None:
+                    buckets[(granularity, start, dimension_key)] = {
+                        "source": policy.name, "granularity": granularity, "bucket_start": start,
+                        "dimension_key": dimension_key, "dimensions": dimensions, "count": count,
+                        "value_sum": aggregate[1], "value_min": aggregate[2], "value_max": aggregate[3],
+                    }
+                else:
+                    _merge_bucket(bucket, *aggregate)
+
+        result["rows_rolled_up"] += rolled_up
+        result["rollup_rows_written"] += len(buckets)
+        self._upsert_rollups(db, policy.name, buckets)
+
+    @staticmethod
+    def _upsert_rollups(db: Session, source: str, buckets: Dict[Tuple[str, datetime, str], Dict[str, Any]]) -> None:
+        """Add buckets to the rollups already stored under uq_data_rollups_bucket, inserting the rest."""
+        rollups = DataRollup.__table__
+        starts = sorted({start for _, start, _ in buckets})
+        updates = []
+        for offset in range(0, len(starts), ROLLUP_INSERT_BATCH):
+            existing = db.execute(
+                select(
+                    rollups.c.rollup_id, rollups.c.granularity, rollups.c.bucket_start, rollups.c.dimension_key,
+                    rollups.c.count, rollups.c.value_sum, rollups.c.value_min, rollups.c.value_max,
+                ).where(rollups.c.source == source, rollups.c.bucket_start.in_(starts[offset:offset + ROLLUP_INSERT_BATCH]))
+            ).all()
+            for row in existing:
+                bucket = buckets.pop((row.granularity, to_utc_naive(row.bucket_start), row.dimension_key), None)
+                if bucket is None:
+                    continue
+                merged = {
+                    "rollup_id": row.rollup_id, "count": row.count,
+                    "value_sum": row.value_sum, "value_min": row.value_min, "value_max": row.value_max,
+                }
+                _merge_bucket(merged, bucket["count"], bucket["value_sum"], bucket["value_min"], bucket["value_max"])
+                updates.append(merged)
+        if updates:
+            db.bulk_update_mappings(DataRollup, updates)
+        inserts = list(buckets.values())
+        for offset in range(0, len(inserts), ROLLUP_INSERT_BATCH):
+            db.execute(rollups.insert(), inserts[offset:offset + ROLLUP_INSERT_BATCH])
+
+    # --- metrics ----------------------------------------------------------
+
+    @staticmethod
+    def _used_bytes(db: Session, policy: RetentionPolicy) -> Optional[int]:
+        """Bytes in use: whole database on SQLite (pages not on the freelist), the
+        policy's relations on PostgreSQL."""
+        dialect = db.get_bind().dialect.name
+        if dialect == "sqlite":
+            page_size = db.execute(text("PRAGMA page_size")).scalar()
+            page_count = db.execute(text("PRAGMA page_count")).scalar()
+            freelist = db.execute(text("PRAGMA freelist_count")).scalar()
+            return int(page_size * (page_count - freelist))
+        if dialect == "postgresql":
+            names = [policy.table.name]
+            if policy.table is READINGS_TABLE:
+                names = get_sensor_reading_store().existing_chunks(db)
+            if not names:
+                return 0
+            return int(db.execute(
+                text("SELECT COALESCE(SUM(pg_total_relation_size(c.oid)), 0) FROM pg_class c WHERE c.relname = ANY(:names)"),
+                {"names": names}
+            ).scalar())
+        return None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "interval_hours": self.interval_hours,
+            "chunk_size": self.chunk_size,
+            "running": self._task is not None and not self._task.done(),
+            "policies": [
+                {**policy.to_dict(), "metrics": dict(self.metrics[policy.name])}
+                for policy in self.policies
+            ],
+        }
+
+    # --- background loop --------------------------------------------------
+
+    async def _run_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.run)
+            except Exception as e:
+                logger.error(f"Retention loop error: {e}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    def start(self) -> None:
+        if self.interval_hours <= 0:
+            logger.info("Data retention schedule disabled (RETENTION_INTERVAL_HOURS <= 0)")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_service: Optional[DataRetentionService] = None
+
+
+def get_data_retention_service() -> DataRetentionService:
+    global _service
+    if _service is None:
+        _service = DataRetentionService()
+    return _service
@@ -0,0 +1,263 @@
+"""
+Emergency Dispatch Service
+Pushes emergency-mode commands (lockdown / unlock / restore) to every access point
+controller concurrently through the hardware bridge.
+
+Commands fan out with bounded parallelism, each point's acknowledgement is tracked,
+failed commands are retried with backoff and progress is streamed to dashboards.
+
+Per-point commands do not go through the shared hardware bridge circuit breaker: each
+point's retries are already bounded, and a rack of offline controllers must neither fail
+the rest of a lockdown fast nor open the breaker that locker release depends on.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from datetime import datetime
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv("EMERGENCY_DISPATCH_CONCURRENCY", "64"))
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("EMERGENCY_DISPATCH_MAX_ATTEMPTS", "3"))
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("EMERGENCY_DISPATCH_TIMEOUT_SECONDS", "3"))
+RETRY_BACKOFF_SECONDS = 0.25
+PROGRESS_INTERVAL_SECONDS = 0.25
+MAX_TRACKED_DISPATCHES = 50
+
+
+class HardwareBridgeClient:
+    """Async client for sending access point commands to the hardware bridge."""
+
+    def __init__(
+        self,
+        bridge_url: Optional[str] = None,
+        timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.bridge_url = (bridge_url or os.getenv("HARDWARE_BRIDGE_URL") or "").rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.bridge_url)
+
+    async def __aenter__(self) -> "HardwareBridgeClient":
+        if self.configured:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(max_connections=DEFAULT_CONCURRENCY, max_keepalive_connections=DEFAULT_CONCURRENCY),
+                transport=self.transport,
+            )
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def send_mode(self, point_id: str, mode: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a mode command to one access point. Raises on transport or HTTP errors."""
+        if not self.configured:
+            return {"acknowledged": False, "bridge_status": "not_configured"}
+        if self._client is None:
+            raise RuntimeError("HardwareBridgeClient must be used as an async context manager")
+        endpoint = f"{self.bridge_url}/access-points/{point_id}/mode"
+        response = await self._client.post(endpoint, json={"mode": mode, **payload})
+        response.raise_for_status()
+        data = response.json() if response.content else {}
+        return {"acknowledged": data.get("acknowledged", True), "bridge_status": "ok"}
+
+
+class EmergencyDispatch:
+    """Tracks a single emergency fan-out and the acknowledgement state of every point."""
+
+    def __init__(self, property_id: str, mode: str, point_ids: List[str], initiated_by: Optional[str]):
+        self.dispatch_id = str(uuid.uuid4())
+        self.property_id = property_id
+        self.mode = mode
+        self.initiated_by = initiated_by
+        self.started_at = datetime.utcnow()
+        self.completed_at: Optional[datetime] = None
+        self.points: Dict[str, Dict[str, Any]] = {
+            point_id: {"status": "pending", "attempts": 0, "latency_ms": None, "error": None}
+            for point_id in point_ids
+        }
+        self.done = asyncio.Event()
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        counts = {"pending": 0, "acknowledged": 0, "failed": 0, "not_configured": 0}
+        for entry in self.points.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def to_dict(self, include_points: bool = False) -> Dict[str, Any]:
+        data = {
+            "dispatch_id": self.dispatch_id,
+            "property_id": self.property_id,
+            "mode": self.mode,
+            "initiated_by": self.initiated_by,
+            "started_at": self.started_at.isoformat(),
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "total": len(self.points),
+            **self.counts,
+        }
+        if include_points:
+            data["points"] = self.points
+        return data
+
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class EmergencyDispatchEngine:
+    """Concurrent, retrying fan-out of emergency commands to access point controllers."""
+
+    def __init__(
+        self,
+        client_factory: Callable[[], HardwareBridgeClient] = HardwareBridgeClient,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_backoff_seconds: float = RETRY_BACKOFF_SECONDS,
+    ):
+        self.client_factory = client_factory
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._dispatches: Dict[str, EmergencyDispatch] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def get_dispatch(self, dispatch_id: str) -> Optional[EmergencyDispatch]:
+        return self._dispatches.get(dispatch_id)
+
+    def _track(self, dispatch: EmergencyDispatch) -> None:
+        self._dispatches[dispatch.dispatch_id] = dispatch
+        while len(self._dispatches) > MAX_TRACKED_DISPATCHES:
+            self._dispatches.pop(next(iter(self._dispatches)))
+
+    def create_dispatch(
+        self,
+        property_id: str,
+        mode: str,
+        point_ids: List[str],
+        initiated_by: Optional[str] = None,
+    ) -> EmergencyDispatch:
+        dispatch = EmergencyDispatch(property_id, mode, point_ids, initiated_by)
+        self._track(dispatch)
+        return dispatch
+
+    def start(self, dispatch: EmergencyDispatch, **kwargs: Any) -> asyncio.Task:
+        """Run a dispatch in the background so the caller can return immediately."""
+        task = asyncio.create_task(self.run(dispatch, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run(
+        self,
+        dispatch: EmergencyDispatch,
+        target_statuses: Optional[Dict[str, str]] = None,
+        payload: Optional[Dict[str, Any]] = None,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> EmergencyDispatch:
+        """Send commands to every point in the dispatch and wait for all of them to settle.
+
+        ``target_statuses`` carries the status each point should end up in (restore returns
+        every point to its own previous status).
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        payload = payload or {}
+        target_statuses = target_statuses or {}
+        progress_task = asyncio.create_task(self._report_progress(dispatch, on_progress)) if on_progress else None
+
+        async with self.client_factory() as client:
+            await asyncio.gather(*(
+                self._send_with_retry(
+                    client, semaphore, dispatch, point_id,
+                    {**payload, "target_status": target_statuses.get(point_id)},
+                )
+                for point_id in dispatch.points
+            ))
+
+        dispatch.completed_at = datetime.utcnow()
+        dispatch.done.set()
+        if progress_task is not None:
+            await progress_task
+        counts = dispatch.counts
+        logger.info(
+            "Emergency dispatch %s (%s) finished: %s acknowledged, %s failed of %s",
+            dispatch.dispatch_id, dispatch.mode, counts["acknowledged"], counts["failed"], len(dispatch.points),
+        )
+        return dispatch
+
+    async def _send_with_retry(
+        self,
+        client: HardwareBridgeClient,
+        semaphore: asyncio.Semaphore,
+        dispatch: EmergencyDispatch,
+        point_id: str,
+        payload: Dict[str, Any],
+    ) -> None:
+        entry = dispatch.points[point_id]
+        started = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            entry["attempts"] = attempt
+            try:
+                async with semaphore:
+                    result = await client.send_mode(point_id, dispatch.mode, payload)
+                if result.get("bridge_status") == "not_configured":
+                    entry["status"] = "not_configured"
+                elif result.get("acknowledged", False):
+                    entry["status"] = "acknowledged"
+                else:
+                    raise RuntimeError("Command not acknowledged by controller")
+                entry["error"] = None
+                break
+            except Exception as e:
+                entry["error"] = str(e)
+                if attempt >= self.max_attempts:
+                    entry["status"] = "failed"
+                    logger.warning("Emergency command to access point %s failed after %s attempts: %s", point_id, attempt, e)
+                    break
+                # Back off outside the semaphore so retries don't starve first attempts
+                await asyncio.sleep(self.retry_backoff_seconds * (2 ** (attempt - 1)))
+        entry["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    @staticmethod
+    async def _report_progress(dispatch: EmergencyDispatch, on_progress: ProgressCallback) -> None:
+        while True:
+            finished = dispatch.done.is_set()
+            try:
+                await on_progress(dispatch.to_dict())
+            except Exception as e:
+                logger.warning(f"Failed to report emergency dispatch progress: {e}")
+            if finished:
+                return
+            try:
+                await asyncio.wait_for(dispatch.done.wait(), timeout=PROGRESS_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def broadcast_dispatch_progress(progress: Dict[str, Any]) -> None:
+    """Stream dispatch progress to connected dashboards over WebSocket."""
+    from main import manager
+    if manager and manager.active_connections:
+        await manager.broadcast_message({"type": "emergency_dispatch_progress", "dispatch": progress})
+
+
+_engine: Optional[EmergencyDispatchEngine] = None
+
+
+def get_emergency_dispatch_engine() -> EmergencyDispatchEngine:
+    global _engine
+    if _engine is None:
+        _engine = EmergencyDispatchEngine()
+    return _engine
@@ -1,70 +1,255 @@
 import os
+import io
 import uuid
+import asyncio
 import hashlib
+import inspect
 import mimetypes
+import tempfile
+import threading
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, BinaryIO
 from pathlib import Path
-from PIL import Image
 import logging
 
+from cachetools import TTLCache
+
+from services.evidence_integrity_service import EvidenceIntegrityScanner, hash_file
+from services.evidence_preview_service import (
+    DEFAULT_PREVIEW_SIZE, EvidencePreviewService, can_render, preview_kind
+)
+
 logger = logging.getLogger(__name__)
 
+VERIFIED_CACHE_SIZE = 10000
+VERIFIED_CACHE_TTL_SECONDS = 3600
+
 class EvidenceFileService:
-    """Secure evidence file management with encryption and integrity verification."""
+    """
+    Secure evidence file management with encryption and integrity verification.
+
+    Content is stored once per SHA-256 under <storage>/objects/<2 hex>/<hash>; each upload
+    gets its own file_id and a hard link <file_id><ext> to that object, so records, URLs
+    and chain of custody stay per upload while identical clips share one copy on disk.
+    The link count of an object is its reference count: deleting an upload removes its
+    link, and the object goes with the last one.
+
+    Thumbnails and previews are rendered by EvidencePreviewService (process pool, cached
+    per content hash), never inside the upload request. EvidenceIntegrityScanner re-verifies
+    the object store in the background and keeps a Merkle manifest per case.
+    """
     
     EVIDENCE_STORAGE_PATH = "storage/evidence"
     THUMBNAIL_STORAGE_PATH = "storage/thumbnails"
     MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB; hashed and written per chunk while streaming
     ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.mp4', '.mov', '.avi', '.pdf', '.doc', '.docx'}
-    THUMBNAIL_SIZE = (300, 300)
-    
+    OBJECTS_DIR = "objects"
+
+    # Serializes placing links against collecting unreferenced objects (per process)
+    _object_lock = threading.Lock()
+
     def __init__(self):
         self._ensure_directories()
+        self.previews = EvidencePreviewService(self.THUMBNAIL_STORAGE_PATH)
+        self.integrity = EvidenceIntegrityScanner(self.EVIDENCE_STORAGE_PATH)
+        # file_path -> (inode, size, mtime_ns, hash) of its last successful integrity check
+        self._verified: TTLCache = TTLCache(maxsize=VERIFIED_CACHE_SIZE, ttl=VERIFIED_CACHE_TTL_SECONDS)
+        self._verified_lock = threading.Lock()
     
     def _ensure_directories(self):
         """Create storage directories if they don't exist."""
         os.makedirs(self.EVIDENCE_STORAGE_PATH, exist_ok=True)
         os.makedirs(self.THUMBNAIL_STORAGE_PATH, exist_ok=True)
+
+    def _object_path(self, root: str, content_hash: str, suffix: str = "") -> str:
+        return os.path.join(root, self.OBJECTS_DIR, content_hash[:2], f"{content_hash}{suffix}")
     
     def _calculate_file_hash(self, file_path: str) -> str:
         """Calculate SHA-256 hash of file for integrity verification."""
-        hash_sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
+        return hash_file(file_path)
     
-    def _generate_thumbnail(self, file_path: str, thumbnail_path: str) -> bool:
-        """Generate thumbnail for image/video files."""
+    async def upload_evidence_file(
+        self,
+        file_data: bytes,
+        filename: str,
+        evidence_id: str,
+        uploaded_by: str,
+        case_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Upload and secure an evidence file already held in memory.
+
+        Prefer upload_evidence_stream for request uploads so the body is never read whole.
+        """
+        return await self.upload_evidence_stream(
+            io.BytesIO(file_data), filename, evidence_id, uploaded_by, case_id=case_id
+        )
+
+    async def _read_chunk(self, stream: Any) -> bytes:
+        data = stream.read(self.UPLOAD_CHUNK_SIZE)
+        if inspect.isawaitable(data):
+            data = await data
+        return data
+
+    def _write_chunk(self, out: BinaryIO, hasher: Any, chunk: bytes) -> None:
+        hasher.update(chunk)
+        out.write(chunk)
+
+    def _link_object(self, source: str, object_path: str, link_path: str, replace: bool = False) -> bool:
+        """
+        Make ``source`` the object (unless one exists) and hard-link ``link_path`` to it.
+        With ``replace``, ``source`` takes the place of an existing object instead.
+        Returns True if an existing object was reused.
+        """
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        with self._object_lock:
+            if replace:
+                # Uploads already linked keep the old inode; new ones get the sound copy
+                replacement = f"{object_path}.{os.getpid()}.new"
+                os.link(source, replacement)
+                os.replace(replacement, object_path)
+                existed = False
+            else:
+                try:
+                    # Fails if identical content is already stored; link() is atomic either way
+                    os.link(source, object_path)
+                    existed = False
+                except FileExistsError:
+                    existed = True
+            os.link(object_path, link_path)
+        return existed
+
+    def _object_sound(self, object_path: str, content_hash: str) -> bool:
+        """
+        False if a stored object was flagged by the scanner or no longer matches its hash.
+        A recent verification is trusted; otherwise the object is re-hashed once and the
+        result recorded, so further duplicates of it cost no read.
+        """
+        if self.integrity.has_failed(content_hash):
+            return False
         try:
-            file_ext = Path(file_path).suffix.lower()
-            
-            if file_ext in {'.jpg', '.jpeg', '.png'}:
-                with Image.open(file_path) as img:
-                    img.thumbnail(self.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
-                    img.save(thumbnail_path, "JPEG", quality=85)
+            size = os.path.getsize(object_path)
+            if self.integrity.verified_ok(content_hash, size):
                 return True
-            elif file_ext in {'.mp4', '.mov', '.avi'}:
-                # For video files, we'd use ffmpeg to extract frame
-                # For now, return False (no thumbnail)
+            if hash_file(object_path) != content_hash:
                 return False
-                
-        except Exception as e:
-            logger.error(f"Failed to generate thumbnail: {e}")
+        except OSError:
             return False
-    
-    async def upload_evidence_file(
+        self.integrity.record_verified(content_hash, size)
+        return True
+
+    def _store_object(self, out: BinaryIO, temp_path: str, content_hash: str, file_path: str) -> bool:
+        """Place a finished spool into the object store; returns True if deduplicated."""
+        out.flush()
+        object_path = self._object_path(self.EVIDENCE_STORAGE_PATH, content_hash)
+        exists = os.path.exists(object_path)
+        # Never hand a corrupted object out as a fresh upload's content
+        replace = exists and not self._object_sound(object_path, content_hash)
+        if replace:
+            logger.warning(f"Replacing corrupted evidence object {object_path} with a fresh upload")
+        if replace or not exists:
+            # New content must be durable before it becomes visible; a duplicate is
+            # dropped unsynced, so repeated uploads cost no forced write-back
+            os.fsync(out.fileno())
+        size = os.fstat(out.fileno()).st_size
+        out.close()
+        try:
+            deduplicated = self._link_object(temp_path, object_path, file_path, replace=replace)
+        except OSError as e:
+            if isinstance(e, FileExistsError):
+                raise
+            # Filesystem without hard links: keep a private copy
+            logger.warning(f"Evidence object store unavailable, storing {file_path} unshared: {e}")
+            os.replace(temp_path, file_path)
+            return False
+        os.remove(temp_path)
+        if not deduplicated:
+            # Objects are shared between uploads; never let one writer alter them in place
+            os.chmod(object_path, 0o444)
+        if replace:
+            self.integrity.record_verified(content_hash, size)
+        return deduplicated
+
+    def _release(self, path: str, content_hash: Optional[str]) -> bool:
+        """
+        Remove one upload's link and collect its object once nothing else references it.
+        Returns True if the object was collected.
+        """
+        with self._object_lock:
+            if os.path.exists(path):
+                os.remove(path)
+            if not content_hash:
+                return False
+            object_path = self._object_path(self.EVIDENCE_STORAGE_PATH, content_hash)
+            try:
+                if os.stat(object_path).st_nlink == 1:
+                    os.remove(object_path)
+                    logger.info(f"Collected unreferenced evidence object: {object_path}")
+                    return True
+            except FileNotFoundError:
+                pass
+            return False
+
+    def _preview_source(self, file_path: str, content_hash: str) -> str:
+        # Render from the shared object: it outlives any single upload's link
+        object_path = self._object_path(self.EVIDENCE_STORAGE_PATH, content_hash)
+        return object_path if os.path.exists(object_path) else file_path
+
+    async def get_preview(self, file_record: Dict[str, Any], size: str = DEFAULT_PREVIEW_SIZE) -> Optional[str]:
+        """Path of a preview JPEG for an upload, rendered on first request; None if unsupported."""
+        kind = preview_kind(file_record["file_path"])
+        if kind is None or not file_record.get("file_hash"):
+            return None
+        source = self._preview_source(file_record["file_path"], file_record["file_hash"])
+        if not os.path.exists(source):
+            return None
+        return await self.previews.get_preview(source, file_record["file_hash"], kind, size)
+
+    def get_reference_count(self, content_hash: str) -> int:
+        """Number of uploads sharing the stored content with this SHA-256."""
+        try:
+            return os.stat(self._object_path(self.EVIDENCE_STORAGE_PATH, content_hash)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def get_storage_stats(self) -> Dict[str, int]:
+        """Physical vs. logical evidence bytes in the object store."""
+        objects, stored, referenced, references = 0, 0, 0, 0
+        root = os.path.join(self.EVIDENCE_STORAGE_PATH, self.OBJECTS_DIR)
+        for directory, _, names in os.walk(root):
+            for name in names:
+                info = os.stat(os.path.join(directory, name))
+                objects += 1
+                stored += info.st_size
+                references += info.st_nlink - 1
+                referenced += info.st_size * (info.st_nlink - 1)
+        return {
+            "objects": objects,
+            "references": references,
+            "stored_bytes": stored,
+            "referenced_bytes": referenced,
+            "saved_bytes": referenced - stored,
+        }
+
+    async def upload_evidence_stream(
         self,
-        file_data: bytes,
+        stream: Any,
         filename: str,
         evidence_id: str,
         uploaded_by: str,
         case_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        Upload and secure an evidence file.
-        
+        Upload and secure an evidence file from a stream (an UploadFile or any object with
+        a sync or async read(size)).
+
+        The stream is copied in UPLOAD_CHUNK_SIZE chunks to a temp file in the storage
+        directory and hashed with SHA-256 as it is written; at most one chunk is held in
+        memory and the size limit is enforced as bytes arrive. The finished spool becomes
+        the content object (or is dropped if that content is already stored and still matches
+        its hash) and the upload gets its own hard link to it.
+
         Returns:
             Dict containing file_id, file_path, hash, thumbnail_path, etc.
         """
@@ -72,31 +257,50 @@ class EvidenceFileService:
         file_ext = Path(filename).suffix.lower()
         if file_ext not in self.ALLOWED_EXTENSIONS:
             raise ValueError(f"File type {file_ext} not allowed")
-        
-        if len(file_data) > self.MAX_FILE_SIZE:
+
+        # UploadFile knows the spooled size up front; reject before copying anything
+        declared_size = getattr(stream, "size", None)
+        if isinstance(declared_size, int) and declared_size > self.MAX_FILE_SIZE:
             raise ValueError(f"File size exceeds {self.MAX_FILE_SIZE} bytes")
-        
+
         # Generate unique file ID and paths
         file_id = str(uuid.uuid4())
         safe_filename = f"{file_id}{file_ext}"
         file_path = os.path.join(self.EVIDENCE_STORAGE_PATH, safe_filename)
-        thumbnail_path = os.path.join(self.THUMBNAIL_STORAGE_PATH, f"{file_id}.jpg")
-        
+        fd, temp_path = tempfile.mkstemp(prefix=f".{file_id}.", suffix=".part", dir=self.EVIDENCE_STORAGE_PATH)
+        out = os.fdopen(fd, "wb")
+
+        file_hash = None
         try:
-            # Write file to storage
-            with open(file_path, "wb") as f:
-                f.write(file_data)
-            
-            # Calculate file hash for integrity
-            file_hash = self._calculate_file_hash(file_path)
-            
-            # Generate thumbnail if applicable
-            has_thumbnail = self._generate_thumbnail(file_path, thumbnail_path)
-            
+            # Stream to the temp file, hashing as we go; disk work runs off the event loop
+            hasher = hashlib.sha256()
+            file_size = 0
+            while True:
+                chunk = await self._read_chunk(stream)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > self.MAX_FILE_SIZE:
+                    raise ValueError(f"File size exceeds {self.MAX_FILE_SIZE} bytes")
+                await asyncio.to_thread(self._write_chunk, out, hasher, chunk)
+            file_hash = hasher.hexdigest()
+            deduplicated = await asyncio.to_thread(self._store_object, out, temp_path, file_hash, file_path)
+
+            # The bytes are durable; the thumbnail renders in the background (shared by
+            # every upload of the same content) and is served once ready
+            # No thumbnail (and no URL to one) when it cannot be rendered, e.g. no ffmpeg
+            kind = preview_kind(filename)
+            if not can_render(kind):
+                kind = None
+            if kind:
+                try:
+                    self.previews.schedule(self._preview_source(file_path, file_hash), file_hash, kind)
+                except Exception as e:
+                    logger.error(f"Failed to schedule thumbnail for {file_id}: {e}")
+
             # Get file metadata
-            file_size = len(file_data)
             mime_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
-            
+
             # Create file record
             file_record = {
                 "file_id": file_id,
@@ -106,27 +310,39 @@ class EvidenceFileService:
                 "file_size": file_size,
                 "file_hash": file_hash,
                 "mime_type": mime_type,
-                "thumbnail_path": thumbnail_path if has_thumbnail else None,
+                "thumbnail_path": self.previews.preview_path(file_hash) if kind else None,
                 "uploaded_by": uploaded_by,
                 "uploaded_at": datetime.now(timezone.utc).isoformat(),
                 "case_id": case_id,
-                "integrity_verified": True
+                "integrity_verified": True,
+                "deduplicated": deduplicated
             }
-            
-            logger.info(f"Evidence file uploaded: {file_id} for evidence {evidence_id}")
+            if case_id:
+                await asyncio.to_thread(self.integrity.add_to_manifest, case_id, file_record)
+
+            logger.info(
+                f"Evidence file uploaded: {file_id} for evidence {evidence_id} ({file_size} bytes"
+                f"{', deduplicated' if deduplicated else ''})"
+            )
             return file_record
-            
+
         except Exception as e:
             # Clean up partial files on error
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
+            out.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if self._release(file_path, file_hash):
+                self.previews.discard(file_hash)
             logger.error(f"Failed to upload evidence file: {e}")
             raise
-    
-    def verify_file_integrity(self, file_record: Dict[str, Any]) -> bool:
-        """Verify file integrity using stored hash."""
+
+    def verify_file_integrity(self, file_record: Dict[str, Any], trust_unchanged: bool = False) -> bool:
+        """
+        Verify file integrity using stored hash.
+
+        With trust_unchanged, a file whose inode, size and mtime match its last successful
+        check is not re-hashed (downloads and range requests); full checks still re-read.
+        """
         try:
             file_path = file_record["file_path"]
             stored_hash = file_record["file_hash"]
@@ -134,10 +350,23 @@ class EvidenceFileService:
             if not os.path.exists(file_path):
                 logger.error(f"Evidence file missing: {file_path}")
                 return False
+
+            info = os.stat(file_path)
+            signature = (info.st_ino, info.st_size, info.st_mtime_ns, stored_hash)
+            with self._verified_lock:
+                known = self._verified.get(file_path)
+            # Bit rot keeps inode, size and mtime; trust the cache only while scans agree
+            if trust_unchanged and known == signature and not self.integrity.has_failed(stored_hash):
+                return True
             
             current_hash = self._calculate_file_hash(file_path)
             integrity_ok = current_hash == stored_hash
             
+            with self._verified_lock:
+                if integrity_ok:
+                    self._verified[file_path] = signature
+                else:
+                    self._verified.pop(file_path, None)
             if not integrity_ok:
                 logger.error(f"File integrity check failed for {file_record['file_id']}")
             
@@ -152,35 +381,45 @@ class EvidenceFileService:
         # In production, this would generate a signed URL
         return f"/api/evidence/files/{file_id}"
     
-    def get_thumbnail_url(self, file_id: str) -> Optional[str]:
-        """Get URL for file thumbnail."""
+    def get_thumbnail_url(self, file_id: str, file_record: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Get URL for file thumbnail (rendered on first request if not ready yet)."""
+        if file_record is not None and file_record.get("thumbnail_path"):
+            return f"/api/evidence/thumbnails/{file_id}"
         thumbnail_path = os.path.join(self.THUMBNAIL_STORAGE_PATH, f"{file_id}.jpg")
         if os.path.exists(thumbnail_path):
             return f"/api/evidence/thumbnails/{file_id}"
         return None
     
     def delete_evidence_file(self, file_record: Dict[str, Any]) -> bool:
-        """Securely delete evidence file and thumbnail."""
+        """
+        Securely delete an upload's evidence file and thumbnail. Content shared with other
+        uploads stays until the last of them is deleted.
+        """
         try:
             file_path = file_record["file_path"]
-            thumbnail_path = file_record.get("thumbnail_path")
-            
-            # Remove main file
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Deleted evidence file: {file_path}")
-            
-            # Remove thumbnail
-            if thumbnail_path and os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-                logger.info(f"Deleted thumbnail: {thumbnail_path}")
-            
+            content_hash = file_record.get("file_hash")
+
+            if file_record.get("case_id"):
+                self.integrity.remove_from_manifest(file_record["case_id"], file_record["file_id"])
+
+            # Remove main file; previews go with the last upload of the content
+            if self._release(file_path, content_hash):
+                self.previews.discard(content_hash)
+                logger.info(f"Deleted previews for evidence content {content_hash}")
+            logger.info(f"Deleted evidence file: {file_path}")
+
+            # Remove a per-upload thumbnail left by older versions
+            legacy_thumbnail = os.path.join(self.THUMBNAIL_STORAGE_PATH, f"{file_record['file_id']}.jpg")
+            if os.path.exists(legacy_thumbnail):
+                os.remove(legacy_thumbnail)
+                logger.info(f"Deleted thumbnail: {legacy_thumbnail}")
+
             return True
-            
+
         except Exception as e:
             logger.error(f"Failed to delete evidence file: {e}")
             return False
-    
+
     def create_chain_of_custody_entry(
         self,
         evidence_id: str,
@@ -0,0 +1,490 @@
+"""
+Evidence Integrity Service
+Scheduled, incremental integrity verification of the evidence archive.
+
+Stored evidence objects are named by their SHA-256 (see EvidenceFileService), so the
+scanner needs no upload records: it walks <evidence storage>/objects in hash order and
+re-hashes each object against its own name.
+  - each run verifies up to INTEGRITY_SCAN_BATCH_FILES objects / INTEGRITY_SCAN_BATCH_BYTES
+    bytes, continuing from a cursor persisted in integrity_state.json, so the archive is
+    covered in rolling passes that survive restarts
+  - reads are admitted against an I/O budget (INTEGRITY_SCAN_BYTES_PER_SECOND), so
+    playback and uploads keep most of the disk
+  - hashing runs in a process pool across cores; large files are mmap-ed and hashed
+    straight from the page cache, small ones through one large reusable buffer
+
+Each case also gets a manifest (manifests/<case id>.json): a Merkle tree over the case's
+uploads (file_id, SHA-256, size). A chain-of-custody proof is the manifest root, an audit
+path for the file in question, and when the scanner last verified each leaf's content,
+so proving a case never re-reads its files.
+"""
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INTEGRITY_SCAN_INTERVAL_SECONDS = float(os.getenv("INTEGRITY_SCAN_INTERVAL_SECONDS", "300"))
+INTEGRITY_SCAN_BATCH_FILES = int(os.getenv("INTEGRITY_SCAN_BATCH_FILES", "500"))
+INTEGRITY_SCAN_BATCH_BYTES = int(os.getenv("INTEGRITY_SCAN_BATCH_BYTES", str(8 * 1024 ** 3)))
+# 0 disables throttling
+INTEGRITY_SCAN_BYTES_PER_SECOND = int(os.getenv("INTEGRITY_SCAN_BYTES_PER_SECOND", str(50 * 1024 ** 2)))
+# How long a verification vouches for an object a duplicate upload would link to
+INTEGRITY_TRUST_SECONDS = float(os.getenv("INTEGRITY_TRUST_SECONDS", str(24 * 3600)))
+INTEGRITY_SCAN_WORKERS = int(os.getenv("INTEGRITY_SCAN_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_BUFFER_SIZE = 4 * 1024 * 1024
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+_OBJECT_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def hash_file(path: str, buffer_size: int = HASH_BUFFER_SIZE) -> str:
+    """SHA-256 of a file: mmap-ed above MMAP_THRESHOLD, large-buffer readinto below it."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, "madvise"):
+                    # Aggressive read-ahead, pages dropped behind the scan
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, buffer_size):
+                        hasher.update(view[offset:offset + buffer_size])
+                finally:
+                    view.release()
+        else:
+            buffer = bytearray(buffer_size)
+            view = memoryview(buffer)
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                hasher.update(view[:count])
+    return hasher.hexdigest()
+
+
+# --- Merkle manifests -----------------------------------------------------------
+
+
+def merkle_leaf(file_id: str, content_hash: str, file_size: int) -> str:
+    # 0x00 / 0x01 prefixes keep leaves and inner nodes from ever colliding (RFC 6962)
+    return hashlib.sha256(b"\x00" + f"{file_id}:{content_hash}:{file_size}".encode()).hexdigest()
+
+
+def _merkle_node(left: str, right: str) -> str:
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def _merkle_levels(leaves: List[str]) -> List[List[str]]:
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        # An odd last node is carried up unchanged
+        levels.append([
+            _merkle_node(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ])
+    return levels
+
+
+def merkle_root(leaves: List[str]) -> Optional[str]:
+    if not leaves:
+        return None
+    return _merkle_levels(leaves)[-1][0]
+
+
+def merkle_proof(leaves: List[str], index: int) -> List[Dict[str, str]]:
+    """Audit path for leaves[index]: sibling hashes from the leaf up to the root."""
+    proof = []
+    for level in _merkle_levels(leaves)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({"side": "left" if sibling < index else "right", "hash": level[sibling]})
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf: str, proof: List[Dict[str, str]], root: str) -> bool:
+    node = leaf
+    for step in proof:
+        node = _merkle_node(step["hash"], node) if step["side"] == "left" else _merkle_node(node, step["hash"])
+    return node == root
+
+
+# --- scanning -------------------------------------------------------------------
+
+
+class IoBudget:
+    """Token bucket over bytes read: acquire() sleeps once the budget is overdrawn."""
+
+    def __init__(self, bytes_per_second: int, burst: Optional[int] = None):
+        self.rate = bytes_per_second
+        self.burst = burst if burst is not None else bytes_per_second
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+
+    def acquire(self, amount: int) -> float:
+        """Charge ``amount`` bytes; returns the seconds slept to stay within the rate."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= amount
+        if self._tokens >= 0:
+            return 0.0
+        # Sleep off the debt; the refill on the next call counts the time slept
+        delay = -self._tokens / self.rate
+        time.sleep(delay)
+        return delay
+
+
+class EvidenceIntegrityScanner:
+    """Rolling SHA-256 verification of the evidence object store, plus case manifests."""
+
+    def __init__(
+        self,
+        storage_root: str,
+        bytes_per_second: int = INTEGRITY_SCAN_BYTES_PER_SECOND,
+        batch_files: int = INTEGRITY_SCAN_BATCH_FILES,
+        batch_bytes: int = INTEGRITY_SCAN_BATCH_BYTES,
+        interval_seconds: float = INTEGRITY_SCAN_INTERVAL_SECONDS,
+        max_workers: int = INTEGRITY_SCAN_WORKERS,
+        executor: Optional[Executor] = None,
+    ):
+        self.objects_root = os.path.join(storage_root, "objects")
+        self.manifest_root = os.path.join(storage_root, "manifests")
+        self.state_path = os.path.join(storage_root, "integrity_state.json")
+        self.bytes_per_second = bytes_per_second
+        self.batch_files = max(1, batch_files)
+        self.batch_bytes = batch_bytes
+        self.interval_seconds = interval_seconds
+        self.max_workers = max(1, max_workers)
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._executor = executor
+        self._state: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()  # state, manifests and the pool
+        self._run_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- persisted state ----------------------------------------------------
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.part"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def _load_state(self) -> Dict[str, Any]:
+        """Called with self._lock held."""
+        if self._state is None:
+            try:
+                with open(self.state_path) as f:
+                    self._state = json.load(f)
+            except FileNotFoundError:
+                self._state = {
+                    "cursor": "",
+                    "passes_completed": 0,
+                    "pass_started_at": None,
+                    "last_pass_completed_at": None,
+                    "objects": {},  # content hash -> last verification
+                }
+        return self._state
+
+    def has_failed(self, content_hash: str) -> bool:
+        """True if the last scan of this content found it corrupt or unreadable."""
+        with self._lock:
+            entry = self._load_state()["objects"].get(content_hash)
+        return entry is not None and not entry["ok"]
+
+    def verified_ok(self, content_hash: str, size: int, max_age_seconds: float = INTEGRITY_TRUST_SECONDS) -> bool:
+        """True if this content, at this size, was last verified sound within ``max_age_seconds``."""
+        with self._lock:
+            entry = self._load_state()["objects"].get(content_hash)
+        if entry is None or not entry["ok"] or entry["size"] != size:
+            return False
+        verified_at = datetime.fromisoformat(entry["verified_at"])
+        return (datetime.now(timezone.utc) - verified_at).total_seconds() <= max_age_seconds
+
+    def record_verified(self, content_hash: str, size: int) -> None:
+        """Record content verified outside a scan (a replaced or re-hashed object)."""
+        with self._lock:
+            state = self._load_state()
+            state["objects"][content_hash] = {"verified_at": _now(), "size": size, "ok": True}
+            self._write_json(self.state_path, state)
+
+    # --- scanning -----------------------------------------------------------
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: the API process runs threads, which fork() does not copy safely
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _objects_after(self, cursor: str) -> Iterator[Tuple[str, str]]:
+        """(content hash, path) of stored objects with hashes after ``cursor``, in order."""
+        try:
+            prefixes = sorted(os.listdir(self.objects_root))
+        except FileNotFoundError:
+            return
+        for prefix in prefixes:
+            if prefix < cursor[:2]:
+                continue
+            directory = os.path.join(self.objects_root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if name > cursor and _OBJECT_NAME.match(name):
+                    yield name, os.path.join(directory, name)
+
+    def _record(self, content_hash: str, path: str, size: int, future: Future, report: Dict[str, Any]) -> None:
+        entry: Dict[str, Any] = {"verified_at": _now(), "size": size}
+        try:
+            actual_hash = future.result()
+            entry["ok"] = actual_hash == content_hash
+            if not entry["ok"]:
+                entry["actual_hash"] = actual_hash
+        except FileNotFoundError:
+            # Collected by a delete while queued
+            return
+        except Exception as e:
+            entry.update(ok=False, error=str(e))
+        with self._lock:
+            self._load_state()["objects"][content_hash] = entry
+        report["verified"] += 1
+        report["bytes"] += size
+        if not entry["ok"]:
+            report["failed"].append(content_hash)
+            logger.error(f"Evidence object failed integrity check: {path} ({entry.get('error') or entry['actual_hash']})")
+
+    def scan(self) -> Dict[str, Any]:
+        """
+        Verify the next batch of objects after the cursor and persist the cursor; the
+        pass completes (and the next one starts from the beginning) when none are left.
+        """
+        with self._run_lock:
+            started = time.perf_counter()
+            with self._lock:
+                state = self._load_state()
+                cursor = state["cursor"]
+                if not cursor:
+                    state["pass_started_at"] = _now()
+            report: Dict[str, Any] = {
+                "started_at": _now(), "verified": 0, "bytes": 0, "failed": [],
+                "throttled_seconds": 0.0, "pass_completed": False,
+            }
+            budget = IoBudget(self.bytes_per_second)
+            pool = self._pool()
+            pending: Dict[Future, Tuple[str, str, int]] = {}
+            scheduled_files, scheduled_bytes, exhausted = 0, 0, True
+            try:
+                for content_hash, path in self._objects_after(cursor):
+                    if scheduled_files >= self.batch_files or scheduled_bytes >= self.batch_bytes:
+                        exhausted = False
+                        break
+                    try:
+                        size = os.stat(path).st_size
+                    except FileNotFoundError:
+                        continue
+                    report["throttled_seconds"] += budget.acquire(size)
+                    pending[pool.submit(hash_file, path)] = (content_hash, path, size)
+                    scheduled_files += 1
+                    scheduled_bytes += size
+                    cursor = content_hash
+                    # Keep every worker busy without queueing the whole batch
+                    while len(pending) >= self.max_workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._record(*pending.pop(future), future, report)
+            finally:
+                for future in list(pending):
+                    self._record(*pending.pop(future), future, report)
+
+            with self._lock:
+                if exhausted:
+                    state["cursor"] = ""
+                    state["passes_completed"] += 1
+                    state["last_pass_completed_at"] = _now()
+                    # Forget objects collected since they were last verified
+                    state["objects"] = {
+                        content_hash: entry for content_hash, entry in state["objects"].items()
+                        if os.path.exists(os.path.join(self.objects_root, content_hash[:2], content_hash))
+                    }
+                    report["pass_completed"] = True
+                else:
+                    state["cursor"] = cursor
+                self._write_json(self.state_path, state)
+            report["cursor"] = state["cursor"]
+            report["throttled_seconds"] = round(report["throttled_seconds"], 3)
+            report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.last_run = report
+            if report["verified"]:
+                logger.info(
+                    f"Evidence integrity scan: verified {report['verified']} objects ({report['bytes']} bytes), "
+                    f"{len(report['failed'])} failed{', pass completed' if exhausted else ''}"
+                )
+            return report
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._load_state()
+            failures = [
+                {"file_hash": content_hash, **entry}
+                for content_hash, entry in state["objects"].items() if not entry["ok"]
+            ]
+            return {
+                "interval_seconds": self.interval_seconds,
+                "bytes_per_second": self.bytes_per_second,
+                "batch_files": self.batch_files,
+                "batch_bytes": self.batch_bytes,
+                "running": self._task is not None and not self._task.done(),
+                "cursor": state["cursor"],
+                "passes_completed": state["passes_completed"],
+                "pass_started_at": state["pass_started_at"],
+                "last_pass_completed_at": state["last_pass_completed_at"],
+                "objects_verified": len(state["objects"]),
+                "failures": failures,
+                "last_run": self.last_run,
+            }
+
+    # --- case manifests -----------------------------------------------------
+
+    def _manifest_path(self, case_id: str) -> str:
+        return os.path.join(self.manifest_root, f"{quote(case_id, safe='')}.json")
+
+    def _read_manifest(self, case_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._manifest_path(case_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, case_id: str, leaves: List[Dict[str, Any]]) -> None:
+        leaves.sort(key=lambda leaf: leaf["file_id"])
+        if not leaves:
+            path = self._manifest_path(case_id)
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        self._write_json(self._manifest_path(case_id), {
+            "case_id": case_id,
+            "updated_at": _now(),
+            "root": merkle_root([leaf["leaf"] for leaf in leaves]),
+            "leaves": leaves,
+        })
+
+    def add_to_manifest(self, case_id: str, file_record: Dict[str, Any]) -> None:
+        leaf = {
+            "file_id": file_record["file_id"],
+            "evidence_id": file_record["evidence_id"],
+            "file_hash": file_record["file_hash"],
+            "file_size": file_record["file_size"],
+            "leaf": merkle_leaf(file_record["file_id"], file_record["file_hash"], file_record["file_size"]),
+        }
+        with self._lock:
+            manifest = self._read_manifest(case_id)
+            leaves = [item for item in (manifest or {}).get("leaves", []) if item["file_id"] != leaf["file_id"]]
+            self._write_manifest(case_id, leaves + [leaf])
+
+    def remove_from_manifest(self, case_id: str, file_id: str) -> None:
+        with self._lock:
+            manifest = self._read_manifest(case_id)
+            if manifest is not None:
+                self._write_manifest(case_id, [leaf for leaf in manifest["leaves"] if leaf["file_id"] != file_id])
+
+    def case_proof(self, case_id: str, file_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Integrity proof for a case from its manifest and the scan results, without reading
+        any evidence file. With file_id, includes that file's Merkle audit path. None if the
+        case has no manifest.
+        """
+        with self._lock:
+            manifest = self._read_manifest(case_id)
+            if manifest is None:
+                return None
+            verified = self._load_state()["objects"]
+            leaves = []
+            for leaf in manifest["leaves"]:
+                entry = verified.get(leaf["file_hash"])
+                leaves.append({
+                    **leaf,
+                    "verified_at": entry["verified_at"] if entry else None,
+                    "verified_ok": entry["ok"] if entry else None,
+                })
+        hashes = [leaf["leaf"] for leaf in leaves]
+        consistent = merkle_root(hashes) == manifest["root"] and all(
+            leaf["leaf"] == merkle_leaf(leaf["file_id"], leaf["file_hash"], leaf["file_size"]) for leaf in leaves
+        )
+        checked = [leaf["verified_at"] for leaf in leaves if leaf["verified_at"]]
+        proof = {
+            "case_id": case_id,
+            "root": manifest["root"],
+            "updated_at": manifest["updated_at"],
+            "manifest_consistent": consistent,
+            "leaves": leaves,
+            "failed": [leaf["file_id"] for leaf in leaves if leaf["verified_ok"] is False],
+            "unverified": [leaf["file_id"] for leaf in leaves if leaf["verified_ok"] is None],
+            "oldest_verification": min(checked) if checked else None,
+        }
+        proof["verified"] = consistent and not proof["failed"] and not proof["unverified"]
+        if file_id is not None:
+            index = next((i for i, leaf in enumerate(leaves) if leaf["file_id"] == file_id), None)
+            if index is None:
+                raise ValueError(f"File {file_id} is not part of case {case_id}")
+            proof["file_id"] = file_id
+            proof["leaf"] = hashes[index]
+            proof["audit_path"] = merkle_proof(hashes, index)
+        return proof
+
+    # --- background loop ----------------------------------------------------
+
+    async def _run_loop(self) -> None:
+        while True:
+            # Wait first: startup should not compete with a scan
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.scan)
+            except Exception as e:
+                logger.error(f"Integrity scan loop error: {e}")
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0:
+            logger.info("Evidence integrity scans disabled (INTEGRITY_SCAN_INTERVAL_SECONDS <= 0)")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
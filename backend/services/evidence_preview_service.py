@@ -0,0 +1,186 @@
+"""
+Evidence Preview Service
+Thumbnail and preview rendering for evidence files, off the request path.
+
+Resizing photos and pulling poster frames out of videos is CPU-bound, so renders run in
+a process pool instead of the event loop (or the GIL-bound thread pool). Previews are
+cached per content hash under <thumbnail storage>/objects, so identical uploads share
+them:
+  - an upload only schedules its default thumbnail and returns once its bytes are durable
+  - any other size is rendered on first request and served from the cache afterwards
+  - concurrent requests for the same missing preview share one render
+JPEGs are decoded with Pillow's draft mode (DCT scaling straight to roughly the target
+size), videos go through a local ffmpeg for a poster frame.
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZES: Dict[str, Tuple[int, int]] = {
+    "thumb": (300, 300),
+    "medium": (800, 800),
+    "large": (1600, 1600),
+}
+DEFAULT_PREVIEW_SIZE = "thumb"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi"}
+PREVIEW_WORKERS = int(os.getenv("EVIDENCE_PREVIEW_WORKERS", str(min(4, os.cpu_count() or 1))))
+POSTER_OFFSET_SECONDS = 1.0
+FFMPEG_TIMEOUT_SECONDS = 30
+JPEG_QUALITY = 85
+
+
+def preview_kind(filename: str) -> Optional[str]:
+    """"image", "video" or None (no preview) for a file name."""
+    ext = Path(filename).suffix.lower()
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+def can_render(kind: Optional[str]) -> bool:
+    """True if previews of this kind can be made here (video posters need ffmpeg)."""
+    return kind == "image" or (kind == "video" and shutil.which("ffmpeg") is not None)
+
+
+def _render_image(source_path: str, size: Tuple[int, int], dest_path: str) -> bool:
+    with Image.open(source_path) as img:
+        # JPEG only: decode at the smallest DCT scale still >= size (up to 8x less work)
+        img.draft("RGB", size)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(dest_path, "JPEG", quality=JPEG_QUALITY)
+    return True
+
+
+def _render_video(source_path: str, size: Tuple[int, int], dest_path: str) -> bool:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return False
+    scale = f"scale={size[0]}:{size[1]}:force_original_aspect_ratio=decrease"
+    # Skip the (often black) first frame; clips shorter than the offset retry from 0
+    for offset in (POSTER_OFFSET_SECONDS, 0):
+        subprocess.run(
+            [ffmpeg, "-v", "error", "-y", "-ss", str(offset), "-i", source_path,
+             "-frames:v", "1", "-vf", scale, "-f", "image2", "-c:v", "mjpeg", dest_path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=FFMPEG_TIMEOUT_SECONDS,
+            check=False,
+        )
+        if os.path.exists(dest_path) and os.path.getsize(dest_path) > 0:
+            return True
+    return False
+
+
+def render_preview(source_path: str, kind: str, size: Tuple[int, int], dest_path: str) -> bool:
+    """Render one preview JPEG to dest_path (atomically). Runs in a worker process."""
+    temp_path = f"{dest_path}.{os.getpid()}.part"
+    try:
+        render = _render_image if kind == "image" else _render_video
+        if not render(source_path, tuple(size), temp_path):
+            return False
+        os.replace(temp_path, dest_path)
+        return True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class EvidencePreviewService:
+    """Process-pool preview renderer with an on-disk cache keyed by content hash."""
+
+    def __init__(self, cache_root: str, max_workers: int = PREVIEW_WORKERS, executor: Optional[Executor] = None):
+        self.cache_root = cache_root
+        self.max_workers = max_workers
+        self._executor = executor
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: the API process runs threads, which fork() does not copy safely
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def preview_path(self, content_hash: str, size: str = DEFAULT_PREVIEW_SIZE) -> str:
+        return os.path.join(self.cache_root, "objects", content_hash[:2], f"{content_hash}-{size}.jpg")
+
+    def schedule(
+        self, source_path: str, content_hash: str, kind: str, size: str = DEFAULT_PREVIEW_SIZE
+    ) -> Optional[Future]:
+        """Start rendering a preview unless it is cached or already rendering."""
+        if size not in PREVIEW_SIZES:
+            raise ValueError(f"size must be one of {', '.join(PREVIEW_SIZES)}")
+        dest_path = self.preview_path(content_hash, size)
+        key = (content_hash, size)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None or os.path.exists(dest_path):
+                return future
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        pool = self._pool()
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = pool.submit(render_preview, source_path, kind, PREVIEW_SIZES[size], dest_path)
+            self._inflight[key] = future
+        # Outside the lock: a render that already finished runs the callback right here
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def _finished(self, key: Tuple[str, str], future: Future) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Preview render failed for {key[0]} ({key[1]}): {error}")
+
+    async def get_preview(
+        self, source_path: str, content_hash: str, kind: str, size: str = DEFAULT_PREVIEW_SIZE
+    ) -> Optional[str]:
+        """Path of the cached preview, rendering it first if needed; None if none can be made."""
+        dest_path = self.preview_path(content_hash, size)
+        if os.path.exists(dest_path):
+            return dest_path
+        future = self.schedule(source_path, content_hash, kind, size)
+        if future is not None:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception:
+                return None
+        return dest_path if os.path.exists(dest_path) else None
+
+    def discard(self, content_hash: str) -> None:
+        """Drop every cached preview of some content (its evidence object is gone)."""
+        for size in PREVIEW_SIZES:
+            path = self.preview_path(content_hash, size)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -8,6 +8,7 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import Handover, HandoverChecklistItem, HandoverSettings, User, Property, UserRole
+from services import load_profiles
 from schemas import (
     HandoverCreate,
     HandoverUpdate,
@@ -46,7 +47,7 @@ class HandoverService:
                 return []
 
             # Filter by user's accessible properties
-            query = db.query(Handover).filter(Handover.property_id.in_(user_property_ids))
+            query = db.query(Handover).options(*load_profiles.HANDOVER).filter(Handover.property_id.in_(user_property_ids))
 
             # Additional filters
             if property_id:
@@ -15,6 +15,8 @@ from datetime import datetime, timedelta
 import logging
 from uuid import UUID
 from services.ai_ml_service import get_llm_service
+from services.agent_spatial_index import coordinates
+from services.mobile_agent_service import MobileAgentService
 from io import BytesIO, StringIO
 import csv
 from collections import Counter, defaultdict
@@ -211,11 +213,25 @@ class IncidentService:
                 witnesses=db_incident.witnesses,
                 ai_confidence=db_incident.ai_confidence,
                 follow_up_required=db_incident.follow_up_required,
-                insurance_claim=db_incident.insurance_claim
+                insurance_claim=db_incident.insurance_claim,
+                suggested_responders=IncidentService._suggest_responders(db_incident.location)
             )
         finally:
             db.close()
 
+    @staticmethod
+    def _suggest_responders(location: Any) -> Optional[List[Dict[str, Any]]]:
+        """Nearest dispatchable agents when the incident location carries coordinates."""
+        point = coordinates(location)
+        if point is None:
+            return None
+        try:
+            return [agent.model_dump(mode="json") for agent in MobileAgentService.find_nearest_agents(*point)]
+        except Exception as e:
+            # Suggestions are advisory; never block incident creation on them
+            logger.warning(f"Responder suggestion failed: {e}")
+            return None
+
     @staticmethod
     async def get_ai_classification_suggestion(title: str, description: str, location: Dict[str, Any] = None) -> Dict[str, Any]:
         """Get AI classification suggestion without creating an incident"""
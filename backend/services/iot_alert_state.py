@@ -0,0 +1,92 @@
+"""
+IoT Alert State
+Alert state machine for environmental sensors, keyed by (sensor, alert_type).
+
+  - Threshold status uses hysteresis: a sensor that went critical only returns to normal
+    once its value is back inside the thresholds by a margin, so noise around a
+    threshold does not flap the status.
+  - While an alert is open, repeat occurrences roll up into it (occurrence_count,
+    last_occurred_at) instead of inserting new rows.
+  - An alert that re-occurs within the minimum re-fire interval of its last occurrence is
+    reopened rather than duplicated.
+  - Push notifications go out at most once per re-fire interval per alert.
+"""
+from typing import Any, Optional
+from datetime import datetime, timezone
+import os
+
+from models import ThreatSeverity
+
+ALERT_REFIRE_SECONDS = float(os.getenv("IOT_ALERT_REFIRE_SECONDS", "900"))
+# Fraction of the threshold band (or of the threshold itself when only one bound is set)
+HYSTERESIS_RATIO = float(os.getenv("IOT_ALERT_HYSTERESIS_RATIO", "0.05"))
+
+SEVERITY_RANK = {
+    ThreatSeverity.LOW: 0,
+    ThreatSeverity.MEDIUM: 1,
+    ThreatSeverity.HIGH: 2,
+    ThreatSeverity.CRITICAL: 3,
+}
+
+ROLLUP = "rollup"
+REOPEN = "reopen"
+CREATE = "create"
+
+
+def _hysteresis_margin(threshold_min: Optional[float], threshold_max: Optional[float], bound: float) -> float:
+    if threshold_min is not None and threshold_max is not None and threshold_max > threshold_min:
+        return (threshold_max - threshold_min) * HYSTERESIS_RATIO
+    return abs(bound) * HYSTERESIS_RATIO
+
+
+def threshold_status(
+    value: Optional[float],
+    threshold_min: Optional[float],
+    threshold_max: Optional[float],
+    previous_status: Optional[str] = None,
+) -> str:
+    """Static threshold status with hysteresis on the way back to normal."""
+    if value is None:
+        return "normal"
+    if threshold_min is not None and value < threshold_min:
+        return "critical"
+    if threshold_max is not None and value > threshold_max:
+        return "critical"
+    if previous_status == "critical":
+        if threshold_min is not None and value < threshold_min + _hysteresis_margin(threshold_min, threshold_max, threshold_min):
+            return "critical"
+        if threshold_max is not None and value > threshold_max - _hysteresis_margin(threshold_min, threshold_max, threshold_max):
+            return "critical"
+    return "normal"
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _seconds_since(value: Optional[datetime], now: datetime) -> float:
+    value = _as_utc(value)
+    return float("inf") if value is None else (_as_utc(now) - value).total_seconds()
+
+
+def next_transition(latest_alert: Any, now: datetime) -> str:
+    """What a new occurrence does given the latest alert for its (sensor, alert_type)."""
+    if latest_alert is None:
+        return CREATE
+    if not latest_alert.resolved:
+        return ROLLUP
+    last_occurred = latest_alert.last_occurred_at or latest_alert.created_at
+    if _seconds_since(last_occurred, now) < ALERT_REFIRE_SECONDS:
+        return REOPEN
+    return CREATE
+
+
+def escalate(current: ThreatSeverity, incoming: ThreatSeverity) -> ThreatSeverity:
+    return incoming if SEVERITY_RANK.get(incoming, 0) > SEVERITY_RANK.get(current, 0) else current
+
+
+def should_notify(severity: ThreatSeverity, last_notified_at: Optional[datetime], now: datetime) -> bool:
+    """Critical alerts notify, but never more than once per re-fire interval."""
+    return severity == ThreatSeverity.CRITICAL and _seconds_since(last_notified_at, now) >= ALERT_REFIRE_SECONDS
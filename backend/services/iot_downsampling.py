@@ -0,0 +1,50 @@
+"""
+IoT Downsampling
+Shape-preserving downsampling of sensor series for charts.
+
+Largest-Triangle-Three-Buckets (LTTB, Steinarsson 2013) keeps the first and last point and
+picks, from each bucket in between, the point forming the largest triangle with the point
+picked in the previous bucket and the average of the next bucket. Spikes and turning
+points survive, which plain averaging flattens.
+"""
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the ``threshold`` points LTTB keeps from a series sorted by ``x``."""
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    # threshold - 2 buckets over the interior points; spacing >= 1 so none are empty
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    lengths = np.diff(np.r_[edges, size])
+    # Mean of every bucket (the last "bucket" is the final point), precomputed in one pass
+    mean_x = np.add.reduceat(x, edges) / lengths
+    mean_y = np.add.reduceat(y, edges) / lengths
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        begin, end = edges[bucket], edges[bucket + 1]
+        ax, ay = x[anchor], y[anchor]
+        area = np.abs(
+            (ax - mean_x[bucket + 1]) * (y[begin:end] - ay)
+            - (ax - x[begin:end]) * (mean_y[bucket + 1] - ay)
+        )
+        anchor = begin + int(area.argmax())
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int):
+    """Downsample (x, y) to at most ``threshold`` points with LTTB."""
+    index = lttb_indices(np.asarray(x, dtype=float), np.asarray(y, dtype=float), threshold)
+    return np.asarray(x)[index], np.asarray(y)[index]
+
+
+def epoch_to_datetimes(epoch_seconds: np.ndarray) -> list:
+    """Epoch seconds -> naive UTC datetimes (millisecond precision)."""
+    return np.round(np.asarray(epoch_seconds) * 1000).astype(np.int64).astype("datetime64[ms]").tolist()
@@ -3,13 +3,21 @@ IoT Environmental Service
 """
 from typing import Any, Dict, List, Optional
 from datetime import datetime
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
+import csv
+import io
+import numpy as np
 from fastapi import HTTPException, status
 import logging
 
 from database import SessionLocal
-from models import IoTEnvironmentalData, IoTEnvironmentalAlert, IoTEnvironmentalSettings, Property, SensorType, ThreatSeverity, UserRole, Camera
+from models import IoTEnvironmentalData, IoTEnvironmentalAlert, IoTEnvironmentalSettings, Property, SensorType, ThreatSeverity, UserRole
 from services.push_notification_service import PushNotificationService
+from services.iot_timeseries_store import get_sensor_reading_store, to_utc_naive
+from services.sensor_rolling_stats import get_sensor_stats_engine
+from services import iot_alert_state, load_profiles
+from services.iot_downsampling import epoch_to_datetimes, lttb
 from schemas import (
     IoTEnvironmentalDataCreate,
     IoTEnvironmentalDataResponse,
@@ -22,6 +30,14 @@ from schemas import (
 
 logger = logging.getLogger(__name__)
 
+EPOCH = datetime(1970, 1, 1)
+
+MAX_SERIES_POINTS = 5000
+# LTTB runs on raw readings up to this many per requested point; longer ranges are first
+# reduced to LTTB_PREAGGREGATE_FACTOR x points time buckets in the database
+LTTB_RAW_FACTOR = 20
+LTTB_PREAGGREGATE_FACTOR = 4
+
 class IoTEnvironmentalService:
     def __init__(self, db: Optional[Session] = None):
         self.db = db or SessionLocal()
@@ -73,20 +89,16 @@ class IoTEnvironmentalService:
         return {column: value}
 
     @staticmethod
-    def _resolve_status(value: Optional[float], threshold_min: Optional[float], threshold_max: Optional[float]) -> str:
-        if value is None:
-            return "normal"
-        if threshold_min is not None and value < threshold_min:
-            return "critical"
-        if threshold_max is not None and value > threshold_max:
-            return "critical"
-        return "normal"
+    def _resolve_status(
+        value: Optional[float],
+        threshold_min: Optional[float],
+        threshold_max: Optional[float],
+        previous_status: Optional[str] = None,
+    ) -> str:
+        return iot_alert_state.threshold_status(value, threshold_min, threshold_max, previous_status)
 
     def _serialize_data(self, data: IoTEnvironmentalData) -> IoTEnvironmentalDataResponse:
-        camera_name = None
-        if data.camera_id:
-            camera = self.db.query(Camera).filter(Camera.camera_id == data.camera_id).first()
-            camera_name = camera.name if camera else None
+        camera_name = data.camera.name if data.camera_id and data.camera else None
         return IoTEnvironmentalDataResponse(
             data_id=data.data_id,
             property_id=data.property_id,
@@ -117,10 +129,7 @@ class IoTEnvironmentalService:
         )
 
     def _serialize_alert(self, alert: IoTEnvironmentalAlert) -> SensorAlertResponse:
-        camera_name = None
-        if alert.camera_id:
-            camera = self.db.query(Camera).filter(Camera.camera_id == alert.camera_id).first()
-            camera_name = camera.name if camera else None
+        camera_name = alert.camera.name if alert.camera_id and alert.camera else None
         return SensorAlertResponse(
             alert_id=alert.alert_id,
             property_id=alert.property_id,
@@ -135,6 +144,8 @@ class IoTEnvironmentalService:
             noise_level=alert.noise_level,
             status=alert.status,
             resolved=alert.resolved,
+            occurrence_count=alert.occurrence_count or 1,
+            last_occurred_at=alert.last_occurred_at,
             created_at=alert.created_at,
             resolved_at=alert.resolved_at,
         )
@@ -150,45 +161,282 @@ class IoTEnvironmentalService:
             IoTEnvironmentalData.sensor_id == payload.sensor_id
         ).first()
 
-        status_value = self._resolve_status(payload.value, payload.threshold_min, payload.threshold_max)
+        previous_status = sensor.status if sensor else None
+        sensor = self._apply_reading_to_sensor(property_id, sensor, payload, location)
+
+        anomalies = self._append_reading(property_id, payload.sensor_id, payload.sensor_type, payload.value, payload.timestamp)
+        self.db.commit()
+        self.db.refresh(sensor)
+        if sensor.status == "critical" and previous_status != "critical":
+            self._create_threshold_alert(payload, location, user_id)
+        self._create_statistical_alerts(anomalies, {payload.sensor_id: location}, user_id)
+        return self._serialize_data(sensor)
 
+    def _sensor_row_values(
+        self,
+        payload: IoTEnvironmentalDataCreate,
+        location: Any,
+        previous_status: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Registry column values derived from a sensor's most recent reading."""
+        values = {
+            "sensor_type": payload.sensor_type,
+            "location": location,
+            "value": payload.value,
+            "unit": payload.unit,
+            "threshold_min": payload.threshold_min,
+            "threshold_max": payload.threshold_max,
+            "status": self._resolve_status(payload.value, payload.threshold_min, payload.threshold_max, previous_status),
+            **self._map_value_to_columns(payload.sensor_type, payload.value)
+        }
+        if payload.camera_id:
+            values["camera_id"] = str(payload.camera_id)
+        return values
+
+    def _apply_reading_to_sensor(
+        self,
+        property_id: str,
+        sensor: Optional[IoTEnvironmentalData],
+        payload: IoTEnvironmentalDataCreate,
+        location: Any,
+    ) -> IoTEnvironmentalData:
+        """Update (or create) the sensor's registry row from its most recent reading."""
+        values = self._sensor_row_values(payload, location, sensor.status if sensor else None)
         if sensor:
-            sensor.sensor_type = payload.sensor_type
-            sensor.location = location
-            sensor.value = payload.value
-            sensor.unit = payload.unit
-            if payload.camera_id:
-                sensor.camera_id = str(payload.camera_id)
-            sensor.threshold_min = payload.threshold_min
-            sensor.threshold_max = payload.threshold_max
-            sensor.status = status_value
-            for key, value in self._map_value_to_columns(payload.sensor_type, payload.value).items():
+            for key, value in values.items():
                 setattr(sensor, key, value)
         else:
-            sensor = IoTEnvironmentalData(
-                property_id=property_id,
-                sensor_id=payload.sensor_id,
-                sensor_type=payload.sensor_type,
-                location=location,
-                camera_id=str(payload.camera_id) if payload.camera_id else None,
-                value=payload.value,
-                unit=payload.unit,
-                threshold_min=payload.threshold_min,
-                threshold_max=payload.threshold_max,
-                status=status_value,
-                **self._map_value_to_columns(payload.sensor_type, payload.value)
-            )
+            sensor = IoTEnvironmentalData(property_id=property_id, sensor_id=payload.sensor_id, **values)
             self.db.add(sensor)
+        return sensor
+
+    def record_sensor_data_batch(self, readings: List[IoTEnvironmentalDataCreate], user_id: Optional[str]) -> Dict[str, Any]:
+        """Ingest many readings with one property lookup, bulk writes and a single commit.
+
+        Every reading is appended to history; each sensor's registry row is updated once,
+        from its newest reading in the batch.
+        """
+        property_id = self._get_default_property_id(self.db, user_id)
+        if not property_id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No property assigned")
+        if not readings:
+            return {"property_id": property_id, "accepted": 0, "sensors": []}
+
+        now = datetime.utcnow()
+        timestamps = [to_utc_naive(reading.timestamp) if reading.timestamp else now for reading in readings]
+        newest: Dict[str, int] = {}
+        for index, reading in enumerate(readings):
+            current = newest.get(reading.sensor_id)
+            if current is None or timestamps[index] >= timestamps[current]:
+                newest[reading.sensor_id] = index
+
+        registry = IoTEnvironmentalData.__table__
+        existing = {
+            sensor_id: (data_id, sensor_status)
+            for sensor_id, data_id, sensor_status in self.db.execute(
+                select(registry.c.sensor_id, registry.c.data_id, registry.c.status).where(
+                    registry.c.property_id == property_id,
+                    registry.c.sensor_id.in_(list(newest))
+                )
+            ).all()
+        }
+
+        # Group rows by column set so each group is a single executemany statement
+        updates: Dict[tuple, List[Dict[str, Any]]] = {}
+        inserts: Dict[tuple, List[Dict[str, Any]]] = {}
+        sensors = []
+        crossings = []
+        for sensor_id, index in newest.items():
+            payload = readings[index]
+            previous_status = existing[sensor_id][1] if sensor_id in existing else None
+            values = self._sensor_row_values(payload, self._normalize_location(payload.location), previous_status)
+            if values["status"] == "critical" and previous_status != "critical":
+                crossings.append((payload, values["location"]))
+            sensors.append({
+                "sensor_id": sensor_id,
+                "sensor_type": payload.sensor_type.value,
+                "location": values["location"],
+                "value": payload.value,
+                "unit": payload.unit,
+                "status": values["status"],
+                "timestamp": timestamps[index].isoformat(),
+                "threshold_min": payload.threshold_min,
+                "threshold_max": payload.threshold_max,
+                "camera_id": values.get("camera_id"),
+            })
+            if sensor_id in existing:
+                updates.setdefault(tuple(sorted(values)), []).append({"b_data_id": existing[sensor_id][0], **values})
+            else:
+                inserts.setdefault(tuple(sorted(values)), []).append({"property_id": property_id, "sensor_id": sensor_id, **values})
+        connection = self.db.connection()
+        for columns, rows in updates.items():
+            connection.execute(
+                update(registry).where(registry.c.data_id == bindparam("b_data_id")).values(
+                    {column: bindparam(column) for column in columns}
+                ),
+                rows
+            )
+        for rows in inserts.values():
+            connection.execute(registry.insert(), rows)
 
+        store = get_sensor_reading_store()
+        keys = store.get_sensor_keys_bulk(
+            self.db, property_id, {sensor_id: readings[index].sensor_type for sensor_id, index in newest.items()}
+        )
+        rows = [
+            (keys[reading.sensor_id], timestamps[index], reading.value)
+            for index, reading in enumerate(readings) if reading.value is not None
+        ]
+        store.append(self.db, rows)
+        store.update_latest(self.db, rows)
+        anomalies = self._score_readings(
+            [reading.sensor_id for reading in readings if reading.value is not None],
+            rows
+        )
         self.db.commit()
-        self.db.refresh(sensor)
-        return self._serialize_data(sensor)
+
+        for payload, location in crossings:
+            self._create_threshold_alert(payload, location, user_id)
+        self._create_statistical_alerts(
+            anomalies, {sensor["sensor_id"]: sensor["location"] for sensor in sensors}, user_id
+        )
+        return {"property_id": property_id, "accepted": len(rows), "sensors": sensors}
+
+    @staticmethod
+    def parse_sensor_batch_csv(body: str) -> List[Dict[str, Any]]:
+        """Parse a compact CSV batch: header row, then one reading per line.
+
+        Required columns: sensor_id, sensor_type, value. Optional: timestamp, unit,
+        location, threshold_min, threshold_max.
+        """
+        reader = csv.DictReader(io.StringIO(body))
+        if not reader.fieldnames or not {"sensor_id", "sensor_type", "value"}.issubset(reader.fieldnames):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="CSV batch requires a header with sensor_id, sensor_type and value columns"
+            )
+        rows = []
+        for row in reader:
+            rows.append({
+                key: value for key, value in row.items()
+                if key is not None and value not in (None, "")
+            })
+            rows[-1].setdefault("location", "Unknown")
+        return rows
+
+    def _append_reading(
+        self,
+        property_id: str,
+        sensor_id: str,
+        sensor_type: SensorType,
+        value: Optional[float],
+        timestamp: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """Append a reading to the time-series history and advance the sensor's latest value.
+
+        Returns any statistical anomalies the reading raised.
+        """
+        if value is None:
+            return []
+        store = get_sensor_reading_store()
+        sensor_key = store.get_sensor_key(self.db, property_id, sensor_id, sensor_type)
+        reading = [(sensor_key, to_utc_naive(timestamp) if timestamp else datetime.utcnow(), value)]
+        store.append(self.db, reading)
+        store.update_latest(self.db, reading)
+        return self._score_readings([sensor_id], reading)
+
+    @staticmethod
+    def _score_readings(sensor_ids: List[str], rows: List[tuple]) -> List[Dict[str, Any]]:
+        """Run (sensor_key, ts, value) rows through the rolling statistics engine."""
+        if not rows:
+            return []
+        try:
+            anomalies = get_sensor_stats_engine().detect(
+                [sensor_key for sensor_key, _, _ in rows],
+                [value for _, _, value in rows],
+                # Naive UTC datetimes -> epoch seconds (timedelta arithmetic is several
+                # times faster than numpy's datetime64 conversion of Python datetimes)
+                np.array([(ts - EPOCH).total_seconds() for _, ts, _ in rows])
+            )
+        except Exception as e:
+            logger.warning(f"Rolling statistics scoring failed: {e}")
+            return []
+        for anomaly in anomalies:
+            anomaly["sensor_id"] = sensor_ids[anomaly["index"]]
+        return anomalies
+
+    def _create_threshold_alert(
+        self,
+        payload: IoTEnvironmentalDataCreate,
+        location: Any,
+        user_id: Optional[str],
+        sensor_id: Optional[str] = None,
+    ) -> None:
+        """Raise (or roll up) the threshold alert for a sensor that just went critical."""
+        sensor_id = sensor_id or payload.sensor_id
+        bounds = " to ".join(
+            "-" if bound is None else f"{bound:g}" for bound in (payload.threshold_min, payload.threshold_max)
+        )
+        try:
+            self.create_alert(
+                SensorAlertCreate(
+                    sensor_id=sensor_id,
+                    alert_type=payload.sensor_type.value,
+                    severity=ThreatSeverity.CRITICAL,
+                    description=f"Sensor {sensor_id} reading {payload.value:g} is outside its threshold range ({bounds})",
+                    location=location,
+                ),
+                user_id
+            )
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"Failed to create threshold alert for sensor {sensor_id}: {e}")
+
+    def _create_statistical_alerts(
+        self,
+        anomalies: List[Dict[str, Any]],
+        locations: Dict[str, Any],
+        user_id: Optional[str],
+    ) -> None:
+        """Raise an alert for each sensor whose readings deviated from its rolling statistics."""
+        strongest: Dict[str, Dict[str, Any]] = {}
+        for anomaly in anomalies:
+            current = strongest.get(anomaly["sensor_id"])
+            if current is None or abs(anomaly["z_score"]) > abs(current["z_score"]):
+                strongest[anomaly["sensor_id"]] = anomaly
+        engine = get_sensor_stats_engine()
+        for sensor_id, anomaly in strongest.items():
+            if anomaly["anomaly_type"] == "rapid_change":
+                description = (
+                    f"Sensor {sensor_id} jumped to {anomaly['value']:g} "
+                    f"(recent range {anomaly['rolling_min']:g} to {anomaly['rolling_max']:g})"
+                )
+            else:
+                description = (
+                    f"Sensor {sensor_id} reading {anomaly['value']:g} is {abs(anomaly['z_score']):.1f} "
+                    f"standard deviations from its mean {anomaly['mean']:g}"
+                )
+            severity = ThreatSeverity.HIGH if abs(anomaly["z_score"]) >= 2 * engine.z_threshold else ThreatSeverity.MEDIUM
+            try:
+                self.create_alert(
+                    SensorAlertCreate(
+                        sensor_id=sensor_id,
+                        alert_type=anomaly["anomaly_type"],
+                        severity=severity,
+                        description=description,
+                        location=locations.get(sensor_id),
+                    ),
+                    user_id
+                )
+            except Exception as e:
+                self.db.rollback()
+                logger.warning(f"Failed to create statistical alert for sensor {sensor_id}: {e}")
 
     def list_sensor_readings(self, user_id: Optional[str]) -> List[IoTEnvironmentalDataResponse]:
         property_id = self._get_default_property_id(self.db, user_id)
         if not property_id:
             return []
-        sensors = self.db.query(IoTEnvironmentalData).filter(
+        sensors = self.db.query(IoTEnvironmentalData).options(*load_profiles.IOT_READING).filter(
             IoTEnvironmentalData.property_id == property_id
         ).order_by(IoTEnvironmentalData.timestamp.desc()).all()
         return [self._serialize_data(sensor) for sensor in sensors]
@@ -216,10 +464,15 @@ class IoTEnvironmentalService:
         sensor.unit = payload.unit
         if payload.camera_id is not None:
             sensor.camera_id = str(payload.camera_id)
-        sensor.status = self._resolve_status(payload.value, payload.threshold_min, payload.threshold_max)
+        previous_status = sensor.status
+        sensor.status = self._resolve_status(payload.value, payload.threshold_min, payload.threshold_max, previous_status)
 
+        anomalies = self._append_reading(property_id, sensor_id, payload.sensor_type, payload.value, payload.timestamp)
         self.db.commit()
         self.db.refresh(sensor)
+        if sensor.status == "critical" and previous_status != "critical":
+            self._create_threshold_alert(payload, sensor.location, user_id, sensor_id=sensor_id)
+        self._create_statistical_alerts(anomalies, {sensor_id: sensor.location}, user_id)
         return self._serialize_data(sensor)
 
     def delete_sensor(self, sensor_id: str, user_id: Optional[str]) -> None:
@@ -238,41 +491,69 @@ class IoTEnvironmentalService:
         self.db.commit()
 
     def create_alert(self, payload: SensorAlertCreate, user_id: Optional[str]) -> SensorAlertResponse:
+        """Raise an alert, rolling repeat occurrences into the latest alert for the same
+        sensor and alert type (see services.iot_alert_state)."""
         property_id = self._get_default_property_id(self.db, user_id)
         if not property_id:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No property assigned")
 
-        resolved_camera_id = str(payload.camera_id) if payload.camera_id else None
-        light_level = None
-        noise_level = None
-        if not resolved_camera_id:
-            latest = self.db.query(IoTEnvironmentalData).filter(
-                IoTEnvironmentalData.property_id == property_id,
-                IoTEnvironmentalData.sensor_id == payload.sensor_id
-            ).order_by(IoTEnvironmentalData.timestamp.desc()).first()
-            if latest and latest.camera_id:
-                resolved_camera_id = latest.camera_id
-            if latest:
-                light_level = latest.light_level
-                noise_level = latest.noise_level
-
-        alert = IoTEnvironmentalAlert(
-            property_id=property_id,
-            sensor_id=payload.sensor_id,
-            camera_id=resolved_camera_id,
-            alert_type=payload.alert_type,
-            severity=payload.severity or ThreatSeverity.MEDIUM,
-            message=payload.description,
-            location=self._normalize_location(payload.location),
-            light_level=light_level,
-            noise_level=noise_level,
-            status="active",
-            resolved=False,
-        )
-        self.db.add(alert)
+        now = datetime.utcnow()
+        severity = payload.severity or ThreatSeverity.MEDIUM
+        latest_alert = self.db.query(IoTEnvironmentalAlert).filter(
+            IoTEnvironmentalAlert.property_id == property_id,
+            IoTEnvironmentalAlert.sensor_id == payload.sensor_id,
+            IoTEnvironmentalAlert.alert_type == payload.alert_type
+        ).order_by(IoTEnvironmentalAlert.created_at.desc()).first()
+        transition = iot_alert_state.next_transition(latest_alert, now)
+
+        if transition == iot_alert_state.CREATE:
+            resolved_camera_id = str(payload.camera_id) if payload.camera_id else None
+            light_level = None
+            noise_level = None
+            if not resolved_camera_id:
+                latest = self.db.query(IoTEnvironmentalData).filter(
+                    IoTEnvironmentalData.property_id == property_id,
+                    IoTEnvironmentalData.sensor_id == payload.sensor_id
+                ).order_by(IoTEnvironmentalData.timestamp.desc()).first()
+                if latest and latest.camera_id:
+                    resolved_camera_id = latest.camera_id
+                if latest:
+                    light_level = latest.light_level
+                    noise_level = latest.noise_level
+
+            alert = IoTEnvironmentalAlert(
+                property_id=property_id,
+                sensor_id=payload.sensor_id,
+                camera_id=resolved_camera_id,
+                alert_type=payload.alert_type,
+                severity=severity,
+                message=payload.description,
+                location=self._normalize_location(payload.location),
+                light_level=light_level,
+                noise_level=noise_level,
+                status="active",
+                resolved=False,
+                occurrence_count=1,
+                last_occurred_at=now,
+            )
+            self.db.add(alert)
+        else:
+            alert = latest_alert
+            alert.severity = iot_alert_state.escalate(alert.severity, severity)
+            alert.message = payload.description
+            alert.occurrence_count = (alert.occurrence_count or 1) + 1
+            alert.last_occurred_at = now
+            if transition == iot_alert_state.REOPEN:
+                alert.status = "active"
+                alert.resolved = False
+                alert.resolved_at = None
+
+        notify = iot_alert_state.should_notify(alert.severity, alert.last_notified_at, now)
+        if notify:
+            alert.last_notified_at = now
         self.db.commit()
         self.db.refresh(alert)
-        if alert.severity == ThreatSeverity.CRITICAL:
+        if notify:
             try:
                 PushNotificationService().send_environmental_alert(
                     alert_id=str(alert.alert_id),
@@ -289,7 +570,7 @@ class IoTEnvironmentalService:
         property_id = self._get_default_property_id(self.db, user_id)
         if not property_id:
             return []
-        alerts = self.db.query(IoTEnvironmentalAlert).filter(
+        alerts = self.db.query(IoTEnvironmentalAlert).options(*load_profiles.IOT_ALERT).filter(
             IoTEnvironmentalAlert.property_id == property_id
         ).order_by(IoTEnvironmentalAlert.created_at.desc()).all()
         return [self._serialize_alert(alert) for alert in alerts]
@@ -322,27 +603,115 @@ class IoTEnvironmentalService:
         if not property_id:
             return {"temperature": 0.0, "humidity": 0.0, "air_quality": 0.0}
 
-        query = self.db.query(IoTEnvironmentalData).filter(
-            IoTEnvironmentalData.property_id == property_id,
-            IoTEnvironmentalData.timestamp >= start_date,
-            IoTEnvironmentalData.timestamp <= end_date
-        )
+        report_types = {
+            SensorType.TEMPERATURE: "temperature",
+            SensorType.HUMIDITY: "humidity",
+            SensorType.AIR_QUALITY: "air_quality",
+        }
+        sensor_ids = None
         if location:
-            query = query.filter(IoTEnvironmentalData.location['label'].astext == location)
-
-        rows = query.all()
-        temps = [row.value for row in rows if row.sensor_type == SensorType.TEMPERATURE and row.value is not None]
-        hums = [row.value for row in rows if row.sensor_type == SensorType.HUMIDITY and row.value is not None]
-        airq = [row.value for row in rows if row.sensor_type == SensorType.AIR_QUALITY and row.value is not None]
-
-        def avg(values: List[float]) -> float:
-            return sum(values) / len(values) if values else 0.0
+            registry = self.db.query(IoTEnvironmentalData.sensor_id, IoTEnvironmentalData.location).filter(
+                IoTEnvironmentalData.property_id == property_id
+            ).all()
+            sensor_ids = [
+                sensor_id for sensor_id, sensor_location in registry
+                if isinstance(sensor_location, dict) and sensor_location.get("label") == location
+            ]
+
+        store = get_sensor_reading_store()
+        sensors = store.get_sensor_keys(self.db, property_id, sensor_ids=sensor_ids, sensor_types=list(report_types))
+        totals = store.aggregate(self.db, list(sensors), start_date, end_date)
+
+        sums = {name: 0.0 for name in report_types.values()}
+        counts = {name: 0 for name in report_types.values()}
+        for sensor_key, stats in totals.items():
+            name = report_types[sensors[sensor_key]["sensor_type"]]
+            sums[name] += stats["sum"]
+            counts[name] += stats["count"]
+
+        return {name: (sums[name] / counts[name] if counts[name] else 0.0) for name in report_types.values()}
+
+    def get_sensor_series(
+        self,
+        sensor_ids: Optional[List[str]],
+        start_date: datetime,
+        end_date: datetime,
+        points: int,
+        method: str,
+        user_id: Optional[str],
+    ) -> Dict[str, Any]:
+        """Chart series for a set of sensors, downsampled server-side to about ``points`` points.
+
+        ``method="lttb"`` keeps the shape (spikes, turning points) of each series;
+        ``method="average"`` returns time-bucket mean/min/max.
+        """
+        if method not in ("lttb", "average"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="method must be 'lttb' or 'average'")
+        start, end = to_utc_naive(start_date), to_utc_naive(end_date)
+        if end <= start:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end_date must be after start_date")
+        points = max(3, min(points, MAX_SERIES_POINTS))
+        response = {"start_date": start, "end_date": end, "points": points, "series": []}
+        property_id = self._get_default_property_id(self.db, user_id)
+        if not property_id:
+            return response
+
+        store = get_sensor_reading_store()
+        sensors = store.get_sensor_keys(self.db, property_id, sensor_ids=sensor_ids or None)
+        counts = {key: totals["count"] for key, totals in store.aggregate(self.db, list(sensors), start, end).items()}
+        span = (end - start).total_seconds()
+
+        raw_keys = [
+            key for key, count in counts.items()
+            if count <= points or (method == "lttb" and count <= points * LTTB_RAW_FACTOR)
+        ]
+        bucketed_keys = [key for key in counts if key not in raw_keys]
+        raw = store.select_series(self.db, raw_keys, start, end)
+        bucket_factor = LTTB_PREAGGREGATE_FACTOR if method == "lttb" else 1
+        bucket_seconds = span / (points * bucket_factor)
+        buckets = store.bucket_series(self.db, bucketed_keys, start, end, bucket_seconds)
+
+        for key in sorted(counts, key=lambda sensor_key: sensors[sensor_key]["sensor_id"]):
+            entry = {
+                "sensor_id": sensors[key]["sensor_id"],
+                "sensor_type": sensors[key]["sensor_type"],
+                "raw_count": counts[key],
+                "min_values": None,
+                "max_values": None,
+            }
+            if key in raw:
+                ts, values = raw[key]
+                entry["method"] = "raw" if len(ts) <= points else "lttb"
+                ts, values = lttb(ts, values, points)
+            elif key in buckets:
+                aggregated = buckets[key]
+                if method == "lttb":
+                    entry["method"] = "lttb"
+                    ts, values = lttb(*self._bucket_extrema(aggregated, bucket_seconds), points)
+                else:
+                    entry["method"] = "average"
+                    ts, values = aggregated["ts"], aggregated["mean"]
+                    entry["min_values"] = aggregated["min"].tolist()
+                    entry["max_values"] = aggregated["max"].tolist()
+            else:
+                continue
+            entry["timestamps"] = epoch_to_datetimes(ts)
+            entry["values"] = np.asarray(values).tolist()
+            response["series"].append(entry)
+        return response
 
-        return {
-            "temperature": avg(temps),
-            "humidity": avg(hums),
-            "air_quality": avg(airq),
-        }
+    @staticmethod
+    def _bucket_extrema(aggregated: Dict[str, Any], bucket_seconds: float):
+        """Min and max of every bucket as two points, in the order the series moves
+        through them, so LTTB over pre-aggregated buckets still sees the peaks."""
+        rising = np.r_[np.diff(aggregated["mean"]) >= 0, True]
+        first = np.where(rising, aggregated["min"], aggregated["max"])
+        second = np.where(rising, aggregated["max"], aggregated["min"])
+        offset = bucket_seconds / 4
+        ts = np.column_stack((aggregated["ts"] - offset, aggregated["ts"] + offset)).ravel()
+        values = np.column_stack((first, second)).ravel()
+        order = np.argsort(ts, kind="stable")
+        return ts[order], values[order]
 
     def get_environmental_analytics(self, user_id: Optional[str]) -> Dict[str, Any]:
         property_id = self._get_default_property_id(self.db, user_id)
@@ -0,0 +1,467 @@
+"""
+IoT Time-Series Store
+Append-only storage for sensor readings plus a per-sensor "latest value" table.
+
+Readings are narrow rows of (sensor_key, ts, value). On PostgreSQL they go into a
+table range-partitioned by month; on SQLite they go into monthly chunk tables
+(iot_sensor_readings_pYYYYMM) cloned from the IoTSensorReading definition. Other
+databases use the plain iot_sensor_readings table.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone
+import logging
+import threading
+
+import numpy as np
+from sqlalchemy import Integer, Table, and_, bindparam, cast, func, inspect, literal_column, or_, select, text, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import Base
+from models import IoTSensorLatest, IoTSensorReading, SensorType
+
+logger = logging.getLogger(__name__)
+
+READINGS_TABLE = IoTSensorReading.__table__
+LATEST_TABLE = IoTSensorLatest.__table__
+CHUNK_PREFIX = f"{READINGS_TABLE.name}_p"
+
+Reading = Tuple[int, datetime, Optional[float]]
+
+
+def to_utc_naive(ts: Optional[datetime]) -> datetime:
+    """Normalize timestamps to naive UTC, matching how the rest of the backend stores them."""
+    if ts is None:
+        return datetime.utcnow()
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _next_month(ts: datetime) -> datetime:
+    return datetime(ts.year + 1, 1, 1) if ts.month == 12 else datetime(ts.year, ts.month + 1, 1)
+
+
+def _sqlite_datetime(ts: datetime) -> str:
+    return ts.isoformat(sep=" ", timespec="microseconds")
+
+
+def epoch_seconds(db: Session, column: Any) -> Any:
+    """SQL expression for a timestamp column as (float) seconds since the epoch."""
+    if db.get_bind().dialect.name == "sqlite":
+        # julianday() carries ~10 microseconds of float error at current dates; rounding
+        # to milliseconds keeps exact hour/day boundaries in the right bucket
+        return func.round((func.julianday(column) - 2440587.5) * 86400.0, 3)
+    return func.extract("epoch", column)
+
+
+def time_bucket(db: Session, column: Any, bucket_seconds: float, origin: float = 0.0) -> Any:
+    """SQL expression numbering ``bucket_seconds``-wide buckets counted from ``origin`` (epoch seconds)."""
+    # Literal (computed, numeric) constants keep the SELECT and GROUP BY expressions
+    # identical, which PostgreSQL requires
+    offset = (epoch_seconds(db, column) - literal_column(repr(float(origin)))) / literal_column(repr(float(bucket_seconds)))
+    return cast(offset, Integer) if db.get_bind().dialect.name == "sqlite" else func.floor(offset)
+
+
+def chunk_name(ts: datetime) -> str:
+    return f"{CHUNK_PREFIX}{ts.year:04d}{ts.month:02d}"
+
+
+def chunk_bounds(name: str) -> Tuple[datetime, datetime]:
+    suffix = name[len(CHUNK_PREFIX):]
+    start = datetime(int(suffix[:4]), int(suffix[4:6]), 1)
+    return start, _next_month(start)
+
+
+class SensorReadingStore:
+    """Dialect-aware writer/reader for iot_sensor_readings and iot_sensor_latest."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sensor_keys: Dict[Tuple[str, str], Tuple[int, SensorType]] = {}
+        self._ensured_chunks: set = set()
+
+    # --- sensor keys ------------------------------------------------------
+
+    def get_sensor_key(self, db: Session, property_id: str, sensor_id: str, sensor_type: SensorType) -> int:
+        """Return the compact key for a sensor, registering it in iot_sensor_latest on first use."""
+        cached = self._sensor_keys.get((property_id, sensor_id))
+        if cached and cached[1] == sensor_type:
+            return cached[0]
+        row = db.execute(
+            select(LATEST_TABLE.c.sensor_key, LATEST_TABLE.c.sensor_type).where(
+                LATEST_TABLE.c.property_id == property_id,
+                LATEST_TABLE.c.sensor_id == sensor_id
+            )
+        ).first()
+        key = row.sensor_key if row else None
+        if key is None:
+            try:
+                with db.begin_nested():
+                    key = db.execute(
+                        LATEST_TABLE.insert().values(
+                            property_id=property_id, sensor_id=sensor_id, sensor_type=sensor_type
+                        ).returning(LATEST_TABLE.c.sensor_key)
+                    ).scalar()
+            except IntegrityError:
+                # Registered concurrently by another request
+                key = db.execute(
+                    select(LATEST_TABLE.c.sensor_key).where(
+                        LATEST_TABLE.c.property_id == property_id,
+                        LATEST_TABLE.c.sensor_id == sensor_id
+                    )
+                ).scalar()
+        elif row.sensor_type != sensor_type:
+            db.execute(update(LATEST_TABLE).where(LATEST_TABLE.c.sensor_key == key).values(sensor_type=sensor_type))
+        with self._lock:
+            self._sensor_keys[(property_id, sensor_id)] = (key, sensor_type)
+        return key
+
+    def get_sensor_keys_bulk(self, db: Session, property_id: str, sensor_types: Dict[str, SensorType]) -> Dict[str, int]:
+        """Resolve keys for many sensors at once: one SELECT plus one multi-row INSERT for new sensors."""
+        keys: Dict[str, int] = {}
+        missing = {}
+        for sensor_id, sensor_type in sensor_types.items():
+            cached = self._sensor_keys.get((property_id, sensor_id))
+            if cached and cached[1] == sensor_type:
+                keys[sensor_id] = cached[0]
+            else:
+                missing[sensor_id] = sensor_type
+        if not missing:
+            return keys
+
+        def _lookup() -> Dict[str, Tuple[int, SensorType]]:
+            rows = db.execute(
+                select(LATEST_TABLE.c.sensor_id, LATEST_TABLE.c.sensor_key, LATEST_TABLE.c.sensor_type).where(
+                    LATEST_TABLE.c.property_id == property_id,
+                    LATEST_TABLE.c.sensor_id.in_(list(missing))
+                )
+            ).all()
+            return {row.sensor_id: (row.sensor_key, row.sensor_type) for row in rows}
+
+        found = _lookup()
+        new_rows = [
+            {"property_id": property_id, "sensor_id": sensor_id, "sensor_type": sensor_type}
+            for sensor_id, sensor_type in missing.items() if sensor_id not in found
+        ]
+        if new_rows:
+            try:
+                with db.begin_nested():
+                    db.execute(LATEST_TABLE.insert(), new_rows)
+            except IntegrityError:
+                # Some were registered concurrently; resolve the rest one by one
+                found = _lookup()
+                for row in new_rows:
+                    if row["sensor_id"] not in found:
+                        key = self.get_sensor_key(db, property_id, row["sensor_id"], row["sensor_type"])
+                        found[row["sensor_id"]] = (key, row["sensor_type"])
+            found = _lookup()
+        retyped = [
+            {"b_sensor_key": found[sensor_id][0], "b_sensor_type": sensor_type}
+            for sensor_id, sensor_type in missing.items()
+            if sensor_id in found and found[sensor_id][1] != sensor_type
+        ]
+        if retyped:
+            db.connection().execute(
+                update(LATEST_TABLE).where(LATEST_TABLE.c.sensor_key == bindparam("b_sensor_key")).values(
+                    sensor_type=bindparam("b_sensor_type")
+                ),
+                retyped
+            )
+        with self._lock:
+            for sensor_id, sensor_type in missing.items():
+                if sensor_id in found:
+                    keys[sensor_id] = found[sensor_id][0]
+                    self._sensor_keys[(property_id, sensor_id)] = (found[sensor_id][0], sensor_type)
+        return keys
+
+    def get_sensor_keys(
+        self,
+        db: Session,
+        property_id: str,
+        sensor_ids: Optional[Iterable[str]] = None,
+        sensor_types: Optional[Iterable[SensorType]] = None,
+    ) -> Dict[int, Dict[str, Any]]:
+        """Map sensor_key -> {sensor_id, sensor_type} for a property."""
+        query = select(LATEST_TABLE.c.sensor_key, LATEST_TABLE.c.sensor_id, LATEST_TABLE.c.sensor_type).where(
+            LATEST_TABLE.c.property_id == property_id
+        )
+        if sensor_ids is not None:
+            query = query.where(LATEST_TABLE.c.sensor_id.in_(list(sensor_ids)))
+        if sensor_types is not None:
+            query = query.where(LATEST_TABLE.c.sensor_type.in_(list(sensor_types)))
+        return {
+            row.sensor_key: {"sensor_id": row.sensor_id, "sensor_type": row.sensor_type}
+            for row in db.execute(query)
+        }
+
+    # --- chunk management -------------------------------------------------
+
+    def _chunk_table(self, name: str) -> Table:
+        table = Base.metadata.tables.get(name)
+        if table is None:
+            # Registering the clone in Base.metadata lets create_all/drop_all manage it too
+            table = READINGS_TABLE.to_metadata(Base.metadata, name=name)
+        return table
+
+    def ensure_chunk(self, db: Session, ts: datetime) -> Table:
+        """Return the table readings at ``ts`` should be inserted into, creating it if needed."""
+        dialect = db.get_bind().dialect.name
+        if dialect not in ("sqlite", "postgresql"):
+            return READINGS_TABLE
+        name = chunk_name(ts)
+        if dialect == "sqlite":
+            table = self._chunk_table(name)
+            if name not in self._ensured_chunks:
+                table.create(db.connection(), checkfirst=True)
+                self._ensured_chunks.add(name)
+            return table
+        if name not in self._ensured_chunks:
+            start, end = chunk_bounds(name)
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {READINGS_TABLE.name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            self._ensured_chunks.add(name)
+        return READINGS_TABLE
+
+    def existing_chunks(self, db: Session) -> List[str]:
+        """Chunk/partition table names currently present in the database, oldest first."""
+        names = inspect(db.connection()).get_table_names()
+        return sorted(name for name in names if name.startswith(CHUNK_PREFIX) and name[len(CHUNK_PREFIX):].isdigit())
+
+    def _tables_for_range(self, db: Session, start: datetime, end: datetime) -> List[Table]:
+        if db.get_bind().dialect.name != "sqlite":
+            return [READINGS_TABLE]
+        tables = []
+        for name in self.existing_chunks(db):
+            chunk_start, chunk_end = chunk_bounds(name)
+            if chunk_start <= end and chunk_end > start:
+                tables.append(self._chunk_table(name))
+        return tables
+
+    def forget_chunk(self, name: str) -> None:
+        self._ensured_chunks.discard(name)
+
+    # --- writes -----------------------------------------------------------
+
+    def append(self, db: Session, readings: Sequence[Reading]) -> int:
+        """Append readings; duplicates of an existing (sensor_key, ts) are ignored."""
+        if not readings:
+            return 0
+        dialect = db.get_bind().dialect.name
+        by_month: Dict[Tuple[int, int], List[Reading]] = {}
+        for sensor_key, ts, value in readings:
+            ts = to_utc_naive(ts)
+            by_month.setdefault((ts.year, ts.month), []).append((sensor_key, ts, value))
+        for (year, month), rows in by_month.items():
+            table = self.ensure_chunk(db, datetime(year, month, 1))
+            if dialect == "sqlite":
+                # Hot path: bypass per-row bind processing. Timestamps are rendered in the
+                # same fixed-width format SQLAlchemy's SQLite DateTime uses, so range
+                # comparisons against ORM-written values stay correct. Gateways sample their
+                # sensors on a shared tick, so each distinct timestamp is formatted once.
+                formatted: Dict[datetime, str] = {}
+                db.connection().exec_driver_sql(
+                    f"INSERT OR IGNORE INTO {table.name} (sensor_key, ts, value) VALUES (?, ?, ?)",
+                    [
+                        (sensor_key, formatted.get(ts) or formatted.setdefault(ts, _sqlite_datetime(ts)), value)
+                        for sensor_key, ts, value in rows
+                    ]
+                )
+                continue
+            if dialect == "postgresql":
+                stmt = pg_insert(table).on_conflict_do_nothing()
+            else:
+                stmt = table.insert()
+            db.execute(stmt, [{"sensor_key": sensor_key, "ts": ts, "value": value} for sensor_key, ts, value in rows])
+        return len(readings)
+
+    def update_latest(self, db: Session, readings: Sequence[Reading]) -> None:
+        """Advance iot_sensor_latest for each sensor, ignoring readings older than the stored one."""
+        newest: Dict[int, Tuple[datetime, Optional[float]]] = {}
+        for sensor_key, ts, value in readings:
+            ts = to_utc_naive(ts)
+            if sensor_key not in newest or ts >= newest[sensor_key][0]:
+                newest[sensor_key] = (ts, value)
+        if not newest:
+            return
+        stmt = update(LATEST_TABLE).where(
+            LATEST_TABLE.c.sensor_key == bindparam("b_sensor_key"),
+            or_(LATEST_TABLE.c.ts.is_(None), LATEST_TABLE.c.ts <= bindparam("b_ts"))
+        ).values(ts=bindparam("b_ts"), value=bindparam("b_value"))
+        db.connection().execute(stmt, [
+            {"b_sensor_key": sensor_key, "b_ts": ts, "b_value": value}
+            for sensor_key, (ts, value) in newest.items()
+        ])
+
+    # --- reads ------------------------------------------------------------
+
+    def select_readings(
+        self,
+        db: Session,
+        sensor_keys: Sequence[int],
+        start: datetime,
+        end: datetime,
+    ) -> List[Reading]:
+        """All readings for the given sensors in [start, end], ordered by sensor and time."""
+        start, end = to_utc_naive(start), to_utc_naive(end)
+        tables = self._tables_for_range(db, start, end)
+        if not tables or not sensor_keys:
+            return []
+        selects = [
+            select(table.c.sensor_key, table.c.ts, table.c.value).where(
+                table.c.sensor_key.in_(list(sensor_keys)),
+                table.c.ts >= start,
+                table.c.ts <= end
+            )
+            for table in tables
+        ]
+        query = selects[0] if len(selects) == 1 else union_all(*selects)
+        subquery = query.subquery()
+        rows = db.execute(select(subquery).order_by(subquery.c.sensor_key, subquery.c.ts)).all()
+        return [(row.sensor_key, row.ts, row.value) for row in rows]
+
+    def aggregate(
+        self,
+        db: Session,
+        sensor_keys: Sequence[int],
+        start: datetime,
+        end: datetime,
+    ) -> Dict[int, Dict[str, float]]:
+        """Per-sensor count/sum/min/max of readings in [start, end]."""
+        start, end = to_utc_naive(start), to_utc_naive(end)
+        tables = self._tables_for_range(db, start, end)
+        if not tables or not sensor_keys:
+            return {}
+        totals: Dict[int, Dict[str, float]] = {}
+        for table in tables:
+            rows = db.execute(
+                select(
+                    table.c.sensor_key,
+                    func.count(table.c.value),
+                    func.sum(table.c.value),
+                    func.min(table.c.value),
+                    func.max(table.c.value)
+                ).where(
+                    table.c.sensor_key.in_(list(sensor_keys)),
+                    and_(table.c.ts >= start, table.c.ts <= end)
+                ).group_by(table.c.sensor_key)
+            ).all()
+            for sensor_key, count, total, minimum, maximum in rows:
+                if not count:
+                    continue
+                entry = totals.setdefault(sensor_key, {"count": 0, "sum": 0.0, "min": minimum, "max": maximum})
+                entry["count"] += count
+                entry["sum"] += total
+                entry["min"] = min(entry["min"], minimum)
+                entry["max"] = max(entry["max"], maximum)
+        return totals
+
+    # --- chart reads ------------------------------------------------------
+
+    def select_series(
+        self,
+        db: Session,
+        sensor_keys: Sequence[int],
+        start: datetime,
+        end: datetime,
+    ) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """Raw readings per sensor as (epoch seconds, values) arrays in time order."""
+        start, end = to_utc_naive(start), to_utc_naive(end)
+        tables = self._tables_for_range(db, start, end)
+        if not tables or not sensor_keys:
+            return {}
+        rows = []
+        for table in tables:
+            rows.extend(db.execute(
+                select(table.c.sensor_key, epoch_seconds(db, table.c.ts), table.c.value).where(
+                    table.c.sensor_key.in_(list(sensor_keys)),
+                    table.c.ts >= start,
+                    table.c.ts <= end,
+                    table.c.value.isnot(None)
+                )
+            ).tuples().all())
+        if not rows:
+            return {}
+        data = np.array(rows, dtype=float)
+        data = data[np.lexsort((data[:, 1], data[:, 0]))]
+        keys, starts = np.unique(data[:, 0], return_index=True)
+        return {
+            int(key): (chunk[:, 1], chunk[:, 2])
+            for key, chunk in zip(keys, np.split(data, starts[1:]))
+        }
+
+    def bucket_series(
+        self,
+        db: Session,
+        sensor_keys: Sequence[int],
+        start: datetime,
+        end: datetime,
+        bucket_seconds: float,
+    ) -> Dict[int, Dict[str, np.ndarray]]:
+        """Per-sensor time-bucket aggregates computed in the database.
+
+        Each sensor maps to arrays of bucket index, reading count, mean timestamp (epoch
+        seconds) and mean/min/max value, ordered by bucket.
+        """
+        start, end = to_utc_naive(start), to_utc_naive(end)
+        tables = self._tables_for_range(db, start, end)
+        if not tables or not sensor_keys:
+            return {}
+        origin = start.replace(tzinfo=timezone.utc).timestamp()
+        rows = []
+        for table in tables:
+            epoch = epoch_seconds(db, table.c.ts)
+            bucket = time_bucket(db, table.c.ts, bucket_seconds, origin)
+            rows.extend(db.execute(
+                select(
+                    table.c.sensor_key,
+                    bucket,
+                    func.count(table.c.value),
+                    func.sum(epoch),
+                    func.sum(table.c.value),
+                    func.min(table.c.value),
+                    func.max(table.c.value)
+                ).where(
+                    table.c.sensor_key.in_(list(sensor_keys)),
+                    table.c.ts >= start,
+                    table.c.ts <= end,
+                    table.c.value.isnot(None)
+                ).group_by(table.c.sensor_key, bucket)
+            ).tuples().all())
+        if not rows:
+            return {}
+
+        # A bucket can straddle two chunk tables, so merge partial aggregates
+        data = np.array(rows, dtype=float)
+        data = data[np.lexsort((data[:, 1], data[:, 0]))]
+        boundary = np.r_[True, (data[1:, 0] != data[:-1, 0]) | (data[1:, 1] != data[:-1, 1])]
+        groups = np.flatnonzero(boundary)
+        count = np.add.reduceat(data[:, 2], groups)
+        merged = {
+            "key": data[groups, 0],
+            "bucket": data[groups, 1],
+            "count": count,
+            "ts": np.add.reduceat(data[:, 3], groups) / count,
+            "mean": np.add.reduceat(data[:, 4], groups) / count,
+            "min": np.minimum.reduceat(data[:, 5], groups),
+            "max": np.maximum.reduceat(data[:, 6], groups),
+        }
+        keys, starts = np.unique(merged["key"], return_index=True)
+        ends = np.r_[starts[1:], len(merged["key"])]
+        return {
+            int(key): {name: values[begin:finish] for name, values in merged.items() if name != "key"}
+            for key, begin, finish in zip(keys, starts, ends)
+        }
+
+
+_store: Optional[SensorReadingStore] = None
+
+
+def get_sensor_reading_store() -> SensorReadingStore:
+    global _store
+    if _store is None:
+        _store = SensorReadingStore()
+    return _store
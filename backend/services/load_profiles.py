@@ -0,0 +1,44 @@
+"""
+Load Profiles
+Eager-loading profiles for the relationships each serializer touches.
+
+A profile is the tuple of loader options a query needs so that building its response
+objects issues no further SQL: ``joinedload`` for many-to-one references (one LEFT JOIN,
+no extra round trip) and ``selectinload`` for collections (one extra ``IN`` query for the
+whole page instead of one per row). Apply with ``query.options(*PROFILE)``.
+
+tests/conftest.py provides a ``query_counter`` fixture that fails a test when a call
+issues more statements per returned row than allowed, so a serializer that starts
+touching a relationship missing from its profile is caught.
+"""
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import Handover, IoTEnvironmentalAlert, IoTEnvironmentalData, LostFoundItem, User
+
+# IoTEnvironmentalService._serialize_alert -> camera name
+IOT_ALERT = (
+    joinedload(IoTEnvironmentalAlert.camera),
+)
+
+# IoTEnvironmentalService._serialize_data -> camera name
+IOT_READING = (
+    joinedload(IoTEnvironmentalData.camera),
+)
+
+# LostFoundService item responses -> property, finder and guest names
+LOST_FOUND_ITEM = (
+    joinedload(LostFoundItem.property),
+    joinedload(LostFoundItem.finder),
+    joinedload(LostFoundItem.ai_matched_guest),
+    joinedload(LostFoundItem.claimed_by_guest),
+)
+
+# PatrolService.get_officers -> roles per officer
+OFFICER = (
+    selectinload(User.user_roles),
+)
+
+# HandoverResponse.from_orm -> checklist items
+HANDOVER = (
+    selectinload(Handover.checklist_items),
+)
@@ -8,6 +8,7 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import LostFoundItem, User, Property, UserRole, LostFoundStatus
+from services import load_profiles
 from schemas import (
     LostFoundItemCreate,
     LostFoundItemUpdate,
@@ -47,7 +48,7 @@ class LostFoundService:
                 return []
 
             # Filter by user's accessible properties
-            query = db.query(LostFoundItem).filter(LostFoundItem.property_id.in_(user_property_ids))
+            query = db.query(LostFoundItem).options(*load_profiles.LOST_FOUND_ITEM).filter(LostFoundItem.property_id.in_(user_property_ids))
 
             # Additional filters
             if property_id:
@@ -95,7 +96,7 @@ class LostFoundService:
         """Get a specific item - Enforces property-level authorization"""
         db = SessionLocal()
         try:
-            item = db.query(LostFoundItem).filter(LostFoundItem.item_id == item_id).first()
+            item = db.query(LostFoundItem).options(*load_profiles.LOST_FOUND_ITEM).filter(LostFoundItem.item_id == item_id).first()
             if not item:
                 raise ValueError("Item not found")
 
@@ -168,7 +169,7 @@ class LostFoundService:
             db.refresh(db_item)
 
             # Reload with relationships
-            db_item = db.query(LostFoundItem).filter(LostFoundItem.item_id == db_item.item_id).first()
+            db_item = db.query(LostFoundItem).options(*load_profiles.LOST_FOUND_ITEM).filter(LostFoundItem.item_id == db_item.item_id).first()
 
             return LostFoundItemResponse(
                 item_id=db_item.item_id,
@@ -223,7 +224,7 @@ class LostFoundService:
             db.refresh(item)
 
             # Reload with relationships
-            item = db.query(LostFoundItem).filter(LostFoundItem.item_id == item_id).first()
+            item = db.query(LostFoundItem).options(*load_profiles.LOST_FOUND_ITEM).filter(LostFoundItem.item_id == item_id).first()
 
             return LostFoundItemResponse(
                 item_id=item.item_id,
@@ -312,7 +313,7 @@ class LostFoundService:
             db.refresh(item)
 
             # Reload with relationships
-            item = db.query(LostFoundItem).filter(LostFoundItem.item_id == item_id).first()
+            item = db.query(LostFoundItem).options(*load_profiles.LOST_FOUND_ITEM).filter(LostFoundItem.item_id == item_id).first()
 
             return LostFoundItemResponse(
                 item_id=item.item_id,
@@ -9,19 +9,29 @@ import json
 import uuid
 import logging
 
+import numpy as np
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
-from models import PatrolSubmission, MobileIncidentReport, AgentLocation, AgentStatus
+from models import PatrolSubmission, MobileIncidentReport, AgentLocation
+from services.agent_location_buffer import as_utc, get_location_buffer
+from services.data_retention_service import purge_before
+from services.trajectory import encode_polyline, simplify_track
 from schemas import (
     PatrolSubmissionResponse,
     MobileIncidentReportResponse,
     AgentLocationResponse,
     AgentStatusResponse,
+    NearbyAgentResponse,
 )
 
 logger = logging.getLogger(__name__)
 
+TRAJECTORY_ENCODINGS = ("json", "polyline")
+# Agents that can be dispatched: reporting recently and not marked offline
+DISPATCHABLE_STATUSES = ("active", "idle")
+DISPATCH_MAX_AGE_SECONDS = 600
+
 
 class MobileAgentService:
     """Service for mobile agent data operations."""
@@ -204,46 +214,17 @@ class MobileAgentService:
         speed: Optional[float] = None,
         heading: Optional[float] = None,
     ) -> AgentLocationResponse:
-        """Record agent location update."""
-        timestamp = datetime.now(timezone.utc)
-        location = AgentLocation(
-            agent_id=agent_id,
-            latitude=latitude,
-            longitude=longitude,
-            accuracy=accuracy,
-            altitude=altitude,
-            speed=speed,
-            heading=heading,
-            timestamp=timestamp,
-        )
-        db.add(location)
-        agent_status = db.query(AgentStatus).filter(AgentStatus.agent_id == agent_id).first()
-        if agent_status:
-            agent_status.last_seen = timestamp
-            agent_status.current_latitude = latitude
-            agent_status.current_longitude = longitude
-            agent_status.status = "active"
-            agent_status.updated_at = timestamp
-        else:
-            agent_status = AgentStatus(
-                agent_id=agent_id,
-                last_seen=timestamp,
-                current_latitude=latitude,
-                current_longitude=longitude,
-                status="active",
-            )
-            db.add(agent_status)
-        db.commit()
-        return AgentLocationResponse(
-            agent_id=agent_id,
-            latitude=latitude,
-            longitude=longitude,
-            accuracy=accuracy,
-            altitude=altitude,
-            speed=speed,
-            heading=heading,
-            timestamp=timestamp,
-        )
+        """Record agent location update (buffered; persisted by the location buffer's flush)."""
+        fix = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "accuracy": accuracy,
+            "altitude": altitude,
+            "speed": speed,
+            "heading": heading,
+        }
+        state = get_location_buffer().record(agent_id, [fix])["status"]
+        return AgentLocationResponse(agent_id=agent_id, timestamp=state["last_seen"], **fix)
 
     @staticmethod
     def get_agent_location_history(
@@ -259,7 +240,7 @@ class MobileAgentService:
             .order_by(AgentLocation.timestamp.desc())
             .all()
         )
-        return [
+        history = [
             AgentLocationResponse(
                 agent_id=loc.agent_id,
                 latitude=loc.latitude,
@@ -272,29 +253,128 @@ class MobileAgentService:
             )
             for loc in locations
         ]
+        # Fixes accepted since the last flush
+        pending = [
+            AgentLocationResponse(**{key: value for key, value in row.items() if key != "id"})
+            for row in get_location_buffer().pending_locations(agent_id, since=cutoff)
+        ]
+        if pending:
+            history = sorted(history + pending, key=lambda loc: as_utc(loc.timestamp), reverse=True)
+        return history
 
     @staticmethod
-    def get_all_agent_status(db: Session) -> List[AgentStatusResponse]:
-        """Get status of all agents."""
-        statuses = db.query(AgentStatus).all()
-        return [
-            AgentStatusResponse(
-                agent_id=s.agent_id,
-                last_seen=s.last_seen,
-                current_latitude=s.current_latitude,
-                current_longitude=s.current_longitude,
-                status=s.status,
-                battery_level=s.battery_level,
-                app_version=s.app_version,
+    def get_agent_trajectory(
+        db: Session,
+        agent_id: str,
+        hours: int = 24,
+        tolerance: float = 5.0,
+        method: str = "douglas-peucker",
+        encoding: str = "json",
+        stationary_radius: float = 15.0,
+        min_dwell: float = 60.0,
+    ) -> Dict[str, Any]:
+        """
+        Simplified location track for map replay. tolerance and stationary_radius are in
+        metres, min_dwell in seconds; encoding "polyline" ships coordinates as a Google
+        encoded polyline with per-point time deltas instead of one object per point.
+        """
+        if encoding not in TRAJECTORY_ENCODINGS:
+            raise ValueError(f"encoding must be one of {', '.join(TRAJECTORY_ENCODINGS)}")
+        if tolerance < 0 or stationary_radius < 0 or min_dwell < 0:
+            raise ValueError("tolerance, stationary_radius and min_dwell must not be negative")
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+        # Only the columns replay needs; a day of 5s fixes is ~17k rows
+        rows = (
+            db.query(AgentLocation.latitude, AgentLocation.longitude, AgentLocation.timestamp)
+            .filter(and_(AgentLocation.agent_id == agent_id, AgentLocation.timestamp > cutoff))
+            .all()
+        )
+        track = [(lat, lng, as_utc(ts).timestamp()) for lat, lng, ts in rows]
+        track.extend(
+            (row["latitude"], row["longitude"], as_utc(row["timestamp"]).timestamp())
+            for row in get_location_buffer().pending_locations(agent_id, since=cutoff)
+        )
+        track.sort(key=lambda point: point[2])
+        raw = np.array(track, dtype=float).reshape(-1, 3)
+        simplified = simplify_track(
+            raw[:, 0], raw[:, 1], raw[:, 2],
+            tolerance=tolerance,
+            method=method,
+            stationary_radius=stationary_radius,
+            min_dwell_seconds=min_dwell,
+        )
+        epoch = simplified["epoch_seconds"]
+        dwell = simplified["dwell_seconds"]
+        result = {
+            "agent_id": agent_id,
+            "raw_count": len(raw),
+            "point_count": len(epoch),
+            "tolerance_m": tolerance,
+            "method": method,
+            "encoding": encoding,
+        }
+        if encoding == "polyline":
+            result["polyline"] = encode_polyline(simplified["lat"], simplified["lng"])
+            result["start"] = (
+                datetime.fromtimestamp(epoch[0], tz=timezone.utc).isoformat() if len(epoch) else None
             )
-            for s in statuses
-        ]
+            # Seconds since the previous point (0 for the first), relative to "start"
+            seconds = np.round(epoch).astype(np.int64)
+            result["time_deltas"] = np.diff(seconds, prepend=seconds[:1]).tolist()
+            result["stops"] = [
+                {"index": int(i), "dwellSeconds": float(dwell[i])} for i in np.flatnonzero(dwell > 0)
+            ]
+        else:
+            points = []
+            for lat, lng, ts, seconds in zip(
+                simplified["lat"].tolist(), simplified["lng"].tolist(), epoch.tolist(), dwell.tolist()
+            ):
+                point = {
+                    "latitude": lat,
+                    "longitude": lng,
+                    "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+                }
+                if seconds:
+                    point["dwellSeconds"] = seconds
+                points.append(point)
+            result["points"] = points
+        return result
+
+    @staticmethod
+    def get_all_agent_status(db: Session) -> List[AgentStatusResponse]:
+        """Get status of all agents (served from the location buffer's memory)."""
+        return [AgentStatusResponse(**state) for state in get_location_buffer().get_all_status()]
+
+    @staticmethod
+    def find_nearest_agents(
+        latitude: float,
+        longitude: float,
+        k: Optional[int] = 5,
+        radius_m: Optional[float] = None,
+        statuses: Optional[List[str]] = None,
+        max_age_seconds: Optional[float] = DISPATCH_MAX_AGE_SECONDS,
+    ) -> List[NearbyAgentResponse]:
+        """Nearest agents to a point, closest first (served from the in-memory spatial index)."""
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("latitude/longitude out of range")
+        matches = get_location_buffer().nearest_agents(
+            latitude,
+            longitude,
+            k=k,
+            radius_m=radius_m,
+            statuses=statuses or DISPATCHABLE_STATUSES,
+            max_age_seconds=max_age_seconds,
+        )
+        return [NearbyAgentResponse(**match) for match in matches]
 
     @staticmethod
     def cleanup_old_locations(db: Session, retention_hours: int = 168) -> int:
-        """Clean up location records older than retention period (default 7 days)."""
+        """Clean up location records older than retention period (default 7 days).
+
+        Deletes in chunks (committing between them) so a large backlog does not lock the
+        table; the scheduled DataRetentionService also rolls these rows up first.
+        """
         cutoff = datetime.now(timezone.utc) - timedelta(hours=retention_hours)
-        deleted = db.query(AgentLocation).filter(AgentLocation.timestamp < cutoff).delete()
-        db.commit()
+        deleted = purge_before(db, AgentLocation.__table__, AgentLocation.timestamp, cutoff)
         logger.info("Cleaned up %s old agent location records", deleted)
         return deleted
@@ -0,0 +1,404 @@
+"""
+Patrol Assignment Service
+Officer-to-patrol assignment for a whole shift.
+
+For every patrol template running in the shift and every security officer / guard of the
+property, a cost is computed from server-side data, all in NumPy over the full
+officer x patrol matrix:
+  - specialization: share of the patrol's required specializations the officer lacks
+    (officer specializations live in their role permissions)
+  - workload: patrols the officer currently has active
+  - distance: walking time from the officer's last AgentLocation to the route's first
+    checkpoint
+  - fatigue: hours on patrol in the last FATIGUE_WINDOW_HOURS, steeper past
+    FATIGUE_SOFT_LIMIT_HOURS
+  - availability: heartbeat status (offline officers cost more)
+
+The assignment minimizing total cost is then found in one pass with the Hungarian
+algorithm (shortest augmenting paths, one vectorized column scan per step). Each officer
+gets at most one patrol per shift; pairs that cannot be staffed stay unassigned.
+Loaded inputs are cached per (property, shift) for SHIFT_INPUT_CACHE_SECONDS.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from datetime import date, datetime, timedelta
+import logging
+import os
+import threading
+
+import numpy as np
+from cachetools import TTLCache
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import AgentLocation, Patrol, PatrolRoute, PatrolStatus, PatrolTemplate, User, UserRole, UserRoleEnum
+from services.patrol_route_optimizer import WALKING_SPEED_MPS, haversine_meters
+from services.patrol_service import PatrolService
+
+logger = logging.getLogger(__name__)
+
+SPECIALIZATION_WEIGHT = 40.0
+WORKLOAD_WEIGHT = 15.0
+# Per minute of walking to the patrol start, capped
+DISTANCE_WEIGHT = 1.0
+MAX_DISTANCE_MINUTES = 30.0
+UNKNOWN_DISTANCE_MINUTES = 10.0
+FATIGUE_WEIGHT = 2.0
+FATIGUE_WINDOW_HOURS = 24
+FATIGUE_SOFT_LIMIT_HOURS = float(os.getenv("PATROL_FATIGUE_SOFT_LIMIT_HOURS", "8"))
+OFFLINE_PENALTY = 20.0
+UNKNOWN_STATUS_PENALTY = 5.0
+# Officers whose last location is older than this count as "location unknown"
+LOCATION_MAX_AGE_MINUTES = 120
+SHIFT_INPUT_CACHE_SECONDS = float(os.getenv("PATROL_ASSIGNMENT_CACHE_SECONDS", "60"))
+OFFICER_ROLES = (UserRoleEnum.SECURITY_OFFICER, UserRoleEnum.GUARD)
+
+
+def min_cost_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows and columns of a minimum-cost matching covering min(rows, cols) pairs."""
+    cost = np.asarray(cost, dtype=float)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n_rows, n_cols = cost.shape
+    if n_rows == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # Potentials and matching use 1-based indices; column 0 is the virtual start
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    match = np.zeros(n_cols + 1, dtype=np.int64)
+    way = np.zeros(n_cols + 1, dtype=np.int64)
+    for row in range(1, n_rows + 1):
+        match[0] = row
+        col = 0
+        min_reduced = np.full(n_cols, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+        while True:
+            used[col] = True
+            current = match[col]
+            free = ~used[1:]
+            reduced = cost[current - 1] - u[current] - v[1:]
+            better = free & (reduced < min_reduced)
+            min_reduced[better] = reduced[better]
+            way[1:][better] = col
+            candidates = np.where(free, min_reduced, np.inf)
+            nxt = int(candidates.argmin())
+            delta = candidates[nxt]
+            used_cols = np.flatnonzero(used)
+            u[match[used_cols]] += delta
+            v[used_cols] -= delta
+            min_reduced[free] -= delta
+            col = nxt + 1
+            if match[col] == 0:
+                break
+        while col:
+            prev = way[col]
+            match[col] = match[prev]
+            col = prev
+
+    cols = np.flatnonzero(match[1:])
+    rows = match[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def _runs_on(schedule: Dict[str, Any], day: date) -> bool:
+    days = [str(d).lower() for d in (schedule.get("days") or [])]
+    weekday = day.strftime("%A").lower()
+    return any(d in ("daily", "everyday", "all") or (len(d) >= 3 and weekday.startswith(d[:3])) for d in days)
+
+
+def _minutes(value: Optional[str]) -> int:
+    """Minutes after midnight of an "HH:MM" time; raises ValueError if malformed."""
+    try:
+        hours, minutes = (int(part) for part in str(value or "00:00").split(":")[:2])
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+    return hours * 60 + minutes
+
+
+def _window(start: Optional[str], end: Optional[str]) -> Tuple[int, int]:
+    """[start, end) in minutes from the day's midnight; an end at or before the start is the next day."""
+    begin, finish = _minutes(start), _minutes(end)
+    return begin, finish + 1440 if finish <= begin else finish
+
+
+def _route_start(checkpoints: Sequence[Any]) -> Tuple[float, float]:
+    for checkpoint in checkpoints or []:
+        coords = checkpoint.get("coordinates") if isinstance(checkpoint, dict) else None
+        if coords and coords.get("lat") is not None and coords.get("lng") is not None:
+            return float(coords["lat"]), float(coords["lng"])
+    return np.nan, np.nan
+
+
+class ShiftInputs:
+    """Officer and patrol features of one shift, as aligned arrays."""
+
+    def __init__(self, officers: List[Dict[str, Any]], patrols: List[Dict[str, Any]]):
+        self.officers = officers
+        self.patrols = patrols
+        vocabulary = sorted({s for item in officers + patrols for s in item["specializations"]})
+        index = {name: i for i, name in enumerate(vocabulary)}
+
+        def encode(items):
+            matrix = np.zeros((len(items), len(vocabulary)))
+            for row, item in enumerate(items):
+                matrix[row, [index[s] for s in item["specializations"]]] = 1.0
+            return matrix
+
+        self.officer_skills = encode(officers)
+        self.patrol_skills = encode(patrols)
+        self.active_patrols = np.array([o["active_patrols"] for o in officers], dtype=float)
+        self.hours_worked = np.array([o["hours_worked"] for o in officers], dtype=float)
+        self.officer_lat = np.array([o["lat"] for o in officers], dtype=float)
+        self.officer_lng = np.array([o["lng"] for o in officers], dtype=float)
+        self.availability = np.array([
+            OFFLINE_PENALTY if o["connection_status"] == "offline"
+            else 0.0 if o["connection_status"] == "online" else UNKNOWN_STATUS_PENALTY
+            for o in officers
+        ])
+        self.patrol_lat = np.array([p["lat"] for p in patrols], dtype=float)
+        self.patrol_lng = np.array([p["lng"] for p in patrols], dtype=float)
+
+
+class PatrolAssignmentEngine:
+    """Builds officer x patrol cost matrices and solves shift assignments."""
+
+    def __init__(self, cache_seconds: float = SHIFT_INPUT_CACHE_SECONDS):
+        self._inputs: TTLCache = TTLCache(maxsize=64, ttl=max(cache_seconds, 0.001))
+        self._lock = threading.Lock()
+
+    # --- inputs -----------------------------------------------------------
+
+    def load_officers(self, db: Session, property_id: str, now: datetime) -> List[Dict[str, Any]]:
+        """Officers of the property with workload, fatigue, last location and heartbeat status."""
+        roles = db.query(UserRole).filter(
+            UserRole.property_id == property_id,
+            UserRole.role_name.in_(OFFICER_ROLES),
+            UserRole.is_active == True
+        ).all()
+        officers: Dict[str, Dict[str, Any]] = {}
+        for role in roles:
+            officer = officers.setdefault(str(role.user_id), {
+                "id": str(role.user_id), "specializations": set(), "active_patrols": 0,
+                "hours_worked": 0.0, "lat": np.nan, "lng": np.nan, "connection_status": "unknown",
+            })
+            officer["specializations"].update((role.permissions or {}).get("specializations") or [])
+        if not officers:
+            return []
+        ids = list(officers)
+        names = dict(db.query(User.user_id, User.first_name + " " + User.last_name).filter(User.user_id.in_(ids)).all())
+
+        for guard_id, count in db.query(Patrol.guard_id, func.count()).filter(
+            Patrol.guard_id.in_(ids), Patrol.status == PatrolStatus.ACTIVE
+        ).group_by(Patrol.guard_id):
+            officers[str(guard_id)]["active_patrols"] = int(count)
+
+        window_start = now - timedelta(hours=FATIGUE_WINDOW_HOURS)
+        for guard_id, started_at, completed_at in db.query(Patrol.guard_id, Patrol.started_at, Patrol.completed_at).filter(
+            Patrol.guard_id.in_(ids), Patrol.started_at.isnot(None), Patrol.started_at >= window_start
+        ):
+            finished = (completed_at or now).replace(tzinfo=None)
+            hours = (finished - started_at.replace(tzinfo=None)).total_seconds() / 3600
+            officers[str(guard_id)]["hours_worked"] += max(0.0, hours)
+
+        latest = db.query(
+            AgentLocation.agent_id, func.max(AgentLocation.timestamp).label("ts")
+        ).filter(
+            AgentLocation.agent_id.in_(ids),
+            AgentLocation.timestamp >= now - timedelta(minutes=LOCATION_MAX_AGE_MINUTES)
+        ).group_by(AgentLocation.agent_id).subquery()
+        for agent_id, lat, lng in db.query(AgentLocation.agent_id, AgentLocation.latitude, AgentLocation.longitude).join(
+            latest, (AgentLocation.agent_id == latest.c.agent_id) & (AgentLocation.timestamp == latest.c.ts)
+        ):
+            officers[str(agent_id)].update(lat=lat, lng=lng)
+
+        for officer_id, health in PatrolService.get_officers_health().items():
+            if officer_id in officers:
+                officers[officer_id]["connection_status"] = health["connection_status"]
+
+        result = []
+        for officer_id in ids:
+            officer = officers[officer_id]
+            officer["specializations"] = sorted(officer["specializations"])
+            officer["name"] = names.get(officer_id, officer_id)
+            result.append(officer)
+        return result
+
+    def load_patrols(
+        self, db: Session, property_id: str, shift_day: date, shift_start: Optional[str], shift_end: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Patrol templates scheduled in the shift, with route start and required specializations."""
+        shift = _window(shift_start, shift_end) if shift_start and shift_end else None
+        rows = db.query(PatrolTemplate, PatrolRoute).join(
+            PatrolRoute, PatrolRoute.route_id == PatrolTemplate.route_id
+        ).filter(PatrolTemplate.property_id == property_id).all()
+        patrols = []
+        for template, route in rows:
+            schedule = template.schedule or {}
+            if not _runs_on(schedule, shift_day):
+                continue
+            if shift is not None:
+                try:
+                    scheduled = _window(schedule.get("startTime"), schedule.get("endTime"))
+                except ValueError as e:
+                    logger.warning(f"Skipping patrol template {template.template_id} with a bad schedule: {e}")
+                    continue
+                if not (scheduled[0] < shift[1] and shift[0] < scheduled[1]):
+                    continue
+            lat, lng = _route_start(route.checkpoints)
+            required = set(schedule.get("requiredSpecializations") or [])
+            for checkpoint in route.checkpoints or []:
+                if isinstance(checkpoint, dict):
+                    required.update(checkpoint.get("requiredSpecializations") or [])
+            patrols.append({
+                "id": str(template.template_id), "name": template.name, "priority": template.priority,
+                "specializations": sorted(required), "lat": lat, "lng": lng,
+                "startTime": schedule.get("startTime"), "endTime": schedule.get("endTime"),
+            })
+        return patrols
+
+    def shift_inputs(
+        self, db: Session, property_id: str, shift_day: date,
+        shift_start: Optional[str] = None, shift_end: Optional[str] = None, now: Optional[datetime] = None
+    ) -> ShiftInputs:
+        key = (property_id, shift_day.isoformat(), shift_start, shift_end)
+        with self._lock:
+            cached = self._inputs.get(key)
+        if cached is not None:
+            return cached
+        now = now or datetime.utcnow()
+        inputs = ShiftInputs(
+            self.load_officers(db, property_id, now),
+            self.load_patrols(db, property_id, shift_day, shift_start, shift_end),
+        )
+        with self._lock:
+            self._inputs[key] = inputs
+        return inputs
+
+    def invalidate(self, property_id: Optional[str] = None) -> None:
+        with self._lock:
+            for key in list(self._inputs):
+                if property_id is None or key[0] == property_id:
+                    self._inputs.pop(key, None)
+
+    # --- costs ------------------------------------------------------------
+
+    @staticmethod
+    def cost_components(inputs: ShiftInputs) -> Dict[str, np.ndarray]:
+        """Officer x patrol cost terms."""
+        required = inputs.patrol_skills.sum(axis=1)
+        covered = inputs.officer_skills @ inputs.patrol_skills.T
+        specialization = SPECIALIZATION_WEIGHT * (required[None, :] - covered) / np.maximum(required, 1.0)[None, :]
+
+        meters = haversine_meters(
+            inputs.officer_lat[:, None], inputs.officer_lng[:, None],
+            inputs.patrol_lat[None, :], inputs.patrol_lng[None, :]
+        )
+        walk_minutes = np.where(np.isnan(meters), UNKNOWN_DISTANCE_MINUTES, meters / WALKING_SPEED_MPS / 60)
+        distance = DISTANCE_WEIGHT * np.minimum(walk_minutes, MAX_DISTANCE_MINUTES)
+
+        hours = inputs.hours_worked
+        fatigue = FATIGUE_WEIGHT * (hours + 2 * np.maximum(hours - FATIGUE_SOFT_LIMIT_HOURS, 0.0) ** 2)
+        per_officer = WORKLOAD_WEIGHT * inputs.active_patrols + fatigue + inputs.availability
+        shape = specialization.shape
+        return {
+            "specialization": specialization,
+            "distance": distance,
+            "workload": np.broadcast_to((WORKLOAD_WEIGHT * inputs.active_patrols)[:, None], shape),
+            "fatigue": np.broadcast_to(fatigue[:, None], shape),
+            "availability": np.broadcast_to(inputs.availability[:, None], shape),
+            "total": specialization + distance + per_officer[:, None],
+        }
+
+    @staticmethod
+    def _reasons(components: Dict[str, np.ndarray], officer: int, patrol: int) -> List[str]:
+        reasons = []
+        if components["specialization"][officer, patrol] == 0:
+            reasons.append("Has all required specializations")
+        else:
+            reasons.append("Missing some required specializations")
+        if components["workload"][officer, patrol] == 0:
+            reasons.append("Currently available")
+        else:
+            reasons.append("Already on an active patrol")
+        if components["distance"][officer, patrol] < 5:
+            reasons.append("Close to the route start")
+        if components["fatigue"][officer, patrol] > FATIGUE_WEIGHT * FATIGUE_SOFT_LIMIT_HOURS:
+            reasons.append("Long hours in the last day")
+        if components["availability"][officer, patrol] >= OFFLINE_PENALTY:
+            reasons.append("Device offline")
+        return reasons
+
+    # --- solving ----------------------------------------------------------
+
+    def solve_shift(
+        self, db: Session, property_id: str, shift_day: date,
+        shift_start: Optional[str] = None, shift_end: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Assign officers to every patrol of the shift at minimum total cost."""
+        inputs = self.shift_inputs(db, property_id, shift_day, shift_start, shift_end)
+        if not inputs.officers or not inputs.patrols:
+            return {
+                "assignments": [],
+                "unassignedPatrols": [p["id"] for p in inputs.patrols],
+                "totalCost": 0.0,
+            }
+        components = self.cost_components(inputs)
+        rows, cols = min_cost_assignment(components["total"])
+        assignments = []
+        for officer, patrol in sorted(zip(rows.tolist(), cols.tolist()), key=lambda pair: pair[1]):
+            cost = float(components["total"][officer, patrol])
+            assignments.append({
+                "patrolId": inputs.patrols[patrol]["id"],
+                "patrolName": inputs.patrols[patrol]["name"],
+                "officerId": inputs.officers[officer]["id"],
+                "officerName": inputs.officers[officer]["name"],
+                "cost": round(cost, 2),
+                "matchScore": int(round(max(0.0, 100.0 - cost))),
+                "reasoning": self._reasons(components, officer, patrol),
+            })
+        assigned = set(cols.tolist())
+        return {
+            "assignments": assignments,
+            "unassignedPatrols": [p["id"] for i, p in enumerate(inputs.patrols) if i not in assigned],
+            "totalCost": round(float(components["total"][rows, cols].sum()), 2),
+        }
+
+    def rank_officers(self, db: Session, property_id: str, patrol: Dict[str, Any], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Officers ordered by cost for one ad-hoc patrol (``requiredSpecializations``, ``checkpoints``)."""
+        now = now or datetime.utcnow()
+        key = (property_id, "officers", now.strftime("%Y-%m-%dT%H:%M"))
+        with self._lock:
+            officers = self._inputs.get(key)
+        if officers is None:
+            officers = self.load_officers(db, property_id, now)
+            with self._lock:
+                self._inputs[key] = officers
+        lat, lng = _route_start(patrol.get("checkpoints") or (patrol.get("route") or {}).get("checkpoints") or [])
+        demand = {"specializations": sorted(set(patrol.get("requiredSpecializations") or [])), "lat": lat, "lng": lng}
+        inputs = ShiftInputs(officers, [demand])
+        components = self.cost_components(inputs)
+        order = np.argsort(components["total"][:, 0], kind="stable")
+        return [
+            {
+                "officerId": officers[i]["id"],
+                "matchScore": int(round(max(0.0, 100.0 - components["total"][i, 0]))),
+                "reasoning": self._reasons(components, i, 0),
+            }
+            for i in order.tolist()
+        ]
+
+
+_engine: Optional[PatrolAssignmentEngine] = None
+
+
+def get_patrol_assignment_engine() -> PatrolAssignmentEngine:
+    global _engine
+    if _engine is None:
+        _engine = PatrolAssignmentEngine()
+    return _engine
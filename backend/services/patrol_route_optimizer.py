@@ -0,0 +1,344 @@
+"""
+Patrol Route Optimizer
+Checkpoint sequencing for patrol routes.
+
+  - Travel times come from a pairwise matrix: great-circle walking time between checkpoint
+    coordinates plus a fixed cost per floor changed. Matrices are cached by the checkpoint
+    geometry, so re-optimizing a route whose checkpoints did not move reuses it.
+  - A nearest-neighbour tour is built first. Critical checkpoints carry a time window
+    (reach them within PATROL_CRITICAL_WINDOW_MINUTES of the start unless the checkpoint
+    sets its own ``timeWindow``), and the construction detours to a windowed checkpoint
+    as soon as going elsewhere first would make it late.
+  - The tour is then improved with 2-opt (segment reversal) and Or-opt (moving runs of
+    1-3 checkpoints, optionally reversed). Each candidate set is scored in one NumPy
+    expression; moves that would add window lateness are rejected.
+  - Results are memoized per route version (route id, version and checkpoint content).
+
+The first checkpoint of the route (or ``startCheckpointId``) is the fixed start. Routes
+are open paths unless ``returnToStart`` is set.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+WALKING_SPEED_MPS = float(os.getenv("PATROL_WALKING_SPEED_MPS", "1.3"))
+FLOOR_TRANSITION_SECONDS = float(os.getenv("PATROL_FLOOR_TRANSITION_SECONDS", "60"))
+CRITICAL_WINDOW_MINUTES = float(os.getenv("PATROL_CRITICAL_WINDOW_MINUTES", "30"))
+# Wall-clock budget for the improvement phase
+TIME_BUDGET_SECONDS = float(os.getenv("PATROL_OPTIMIZER_TIME_BUDGET", "0.15"))
+MAX_ROUNDS = 50
+OR_OPT_SEGMENTS = (1, 2, 3)
+EARTH_RADIUS_M = 6371008.8
+EPSILON = 1e-9
+
+
+def haversine_meters(lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray) -> np.ndarray:
+    """Great-circle distance (meters); inputs broadcast against each other."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(lng2) - np.radians(lng1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def travel_time_matrix(
+    lat: np.ndarray,
+    lng: np.ndarray,
+    floors: np.ndarray,
+    walking_speed: float = WALKING_SPEED_MPS,
+    floor_seconds: float = FLOOR_TRANSITION_SECONDS,
+) -> np.ndarray:
+    """Symmetric travel time (seconds) between every pair of points."""
+    meters = haversine_meters(lat[:, None], lng[:, None], lat[None, :], lng[None, :])
+    return meters / walking_speed + np.abs(floors[:, None] - floors[None, :]) * floor_seconds
+
+
+def schedule(
+    route: np.ndarray,
+    travel: np.ndarray,
+    service: np.ndarray,
+    earliest: np.ndarray,
+    latest: np.ndarray,
+) -> Tuple[np.ndarray, float]:
+    """Arrival times along ``route`` (waiting for window starts) and total lateness."""
+    legs = service[route[:-1]] + travel[route[:-1], route[1:]]
+    elapsed = np.concatenate(([0.0], np.cumsum(legs)))
+    # t_k = max(earliest_k, t_{k-1} + leg_k) unrolled: S_k + max_{j<=k}(earliest_j - S_j)
+    arrival = elapsed + np.maximum.accumulate(earliest[route] - elapsed)
+    lateness = float(np.maximum(arrival - latest[route], 0.0).sum())
+    return arrival, lateness
+
+
+def nearest_neighbour(
+    travel: np.ndarray,
+    start: int,
+    end: int,
+    candidates: np.ndarray,
+    service: np.ndarray,
+    earliest: np.ndarray,
+    latest: np.ndarray,
+) -> np.ndarray:
+    """Nearest-neighbour path from ``start`` through ``candidates`` to ``end`` that detours
+    to windowed checkpoints when visiting the nearest one first would make them late."""
+    size = travel.shape[0]
+    unvisited = np.zeros(size, dtype=bool)
+    unvisited[candidates] = True
+    windowed = unvisited & np.isfinite(latest)
+    route = [start]
+    current, clock = start, max(0.0, earliest[start])
+    for _ in range(len(candidates)):
+        depart = clock + service[current]
+        row = np.where(unvisited, travel[current], np.inf)
+        nxt = int(row.argmin())
+        if windowed.any():
+            pending = np.flatnonzero(windowed)
+            direct = depart + travel[current, pending]
+            via_nearest = max(earliest[nxt], depart + travel[current, nxt]) + service[nxt] + travel[nxt, pending]
+            urgent = pending[(via_nearest > latest[pending]) | (direct > latest[pending])]
+            urgent = urgent[urgent != nxt]
+            if len(urgent):
+                nxt = int(urgent[travel[current, urgent].argmin()])
+        clock = max(earliest[nxt], depart + travel[current, nxt])
+        unvisited[nxt] = windowed[nxt] = False
+        route.append(nxt)
+        current = nxt
+    route.append(end)
+    return np.asarray(route, dtype=np.int64)
+
+
+class _Search:
+    """2-opt / Or-opt improvement of a path with fixed endpoints."""
+
+    def __init__(self, travel, service, earliest, latest, deadline):
+        self.travel = travel
+        self.service = service
+        self.earliest = earliest
+        self.latest = latest
+        self.has_windows = bool(np.isfinite(latest).any() or (earliest > 0).any())
+        self.deadline = deadline
+
+    def _accept(self, candidate: np.ndarray, lateness: float) -> Optional[float]:
+        if not self.has_windows:
+            return 0.0
+        _, new_lateness = schedule(candidate, self.travel, self.service, self.earliest, self.latest)
+        return new_lateness if new_lateness <= lateness + EPSILON else None
+
+    def two_opt(self, route: np.ndarray, lateness: float) -> Tuple[np.ndarray, float, bool]:
+        travel = self.travel
+        improved = False
+        size = len(route)
+        for i in range(size - 3):
+            if time.perf_counter() > self.deadline:
+                break
+            a, b = route[i], route[i + 1]
+            c, d = route[i + 2:size - 1], route[i + 3:size]
+            delta = travel[a, c] + travel[b, d] - travel[a, b] - travel[c, d]
+            j = int(delta.argmin())
+            if delta[j] >= -EPSILON:
+                continue
+            j += i + 2
+            candidate = np.concatenate((route[:i + 1], route[j:i:-1], route[j + 1:]))
+            accepted = self._accept(candidate, lateness)
+            if accepted is not None:
+                route, lateness, improved = candidate, accepted, True
+        return route, lateness, improved
+
+    def or_opt(self, route: np.ndarray, lateness: float) -> Tuple[np.ndarray, float, bool]:
+        travel = self.travel
+        improved = False
+        for length in OR_OPT_SEGMENTS:
+            i = 1
+            while i + length < len(route):
+                if time.perf_counter() > self.deadline:
+                    return route, lateness, improved
+                prev, nxt = route[i - 1], route[i + length]
+                first, last = route[i], route[i + length - 1]
+                removal_gain = travel[prev, first] + travel[last, nxt] - travel[prev, nxt]
+                rest = np.concatenate((route[:i], route[i + length:]))
+                u, v = rest[:-1], rest[1:]
+                base = travel[u, v]
+                forward = travel[u, first] + travel[last, v] - base
+                backward = travel[u, last] + travel[first, v] - base
+                # Re-inserting where the segment came from is not a move
+                forward[i - 1] = backward[i - 1] = np.inf
+                k_fwd, k_bwd = int(forward.argmin()), int(backward.argmin())
+                reverse = backward[k_bwd] < forward[k_fwd]
+                k = k_bwd if reverse else k_fwd
+                cost = backward[k] if reverse else forward[k]
+                if cost - removal_gain < -EPSILON:
+                    segment = route[i:i + length][::-1] if reverse else route[i:i + length]
+                    candidate = np.concatenate((rest[:k + 1], segment, rest[k + 1:]))
+                    accepted = self._accept(candidate, lateness)
+                    if accepted is not None:
+                        route, lateness, improved = candidate, accepted, True
+                        continue
+                i += 1
+        return route, lateness, improved
+
+    def improve(self, route: np.ndarray) -> np.ndarray:
+        _, lateness = schedule(route, self.travel, self.service, self.earliest, self.latest)
+        for _ in range(MAX_ROUNDS):
+            route, lateness, changed = self.two_opt(route, lateness)
+            while changed and time.perf_counter() < self.deadline:
+                route, lateness, changed = self.two_opt(route, lateness)
+            route, lateness, moved = self.or_opt(route, lateness)
+            if not moved or time.perf_counter() > self.deadline:
+                break
+        return route
+
+
+def _fingerprint(payload: Any) -> str:
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _coordinate(checkpoint: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    coords = checkpoint.get("coordinates") or {}
+    try:
+        return float(coords["lat"]), float(coords["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class PatrolRouteOptimizer:
+    """Optimizes checkpoint order; caches travel matrices and memoizes results."""
+
+    def __init__(
+        self,
+        time_budget: float = TIME_BUDGET_SECONDS,
+        critical_window_minutes: float = CRITICAL_WINDOW_MINUTES,
+        result_cache_size: int = 256,
+        matrix_cache_size: int = 32,
+    ):
+        self.time_budget = time_budget
+        self.critical_window_minutes = critical_window_minutes
+        self._results = LRUCache(maxsize=result_cache_size)
+        self._matrices = LRUCache(maxsize=matrix_cache_size)
+        self._lock = threading.Lock()
+
+    def _travel_matrix(self, lat: np.ndarray, lng: np.ndarray, floors: np.ndarray) -> np.ndarray:
+        key = hashlib.sha1(np.concatenate((lat, lng, floors)).tobytes()).hexdigest()
+        with self._lock:
+            matrix = self._matrices.get(key)
+        if matrix is None:
+            matrix = travel_time_matrix(lat, lng, floors)
+            matrix.flags.writeable = False
+            with self._lock:
+                self._matrices[key] = matrix
+        return matrix
+
+    def optimize(self, route: Dict[str, Any], options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Optimized sequence for ``route`` (``{"id", "version", "checkpoints": [...]}``)."""
+        options = options or {}
+        checkpoints = route.get("checkpoints") or []
+        if any(not isinstance(cp, dict) or cp.get("id") is None for cp in checkpoints):
+            raise ValueError("Every checkpoint needs an id")
+        key = _fingerprint([route.get("id"), route.get("version"), checkpoints, options])
+        with self._lock:
+            cached = self._results.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+        result = self._optimize(checkpoints, options)
+        with self._lock:
+            self._results[key] = result
+        return {**result, "cached": False}
+
+    def _optimize(self, checkpoints: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        ids = [str(cp["id"]) for cp in checkpoints]
+        located = [i for i, cp in enumerate(checkpoints) if _coordinate(cp) is not None]
+        unlocated = [ids[i] for i, cp in enumerate(checkpoints) if _coordinate(cp) is None]
+        reasoning = []
+        if len(located) < 3:
+            return {
+                "optimizedSequence": ids, "timeSaved": 0, "originalDuration": 0, "optimizedDuration": 0,
+                "lateCheckpoints": [], "reasoning": ["Too few checkpoints with coordinates to optimize"],
+            }
+
+        start_id = options.get("startCheckpointId")
+        start_pos = next((p for p, i in enumerate(located) if ids[i] == str(start_id)), 0) if start_id else 0
+        closed = bool(options.get("returnToStart"))
+        critical_minutes = float(options.get("criticalWithinMinutes", self.critical_window_minutes))
+
+        count = len(located)
+        coords = np.array([_coordinate(checkpoints[i]) for i in located])
+        floors = np.array([float(checkpoints[i].get("floor") or 0) for i in located])
+        base = self._travel_matrix(coords[:, 0], coords[:, 1], floors)
+        # Paths end at a terminal node with no window or service time: free to reach from
+        # anywhere on open paths, a walk back to the start checkpoint on closed tours
+        size = count + 1
+        travel = np.zeros((size, size))
+        travel[:count, :count] = base
+        if closed:
+            travel[:count, count] = base[:, start_pos]
+            travel[count, :count] = base[start_pos, :]
+        service = np.zeros(size)
+        earliest = np.zeros(size)
+        latest = np.full(size, np.inf)
+        for p, i in enumerate(located):
+            cp = checkpoints[i]
+            service[p] = float(cp.get("estimatedTime") or 0) * 60
+            window = cp.get("timeWindow") or {}
+            if window.get("start") is not None:
+                earliest[p] = float(window["start"]) * 60
+            if window.get("end") is not None:
+                latest[p] = float(window["end"]) * 60
+            elif cp.get("isCritical"):
+                latest[p] = critical_minutes * 60
+        end = count
+
+        original = np.array([start_pos] + [p for p in range(count) if p != start_pos] + [end], dtype=np.int64)
+        candidates = original[1:-1]
+        constructed = nearest_neighbour(travel, start_pos, end, candidates, service, earliest, latest)
+        search = _Search(travel, service, earliest, latest, started + self.time_budget)
+        optimized = search.improve(constructed)
+
+        orig_arrival, orig_late = schedule(original, travel, service, earliest, latest)
+        opt_arrival, opt_late = schedule(optimized, travel, service, earliest, latest)
+        orig_duration = orig_arrival[-1]
+        opt_duration = opt_arrival[-1]
+        if (opt_late, opt_duration) > (orig_late, orig_duration):
+            optimized, opt_arrival, opt_late, opt_duration = original, orig_arrival, orig_late, orig_duration
+            reasoning.append("Original sequence is already the best found")
+        else:
+            reasoning.append(f"Reordered {count} checkpoints to minimize walking and floor changes")
+
+        late = [ids[located[p]] for p, t in zip(optimized, opt_arrival) if p < count and t > latest[p] + EPSILON]
+        windowed = int(np.isfinite(latest[:count]).sum())
+        if windowed:
+            reasoning.append(
+                f"{windowed - len(late)} of {windowed} time-windowed checkpoints reached on time"
+                if late else f"All {windowed} time-windowed checkpoints reached on time"
+            )
+        if unlocated:
+            reasoning.append(f"{len(unlocated)} checkpoints without coordinates kept at the end")
+
+        sequence = [ids[located[start_pos]]] + [ids[located[p]] for p in optimized[1:-1]] + unlocated
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.debug(f"Optimized patrol route of {count} checkpoints in {elapsed_ms:.1f} ms")
+        return {
+            "optimizedSequence": sequence,
+            "timeSaved": round(max(0.0, orig_duration - opt_duration) / 60, 1),
+            "originalDuration": round(orig_duration / 60, 1),
+            "optimizedDuration": round(opt_duration / 60, 1),
+            "lateCheckpoints": late,
+            "reasoning": reasoning,
+        }
+
+
+_optimizer: Optional[PatrolRouteOptimizer] = None
+
+
+def get_route_optimizer() -> PatrolRouteOptimizer:
+    global _optimizer
+    if _optimizer is None:
+        _optimizer = PatrolRouteOptimizer()
+    return _optimizer
@@ -0,0 +1,187 @@
+"""
+Patrol Schedule Index
+Per-property interval index over patrol template schedules for conflict checks.
+
+Two templates conflict when they run on a common weekday, their HH:MM windows overlap,
+and they share the route or an assigned officer. Schedules are parsed once into minute
+ranges and filed under (weekday, "route", route_id) and (weekday, "officer", officer_id)
+keys; each key holds a static interval tree (intervals sorted by start, every implicit
+subtree annotated with its largest end). A conflict check therefore only looks at the
+keys of the candidate schedule and costs O(log n + k) per key instead of a scan over all
+templates of the property.
+
+Indexes are built lazily and dropped with invalidate() whenever a template of the
+property is written; the TTL bounds staleness from writes made by other processes.
+"""
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+import os
+import threading
+
+from cachetools import TTLCache
+from sqlalchemy.orm import Session
+
+from models import PatrolTemplate
+
+logger = logging.getLogger(__name__)
+
+INDEX_CACHE_SECONDS = float(os.getenv("PATROL_SCHEDULE_INDEX_CACHE_SECONDS", "300"))
+
+IndexKey = Tuple[str, str, str]
+
+
+def to_minutes(value: str) -> int:
+    """Minutes since midnight of an "HH:MM" string."""
+    parts = [int(part) for part in value.split(":")]
+    return parts[0] * 60 + parts[1]
+
+
+class ScheduleEntry:
+    """A template schedule parsed for indexing."""
+
+    __slots__ = ("template_id", "name", "route_id", "officers", "days", "start", "end")
+
+    def __init__(
+        self,
+        template_id: Optional[str],
+        route_id: Optional[str],
+        officers: Iterable[Any],
+        schedule: Dict[str, Any],
+        name: Optional[str] = None
+    ):
+        self.template_id = str(template_id) if template_id else None
+        self.name = name
+        self.route_id = str(route_id) if route_id else None
+        self.officers = frozenset(str(officer_id) for officer_id in officers or [])
+        self.days = frozenset(str(day).lower() for day in schedule.get("days") or [])
+        self.start = to_minutes(schedule.get("startTime", "00:00"))
+        self.end = to_minutes(schedule.get("endTime", "00:00"))
+
+    @classmethod
+    def from_template(cls, template: PatrolTemplate) -> "ScheduleEntry":
+        return cls(template.template_id, template.route_id, template.assigned_officers, template.schedule, template.name)
+
+    def keys(self) -> Iterator[IndexKey]:
+        for day in self.days:
+            if self.route_id:
+                yield (day, "route", self.route_id)
+            for officer_id in self.officers:
+                yield (day, "officer", officer_id)
+
+    def conflict_reason(self, other: "ScheduleEntry") -> List[str]:
+        reasons = []
+        if self.route_id and self.route_id == other.route_id:
+            reasons.append("route")
+        shared = sorted(self.officers & other.officers)
+        if shared:
+            reasons.append("officers: " + ", ".join(shared))
+        return reasons
+
+
+class IntervalTree:
+    """Static interval tree over half-open [start, end) minute ranges."""
+
+    def __init__(self, entries: Sequence[ScheduleEntry]):
+        self.entries = sorted(entries, key=lambda entry: entry.start)
+        self.starts = [entry.start for entry in self.entries]
+        self.ends = [entry.end for entry in self.entries]
+        # max_end[mid] is the largest end within the subtree rooted at mid, where the
+        # subtree over [lo, hi) is rooted at (lo + hi) // 2
+        self.max_end = [0] * len(self.entries)
+        self._annotate(0, len(self.entries))
+
+    def _annotate(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        self.max_end[mid] = max(self.ends[mid], self._annotate(lo, mid), self._annotate(mid + 1, hi))
+        return self.max_end[mid]
+
+    def overlapping(self, start: int, end: int) -> Iterator[ScheduleEntry]:
+        """Entries with entry.start < end and entry.end > start."""
+        limit = bisect_left(self.starts, end)
+        stack = [(0, len(self.entries))]
+        while stack:
+            lo, hi = stack.pop()
+            # Entries from limit on start at or after end
+            if lo >= hi or lo >= limit:
+                continue
+            mid = (lo + hi) // 2
+            if self.max_end[mid] <= start:
+                continue
+            if mid < limit and self.ends[mid] > start:
+                yield self.entries[mid]
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+
+class ScheduleIndex:
+    """Interval trees of one property's schedules, keyed by weekday and route/officer."""
+
+    def __init__(self, entries: Iterable[ScheduleEntry]):
+        grouped: Dict[IndexKey, List[ScheduleEntry]] = {}
+        for entry in entries:
+            for key in entry.keys():
+                grouped.setdefault(key, []).append(entry)
+        self.trees = {key: IntervalTree(items) for key, items in grouped.items()}
+
+    def conflicts(
+        self,
+        candidate: ScheduleEntry,
+        exclude: Iterable[Optional[str]] = ()
+    ) -> List[Tuple[ScheduleEntry, str]]:
+        """Indexed entries conflicting with candidate, with the first shared weekday."""
+        excluded = {str(template_id) for template_id in exclude if template_id}
+        found: Dict[int, Tuple[ScheduleEntry, str]] = {}
+        for key in candidate.keys():
+            tree = self.trees.get(key)
+            if tree is None:
+                continue
+            for entry in tree.overlapping(candidate.start, candidate.end):
+                if entry is candidate or entry.template_id in excluded or id(entry) in found:
+                    continue
+                found[id(entry)] = (entry, key[0])
+        return list(found.values())
+
+
+_indexes: TTLCache = TTLCache(maxsize=256, ttl=INDEX_CACHE_SECONDS)
+_indexes_lock = threading.Lock()
+# Bumped on every invalidation so an index built from pre-write rows is not cached
+_generation = 0
+
+
+def get_schedule_index(db: Session, property_id: str) -> ScheduleIndex:
+    """The property's schedule index, built from its templates on first use."""
+    property_id = str(property_id)
+    with _indexes_lock:
+        index = _indexes.get(property_id)
+        generation = _generation
+    if index is not None:
+        return index
+
+    entries = []
+    templates = db.query(PatrolTemplate).filter(PatrolTemplate.property_id == property_id).all()
+    for template in templates:
+        if not template.schedule:
+            continue
+        try:
+            entries.append(ScheduleEntry.from_template(template))
+        except (AttributeError, IndexError, TypeError, ValueError):
+            logger.warning(f"Skipping patrol template {template.template_id} with malformed schedule")
+    index = ScheduleIndex(entries)
+    with _indexes_lock:
+        if generation == _generation:
+            _indexes[property_id] = index
+    return index
+
+
+def invalidate(property_id: Optional[str] = None) -> None:
+    """Drop the cached index of a property (or of all properties)."""
+    global _generation
+    with _indexes_lock:
+        _generation += 1
+        if property_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(str(property_id), None)
@@ -1,8 +1,10 @@
 from typing import List, Optional, Dict, Any
 from fastapi import HTTPException, status
 from database import SessionLocal
-from models import Patrol, User, Property, PatrolRoute, PatrolTemplate, UserRole, PatrolSettings, PatrolStatus, SystemLog, Incident, IncidentType, IncidentSeverity, IncidentStatus
+from models import Patrol, PatrolCheckpointProgress, User, Property, PatrolRoute, PatrolTemplate, UserRole, PatrolSettings, PatrolStatus, SystemLog, Incident, IncidentType, IncidentSeverity, IncidentStatus
 from services.push_notification_service import PushNotificationService
+from services import load_profiles, patrol_schedule_index
+from services.patrol_schedule_index import ScheduleEntry, ScheduleIndex, get_schedule_index
 from schemas import (
     PatrolCreate, PatrolUpdate, PatrolResponse, 
     UserCreate, UserResponse, UserRoleEnum,
@@ -12,6 +14,7 @@ from schemas import (
     SystemLogResponse
 )
 from passlib.context import CryptContext
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from uuid import uuid4, UUID
 import os
@@ -20,9 +23,6 @@ from cachetools import TTLCache
 
 logger = logging.getLogger(__name__)
 
-# In-memory dedup for check-in request_id. Key: (patrol_id, checkpoint_id, request_id). TTL 24h.
-_checkin_request_cache: TTLCache = TTLCache(maxsize=10000, ttl=86400)
-
 # Officer heartbeat: officer_id -> {last_heartbeat: datetime, device_id?: str}. TTL 30 min.
 _heartbeat_cache: TTLCache = TTLCache(maxsize=500, ttl=1800)
 HEARTBEAT_ONLINE_SEC = 300  # 5 min
@@ -60,7 +60,8 @@ class PatrolService:
         property_id: Optional[str],
         resource_type: str,
         resource_id: Optional[str],
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        commit: bool = True
     ) -> None:
         log_entry = SystemLog(
             log_level="info",
@@ -71,7 +72,20 @@ class PatrolService:
             property_id=property_id
         )
         db.add(log_entry)
-        db.commit()
+        if commit:
+            db.commit()
+    @staticmethod
+    def _require_started_for_completion(patrol: Patrol) -> None:
+        if not patrol.started_at:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Patrol must be started before completion"
+            )
+    @staticmethod
+    def _invalidate_shift_inputs(property_id: Optional[str] = None) -> None:
+        # Imported here: the assignment engine builds on PatrolService
+        from services.patrol_assignment_service import get_patrol_assignment_engine
+        get_patrol_assignment_engine().invalidate(property_id)
     @staticmethod
     def _get_default_property_id(db, user_id: Optional[str]) -> str:
         if user_id:
@@ -90,6 +104,81 @@ class PatrolService:
             )
         return prop.property_id
 
+    @staticmethod
+    def _checkpoint_progress(db, patrol_ids: List[str]) -> Dict[str, Dict[str, PatrolCheckpointProgress]]:
+        """Checkpoint progress rows of the given patrols: patrol_id -> checkpoint_id -> row."""
+        progress: Dict[str, Dict[str, PatrolCheckpointProgress]] = {}
+        if not patrol_ids:
+            return progress
+        rows = db.query(PatrolCheckpointProgress).filter(
+            PatrolCheckpointProgress.patrol_id.in_([str(patrol_id) for patrol_id in patrol_ids])
+        ).all()
+        for row in rows:
+            progress.setdefault(str(row.patrol_id), {})[row.checkpoint_id] = row
+        return progress
+
+    @staticmethod
+    def _project_checkpoints(patrol: Patrol, progress: Optional[Dict[str, PatrolCheckpointProgress]]) -> Any:
+        """Patrol checkpoint definitions with their check-in progress applied."""
+        if not progress:
+            return patrol.checkpoints
+        route_checkpoints = patrol.route.get("checkpoints", []) if isinstance(patrol.route, dict) else []
+        projected = []
+        for checkpoint in patrol.checkpoints or route_checkpoints:
+            row = progress.get(checkpoint.get("id")) if checkpoint else None
+            if row is None:
+                projected.append(checkpoint)
+                continue
+            projected.append({
+                **checkpoint,
+                "status": row.status,
+                "completedAt": row.completed_at.isoformat() if row.completed_at else None,
+                "completedBy": row.completed_by,
+                "notes": row.notes,
+                "method": row.method,
+                "deviceId": row.device_id,
+                "requestId": row.request_id,
+                "location": row.location
+            })
+        return projected
+
+    @staticmethod
+    def _patrol_response(
+        patrol: Patrol,
+        progress: Optional[Dict[str, PatrolCheckpointProgress]] = None,
+        with_names: bool = False
+    ) -> PatrolResponse:
+        names = {}
+        if with_names:
+            names = {
+                "guard_name": f"{patrol.guard.first_name} {patrol.guard.last_name}" if patrol.guard else None,
+                "property_name": patrol.property.property_name if patrol.property else None,
+            }
+        return PatrolResponse(
+            patrol_id=patrol.patrol_id,
+            property_id=patrol.property_id,
+            guard_id=patrol.guard_id,
+            template_id=patrol.template_id,
+            patrol_type=patrol.patrol_type,
+            route=patrol.route,
+            status=patrol.status,
+            started_at=patrol.started_at,
+            completed_at=patrol.completed_at,
+            created_at=patrol.created_at,
+            ai_priority_score=patrol.ai_priority_score,
+            checkpoints=PatrolService._project_checkpoints(patrol, progress),
+            observations=patrol.observations,
+            incidents_found=patrol.incidents_found,
+            efficiency_score=patrol.efficiency_score,
+            version=getattr(patrol, "version", 0),
+            **names
+        )
+
+    @staticmethod
+    def _load_patrol_response(db, patrol: Patrol, with_names: bool = False) -> PatrolResponse:
+        progress = PatrolService._checkpoint_progress(db, [patrol.patrol_id])
+        return PatrolService._patrol_response(patrol, progress.get(str(patrol.patrol_id)), with_names)
+
     @staticmethod
     def _validate_template_schedule(schedule: Dict[str, Any]) -> None:
         if not schedule:
@@ -130,27 +219,6 @@ class PatrolService:
                 detail="Schedule must include at least one day"
             )
 
-    @staticmethod
-    def _schedule_overlaps(
-        schedule_a: Dict[str, Any],
-        schedule_b: Dict[str, Any]
-    ) -> bool:
-        days_a = set(schedule_a.get("days") or [])
-        days_b = set(schedule_b.get("days") or [])
-        if not days_a or not days_b or not days_a.intersection(days_b):
-            return False
-
-        def to_minutes(value: str) -> int:
-            parts = [int(part) for part in value.split(":")]
-            return parts[0] * 60 + parts[1]
-
-        start_a = to_minutes(schedule_a.get("startTime", "00:00"))
-        end_a = to_minutes(schedule_a.get("endTime", "00:00"))
-        start_b = to_minutes(schedule_b.get("startTime", "00:00"))
-        end_b = to_minutes(schedule_b.get("endTime", "00:00"))
-
-        return max(start_a, start_b) < min(end_a, end_b)
-
     @staticmethod
     def _check_schedule_conflicts(
         db,
@@ -161,28 +229,92 @@ class PatrolService:
         assigned_officers: List[str],
         exclude_template_id: Optional[str] = None
     ) -> None:
-        templates = db.query(PatrolTemplate).filter(
-            PatrolTemplate.property_id == property_id
-        ).all()
+        candidate = ScheduleEntry(exclude_template_id, route_id, assigned_officers, schedule)
+        if get_schedule_index(db, property_id).conflicts(candidate, exclude=[exclude_template_id]):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Schedule conflicts with an existing patrol template"
+            )
 
-        for template in templates:
-            if exclude_template_id and str(template.template_id) == str(exclude_template_id):
+    @staticmethod
+    def validate_week_schedule(db, property_id: str, templates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Validate a whole week of template schedules at once.
+        Each item is {template_id?, name?, route_id, assigned_officers, schedule}; items with a
+        template_id replace that stored template. Items are checked against the remaining stored
+        templates and against each other.
+        """
+        for position, item in enumerate(templates):
+            if not isinstance(item, dict):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"templates[{position}] must be an object"
+                )
+        index = get_schedule_index(db, property_id)
+        replaced = [item.get("template_id") for item in templates]
+        results = []
+        entries: List[Optional[ScheduleEntry]] = []
+        for position, item in enumerate(templates):
+            result = {
+                "index": position,
+                "templateId": item.get("template_id"),
+                "name": item.get("name"),
+                "errors": [],
+                "conflicts": [],
+            }
+            results.append(result)
+            try:
+                if not isinstance(item.get("schedule") or {}, dict):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Schedule must be an object"
+                    )
+                PatrolService._validate_template_schedule(item.get("schedule") or {})
+            except HTTPException as e:
+                result["errors"].append(e.detail)
+                entries.append(None)
                 continue
-
-            if not template.schedule:
+            if not item.get("route_id"):
+                result["errors"].append("route_id is required")
+            if not isinstance(item.get("assigned_officers") or [], list):
+                result["errors"].append("assigned_officers must be a list")
+                entries.append(None)
                 continue
+            entry = ScheduleEntry(
+                item.get("template_id"), item.get("route_id"), item.get("assigned_officers"),
+                item["schedule"], item.get("name")
+            )
+            entries.append(entry)
+            for existing, day in index.conflicts(entry, exclude=replaced):
+                result["conflicts"].append({
+                    "templateId": existing.template_id,
+                    "name": existing.name,
+                    "day": day,
+                    "shared": entry.conflict_reason(existing),
+                })
 
-            if not PatrolService._schedule_overlaps(schedule, template.schedule):
+        positions = {id(entry): position for position, entry in enumerate(entries) if entry}
+        batch = ScheduleIndex(entry for entry in entries if entry)
+        for position, entry in enumerate(entries):
+            if entry is None:
                 continue
+            for other, day in batch.conflicts(entry):
+                other_position = positions[id(other)]
+                if other_position < position:
+                    continue
+                for first, second, second_entry in ((position, other_position, other), (other_position, position, entry)):
+                    results[first]["conflicts"].append({
+                        "index": second,
+                        "templateId": second_entry.template_id,
+                        "name": second_entry.name,
+                        "day": day,
+                        "shared": entry.conflict_reason(other),
+                    })
 
-            same_route = route_id and str(template.route_id) == str(route_id)
-            shared_officers = bool(set(assigned_officers or []).intersection(template.assigned_officers or []))
-
-            if same_route or shared_officers:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Schedule conflicts with an existing patrol template"
-                )
+        return {
+            "valid": not any(result["errors"] or result["conflicts"] for result in results),
+            "templates": results,
+        }
     @staticmethod
     async def get_patrols(
         user_id: str, 
@@ -207,27 +339,9 @@ class PatrolService:
             if not patrols:
                 return []
 
+            progress = PatrolService._checkpoint_progress(db, [patrol.patrol_id for patrol in patrols])
             return [
-                PatrolResponse(
-                    patrol_id=patrol.patrol_id,
-                    property_id=patrol.property_id,
-                    guard_id=patrol.guard_id,
-                    template_id=patrol.template_id,
-                    patrol_type=patrol.patrol_type,
-                    route=patrol.route,
-                    status=patrol.status,
-                    started_at=patrol.started_at,
-                    completed_at=patrol.completed_at,
-                    created_at=patrol.created_at,
-                    ai_priority_score=patrol.ai_priority_score,
-                    checkpoints=patrol.checkpoints,
-                    observations=patrol.observations,
-                    incidents_found=patrol.incidents_found,
-                    efficiency_score=patrol.efficiency_score,
-                    guard_name=f"{patrol.guard.first_name} {patrol.guard.last_name}" if patrol.guard else None,
-                    property_name=patrol.property.property_name if patrol.property else None,
-                    version=getattr(patrol, "version", 0),
-                )
+                PatrolService._patrol_response(patrol, progress.get(str(patrol.patrol_id)), with_names=True)
                 for patrol in patrols
             ]
         except Exception as e:
@@ -259,24 +373,7 @@ class PatrolService:
             db.commit()
             db.refresh(db_patrol)
             
-            return PatrolResponse(
-                patrol_id=db_patrol.patrol_id,
-                property_id=db_patrol.property_id,
-                guard_id=db_patrol.guard_id,
-                template_id=db_patrol.template_id,
-                patrol_type=db_patrol.patrol_type,
-                route=db_patrol.route,
-                status=db_patrol.status,
-                started_at=db_patrol.started_at,
-                completed_at=db_patrol.completed_at,
-                created_at=db_patrol.created_at,
-                ai_priority_score=db_patrol.ai_priority_score,
-                checkpoints=db_patrol.checkpoints,
-                observations=db_patrol.observations,
-                incidents_found=db_patrol.incidents_found,
-                efficiency_score=db_patrol.efficiency_score,
-                version=getattr(db_patrol, "version", 0),
-            )
+            return PatrolService._patrol_response(db_patrol)
         finally:
             db.close()
     
@@ -289,26 +386,7 @@ class PatrolService:
             if not patrol:
                 raise ValueError("Patrol not found")
             
-            return PatrolResponse(
-                patrol_id=patrol.patrol_id,
-                property_id=patrol.property_id,
-                guard_id=patrol.guard_id,
-                template_id=patrol.template_id,
-                patrol_type=patrol.patrol_type,
-                route=patrol.route,
-                status=patrol.status,
-                started_at=patrol.started_at,
-                completed_at=patrol.completed_at,
-                created_at=patrol.created_at,
-                ai_priority_score=patrol.ai_priority_score,
-                checkpoints=patrol.checkpoints,
-                observations=patrol.observations,
-                incidents_found=patrol.incidents_found,
-                efficiency_score=patrol.efficiency_score,
-                guard_name=f"{patrol.guard.first_name} {patrol.guard.last_name}" if patrol.guard else None,
-                property_name=patrol.property.property_name if patrol.property else None,
-                version=getattr(patrol, "version", 0),
-            )
+            return PatrolService._load_patrol_response(db, patrol, with_names=True)
         finally:
             db.close()
 
@@ -351,11 +429,7 @@ class PatrolService:
                 if patrol_update.status == PatrolStatus.ACTIVE and not patrol.started_at:
                     patrol.started_at = datetime.utcnow()
                 if patrol_update.status == PatrolStatus.COMPLETED and not patrol.completed_at:
-                    if not patrol.started_at:
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="Patrol must be started before completion"
-                        )
+                    PatrolService._require_started_for_completion(patrol)
                     patrol.completed_at = datetime.utcnow()
             
             db.commit()
@@ -399,24 +473,7 @@ class PatrolService:
                 )
             db.refresh(patrol)
             
-            return PatrolResponse(
-                patrol_id=patrol.patrol_id,
-                property_id=patrol.property_id,
-                guard_id=patrol.guard_id,
-                template_id=patrol.template_id,
-                patrol_type=patrol.patrol_type,
-                route=patrol.route,
-                status=patrol.status,
-                started_at=patrol.started_at,
-                completed_at=patrol.completed_at,
-                created_at=patrol.created_at,
-                ai_priority_score=patrol.ai_priority_score,
-                checkpoints=patrol.checkpoints,
-                observations=patrol.observations,
-                incidents_found=patrol.incidents_found,
-                efficiency_score=patrol.efficiency_score,
-                version=patrol.version,
-            )
+            return PatrolService._load_patrol_response(db, patrol)
         finally:
             db.close()
     
@@ -485,7 +542,7 @@ class PatrolService:
             # Query users who have 'security_officer' or 'guard' role
             from models import UserRole
             try:
-                users = db.query(User).join(
+                users = db.query(User).options(*load_profiles.OFFICER).join(
                     UserRole, UserRole.user_id == User.user_id
                 ).filter(
                     UserRole.role_name.in_([UserRoleEnum.SECURITY_OFFICER, UserRoleEnum.GUARD])
@@ -542,6 +599,7 @@ class PatrolService:
             # Could update UserRole permissions here if needed
 
             db.commit()
+            PatrolService._invalidate_shift_inputs()
             db.refresh(db_user)
             
             # Return full response using map helper logic (duplicated for now or extract)
@@ -572,6 +630,7 @@ class PatrolService:
             # Soft delete by setting status to inactive
             db_user.status = "inactive"
             db.commit()
+            PatrolService._invalidate_shift_inputs()
             return {"message": "Officer deactivated successfully"}
         finally:
             db.close()
@@ -649,6 +708,7 @@ class PatrolService:
             )
             db.add(new_role)
             db.commit()
+            PatrolService._invalidate_shift_inputs()
             
             return UserResponse(
                 user_id=new_user.user_id,
@@ -924,7 +984,7 @@ class PatrolService:
                 name=template.name,
                 description=template.description,
                 route_id=str(template.route_id),
-                assigned_officers=template.assigned_officers or [],
+                assigned_officers=[str(officer_id) for officer_id in (template.assigned_officers or [])],
                 schedule=template.schedule or {},
                 priority=template.priority,
                 is_recurring=template.is_recurring,
@@ -932,6 +992,8 @@ class PatrolService:
             )
             db.add(db_template)
             db.commit()
+            patrol_schedule_index.invalidate(property_id)
+            PatrolService._invalidate_shift_inputs(property_id)
             db.refresh(db_template)
             PatrolService._log_audit_event(
                 db,
@@ -968,6 +1030,8 @@ class PatrolService:
                 raise ValueError("Template not found")
 
             update_data = template_update.model_dump(exclude_unset=True)
+            if update_data.get("assigned_officers") is not None:
+                update_data["assigned_officers"] = [str(officer_id) for officer_id in update_data["assigned_officers"]]
             if "schedule" in update_data:
                 PatrolService._validate_template_schedule(update_data.get("schedule") or {})
             if "route_id" in update_data and update_data.get("route_id"):
@@ -992,6 +1056,8 @@ class PatrolService:
                 setattr(template, field, value)
 
             db.commit()
+            patrol_schedule_index.invalidate(template.property_id)
+            PatrolService._invalidate_shift_inputs(template.property_id)
             db.refresh(template)
             PatrolService._log_audit_event(
                 db,
@@ -1038,6 +1104,8 @@ class PatrolService:
                     )
             db.delete(template)
             db.commit()
+            patrol_schedule_index.invalidate(template.property_id)
+            PatrolService._invalidate_shift_inputs(template.property_id)
             PatrolService._log_audit_event(
                 db,
                 action="patrol_template_deleted",
@@ -1051,6 +1119,83 @@ class PatrolService:
         finally:
             db.close()
 
+    @staticmethod
+    def _add_checkpoint_progress(
+        db,
+        patrol: Patrol,
+        checkpoint_id: str,
+        payload: Dict[str, Any],
+        user_id: Optional[str]
+    ) -> bool:
+        """
+        Validate a check-in and stage its progress row (flushed, not committed).
+        Returns False when the checkpoint (or the payload's request_id) is already recorded.
+        """
+        method = payload.get("method") or "manual"
+        if method not in ["manual", "nfc", "qr", "gps", "hardware"]:
+            raise ValueError("Invalid check-in method")
+        device_id = payload.get("device_id")
+        if method != "manual" and not device_id:
+            raise ValueError("device_id is required for hardware check-ins")
+        if method != "manual":
+            allowlist_raw = os.getenv("HARDWARE_DEVICE_IDS", "")
+            if allowlist_raw:
+                allowlist = {item.strip() for item in allowlist_raw.split(",") if item.strip()}
+                if allowlist and device_id not in allowlist:
+                    raise HTTPException(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        detail="Device not authorized for hardware check-in"
+                    )
+
+        # Already checked in (or a retry of the same request): idempotent
+        request_id = payload.get("request_id")
+        existing_filter = PatrolCheckpointProgress.checkpoint_id == checkpoint_id
+        if request_id:
+            existing_filter = existing_filter | (PatrolCheckpointProgress.request_id == request_id)
+        existing = db.query(PatrolCheckpointProgress.progress_id).filter(
+            PatrolCheckpointProgress.patrol_id == patrol.patrol_id,
+            existing_filter
+        ).first()
+        if existing:
+            return False
+
+        if patrol.status != PatrolStatus.ACTIVE:
+            raise ValueError("Checkpoint check-in is only allowed for active patrols")
+
+        route_checkpoints = patrol.route.get("checkpoints", []) if isinstance(patrol.route, dict) else []
+        checkpoint_list = patrol.checkpoints or route_checkpoints
+        if not checkpoint_list:
+            raise ValueError("No checkpoints available for this patrol")
+        checkpoint = next((cp for cp in checkpoint_list if cp and cp.get("id") == checkpoint_id), None)
+        if checkpoint is None:
+            raise ValueError("Checkpoint not found")
+        if checkpoint.get("status") == "completed":
+            return False
+
+        completed_at = payload.get("completed_at")
+        if completed_at and not isinstance(completed_at, datetime):
+            try:
+                completed_at = datetime.fromisoformat(str(completed_at).replace("Z", "+00:00"))
+            except ValueError:
+                raise ValueError("completed_at must be an ISO 8601 timestamp")
+
+        # One row per (patrol, checkpoint); the unique constraints make concurrent
+        # or repeated check-ins collapse into the first one
+        db.add(PatrolCheckpointProgress(
+            patrol_id=patrol.patrol_id,
+            checkpoint_id=checkpoint_id,
+            status="completed",
+            completed_at=completed_at or datetime.utcnow(),
+            completed_by=payload.get("completed_by") or user_id or "hardware",
+            method=method,
+            device_id=device_id,
+            request_id=request_id,
+            notes=payload.get("notes"),
+            location=payload.get("location"),
+        ))
+        db.flush()
+        return True
+
     @staticmethod
     async def check_in_checkpoint(
         patrol_id: str,
@@ -1060,109 +1205,19 @@ class PatrolService:
     ) -> PatrolResponse:
         db = SessionLocal()
         try:
-            method = payload.get("method") or "manual"
-            if method not in ["manual", "nfc", "qr", "gps", "hardware"]:
-                raise ValueError("Invalid check-in method")
-            device_id = payload.get("device_id")
-            if method != "manual" and not device_id:
-                raise ValueError("device_id is required for hardware check-ins")
-            if method != "manual":
-                allowlist_raw = os.getenv("HARDWARE_DEVICE_IDS", "")
-                if allowlist_raw:
-                    allowlist = {item.strip() for item in allowlist_raw.split(",") if item.strip()}
-                    if allowlist and device_id not in allowlist:
-                        raise HTTPException(
-                            status_code=status.HTTP_401_UNAUTHORIZED,
-                            detail="Device not authorized for hardware check-in"
-                        )
-
-            request_id = payload.get("request_id")
-            dedup_key = (patrol_id, checkpoint_id, request_id) if request_id else None
-            if dedup_key and dedup_key in _checkin_request_cache:
-                patrol = db.query(Patrol).filter(Patrol.patrol_id == patrol_id).first()
-                if not patrol:
-                    raise ValueError("Patrol not found")
-                return PatrolResponse(
-                    patrol_id=patrol.patrol_id,
-                    property_id=patrol.property_id,
-                    guard_id=patrol.guard_id,
-                    template_id=patrol.template_id,
-                    patrol_type=patrol.patrol_type,
-                    route=patrol.route,
-                    status=patrol.status,
-                    started_at=patrol.started_at,
-                    completed_at=patrol.completed_at,
-                    created_at=patrol.created_at,
-                    ai_priority_score=patrol.ai_priority_score,
-                    checkpoints=patrol.checkpoints,
-                    observations=patrol.observations,
-                    incidents_found=patrol.incidents_found,
-                    efficiency_score=patrol.efficiency_score,
-                    version=getattr(patrol, "version", 0),
-                )
-
             patrol = db.query(Patrol).filter(Patrol.patrol_id == patrol_id).first()
             if not patrol:
                 raise ValueError("Patrol not found")
 
-            if patrol.status != PatrolStatus.ACTIVE:
-                raise ValueError("Checkpoint check-in is only allowed for active patrols")
-
-            route_checkpoints = patrol.route.get("checkpoints", []) if isinstance(patrol.route, dict) else []
-            checkpoint_list = patrol.checkpoints or route_checkpoints
-            if not checkpoint_list:
-                raise ValueError("No checkpoints available for this patrol")
-
-            completed_at = payload.get("completed_at")
-            if isinstance(completed_at, datetime):
-                completed_at = completed_at.isoformat()
-
-            updated_checkpoints = []
-            found = False
-            for checkpoint in checkpoint_list:
-                if checkpoint and checkpoint.get("id") == checkpoint_id:
-                    if checkpoint.get("status") == "completed":
-                        if dedup_key:
-                            _checkin_request_cache[dedup_key] = True
-                        return PatrolResponse(
-                            patrol_id=patrol.patrol_id,
-                            property_id=patrol.property_id,
-                            guard_id=patrol.guard_id,
-                            template_id=patrol.template_id,
-                            patrol_type=patrol.patrol_type,
-                            route=patrol.route,
-                            status=patrol.status,
-                            started_at=patrol.started_at,
-                            completed_at=patrol.completed_at,
-                            created_at=patrol.created_at,
-                            ai_priority_score=patrol.ai_priority_score,
-                            checkpoints=patrol.checkpoints,
-                            observations=patrol.observations,
-                            incidents_found=patrol.incidents_found,
-                            efficiency_score=patrol.efficiency_score,
-                            version=getattr(patrol, "version", 0),
-                        )
-                    found = True
-                    updated_checkpoints.append({
-                        **checkpoint,
-                        "status": "completed",
-                        "completedAt": completed_at or datetime.utcnow().isoformat(),
-                        "completedBy": payload.get("completed_by") or user_id or "hardware",
-                        "notes": payload.get("notes"),
-                        "method": method,
-                        "deviceId": payload.get("device_id"),
-                        "requestId": payload.get("request_id"),
-                        "location": payload.get("location")
-                    })
-                else:
-                    updated_checkpoints.append(checkpoint)
-
-            if not found:
-                raise ValueError("Checkpoint not found")
+            try:
+                if not PatrolService._add_checkpoint_progress(db, patrol, checkpoint_id, payload, user_id):
+                    return PatrolService._load_patrol_response(db, patrol)
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return PatrolService._load_patrol_response(db, patrol)
 
-            patrol.checkpoints = updated_checkpoints
-            db.commit()
-            db.refresh(patrol)
+            method = payload.get("method") or "manual"
             source = "web_admin" if method == "manual" else "mobile_agent"
             PatrolService._log_audit_event(
                 db,
@@ -1179,27 +1234,8 @@ class PatrolService:
                     "request_id": payload.get("request_id")
                 }
             )
-            if dedup_key:
-                _checkin_request_cache[dedup_key] = True
 
-            return PatrolResponse(
-                patrol_id=patrol.patrol_id,
-                property_id=patrol.property_id,
-                guard_id=patrol.guard_id,
-                template_id=patrol.template_id,
-                patrol_type=patrol.patrol_type,
-                route=patrol.route,
-                status=patrol.status,
-                started_at=patrol.started_at,
-                completed_at=patrol.completed_at,
-                created_at=patrol.created_at,
-                ai_priority_score=patrol.ai_priority_score,
-                checkpoints=patrol.checkpoints,
-                observations=patrol.observations,
-                incidents_found=patrol.incidents_found,
-                efficiency_score=patrol.efficiency_score,
-                version=getattr(patrol, "version", 0),
-            )
+            return PatrolService._load_patrol_response(db, patrol)
         finally:
             db.close()
 
@@ -0,0 +1,374 @@
+"""
+Patrol Sync Service
+Offline-first batched sync for mobile patrol agents.
+
+A device that was offline uploads its whole journal in one request: an ordered list of
+operations, each with a client sequence number (monotonic per device). Operations are
+grouped into streams - one per patrol, plus an "agent" stream for locations recorded
+outside a patrol - and each stream is applied in its own transaction:
+  - operations at or below the stream's stored cursor are duplicates of an earlier sync
+    and skipped, so a retried upload is applied exactly once
+  - operations that fail validation are rejected and acknowledged (the device drops them)
+  - patrol changes bump Patrol.version with a compare-and-swap; status changes are refused
+    when the device's base version is stale, as in PatrolService.update_patrol
+  - a lost race (version or cursor) rolls the stream back and it is reported as "retry"
+  - applied check-ins and status changes write the same audit entries as the single-op
+    endpoints, in the stream's transaction
+Location fixes are handed to the agent location buffer once their stream has committed,
+in batches of at most MAX_FIXES_PER_BATCH.
+
+Operation types:
+  check_in     checkpoint_id, method, device_id, completed_at, notes, location, request_id
+  status       status ("active", "completed", "interrupted")
+  observation  observations, location, photo_files (references to already uploaded files)
+  location     latitude, longitude, accuracy, altitude, speed, heading, timestamp
+
+The response is a compact diff: per stream the acknowledged sequence and rejected
+operations, and for patrols the device's view was stale on, the patrol's current status
+and checkpoint progress.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+import json
+import logging
+import uuid
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Patrol, PatrolStatus, PatrolSubmission, PatrolSyncCursor, SystemLog
+from services.agent_location_buffer import MAX_FIXES_PER_BATCH, AgentLocationBuffer, get_location_buffer, parse_fix
+from services.patrol_service import PatrolService
+
+logger = logging.getLogger(__name__)
+
+AGENT_STREAM = "agent"
+MAX_OPERATIONS = 5000
+OPERATION_TYPES = ("check_in", "status", "observation", "location")
+PATROL_OPERATION_TYPES = ("check_in", "status", "observation")
+
+
+class SyncConflict(Exception):
+    """Another writer changed the patrol or the device cursor during the sync."""
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError("timestamp must be an ISO 8601 timestamp")
+
+
+def _error_detail(error: Exception) -> str:
+    return str(error.detail) if isinstance(error, HTTPException) else str(error)
+
+
+class PatrolSyncService:
+    """Applies device journals; one instance per sync request."""
+
+    def __init__(
+        self,
+        db: Session,
+        device_id: str,
+        agent_id: str,
+        user_id: Optional[str],
+        location_buffer: Optional[AgentLocationBuffer] = None,
+        property_ids: Optional[Iterable[str]] = None
+    ):
+        self.db = db
+        self.device_id = device_id
+        self.agent_id = agent_id
+        self.user_id = user_id
+        self.location_buffer = location_buffer or get_location_buffer()
+        # Properties whose patrols the caller may change; None skips the check
+        self.property_ids = None if property_ids is None else {str(p) for p in property_ids}
+
+    def _accessible(self, patrol: Optional[Patrol]) -> bool:
+        return patrol is not None and (self.property_ids is None or str(patrol.property_id) in self.property_ids)
+
+    @staticmethod
+    def group_operations(operations: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Validate the journal shape and split it into streams, keeping journal order."""
+        if not isinstance(operations, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="operations must be a list")
+        if len(operations) > MAX_OPERATIONS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {MAX_OPERATIONS} operations per sync"
+            )
+        streams: Dict[str, List[Dict[str, Any]]] = {}
+        for op in operations:
+            if not isinstance(op, dict) or not isinstance(op.get("seq"), int) or op.get("type") not in OPERATION_TYPES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Each operation needs an integer seq and a type in {', '.join(OPERATION_TYPES)}"
+                )
+            patrol_id = op.get("patrol_id")
+            if op["type"] in PATROL_OPERATION_TYPES and not patrol_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Operation {op['seq']} ({op['type']}) requires patrol_id"
+                )
+            streams.setdefault(str(patrol_id) if patrol_id else AGENT_STREAM, []).append(op)
+        return streams
+
+    def sync(self, operations: List[Dict[str, Any]], patrol_versions: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        streams = self.group_operations(operations)
+        patrol_versions = patrol_versions or {}
+        result: Dict[str, Any] = {
+            "device_id": self.device_id,
+            "server_time": datetime.now(timezone.utc).isoformat(),
+            "patrols": {},
+        }
+        for stream, ops in streams.items():
+            points: List[Dict[str, Any]] = []
+            try:
+                if stream == AGENT_STREAM:
+                    outcome = self._apply_agent_stream(ops, points)
+                else:
+                    outcome = self._apply_patrol_stream(stream, ops, patrol_versions.get(stream), points)
+                self.db.commit()
+            except (SyncConflict, IntegrityError) as e:
+                self.db.rollback()
+                logger.info(f"Sync of stream {stream} for device {self.device_id} lost a race: {e}")
+                outcome = {"status": "retry"}
+            else:
+                # Locations go through the write-behind buffer once the stream is acknowledged;
+                # a journal may carry more fixes than the buffer takes in one batch
+                for start in range(0, len(points), MAX_FIXES_PER_BATCH):
+                    self.location_buffer.record(self.agent_id, points[start:start + MAX_FIXES_PER_BATCH])
+            if stream == AGENT_STREAM:
+                result["agent"] = outcome
+            else:
+                result["patrols"][stream] = outcome
+
+        # Patrols the device knows about but sent nothing for: report changes only
+        for patrol_id, base_version in patrol_versions.items():
+            if str(patrol_id) not in result["patrols"]:
+                patrol = self.db.query(Patrol).filter(Patrol.patrol_id == str(patrol_id)).first()
+                if self._accessible(patrol) and (patrol.version or 0) != base_version:
+                    result["patrols"][str(patrol_id)] = {
+                        "status": "changed",
+                        "version": patrol.version or 0,
+                        "patrol": self._patrol_state(patrol),
+                    }
+        return result
+
+    def _cursor(self, stream: str) -> Tuple[Optional[PatrolSyncCursor], int]:
+        cursor = self.db.query(PatrolSyncCursor).filter(
+            PatrolSyncCursor.device_id == self.device_id,
+            PatrolSyncCursor.stream == stream
+        ).first()
+        return cursor, (cursor.last_seq if cursor else 0)
+
+    def _advance_cursor(self, stream: str, cursor: Optional[PatrolSyncCursor], previous: int, last_seq: int) -> None:
+        if last_seq <= previous:
+            return
+        if cursor is None:
+            # A concurrent first sync of the same stream fails the unique constraint
+            self.db.add(PatrolSyncCursor(device_id=self.device_id, stream=stream, last_seq=last_seq))
+            self.db.flush()
+            return
+        updated = self.db.query(PatrolSyncCursor).filter(
+            PatrolSyncCursor.cursor_id == cursor.cursor_id,
+            PatrolSyncCursor.last_seq == previous
+        ).update({PatrolSyncCursor.last_seq: last_seq}, synchronize_session=False)
+        if updated != 1:
+            raise SyncConflict(f"cursor {stream} moved")
+
+    def _apply_agent_stream(self, ops: List[Dict[str, Any]], points: List[Dict[str, Any]]) -> Dict[str, Any]:
+        cursor, previous = self._cursor(AGENT_STREAM)
+        last_seq, duplicates, rejected = previous, 0, []
+        for op in ops:
+            if op["seq"] <= previous:
+                duplicates += 1
+                continue
+            try:
+                points.append(parse_fix(op))
+            except ValueError as e:
+                rejected.append({"seq": op["seq"], "error": str(e)})
+            last_seq = max(last_seq, op["seq"])
+        self._advance_cursor(AGENT_STREAM, cursor, previous, last_seq)
+        return {"status": "ok", "acked": last_seq, "applied": len(points), "duplicates": duplicates, "rejected": rejected}
+
+    def _apply_patrol_stream(
+        self,
+        patrol_id: str,
+        ops: List[Dict[str, Any]],
+        base_version: Optional[int],
+        points: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        cursor, previous = self._cursor(patrol_id)
+        patrol = self.db.query(Patrol).filter(Patrol.patrol_id == patrol_id).first()
+        if not self._accessible(patrol):
+            # Other properties' patrols are indistinguishable from missing ones
+            patrol = None
+        server_version = (patrol.version or 0) if patrol else 0
+        stale = base_version is not None and base_version != server_version
+
+        last_seq, duplicates, applied, changed = previous, 0, 0, False
+        rejected: List[Dict[str, Any]] = []
+        for op in ops:
+            if op["seq"] <= previous:
+                duplicates += 1
+                continue
+            last_seq = max(last_seq, op["seq"])
+            if patrol is None:
+                rejected.append({"seq": op["seq"], "error": "Patrol not found"})
+                continue
+            try:
+                if op["type"] == "check_in":
+                    payload = {key: value for key, value in op.items() if key not in ("seq", "type", "patrol_id", "checkpoint_id")}
+                    payload.setdefault("device_id", self.device_id)
+                    payload.setdefault("request_id", f"{self.device_id}:{op['seq']}")
+                    checkpoint_id = str(op.get("checkpoint_id"))
+                    if PatrolService._add_checkpoint_progress(self.db, patrol, checkpoint_id, payload, self.user_id):
+                        self._log_checkin(patrol, checkpoint_id, payload)
+                        changed = True
+                elif op["type"] == "status":
+                    changed = self._apply_status(patrol, op, stale) or changed
+                elif op["type"] == "observation":
+                    self._add_observation(patrol_id, op)
+                else:
+                    points.append(parse_fix(op))
+                applied += 1
+            except (ValueError, HTTPException) as e:
+                rejected.append({"seq": op["seq"], "error": _error_detail(e)})
+
+        version = server_version
+        if changed:
+            updated = self.db.query(Patrol).filter(
+                Patrol.patrol_id == patrol_id,
+                Patrol.version == server_version
+            ).update({Patrol.version: server_version + 1}, synchronize_session=False)
+            if updated != 1:
+                raise SyncConflict(f"patrol {patrol_id} version moved")
+            version = server_version + 1
+            patrol.version = version
+        self._advance_cursor(patrol_id, cursor, previous, last_seq)
+        if applied:
+            self.db.add(SystemLog(
+                log_level="info",
+                message="patrol_sync_applied",
+                service="patrols",
+                log_metadata={
+                    "patrol_id": patrol_id,
+                    "device_id": self.device_id,
+                    "applied": applied,
+                    "rejected": len(rejected),
+                    "last_seq": last_seq,
+                },
+                user_id=self.user_id,
+                property_id=patrol.property_id
+            ))
+
+        outcome = {
+            "status": "ok",
+            "acked": last_seq,
+            "version": version,
+            "applied": applied,
+            "duplicates": duplicates,
+            "rejected": rejected,
+        }
+        if patrol is not None and (stale or base_version is None or rejected):
+            self.db.flush()
+            outcome["patrol"] = self._patrol_state(patrol)
+        return outcome
+
+    def _apply_status(self, patrol: Patrol, op: Dict[str, Any], stale: bool) -> bool:
+        try:
+            next_status = PatrolStatus(op.get("status"))
+        except ValueError:
+            raise ValueError(f"Invalid patrol status: {op.get('status')}")
+        if next_status == patrol.status:
+            return False
+        if stale:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Patrol was updated elsewhere; refresh and retry.",
+            )
+        PatrolService._validate_patrol_status_transition(patrol.status, next_status)
+        at = _parse_timestamp(op.get("timestamp")) or datetime.utcnow()
+        if next_status == PatrolStatus.ACTIVE and not patrol.started_at:
+            patrol.started_at = at
+        if next_status == PatrolStatus.COMPLETED and not patrol.completed_at:
+            PatrolService._require_started_for_completion(patrol)
+            patrol.completed_at = at
+        previous_status = patrol.status
+        patrol.status = next_status
+        PatrolService._log_audit_event(
+            self.db,
+            action="patrol_status_changed",
+            user_id=self.user_id,
+            property_id=patrol.property_id,
+            resource_type="patrol",
+            resource_id=patrol.patrol_id,
+            metadata={
+                "from": str(previous_status),
+                "to": str(next_status)
+            },
+            commit=False
+        )
+        return True
+
+    def _log_checkin(self, patrol: Patrol, checkpoint_id: str, payload: Dict[str, Any]) -> None:
+        # Same audit entry as PatrolService.check_in_checkpoint; committed with the stream
+        method = payload.get("method") or "manual"
+        PatrolService._log_audit_event(
+            self.db,
+            action="patrol_checkpoint_checkin",
+            user_id=self.user_id,
+            property_id=patrol.property_id,
+            resource_type="patrol_checkpoint",
+            resource_id=checkpoint_id,
+            metadata={
+                "patrol_id": str(patrol.patrol_id),
+                "method": payload.get("method"),
+                "device_id": payload.get("device_id"),
+                "source": "web_admin" if method == "manual" else "mobile_agent",
+                "request_id": payload.get("request_id")
+            },
+            commit=False
+        )
+
+    def _add_observation(self, patrol_id: str, op: Dict[str, Any]) -> None:
+        observations = op.get("observations")
+        if not isinstance(observations, dict):
+            raise ValueError("observations must be an object")
+        location = op.get("location") or {}
+        photo_files = op.get("photo_files") or []
+        self.db.add(PatrolSubmission(
+            submission_id=str(uuid.uuid4()),
+            agent_id=self.agent_id,
+            patrol_id=patrol_id,
+            timestamp=_parse_timestamp(op.get("timestamp")) or datetime.now(timezone.utc),
+            location_latitude=location.get("latitude"),
+            location_longitude=location.get("longitude"),
+            location_accuracy=location.get("accuracy"),
+            location_address=location.get("address"),
+            observations=json.dumps(observations),
+            photo_count=len(photo_files),
+            photo_files=json.dumps(photo_files) if photo_files else None,
+            status="received",
+            user_id=self.user_id,
+        ))
+
+    def _patrol_state(self, patrol: Patrol) -> Dict[str, Any]:
+        progress = PatrolService._checkpoint_progress(self.db, [patrol.patrol_id]).get(str(patrol.patrol_id), {})
+        return {
+            "status": patrol.status.value if isinstance(patrol.status, PatrolStatus) else patrol.status,
+            "guard_id": patrol.guard_id,
+            "started_at": patrol.started_at.isoformat() if patrol.started_at else None,
+            "completed_at": patrol.completed_at.isoformat() if patrol.completed_at else None,
+            "checkpoints": {
+                checkpoint_id: {
+                    "status": row.status,
+                    "completedAt": row.completed_at.isoformat() if row.completed_at else None,
+                    "completedBy": row.completed_by,
+                }
+                for checkpoint_id, row in progress.items()
+            },
+        }
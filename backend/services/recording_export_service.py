@@ -1,221 +1,701 @@
+"""
+Recording Export Service
+Persistent recording export jobs run by a bounded pool of ffmpeg workers.
+
+Export requests only insert a RecordingExportJob row and queue it, then return the
+export id; worker threads pick jobs up and run ffmpeg:
+  - "copy" jobs (same container, or quality "original") stream-copy and are I/O bound,
+    up to EXPORT_COPY_WORKERS at a time
+  - "transcode" jobs re-encode with the quality profile's settings, each ffmpeg limited
+    to EXPORT_THREADS_PER_JOB threads, with one job per that many CPUs
+Progress comes from ffmpeg's -progress output (out_time against the probed duration) and
+is written to the row every EXPORT_PROGRESS_INTERVAL_SECONDS together with a heartbeat.
+Cancelling marks the row; the worker running it (in whichever process) terminates its
+ffmpeg on the next progress tick. Output is written to <file>.part and renamed when done.
+
+Restart recovery: on start, and whenever a worker is idle, "processing" rows whose worker
+process is gone (same host) or whose heartbeat is older than EXPORT_STALE_SECONDS go back
+to pending (up to EXPORT_MAX_ATTEMPTS runs), and pending rows are queued. Every state
+change is a conditional UPDATE on the current status, so several API processes can share
+the table without running a job twice.
+
+A batch is the jobs sharing a batch_id. Its download is a ZIP streamed straight from the
+export files (utils/zip_stream.py): entries are sent as their exports complete, so the
+download can start before the last recording is done and no archive copy is stored. The
+stream is an async generator, so a download waiting for exports holds no worker thread;
+the download endpoint answers 409 until at least one export has completed.
+"""
+import asyncio
 import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
 import uuid
-import asyncio
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from pathlib import Path
 import logging
 
+from sqlalchemy import update
+
+from database import SessionLocal
+from models import RecordingExportJob
+from utils.zip_stream import ZipStreamWriter
+
 logger = logging.getLogger(__name__)
 
+EXPORT_THREADS_PER_JOB = int(os.getenv("EXPORT_THREADS_PER_JOB", "2"))
+EXPORT_TRANSCODE_WORKERS = int(os.getenv(
+    "EXPORT_TRANSCODE_WORKERS", str(max(1, (os.cpu_count() or 1) // EXPORT_THREADS_PER_JOB))
+))
+EXPORT_COPY_WORKERS = int(os.getenv("EXPORT_COPY_WORKERS", "4"))
+EXPORT_PROGRESS_INTERVAL_SECONDS = float(os.getenv("EXPORT_PROGRESS_INTERVAL_SECONDS", "1.0"))
+EXPORT_STALE_SECONDS = float(os.getenv("EXPORT_STALE_SECONDS", "120"))
+EXPORT_MAX_ATTEMPTS = int(os.getenv("EXPORT_MAX_ATTEMPTS", "3"))
+EXPORT_RECOVERY_INTERVAL_SECONDS = 60.0
+BATCH_STREAM_POLL_SECONDS = 1.0
+# A batch download stops waiting for unfinished exports when none has finished for this
+# long; kept under the usual 60 s proxy read timeout, since nothing is sent while waiting
+BATCH_STREAM_MAX_WAIT_SECONDS = float(os.getenv("BATCH_STREAM_MAX_WAIT_SECONDS", "45"))
+FFPROBE_TIMEOUT_SECONDS = 30
+
+ACTIVE_STATUSES = ("pending", "processing")
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# ffmpeg settings per quality; "original" never re-encodes
+QUALITY_PROFILES: Dict[str, Optional[Dict[str, Any]]] = {
+    "original": None,
+    "high": {"crf": 20, "vp9_crf": 31, "preset": "medium", "height": None},
+    "medium": {"crf": 26, "vp9_crf": 36, "preset": "fast", "height": 720},
+    "low": {"crf": 30, "vp9_crf": 41, "preset": "veryfast", "height": 480},
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(ts: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands timezone=True columns back naive
+    if ts is not None and ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+def export_mode(source: Optional[str], format: str, quality: str) -> str:
+    """"copy" when the source can be remuxed as-is, else "transcode"."""
+    if quality == "original":
+        return "copy"
+    source_ext = Path(source).suffix.lower().lstrip(".") if source else ""
+    return "copy" if source_ext == format and quality == "high" else "transcode"
+
+
+def build_ffmpeg_command(
+    ffmpeg: str, source: str, dest: str, format: str, quality: str, mode: str, threads: int = EXPORT_THREADS_PER_JOB
+) -> List[str]:
+    cmd = [ffmpeg, "-hide_banner", "-nostdin", "-y", "-v", "error", "-progress", "pipe:1", "-nostats", "-i", source]
+    if mode == "copy":
+        cmd += ["-map", "0", "-c", "copy"]
+    else:
+        profile = QUALITY_PROFILES[quality] or QUALITY_PROFILES["high"]
+        if format == "webm":
+            cmd += ["-c:v", "libvpx-vp9", "-crf", str(profile["vp9_crf"]), "-b:v", "0", "-c:a", "libopus"]
+        else:
+            cmd += ["-c:v", "libx264", "-preset", profile["preset"], "-crf", str(profile["crf"]), "-c:a", "aac"]
+        if profile["height"]:
+            # Downscale only; -2 keeps the width even for the encoder
+            cmd += ["-vf", f"scale=-2:'min({profile['height']},ih)'"]
+        cmd += ["-threads", str(threads)]
+    if format in ("mp4", "mov"):
+        cmd += ["-movflags", "+faststart"]
+    return cmd + ["-f", format, dest]
+
+
+def parse_progress(line: str, duration_seconds: Optional[float]) -> Optional[float]:
+    """Percent done from one line of ffmpeg -progress output, or None if it carries none."""
+    key, _, value = line.strip().partition("=")
+    if key == "progress" and value == "end":
+        return 100.0
+    # out_time_ms is microseconds too (long-standing ffmpeg quirk)
+    if key in ("out_time_us", "out_time_ms") and duration_seconds:
+        try:
+            seconds = int(value) / 1_000_000
+        except ValueError:  # "N/A" before the first frame
+            return None
+        return max(0.0, min(99.0, seconds / duration_seconds * 100))
+    return None
+
+
+def _ffmpeg_error(stderr_text: str, returncode: int) -> str:
+    lines = [line.strip() for line in stderr_text.splitlines() if line.strip()]
+    return lines[-1][:280] if lines else f"ffmpeg exited with code {returncode}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
 class RecordingExportService:
     """Recording export system with format conversion and batch operations."""
-    
+
     RECORDINGS_STORAGE_PATH = "storage/recordings"
     EXPORTS_STORAGE_PATH = "storage/exports"
     MAX_EXPORT_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
     SUPPORTED_FORMATS = ["mp4", "avi", "mov", "webm"]
     DEFAULT_RETENTION_DAYS = 90
-    
-    def __init__(self):
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        transcode_workers: int = EXPORT_TRANSCODE_WORKERS,
+        copy_workers: int = EXPORT_COPY_WORKERS,
+        progress_interval: float = EXPORT_PROGRESS_INTERVAL_SECONDS,
+    ):
         self._ensure_directories()
-        self._export_queue: List[Dict[str, Any]] = []
-    
+        self.session_factory = session_factory
+        self.workers = {"transcode": max(1, transcode_workers), "copy": max(1, copy_workers)}
+        self.progress_interval = progress_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._queues: Dict[str, "queue.Queue[Optional[str]]"] = {mode: queue.Queue() for mode in self.workers}
+        self._queued: set = set()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, subprocess.Popen] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
     def _ensure_directories(self):
         """Create storage directories if they don't exist."""
         os.makedirs(self.RECORDINGS_STORAGE_PATH, exist_ok=True)
         os.makedirs(self.EXPORTS_STORAGE_PATH, exist_ok=True)
-    
+
+    @staticmethod
+    def _to_dict(job: RecordingExportJob) -> Dict[str, Any]:
+        return {
+            "export_id": job.export_id,
+            "batch_id": job.batch_id,
+            "recording_id": job.recording_id,
+            "format": job.format,
+            "quality": job.quality,
+            "mode": job.mode,
+            "status": job.status,
+            "progress": round(job.progress or 0.0, 1),
+            "attempts": job.attempts,
+            "user_id": job.user_id,
+            "file_path": job.file_path,
+            "file_size": job.file_size or 0,
+            "error_message": job.error_message,
+            "created_at": _aware(job.created_at).isoformat() if job.created_at else None,
+            "started_at": _aware(job.started_at).isoformat() if job.started_at else None,
+            "completed_at": _aware(job.completed_at).isoformat() if job.completed_at else None,
+        }
+
+    def _find_source(self, recording_id: str) -> Optional[str]:
+        """A stored recording file named after the recording id, if any."""
+        directory = Path(self.RECORDINGS_STORAGE_PATH)
+        if not directory.is_dir():
+            return None
+        for candidate in sorted(directory.glob(f"{recording_id}.*")):
+            if candidate.is_file():
+                return str(candidate)
+        return None
+
+    def _validate(self, format: str, quality: str) -> None:
+        if format not in self.SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported format: {format}")
+        if quality not in QUALITY_PROFILES:
+            raise ValueError(f"Unsupported quality: {quality} (use {', '.join(QUALITY_PROFILES)})")
+
+    def _new_job(
+        self, recording_id: str, format: str, quality: str, user_id: Optional[str],
+        source: Optional[str], batch_id: Optional[str] = None
+    ) -> RecordingExportJob:
+        source = source or self._find_source(recording_id)
+        job = RecordingExportJob(
+            export_id=str(uuid.uuid4()),
+            batch_id=batch_id,
+            recording_id=recording_id,
+            user_id=user_id,
+            source=source,
+            format=format,
+            quality=quality,
+            mode=export_mode(source, format, quality),
+            status="pending",
+            progress=0.0,
+            attempts=0,
+            created_at=_now(),
+        )
+        if source is None:
+            job.status = "failed"
+            job.error_message = "Recording source not found"
+            job.completed_at = job.created_at
+        return job
+
+    def _enqueue(self, jobs: List[RecordingExportJob]) -> None:
+        with self._lock:
+            for job in jobs:
+                if job.status == "pending" and job.export_id not in self._queued:
+                    self._queued.add(job.export_id)
+                    self._queues[job.mode].put(job.export_id)
+
     async def export_recording(
         self,
         recording_id: str,
         format: str = "mp4",
         quality: str = "high",
-        user_id: str = None
+        user_id: str = None,
+        source: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Export a single recording with format conversion."""
-        if format not in self.SUPPORTED_FORMATS:
-            raise ValueError(f"Unsupported format: {format}")
-        
-        export_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc)
-        
-        export_job = {
-            "export_id": export_id,
-            "recording_id": recording_id,
-            "format": format,
-            "quality": quality,
-            "status": "pending",
-            "created_at": timestamp.isoformat(),
-            "user_id": user_id,
-            "progress": 0,
-            "file_path": None,
-            "file_size": 0,
-            "error_message": None
-        }
-        
+        """Queue a single recording export; returns the job (status "pending") at once."""
+        self._validate(format, quality)
+        db = self.session_factory()
         try:
-            # Simulate processing (in production, would use ffmpeg)
-            export_job["status"] = "processing"
-            self._export_queue.append(export_job)
-            
-            # Mock export processing
-            await asyncio.sleep(0.1)  # Simulate processing time
-            
-            # Generate export file path
-            export_filename = f"{recording_id}_{export_id}.{format}"
-            export_path = os.path.join(self.EXPORTS_STORAGE_PATH, export_filename)
-            
-            # Simulate file creation (mock data)
-            mock_content = f"Mock exported recording data for {recording_id}".encode()
-            with open(export_path, "wb") as f:
-                f.write(mock_content)
-            
-            export_job.update({
-                "status": "completed",
-                "progress": 100,
-                "file_path": export_path,
-                "file_size": len(mock_content),
-                "completed_at": datetime.now(timezone.utc).isoformat()
-            })
-            
-            logger.info(f"Recording exported: {recording_id} -> {export_id}")
-            return export_job
-            
-        except Exception as e:
-            export_job.update({
-                "status": "failed",
-                "error_message": str(e),
-                "failed_at": datetime.now(timezone.utc).isoformat()
-            })
-            logger.error(f"Recording export failed: {e}")
-            raise
-    
+            job = self._new_job(recording_id, format, quality, user_id, source)
+            db.add(job)
+            db.commit()
+            result = self._to_dict(job)
+            self._enqueue([job])
+        finally:
+            db.close()
+        logger.info(f"Recording export queued: {recording_id} -> {result['export_id']} ({result['mode']})")
+        return result
+
     async def export_recordings_batch(
         self,
         recording_ids: List[str],
         format: str = "mp4",
         quality: str = "high",
-        user_id: str = None
+        user_id: str = None,
+        sources: Optional[Dict[str, Optional[str]]] = None
     ) -> Dict[str, Any]:
-        """Export multiple recordings as a batch."""
+        """Queue one export per recording under a shared batch id; returns at once."""
+        self._validate(format, quality)
         batch_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc)
-        
-        batch_job = {
-            "batch_id": batch_id,
-            "recording_ids": recording_ids,
-            "format": format,
-            "quality": quality,
-            "status": "pending",
-            "created_at": timestamp.isoformat(),
-            "user_id": user_id,
-            "total_count": len(recording_ids),
-            "completed_count": 0,
-            "failed_count": 0,
-            "exports": [],
-            "archive_path": None
-        }
-        
+        sources = sources or {}
+        db = self.session_factory()
+        try:
+            jobs = [
+                self._new_job(recording_id, format, quality, user_id, sources.get(recording_id), batch_id)
+                for recording_id in recording_ids
+            ]
+            db.add_all(jobs)
+            db.commit()
+            self._enqueue(jobs)
+        finally:
+            db.close()
+        logger.info(f"Batch export queued: {batch_id} ({len(recording_ids)} recordings)")
+        return self.get_batch_status(batch_id)
+
+    # --- workers ----------------------------------------------------------
+
+    def _transition(self, export_id: str, from_statuses: tuple, **values) -> bool:
+        """UPDATE the job only if it is still in one of from_statuses; True if it was."""
+        db = self.session_factory()
         try:
-            batch_job["status"] = "processing"
-            
-            # Process each recording
-            for recording_id in recording_ids:
+            result = db.execute(
+                update(RecordingExportJob)
+                .where(RecordingExportJob.export_id == export_id, RecordingExportJob.status.in_(from_statuses))
+                .values(**values)
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    def _claim(self, export_id: str) -> Optional[Dict[str, Any]]:
+        now = _now()
+        db = self.session_factory()
+        try:
+            job = db.get(RecordingExportJob, export_id)
+            if job is None or job.status != "pending":
+                return None
+            claimed = db.execute(
+                update(RecordingExportJob)
+                .where(RecordingExportJob.export_id == export_id, RecordingExportJob.status == "pending")
+                .values(status="processing", started_at=now, heartbeat_at=now, progress=0.0,
+                        attempts=RecordingExportJob.attempts + 1, worker_id=self.worker_id)
+            ).rowcount == 1
+            db.commit()
+            if not claimed:
+                return None
+            db.refresh(job)
+            return self._to_dict(job) | {"source": job.source}
+        finally:
+            db.close()
+
+    def _probe_duration(self, source: str) -> Optional[float]:
+        ffprobe = shutil.which("ffprobe")
+        if ffprobe is None:
+            return None
+        try:
+            result = subprocess.run(
+                [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", source],
+                capture_output=True, text=True, timeout=FFPROBE_TIMEOUT_SECONDS, check=False,
+            )
+            return float(result.stdout.strip()) or None
+        except (subprocess.TimeoutExpired, ValueError, OSError):
+            return None
+
+    def _output_path(self, job: Dict[str, Any]) -> str:
+        return os.path.join(self.EXPORTS_STORAGE_PATH, f"{job['recording_id']}_{job['export_id']}.{job['format']}")
+
+    def _run(self, export_id: str) -> None:
+        job = self._claim(export_id)
+        if job is None:
+            return  # cancelled, or taken by another process
+        dest = self._output_path(job)
+        partial = f"{dest}.part"
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            self._fail(job, "FFmpeg is not installed")
+            return
+        duration = self._probe_duration(job["source"])
+        cmd = build_ffmpeg_command(ffmpeg, job["source"], partial, job["format"], job["quality"], job["mode"])
+        cancelled = False
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+            except OSError as e:
+                self._fail(job, f"Failed to start ffmpeg: {e}")
+                return
+            with self._lock:
+                self._running[export_id] = proc
+            try:
+                progress, last_write = 0.0, time.monotonic()
+                for line in proc.stdout:
+                    value = parse_progress(line, duration)
+                    if value is not None:
+                        progress = value
+                    if time.monotonic() - last_write >= self.progress_interval:
+                        last_write = time.monotonic()
+                        # Also the heartbeat; fails once the job was cancelled (here or elsewhere)
+                        if not self._transition(export_id, ("processing",), progress=min(progress, 99.0), heartbeat_at=_now()):
+                            cancelled = True
+                            proc.terminate()
+                            break
+                returncode = proc.wait()
+            finally:
+                with self._lock:
+                    self._running.pop(export_id, None)
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+            stderr.seek(0)
+            error = _ffmpeg_error(stderr.read().decode(errors="replace"), returncode)
+
+        if cancelled or returncode != 0:
+            if os.path.exists(partial):
+                os.remove(partial)
+            # On shutdown the job was already put back to pending for the next start
+            if not self._stopping.is_set():
+                self._fail(job, error)
+            return
+
+        file_size = os.path.getsize(partial)
+        if file_size > self.MAX_EXPORT_SIZE:
+            os.remove(partial)
+            self._fail(job, f"Export exceeds {self.MAX_EXPORT_SIZE} bytes")
+            return
+        os.replace(partial, dest)
+        if self._transition(export_id, ("processing",), status="completed", progress=100.0, file_path=dest,
+                            file_size=file_size, completed_at=_now(), heartbeat_at=_now()):
+            logger.info(f"Recording exported: {job['recording_id']} -> {export_id} ({file_size} bytes)")
+        else:
+            # Cancelled after ffmpeg finished
+            os.remove(dest)
+
+    def _fail(self, job: Dict[str, Any], error: str) -> None:
+        if self._transition(job["export_id"], ("processing",), status="failed", error_message=error, completed_at=_now()):
+            logger.error(f"Recording export failed: {job['export_id']} ({job['recording_id']}): {error}")
+        else:
+            # ffmpeg was terminated because the job had been cancelled
+            logger.info(f"Recording export cancelled: {job['export_id']}")
+
+    def _worker(self, mode: str) -> None:
+        jobs = self._queues[mode]
+        while not self._stopping.is_set():
+            try:
+                export_id = jobs.get(timeout=EXPORT_RECOVERY_INTERVAL_SECONDS)
+            except queue.Empty:
+                # Idle: adopt jobs left behind by dead workers (any process)
                 try:
-                    export_result = await self.export_recording(
-                        recording_id, format, quality, user_id
-                    )
-                    batch_job["exports"].append(export_result)
-                    batch_job["completed_count"] += 1
+                    self.recover()
                 except Exception as e:
-                    batch_job["failed_count"] += 1
-                    batch_job["exports"].append({
-                        "recording_id": recording_id,
-                        "status": "failed",
-                        "error_message": str(e)
-                    })
-            
-            # Create archive if successful exports
-            if batch_job["completed_count"] > 0:
-                archive_path = await self._create_batch_archive(batch_job)
-                batch_job["archive_path"] = archive_path
-            
-            batch_job.update({
-                "status": "completed",
-                "completed_at": datetime.now(timezone.utc).isoformat()
-            })
-            
-            logger.info(f"Batch export completed: {batch_id} ({batch_job['completed_count']}/{batch_job['total_count']})")
-            return batch_job
-            
+                    logger.error(f"Export recovery failed: {e}")
+                continue
+            if export_id is None:
+                return
+            with self._lock:
+                self._queued.discard(export_id)
+            try:
+                self._run(export_id)
+            except Exception as e:
+                logger.exception(f"Export worker error for {export_id}: {e}")
+
+    def recover(self) -> int:
+        """Requeue interrupted and pending jobs; returns how many interrupted jobs were reset."""
+        now = _now()
+        stale_before = now - timedelta(seconds=EXPORT_STALE_SECONDS)
+        host = socket.gethostname()
+        reset = 0
+        db = self.session_factory()
+        try:
+            for job in db.query(RecordingExportJob).filter(RecordingExportJob.status == "processing").all():
+                if job.worker_id == self.worker_id:
+                    continue
+                owner_host, _, owner_pid = (job.worker_id or "").rpartition(":")
+                dead = owner_host == host and owner_pid.isdigit() and not _pid_alive(int(owner_pid))
+                heartbeat = _aware(job.heartbeat_at)
+                if not dead and heartbeat is not None and heartbeat >= stale_before:
+                    continue
+                partial = f"{self._output_path(self._to_dict(job))}.part"
+                if os.path.exists(partial):
+                    os.remove(partial)
+                if job.attempts >= EXPORT_MAX_ATTEMPTS:
+                    job.status = "failed"
+                    job.error_message = f"Interrupted {job.attempts} times"
+                    job.completed_at = now
+                else:
+                    job.status = "pending"
+                    job.progress = 0.0
+                reset += 1
+            db.commit()
+            pending = (
+                db.query(RecordingExportJob)
+                .filter(RecordingExportJob.status == "pending")
+                .order_by(RecordingExportJob.created_at)
+                .all()
+            )
+            self._enqueue(pending)
+        finally:
+            db.close()
+        if reset:
+            logger.warning(f"Recovered {reset} interrupted recording exports")
+        return reset
+
+    def start(self) -> None:
+        """Recover interrupted jobs and start the worker threads."""
+        if self._threads:
+            return
+        self._stopping.clear()
+        try:
+            self.recover()
         except Exception as e:
-            batch_job.update({
-                "status": "failed",
-                "error_message": str(e),
-                "failed_at": datetime.now(timezone.utc).isoformat()
-            })
-            logger.error(f"Batch export failed: {e}")
-            raise
-    
-    async def _create_batch_archive(self, batch_job: Dict[str, Any]) -> str:
-        """Create ZIP archive of batch export."""
-        # In production, would create actual ZIP file
-        archive_filename = f"batch_{batch_job['batch_id']}.zip"
-        archive_path = os.path.join(self.EXPORTS_STORAGE_PATH, archive_filename)
-        
-        # Mock archive creation
-        mock_content = f"Mock batch archive for {batch_job['batch_id']}".encode()
-        with open(archive_path, "wb") as f:
-            f.write(mock_content)
-        
-        return archive_path
-    
+            logger.error(f"Export recovery failed: {e}")
+        for mode, count in self.workers.items():
+            for i in range(count):
+                thread = threading.Thread(target=self._worker, args=(mode,), name=f"export-{mode}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the workers; running exports go back to pending for the next start."""
+        self._stopping.set()
+        with self._lock:
+            running = dict(self._running)
+        for export_id, proc in running.items():
+            self._transition(export_id, ("processing",), status="pending", progress=0.0)
+            proc.terminate()
+        for mode, count in self.workers.items():
+            for _ in range(count):
+                self._queues[mode].put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._lock:
+            self._queued.clear()
+        self._queues = {mode: queue.Queue() for mode in self.workers}
+
+    # --- cancellation -----------------------------------------------------
+
+    def cancel_export(self, export_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a pending or running export; None if unknown, ValueError if already final."""
+        if not self._transition(export_id, ACTIVE_STATUSES, status="cancelled", completed_at=_now()):
+            job = self.get_export_status(export_id)
+            if job is None:
+                return None
+            raise ValueError(f"Export already {job['status']}")
+        with self._lock:
+            proc = self._running.get(export_id)
+        if proc is not None:
+            proc.terminate()
+        return self.get_export_status(export_id)
+
+    def cancel_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self.get_batch_status(batch_id)
+        if batch is None:
+            return None
+        for job in batch["exports"]:
+            if job["status"] in ACTIVE_STATUSES:
+                try:
+                    self.cancel_export(job["export_id"])
+                except ValueError:
+                    pass  # finished meanwhile
+        return self.get_batch_status(batch_id)
+
+    # --- batches ----------------------------------------------------------
+
+    async def batch_archive_entries(
+        self, batch_id: str, poll_seconds: float = BATCH_STREAM_POLL_SECONDS,
+        max_wait_seconds: float = BATCH_STREAM_MAX_WAIT_SECONDS
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        (archive name, file path) of each completed export of a batch, in completion order,
+        waiting for exports still pending or running. Gives up on them once no export has
+        finished for ``max_wait_seconds``.
+        """
+        loop = asyncio.get_running_loop()
+        done: set = set()
+        names: set = set()
+        deadline = loop.time() + max_wait_seconds
+        while True:
+            batch = await asyncio.to_thread(self.get_batch_status, batch_id)
+            if batch is None:
+                return
+            for job in batch["exports"]:
+                if job["export_id"] in done or job["status"] in ACTIVE_STATUSES:
+                    continue
+                done.add(job["export_id"])
+                deadline = loop.time() + max_wait_seconds
+                if job["status"] != "completed" or not job["file_path"] or not os.path.exists(job["file_path"]):
+                    continue
+                name = f"recording_{job['recording_id']}.{job['format']}"
+                if name in names:
+                    name = f"recording_{job['recording_id']}_{job['export_id'][:8]}.{job['format']}"
+                names.add(name)
+                yield name, job["file_path"]
+            if len(done) == len(batch["exports"]):
+                return
+            if loop.time() >= deadline:
+                logger.warning(f"Batch {batch_id} download closed with {len(batch['exports']) - len(done)} exports unfinished")
+                return
+            await asyncio.sleep(poll_seconds)
+
+    def stream_batch_archive(self, batch_id: str, compression: str = "stored") -> AsyncIterator[bytes]:
+        """ZIP of the batch's exports, produced chunk by chunk (for a StreamingResponse)."""
+        return self._archive_chunks(batch_id, ZipStreamWriter(compression))
+
+    async def _archive_chunks(self, batch_id: str, writer: ZipStreamWriter) -> AsyncIterator[bytes]:
+        # Waiting happens on the event loop; only file reads and DB queries use worker threads
+        async for name, path in self.batch_archive_entries(batch_id):
+            chunks = writer.add(name, path)
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        data = writer.close()
+        if data:
+            yield data
+
+    def get_batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            jobs = (
+                db.query(RecordingExportJob)
+                .filter(RecordingExportJob.batch_id == batch_id)
+                .order_by(RecordingExportJob.created_at, RecordingExportJob.export_id)
+                .all()
+            )
+            exports = [self._to_dict(job) for job in jobs]
+        finally:
+            db.close()
+        if not exports:
+            return None
+        counts = {status: sum(job["status"] == status for job in exports) for status in ACTIVE_STATUSES + FINAL_STATUSES}
+        if counts["processing"] or (counts["pending"] and len(exports) > counts["pending"]):
+            status = "processing"
+        elif counts["pending"]:
+            status = "pending"
+        elif counts["completed"]:
+            status = "completed"
+        elif counts["failed"]:
+            status = "failed"
+        else:
+            status = "cancelled"
+        return {
+            "batch_id": batch_id,
+            "format": exports[0]["format"],
+            "quality": exports[0]["quality"],
+            "status": status,
+            "created_at": exports[0]["created_at"],
+            "user_id": exports[0]["user_id"],
+            "total_count": len(exports),
+            "completed_count": counts["completed"],
+            "failed_count": counts["failed"],
+            "cancelled_count": counts["cancelled"],
+            "progress": round(sum(job["progress"] for job in exports) / len(exports), 1),
+            "exports": exports,
+        }
+
+    # --- queries and housekeeping -------------------------------------------
+
     def get_export_status(self, export_id: str) -> Optional[Dict[str, Any]]:
         """Get status of an export job."""
-        for export_job in self._export_queue:
-            if export_job["export_id"] == export_id:
-                return export_job
-        return None
-    
+        db = self.session_factory()
+        try:
+            job = db.get(RecordingExportJob, export_id)
+            return self._to_dict(job) if job is not None else None
+        finally:
+            db.close()
+
     def list_user_exports(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """List export jobs for a specific user."""
-        user_exports = [
-            job for job in self._export_queue 
-            if job.get("user_id") == user_id
-        ]
-        return sorted(user_exports, key=lambda x: x["created_at"], reverse=True)[:limit]
-    
+        db = self.session_factory()
+        try:
+            jobs = (
+                db.query(RecordingExportJob)
+                .filter(RecordingExportJob.user_id == user_id)
+                .order_by(RecordingExportJob.created_at.desc())
+                .limit(limit)
+                .all()
+            )
+            return [self._to_dict(job) for job in jobs]
+        finally:
+            db.close()
+
     def cleanup_old_exports(self, days_old: int = 7) -> int:
-        """Clean up export files older than specified days."""
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_old)
+        """Clean up finished export jobs (and their files) older than specified days."""
+        cutoff_date = _now() - timedelta(days=days_old)
         cleaned_count = 0
-        
+        db = self.session_factory()
         try:
-            for export_job in self._export_queue[:]:
-                created_at = datetime.fromisoformat(export_job["created_at"].replace('Z', '+00:00'))
-                
-                if created_at < cutoff_date:
-                    # Remove export file
-                    if export_job.get("file_path") and os.path.exists(export_job["file_path"]):
-                        os.remove(export_job["file_path"])
-                    
-                    # Remove from queue
-                    self._export_queue.remove(export_job)
-                    cleaned_count += 1
-            
+            old_jobs = (
+                db.query(RecordingExportJob)
+                .filter(RecordingExportJob.created_at < cutoff_date, RecordingExportJob.status.in_(FINAL_STATUSES))
+                .all()
+            )
+            for job in old_jobs:
+                if job.file_path and os.path.exists(job.file_path):
+                    os.remove(job.file_path)
+                db.delete(job)
+                cleaned_count += 1
+            db.commit()
+
             logger.info(f"Cleaned up {cleaned_count} old export files")
             return cleaned_count
-            
+
         except Exception as e:
+            db.rollback()
             logger.error(f"Export cleanup failed: {e}")
             return 0
-    
+        finally:
+            db.close()
+
     def apply_retention_policy(self, retention_days: int = None) -> Dict[str, int]:
         """Apply retention policy to recordings."""
         days = retention_days or self.DEFAULT_RETENTION_DAYS
         cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
-        
+
         # Mock retention policy application
         result = {
             "scanned_count": 100,  # Mock
@@ -223,9 +703,9 @@ class RecordingExportService:
             "archived_count": 5,   # Mock
             "retention_days": days
         }
-        
+
         logger.info(f"Retention policy applied: {result}")
         return result
 
 # Global service instance
-recording_export_service = RecordingExportService()
\ No newline at end of file
+recording_export_service = RecordingExportService()
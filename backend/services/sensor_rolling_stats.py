@@ -0,0 +1,281 @@
+"""
+Sensor Rolling Statistics
+Per-sensor streaming statistics for IoT threshold alerting.
+
+State for every sensor lives in preallocated NumPy arrays indexed by a slot number:
+  - EWMA of the value
+  - Welford running mean / variance
+  - rolling min / max over the last WINDOW_SIZE readings (ring buffer)
+  - rate of change since the previous reading
+
+A whole batch of readings is scored in one vectorized pass: readings are grouped per
+sensor in timestamp order and each reading is compared with the state its sensor had
+just before it (stored state merged with the earlier readings of the batch).
+Statistics are per-process and warm up from live traffic.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+import logging
+import os
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = int(os.getenv("IOT_STATS_WINDOW_SIZE", "120"))
+EWMA_ALPHA = float(os.getenv("IOT_STATS_EWMA_ALPHA", "0.1"))
+# Readings needed before a sensor's statistics are trusted for alerting
+MIN_SAMPLES = int(os.getenv("IOT_STATS_MIN_SAMPLES", "30"))
+Z_SCORE_THRESHOLD = float(os.getenv("IOT_STATS_Z_THRESHOLD", "4.0"))
+# A step between consecutive readings larger than this many standard deviations
+RAPID_CHANGE_SIGMA = float(os.getenv("IOT_STATS_RAPID_CHANGE_SIGMA", "6.0"))
+INITIAL_CAPACITY = 1024
+
+
+class SensorStatsEngine:
+    """Streaming per-sensor statistics kept in preallocated NumPy ring buffers."""
+
+    def __init__(
+        self,
+        window_size: int = WINDOW_SIZE,
+        alpha: float = EWMA_ALPHA,
+        min_samples: int = MIN_SAMPLES,
+        z_threshold: float = Z_SCORE_THRESHOLD,
+        rapid_change_sigma: float = RAPID_CHANGE_SIGMA,
+        capacity: int = INITIAL_CAPACITY,
+    ):
+        self.window_size = max(1, window_size)
+        self.alpha = alpha
+        self.min_samples = max(2, min_samples)
+        self.z_threshold = z_threshold
+        self.rapid_change_sigma = rapid_change_sigma
+        self._lock = threading.Lock()
+        self._slots: Dict[Any, int] = {}
+        self._allocate(max(1, capacity))
+
+    def _allocate(self, capacity: int) -> None:
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros(capacity)
+        self.m2 = np.zeros(capacity)
+        self.ewma = np.zeros(capacity)
+        self.last_value = np.full(capacity, np.nan)
+        self.last_ts = np.full(capacity, np.nan)
+        self.window = np.full((capacity, self.window_size), np.nan)
+        self.head = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        new_capacity = capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        old = (self.count, self.mean, self.m2, self.ewma, self.last_value, self.last_ts, self.window, self.head)
+        self._allocate(new_capacity)
+        for target, source in zip(
+            (self.count, self.mean, self.m2, self.ewma, self.last_value, self.last_ts, self.window, self.head), old
+        ):
+            target[:capacity] = source
+
+    def _slots_for(self, keys: Sequence[Any]) -> np.ndarray:
+        slots = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = len(self._slots)
+                self._slots[key] = slot
+            slots[i] = slot
+        self._grow(len(self._slots))
+        return slots
+
+    # --- scoring ----------------------------------------------------------
+
+    def score(self, keys: Sequence[Any], values: Sequence[float], timestamps: Sequence[float]) -> Dict[str, np.ndarray]:
+        """Score readings against each sensor's state, then fold them into it.
+
+        ``timestamps`` are epoch seconds. Every output array is aligned with the input;
+        statistics describe the sensor just *before* each reading was applied (earlier
+        readings of the same sensor in the batch included).
+        """
+        values = np.asarray(values, dtype=float)
+        timestamps = np.asarray(timestamps, dtype=float)
+        size = len(values)
+        result = {
+            name: np.full(size, np.nan)
+            for name in ("mean", "std", "ewma", "z_score", "previous_value", "rate_of_change", "rolling_min", "rolling_max")
+        }
+        result["count"] = np.zeros(size, dtype=np.int64)
+        if size == 0:
+            return result
+
+        with self._lock:
+            slots = self._slots_for(keys)
+            # Sort by sensor then timestamp; each sensor becomes one contiguous group
+            order = np.lexsort((timestamps, slots))
+            sorted_slots = slots[order]
+            v = values[order]
+            t = timestamps[order]
+            starts = np.flatnonzero(np.r_[True, sorted_slots[1:] != sorted_slots[:-1]])
+            lengths = np.diff(np.r_[starts, size])
+            groups = sorted_slots[starts]
+            g = np.repeat(np.arange(len(groups)), lengths)
+            rank = np.arange(size) - starts[g]
+
+            count0 = self.count[groups]
+            mean0 = self.mean[groups]
+            m2_0 = self.m2[groups]
+            last_value0 = self.last_value[groups]
+            last_ts0 = self.last_ts[groups]
+
+            # Welford state merged with the batch prefix before each reading (parallel update)
+            d = v - mean0[g]
+            prefix = self._grouped_exclusive_cumsum(d, starts, g)
+            prefix_sq = self._grouped_exclusive_cumsum(d * d, starts, g)
+            n = count0[g] + rank
+            mean = mean0[g] + np.divide(prefix, n, out=np.zeros(size), where=n > 0)
+            m2 = m2_0[g] + prefix_sq - np.divide(prefix * prefix, n, out=np.zeros(size), where=n > 0)
+            std = np.sqrt(np.divide(np.maximum(m2, 0.0), n - 1, out=np.zeros(size), where=n > 1))
+
+            # Previous reading: earlier in the batch unless the stored one is newer
+            previous_value = np.r_[np.nan, v[:-1]]
+            previous_ts = np.r_[np.nan, t[:-1]]
+            use_state = (rank == 0) | (previous_ts < last_ts0[g])
+            previous_value = np.where(use_state, last_value0[g], previous_value)
+            previous_ts = np.where(use_state, last_ts0[g], previous_ts)
+            elapsed = t - previous_ts
+
+            # Rolling window: lay out [ring (oldest first), batch values] per sensor and slide over it
+            width = self.window_size
+            ring_index = (self.head[groups][:, None] + np.arange(width)) % width
+            blocks = starts + np.arange(len(groups)) * width
+            flat = np.empty(size + len(groups) * width)
+            flat[blocks[:, None] + np.arange(width)] = self.window[groups[:, None], ring_index]
+            flat[blocks[g] + width + rank] = v
+            windows = sliding_window_view(flat, width)[blocks[g] + rank]
+
+            ewma = self._batch_ewma(v, g, rank, np.where(count0 > 0, self.ewma[groups], v[starts]))
+
+            scored = {
+                "count": n,
+                "mean": np.where(n > 0, mean, np.nan),
+                "std": np.where(n > 1, std, np.nan),
+                "ewma": np.where(n > 0, ewma[0], np.nan),
+                "z_score": np.divide(v - mean, std, out=np.zeros(size), where=std > 0),
+                "previous_value": previous_value,
+                "rate_of_change": np.divide(v - previous_value, elapsed, out=np.full(size, np.nan), where=elapsed > 0),
+                # fmin/fmax skip the NaN padding of windows that are not full yet
+                "rolling_min": np.fmin.reduce(windows, axis=1),
+                "rolling_max": np.fmax.reduce(windows, axis=1),
+            }
+            for name, column in scored.items():
+                result[name][order] = column
+
+            # Fold the batch into the stored state
+            last = starts + lengths - 1
+            total = count0 + lengths
+            shift = prefix[last] + d[last]
+            self.count[groups] = total
+            self.mean[groups] = mean0 + shift / total
+            self.m2[groups] = m2_0 + prefix_sq[last] + d[last] * d[last] - shift * shift / total
+            self.ewma[groups] = ewma[1]
+            self.window[groups] = flat[(blocks + lengths)[:, None] + np.arange(width)]
+            self.head[groups] = 0
+            newer = ~(t[last] < last_ts0)
+            self.last_value[groups] = np.where(newer, v[last], last_value0)
+            self.last_ts[groups] = np.where(newer, t[last], last_ts0)
+        return result
+
+    @staticmethod
+    def _grouped_exclusive_cumsum(x: np.ndarray, starts: np.ndarray, group: np.ndarray) -> np.ndarray:
+        """Running sum of the earlier elements of each contiguous group."""
+        exclusive = np.cumsum(x) - x
+        return exclusive - exclusive[starts][group]
+
+    def _batch_ewma(self, v: np.ndarray, group: np.ndarray, rank: np.ndarray, initial: np.ndarray):
+        """EWMA before each reading and the final EWMA per group, in closed form.
+
+        With b = 1 - alpha the EWMA after r readings is
+        b^r * e0 + alpha * b^(r-1) * sum(b^-k * v_k). Ranks are taken in blocks small
+        enough that b^-k cannot overflow.
+        """
+        beta = 1.0 - self.alpha
+        block_size = max(1, int(600 / -np.log(beta))) if 0 < beta < 1 else len(v)
+        before = np.empty(len(v))
+        current = initial.astype(float)
+        for offset in range(0, int(rank.max()) + 1, block_size):
+            index = np.flatnonzero((rank >= offset) & (rank < offset + block_size))
+            local = rank[index] - offset
+            owner = group[index]
+            scaled = np.power(beta, -local) * v[index] if beta > 0 else np.where(local == 0, v[index], 0.0)
+            local_starts = np.flatnonzero(local == 0)
+            prefix = self._grouped_exclusive_cumsum(scaled, local_starts, np.cumsum(local == 0) - 1)
+            decay = np.power(beta, local)
+            before[index] = decay * current[owner] + np.where(
+                local > 0, self.alpha * np.power(beta, np.maximum(local - 1, 0)) * prefix, 0.0
+            )
+            ends = np.r_[local_starts[1:], len(index)] - 1
+            steps = local[ends] + 1
+            current[owner[ends]] = (
+                np.power(beta, steps) * current[owner[ends]]
+                + self.alpha * np.power(beta, steps - 1) * (prefix[ends] + scaled[ends])
+            )
+        return before, current
+
+    def detect(self, keys: Sequence[Any], values: Sequence[float], timestamps: Sequence[float]) -> List[Dict[str, Any]]:
+        """Score a batch and return the readings that look anomalous.
+
+        Each anomaly carries ``index`` (position in the input) so callers can map it back.
+        """
+        scores = self.score(keys, values, timestamps)
+        values = np.asarray(values, dtype=float)
+        trusted = scores["count"] >= self.min_samples
+        outlier = trusted & (np.abs(scores["z_score"]) > self.z_threshold)
+        jump = np.abs(values - scores["previous_value"])
+        rapid = trusted & ~outlier & (jump > self.rapid_change_sigma * scores["std"])
+
+        anomalies = []
+        for i in np.flatnonzero(outlier | rapid):
+            anomalies.append({
+                "index": int(i),
+                "key": keys[i],
+                "anomaly_type": "statistical_outlier" if outlier[i] else "rapid_change",
+                "value": float(values[i]),
+                "z_score": round(float(scores["z_score"][i]), 2),
+                "mean": round(float(scores["mean"][i]), 4),
+                "std": round(float(scores["std"][i]), 4),
+                "ewma": round(float(scores["ewma"][i]), 4),
+                "rate_of_change": None if np.isnan(scores["rate_of_change"][i]) else round(float(scores["rate_of_change"][i]), 4),
+                "rolling_min": float(scores["rolling_min"][i]),
+                "rolling_max": float(scores["rolling_max"][i]),
+            })
+        return anomalies
+
+    def snapshot(self, key: Any) -> Optional[Dict[str, Any]]:
+        """Current statistics for one sensor, or None if it has not reported yet."""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None or self.count[slot] == 0:
+                return None
+            count = int(self.count[slot])
+            window = self.window[slot]
+            window = window[~np.isnan(window)]
+            return {
+                "count": count,
+                "mean": float(self.mean[slot]),
+                "std": float(np.sqrt(self.m2[slot] / (count - 1))) if count > 1 else 0.0,
+                "ewma": float(self.ewma[slot]),
+                "rolling_min": float(window.min()),
+                "rolling_max": float(window.max()),
+                "last_value": float(self.last_value[slot]),
+            }
+
+
+_engine: Optional[SensorStatsEngine] = None
+
+
+def get_sensor_stats_engine() -> SensorStatsEngine:
+    global _engine
+    if _engine is None:
+        _engine = SensorStatsEngine()
+    return _engine
@@ -14,6 +14,7 @@ from schemas import (
 )
 from services.auth_service import AuthService
 from services.event_log_service import EventLogService
+from services.patrol_assignment_service import get_patrol_assignment_engine
 import logging
 import uuid
 import secrets
@@ -117,6 +118,8 @@ class SystemAdminService:
         self.db.add(user_role)
         self.db.commit()
         self.db.refresh(user_role)
+        # Officer roles and specializations feed cached shift assignment inputs
+        get_patrol_assignment_engine().invalidate(user_role.property_id)
         return user_role
 
     def revoke_role(self, role_id: str, revoker_id: str) -> bool:
@@ -126,6 +129,7 @@ class SystemAdminService:
         
         self.db.delete(role)
         self.db.commit()
+        get_patrol_assignment_engine().invalidate(role.property_id)
         return True
 
     # Property Management
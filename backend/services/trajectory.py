@@ -0,0 +1,221 @@
+"""
+Trajectory
+Simplification and compact encoding of agent GPS tracks for map replay.
+
+Fixes are projected to local metres (equirectangular around the track's mean latitude,
+accurate to well under a metre over a property-sized area), then:
+  - stationary clustering collapses runs of fixes that stay within a radius for at least
+    a minimum dwell time into one stop at their centroid, so an officer standing at a
+    post for an hour is one point instead of 720 jittering ones
+  - Douglas-Peucker (keep the point farthest from each chord while it deviates more than
+    the tolerance) or Visvalingam-Whyatt (repeatedly drop the point whose triangle with
+    its neighbours has the smallest area while that area is below tolerance^2) removes
+    points that do not change the drawn line by more than the tolerance
+  - the result can be shipped as an encoded polyline (Google's format) with delta-encoded
+    timestamps instead of one JSON object per point
+"""
+from typing import Dict, List, Sequence, Tuple
+import heapq
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+METHODS = ("douglas-peucker", "visvalingam")
+CLUSTER_SCAN_CHUNK = 64
+
+
+def project_meters(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """(n, 2) local x/y in metres for degrees lat/lng."""
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    if len(lat) == 0:
+        return np.empty((0, 2))
+    lat0 = np.radians(lat.mean())
+    x = np.radians(lng - lng[0]) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(lat - lat[0]) * EARTH_RADIUS_M
+    return np.column_stack([x, y])
+
+
+def _segment_distances(points: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Distance of every point to the segment start-end."""
+    direction = end - start
+    length_sq = float(direction @ direction)
+    if length_sq == 0.0:
+        return np.hypot(*(points - start).T)
+    t = np.clip(((points - start) @ direction) / length_sq, 0.0, 1.0)
+    closest = start + t[:, None] * direction
+    return np.hypot(*(points - closest).T)
+
+
+def douglas_peucker(xy: np.ndarray, tolerance: float, keep: np.ndarray = None) -> np.ndarray:
+    """Boolean mask of the points Douglas-Peucker keeps at ``tolerance`` (same units as xy).
+
+    ``keep`` marks points that must survive; they split the track into independent runs.
+    """
+    size = len(xy)
+    mask = np.zeros(size, dtype=bool) if keep is None else keep.copy()
+    if size <= 2:
+        mask[:] = True
+        return mask
+    mask[0] = mask[-1] = True
+    anchors = np.flatnonzero(mask)
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(xy[first + 1:last], xy[first], xy[last])
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            mask[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return mask
+
+
+def _triangle_areas(xy: np.ndarray, prev: np.ndarray, curr: np.ndarray, nxt: np.ndarray) -> np.ndarray:
+    a, b, c = xy[prev], xy[curr], xy[nxt]
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def visvalingam(xy: np.ndarray, tolerance: float, keep: np.ndarray = None) -> np.ndarray:
+    """Boolean mask of the points Visvalingam-Whyatt keeps with minimum area ``tolerance ** 2``."""
+    size = len(xy)
+    mask = np.ones(size, dtype=bool)
+    if size <= 2:
+        return mask
+    forced = np.zeros(size, dtype=bool) if keep is None else keep
+    threshold = tolerance ** 2
+    prev = np.arange(-1, size - 1)
+    nxt = np.arange(1, size + 1)
+    interior = np.arange(1, size - 1)
+    areas = np.full(size, np.inf)
+    areas[interior] = _triangle_areas(xy, interior - 1, interior, interior + 1)
+    heap = [(areas[i], i) for i in interior if not forced[i] and areas[i] < threshold]
+    heapq.heapify(heap)
+    # Neighbour updates touch one triangle at a time; plain floats beat tiny arrays there
+    points = xy.tolist()
+    while heap:
+        area, point = heapq.heappop(heap)
+        if not mask[point] or area != areas[point]:
+            continue
+        mask[point] = False
+        before, after = prev[point], nxt[point]
+        nxt[before] = after
+        prev[after] = before
+        for neighbour in (before, after):
+            if 0 < neighbour < size - 1 and not forced[neighbour]:
+                (ax, ay), (bx, by), (cx, cy) = points[prev[neighbour]], points[neighbour], points[nxt[neighbour]]
+                updated = 0.5 * abs((bx - ax) * (cy - ay) - (cx - ax) * (by - ay))
+                # Classic VW never lets a neighbour's area drop below the removed one
+                updated = max(updated, area)
+                areas[neighbour] = updated
+                if updated < threshold:
+                    heapq.heappush(heap, (updated, neighbour))
+    return mask
+
+
+def stationary_clusters(
+    xy: np.ndarray,
+    epoch_seconds: np.ndarray,
+    radius: float,
+    min_dwell_seconds: float
+) -> List[Tuple[int, int]]:
+    """(first, last) index ranges where the track stays within ``radius`` of the run's
+    first fix for at least ``min_dwell_seconds``."""
+    size = len(xy)
+    clusters = []
+    start = 0
+    while start < size:
+        # Extend the run chunk by chunk (vectorized) until a fix leaves the radius
+        end = start
+        while end < size - 1:
+            chunk = xy[end + 1:end + 1 + CLUSTER_SCAN_CHUNK]
+            outside = np.flatnonzero(np.hypot(*(chunk - xy[start]).T) > radius)
+            if len(outside):
+                end += int(outside[0])
+                break
+            end += len(chunk)
+        if end > start and epoch_seconds[end] - epoch_seconds[start] >= min_dwell_seconds:
+            clusters.append((start, end))
+            start = end + 1
+        else:
+            start += 1
+    return clusters
+
+
+def encode_polyline(lat: Sequence[float], lng: Sequence[float], precision: int = 5) -> str:
+    """Google encoded polyline of the coordinates."""
+    factor = 10 ** precision
+    coords = np.round(np.column_stack([lat, lng]) * factor).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zig-zag sign encoding, then 5-bit chunks with a continuation bit
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chunks = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    """Inverse of encode_polyline."""
+    values, value, shift = [], 0, 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1F) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return [tuple(pair) for pair in coords.tolist()]
+
+
+def simplify_track(
+    lat: np.ndarray,
+    lng: np.ndarray,
+    epoch_seconds: np.ndarray,
+    tolerance: float = 5.0,
+    method: str = "douglas-peucker",
+    stationary_radius: float = 15.0,
+    min_dwell_seconds: float = 60.0,
+) -> Dict[str, np.ndarray]:
+    """
+    Simplify a track sorted by time. Returns arrays lat, lng, epoch_seconds of the kept
+    points, dwell_seconds (0 for moving points) and source_index (index of the raw fix a
+    point starts at).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    epoch_seconds = np.asarray(epoch_seconds, dtype=float)
+    xy = project_meters(lat, lng)
+
+    # Collapse stops: one point per cluster at its centroid, stamped with its arrival time
+    clusters = stationary_clusters(xy, epoch_seconds, stationary_radius, min_dwell_seconds) if stationary_radius > 0 else []
+    collapsed = np.ones(len(lat), dtype=bool)
+    dwell = np.zeros(len(lat))
+    out_lat, out_lng = lat.copy(), lng.copy()
+    for first, last in clusters:
+        collapsed[first + 1:last + 1] = False
+        out_lat[first] = lat[first:last + 1].mean()
+        out_lng[first] = lng[first:last + 1].mean()
+        dwell[first] = epoch_seconds[last] - epoch_seconds[first]
+    index = np.flatnonzero(collapsed)
+    out_lat, out_lng, dwell = out_lat[index], out_lng[index], dwell[index]
+    stops = dwell > 0
+
+    simplify = douglas_peucker if method == "douglas-peucker" else visvalingam
+    keep = simplify(project_meters(out_lat, out_lng), tolerance, keep=stops)
+    return {
+        "lat": out_lat[keep],
+        "lng": out_lng[keep],
+        "epoch_seconds": epoch_seconds[index][keep],
+        "dwell_seconds": dwell[keep],
+        "source_index": index[keep],
+    }
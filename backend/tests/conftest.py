@@ -2,7 +2,8 @@ import pytest
 import asyncio
 from typing import AsyncGenerator, Generator
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from collections import Counter
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
@@ -55,6 +56,50 @@ def client(db_session) -> Generator:
         yield test_client
     app.dependency_overrides.clear()
 
+# Statements per returned row above which a call is treated as an N+1
+N_PLUS_ONE_MAX_STATEMENTS_PER_ROW = 0.5
+
+
+class QueryCounter:
+    """Records the SQL statements issued on the test engine."""
+
+    def __init__(self):
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def reset(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def assert_per_row(self, rows: int, max_per_row: float = N_PLUS_ONE_MAX_STATEMENTS_PER_ROW):
+        """Fail when the statements issued since the last reset exceed ``max_per_row`` per returned row."""
+        assert rows > 0, "N+1 check needs at least one returned row"
+        if self.count > max_per_row * rows:
+            repeated = "\n".join(
+                f"  {times}x {statement[:160]}"
+                for statement, times in Counter(self.statements).most_common(5)
+            )
+            pytest.fail(
+                f"{self.count} statements for {rows} rows (limit {max_per_row}/row); "
+                f"most repeated:\n{repeated}"
+            )
+
+
+@pytest.fixture
+def query_counter(db_session):
+    """Count statements on the test engine; call ``reset()`` before the code under test."""
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._record)
+
 @pytest.fixture
 def auth_service(db_session):
     """Create an auth service instance for testing."""
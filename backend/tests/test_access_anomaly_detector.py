@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+from services.access_anomaly_detector import (
+    AccessAnomalyDetector,
+    RingCounter,
+    USER_DENIAL_THRESHOLD,
+    AFTER_HOURS_THRESHOLD,
+)
+
+
+class TestRingCounter:
+    def test_window_slides(self):
+        counter = RingCounter(window_seconds=60, bucket_seconds=10)
+        for second in range(0, 60, 5):
+            counter.add(1000 + second)
+        assert counter.total(1059) == 12
+        # Buckets older than the window no longer count
+        assert counter.total(1090) == 4
+        assert counter.total(2000) == 0
+        assert len(counter.counts) == 6
+
+    def test_late_events_never_reset_newer_buckets(self):
+        counter = RingCounter(window_seconds=60, bucket_seconds=10)
+        now = 10_000
+        for offset in range(4):
+            counter.add(now + offset)
+        # Same ring slot as the current bucket, but long out of the window
+        assert counter.add(now - 3000) == 4
+        # Late but still inside the window: counted
+        assert counter.add(now - 30) == 5
+        assert counter.total(now) == 5
+
+
+class TestAccessAnomalyDetector:
+    def test_repeated_denials_with_cooldown(self):
+        detector = AccessAnomalyDetector()
+        start = datetime(2024, 1, 15, 12, 0, 0)
+        anomalies = []
+        for i in range(USER_DENIAL_THRESHOLD + 3):
+            anomalies += detector.observe(
+                "prop-1", f"door-{i}", user_id="user-1", card_id="card-9",
+                is_authorized=False, timestamp=start + timedelta(seconds=i)
+            )
+        kinds = {(a["type"], a["key_type"]) for a in anomalies}
+        assert ("repeated_denials", "user") in kinds
+        assert ("repeated_denials", "card") in kinds
+        # Only one alert per key while the cooldown is active
+        assert len([a for a in anomalies if a["key_type"] == "user"]) == 1
+
+    def test_granted_events_do_not_count_as_denials(self):
+        detector = AccessAnomalyDetector()
+        start = datetime(2024, 1, 15, 12, 0, 0)
+        for i in range(USER_DENIAL_THRESHOLD * 2):
+            assert detector.observe("prop-1", "door-1", user_id="user-1", timestamp=start + timedelta(seconds=i)) == []
+
+    def test_impossible_travel(self):
+        detector = AccessAnomalyDetector()
+        start = datetime(2024, 1, 15, 12, 0, 0)
+        assert detector.observe(
+            "prop-1", "north-gate", user_id="user-1", timestamp=start,
+            location={"lat": 40.7128, "lng": -74.0060}
+        ) == []
+        # ~1.1 km in 30 seconds
+        anomalies = detector.observe(
+            "prop-1", "south-gate", user_id="user-1", timestamp=start + timedelta(seconds=30),
+            location={"lat": 40.7228, "lng": -74.0060}
+        )
+        assert len(anomalies) == 1
+        assert anomalies[0]["type"] == "impossible_travel"
+        assert anomalies[0]["from_access_point"] == "north-gate"
+        assert anomalies[0]["distance_meters"] > 1000
+
+    def test_after_hours_spike(self):
+        detector = AccessAnomalyDetector(after_hours="22-6")
+        night = datetime(2024, 1, 15, 2, 0, 0)
+        day = datetime(2024, 1, 15, 14, 0, 0)
+        for i in range(AFTER_HOURS_THRESHOLD * 2):
+            assert detector.observe("prop-1", "dock", timestamp=day + timedelta(seconds=i)) == []
+        anomalies = []
+        for i in range(AFTER_HOURS_THRESHOLD):
+            anomalies += detector.observe("prop-1", "dock", timestamp=night + timedelta(seconds=i))
+        assert [a["type"] for a in anomalies] == ["after_hours_spike"]
+        assert detector.get_recent("prop-1")[0]["type"] == "after_hours_spike"
+        assert detector.get_recent("prop-2") == []
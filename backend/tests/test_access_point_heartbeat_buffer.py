@@ -0,0 +1,89 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+
+from models import AccessPoint
+from services.access_point_heartbeat_buffer import AccessPointHeartbeatBuffer, OFFLINE_AFTER_SECONDS
+
+
+class TestAccessPointHeartbeatBuffer:
+    @pytest.fixture
+    def setup_data(self, db_session):
+        from services.system_admin_service import SystemAdminService
+        from schemas import PropertyCreate, PropertyType
+
+        prop = SystemAdminService(db_session).create_property(
+            PropertyCreate(
+                property_name="Heartbeat Prop", property_type=PropertyType.HOTEL,
+                address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC"
+            ),
+            creator_id="system"
+        )
+        points = []
+        for index in range(3):
+            point = AccessPoint(property_id=prop.property_id, name=f"Door {index}", location="Lobby", type="door")
+            db_session.add(point)
+            points.append(point)
+        db_session.commit()
+        return {"property": prop, "points": points}
+
+    @pytest.fixture
+    def buffer(self, db_session):
+        return AccessPointHeartbeatBuffer(session_factory=sessionmaker(bind=db_session.get_bind()))
+
+    def _details(self, db_session, point_id):
+        db_session.expire_all()
+        return db_session.query(AccessPoint).filter(AccessPoint.access_point_id == point_id).one().details or {}
+
+    def test_heartbeats_are_buffered_until_flush(self, buffer, setup_data, db_session):
+        point_id = setup_data["points"][0].access_point_id
+        entry = buffer.record(point_id, device_id="dev-1", battery_level=80)
+        buffer.record(point_id, battery_level=79)
+
+        assert entry["battery_level"] == 79
+        assert "last_heartbeat" not in self._details(db_session, point_id)
+
+        assert buffer.flush() == 1
+        details = self._details(db_session, point_id)
+        assert details["device_id"] == "dev-1"
+        assert details["battery_level"] == 79
+        assert details["isOnline"] is True
+        assert buffer.flush() == 0
+
+    def test_unknown_point(self, buffer, setup_data):
+        assert buffer.record("missing-point") is None
+
+    def test_online_offline_transitions_persist_immediately(self, buffer, setup_data, db_session):
+        point_id = setup_data["points"][1].access_point_id
+        past = datetime.utcnow() - timedelta(seconds=OFFLINE_AFTER_SECONDS + 60)
+        buffer.record(point_id, now=past)
+
+        assert buffer.mark_stale_offline() == [point_id]
+        assert self._details(db_session, point_id)["isOnline"] is False
+
+        buffer.record(point_id)
+        assert self._details(db_session, point_id)["isOnline"] is True
+
+    def test_health_served_from_memory(self, buffer, setup_data):
+        property_id = setup_data["property"].property_id
+        point_id = setup_data["points"][2].access_point_id
+        buffer.record(point_id, firmware_version="1.2.3")
+
+        health = buffer.get_health(property_id)
+        assert len(health) == 3
+        assert health[point_id]["connection_status"] == "online"
+        assert health[point_id]["firmware_version"] == "1.2.3"
+        assert buffer.get_health("other-property") == {}
+
+    def test_observe_keeps_unflushed_heartbeat(self, buffer, setup_data, db_session):
+        point = setup_data["points"][0]
+        buffer.record(point.access_point_id, battery_level=42)
+        point.name = "Front Door"
+        db_session.commit()
+
+        buffer.observe(point)
+        entry = buffer.get_health()[point.access_point_id]
+        assert entry["name"] == "Front Door"
+        assert entry["battery_level"] == 42
+        assert buffer.flush() == 1
+        assert self._details(db_session, point.access_point_id)["battery_level"] == 42
@@ -0,0 +1,141 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import sessionmaker
+
+from models import AgentLocation, AgentStatus
+from services import mobile_agent_service
+from services.agent_location_buffer import AgentLocationBuffer
+from services.mobile_agent_service import MobileAgentService
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _fixes(count, start=NOW, lat=40.0):
+    return [
+        {"latitude": lat + i * 0.0001, "longitude": -73.0, "timestamp": (start + timedelta(seconds=5 * i)).isoformat()}
+        for i in range(count)
+    ]
+
+
+class FailingSession:
+    def bulk_insert_mappings(self, *args):
+        raise RuntimeError("database unavailable")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestAgentLocationBuffer:
+    @pytest.fixture
+    def make_buffer(self, db_session, tmp_path):
+        def make(**kwargs):
+            kwargs.setdefault("session_factory", sessionmaker(bind=db_session.get_bind()))
+            return AgentLocationBuffer(log_dir=tmp_path, fsync=False, **kwargs)
+        return make
+
+    def _count(self, db_session, model):
+        db_session.expire_all()
+        return db_session.query(model).count()
+
+    def test_fixes_are_buffered_until_flush(self, db_session, make_buffer, tmp_path):
+        buffer = make_buffer()
+        result = buffer.record("agent-1", _fixes(3), battery_level=80)
+
+        assert result["accepted"] == 3
+        assert result["status"]["current_latitude"] == pytest.approx(40.0002)
+        assert self._count(db_session, AgentLocation) == 0
+        assert [s["agent_id"] for s in buffer.get_all_status()] == ["agent-1"]
+        assert len(list(tmp_path.glob("segment-*.jsonl"))) == 1
+
+        assert buffer.flush() == 3
+        assert self._count(db_session, AgentLocation) == 3
+        status = db_session.query(AgentStatus).filter(AgentStatus.agent_id == "agent-1").one()
+        assert status.battery_level == 80
+        assert status.current_latitude == pytest.approx(40.0002)
+        # Committed rows no longer need the log
+        assert list(tmp_path.glob("segment-*.jsonl")) == []
+        assert buffer.flush() == 0
+
+    def test_flushes_when_row_threshold_reached(self, db_session, make_buffer):
+        buffer = make_buffer(max_pending_rows=5)
+        buffer.record("agent-1", _fixes(3))
+        assert self._count(db_session, AgentLocation) == 0
+        buffer.record("agent-2", _fixes(2))
+        assert self._count(db_session, AgentLocation) == 5
+        assert self._count(db_session, AgentStatus) == 2
+
+    def test_replayed_old_fixes_keep_current_status(self, make_buffer):
+        buffer = make_buffer()
+        buffer.record("agent-1", _fixes(1, lat=41.0))
+        state = buffer.record("agent-1", _fixes(1, start=NOW - timedelta(hours=1), lat=39.0))["status"]
+        assert state["current_latitude"] == 41.0
+        assert len(buffer.pending_locations("agent-1")) == 2
+
+    def test_invalid_batch_rejected_whole(self, make_buffer):
+        buffer = make_buffer()
+        with pytest.raises(ValueError):
+            buffer.record("agent-1", _fixes(2) + [{"latitude": 91, "longitude": 0}])
+        assert buffer.pending_locations("agent-1") == []
+
+    def test_recovers_unflushed_log_after_crash(self, db_session, make_buffer):
+        crashed = make_buffer()
+        crashed.record("agent-1", _fixes(4))
+        # Crash after the first batch committed but before its segment was removed
+        committed = crashed.pending_locations("agent-1")[:2]
+        crashed._commit(committed, {})
+        crashed._log.close()
+
+        restarted = make_buffer()
+        assert restarted.recover() == 2
+        assert self._count(db_session, AgentLocation) == 4
+        assert db_session.query(AgentStatus).filter(AgentStatus.agent_id == "agent-1").one().current_latitude == pytest.approx(40.0003)
+        assert restarted.recover() == 0
+
+    def test_failed_flush_keeps_rows_and_log(self, db_session, make_buffer, tmp_path):
+        buffer = make_buffer()
+        buffer.record("agent-1", _fixes(2))
+        buffer.session_factory = FailingSession
+        assert buffer.flush() == 0
+        assert len(buffer.pending_locations("agent-1")) == 2
+        assert len(list(tmp_path.glob("segment-*.jsonl"))) == 1
+
+        buffer.session_factory = sessionmaker(bind=db_session.get_bind())
+        buffer.record("agent-1", _fixes(1, start=NOW + timedelta(minutes=1)))
+        assert buffer.flush() == 3
+        assert list(tmp_path.glob("segment-*.jsonl")) == []
+
+    def test_rejected_row_is_dropped_and_the_rest_written(self, db_session, make_buffer, tmp_path):
+        buffer = make_buffer()
+        buffer.record("agent-1", _fixes(3))
+        # A row the database rejects (latitude is NOT NULL)
+        buffer._pending[1]["latitude"] = None
+        assert buffer.flush() == 3
+        assert self._count(db_session, AgentLocation) == 2
+        assert buffer.pending_locations("agent-1") == []
+        assert list(tmp_path.glob("segment-*.jsonl")) == []
+
+    @pytest.mark.parametrize("kwargs", [
+        {"battery_level": "full"},
+        {"battery_level": 101},
+        {"app_version": "1." * 30},
+        {"agent_id": "a" * 37},
+    ])
+    def test_invalid_fields_rejected(self, make_buffer, kwargs):
+        buffer = make_buffer()
+        agent_id = kwargs.pop("agent_id", "agent-1")
+        with pytest.raises(ValueError):
+            buffer.record(agent_id, _fixes(1), **kwargs)
+        assert buffer.pending_locations(agent_id) == []
+
+    def test_history_includes_unflushed_fixes(self, db_session, make_buffer, monkeypatch):
+        buffer = make_buffer()
+        monkeypatch.setattr(mobile_agent_service, "get_location_buffer", lambda: buffer)
+        buffer.record("agent-1", _fixes(2))
+        buffer.flush()
+        buffer.record("agent-1", _fixes(1, start=NOW + timedelta(minutes=1), lat=42.0))
+
+        history = MobileAgentService.get_agent_location_history(db_session, "agent-1", hours=1)
+        assert [loc.latitude for loc in history] == [42.0, pytest.approx(40.0001), 40.0]
@@ -0,0 +1,109 @@
+import random
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import sessionmaker
+
+from services import mobile_agent_service
+from services.agent_location_buffer import AgentLocationBuffer
+from services.agent_spatial_index import AgentSpatialIndex, coordinates, haversine_m
+from services.incident_service import IncidentService
+from services.mobile_agent_service import MobileAgentService
+
+NOW = datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def scattered():
+    rng = random.Random(3)
+    index = AgentSpatialIndex()
+    points = {}
+    for i in range(500):
+        points[f"agent-{i}"] = (40 + rng.uniform(-0.02, 0.02), -73 + rng.uniform(-0.02, 0.02))
+        index.update(f"agent-{i}", *points[f"agent-{i}"], status=rng.choice(["active", "idle", "offline"]))
+    return index, points
+
+
+def _brute_force(points, lat, lng):
+    return sorted((haversine_m(lat, lng, *point), agent_id) for agent_id, point in points.items())
+
+
+class TestAgentSpatialIndex:
+    def test_k_nearest_matches_brute_force(self, scattered):
+        index, points = scattered
+        rng = random.Random(5)
+        # Includes query points well outside the cluster of agents
+        for _ in range(50):
+            lat, lng = 40 + rng.uniform(-0.05, 0.05), -73 + rng.uniform(-0.05, 0.05)
+            assert index.query(lat, lng, k=5) == _brute_force(points, lat, lng)[:5]
+
+    def test_radius_matches_brute_force(self, scattered):
+        index, points = scattered
+        expected = [match for match in _brute_force(points, 40.0, -73.0) if match[0] <= 250]
+        assert index.query(40.0, -73.0, radius_m=250) == expected
+        assert index.query(40.0, -73.0, k=3, radius_m=250) == expected[:3]
+
+    def test_moves_and_removals(self):
+        index = AgentSpatialIndex()
+        index.update("a", 40.0, -73.0)
+        index.update("b", 40.01, -73.0)
+        assert [agent for _, agent in index.query(40.0, -73.0, k=1)] == ["a"]
+
+        index.update("a", 40.02, -73.0)
+        assert [agent for _, agent in index.query(40.0, -73.0, k=1)] == ["b"]
+        index.update("b", None, None)
+        assert [agent for _, agent in index.query(40.0, -73.0, k=5)] == ["a"]
+        assert len(index) == 1 and len(index._cells) == 1
+
+    def test_status_and_age_filters(self):
+        index = AgentSpatialIndex()
+        index.update("near-offline", 40.0, -73.0, status="offline", last_seen=NOW)
+        index.update("near-stale", 40.0001, -73.0, status="active", last_seen=NOW - timedelta(hours=1))
+        index.update("far-active", 40.01, -73.0, status="active", last_seen=NOW)
+
+        assert len(index.query(40.0, -73.0, k=5)) == 3
+        assert [agent for _, agent in index.query(40.0, -73.0, k=1, statuses=["active"])] == ["near-stale"]
+        assert [agent for _, agent in index.query(
+            40.0, -73.0, k=1, statuses=["active"], max_age_seconds=600, now=NOW
+        )] == ["far-active"]
+
+    def test_requires_a_bound(self):
+        with pytest.raises(ValueError):
+            AgentSpatialIndex().query(40.0, -73.0)
+
+    def test_coordinates_from_location_dicts(self):
+        assert coordinates({"lat": 1, "lng": 2}) == (1.0, 2.0)
+        assert coordinates({"latitude": "1.5", "longitude": -2}) == (1.5, -2.0)
+        assert coordinates({"area": "Lobby"}) is None
+        assert coordinates("Lobby") is None
+
+
+class TestNearestAgents:
+    @pytest.fixture
+    def buffer(self, db_session, tmp_path, monkeypatch):
+        buffer = AgentLocationBuffer(session_factory=sessionmaker(bind=db_session.get_bind()), log_dir=tmp_path, fsync=False)
+        monkeypatch.setattr(mobile_agent_service, "get_location_buffer", lambda: buffer)
+        return buffer
+
+    def test_index_follows_location_ingest(self, buffer):
+        buffer.record("agent-1", [{"latitude": 40.0, "longitude": -73.0}])
+        buffer.record("agent-2", [{"latitude": 40.005, "longitude": -73.0}])
+        nearest = MobileAgentService.find_nearest_agents(40.004, -73.0, k=2)
+        assert [agent.agent_id for agent in nearest] == ["agent-2", "agent-1"]
+        assert nearest[0].distance_m == pytest.approx(111.2, abs=0.5)
+
+        buffer.record("agent-1", [{"latitude": 40.004, "longitude": -73.0001}])
+        assert MobileAgentService.find_nearest_agents(40.004, -73.0, k=1)[0].agent_id == "agent-1"
+
+    def test_index_hydrates_from_stored_status(self, db_session, buffer, tmp_path):
+        buffer.record("agent-1", [{"latitude": 40.0, "longitude": -73.0}])
+        buffer.flush()
+        restarted = AgentLocationBuffer(
+            session_factory=sessionmaker(bind=db_session.get_bind()), log_dir=tmp_path, fsync=False
+        )
+        assert [a["agent_id"] for a in restarted.nearest_agents(40.0, -73.0, k=1)] == ["agent-1"]
+
+    def test_incident_suggests_responders(self, buffer):
+        buffer.record("agent-1", [{"latitude": 40.0, "longitude": -73.0}])
+        suggested = IncidentService._suggest_responders({"lat": 40.0001, "lng": -73.0, "area": "Lobby"})
+        assert [agent["agent_id"] for agent in suggested] == ["agent-1"]
+        assert IncidentService._suggest_responders({"area": "Lobby"}) is None
@@ -0,0 +1,122 @@
+import pytest
+from datetime import datetime, timedelta
+
+from api.auth_dependencies import require_admin_role
+from api.system_admin_endpoints import router
+from models import DataRollup, SensorType, SystemLog
+from services.data_retention_service import DataRetentionService, RetentionPolicy, purge_before
+from services.iot_timeseries_store import READINGS_TABLE, get_sensor_reading_store
+
+
+def _service(db_session, policies, chunk_size=50):
+    return DataRetentionService(lambda: db_session, policies=policies, chunk_size=chunk_size, pause_seconds=0)
+
+
+class TestReadingsRetention:
+    @pytest.fixture
+    def sensor_key(self, db_session):
+        store = get_sensor_reading_store()
+        key = store.get_sensor_key(db_session, "prop-retention", "temp-1", SensorType.TEMPERATURE)
+        start = datetime(2024, 1, 20)
+        # One reading every 30 minutes from Jan 20 to Mar 10 -> spans three monthly chunks
+        store.append(db_session, [
+            (key, start + timedelta(minutes=30 * i), float(i % 48))
+            for i in range(50 * 48)
+        ])
+        db_session.commit()
+        return key
+
+    def test_rolls_up_then_drops_and_purges(self, db_session, sensor_key):
+        policy = RetentionPolicy("iot_sensor_readings", READINGS_TABLE, "ts", 30, dimensions=("sensor_key",), value="value")
+        service = _service(db_session, [policy])
+        result = service.run(now=datetime(2024, 3, 15, 13, 30))["iot_sensor_readings"]
+
+        cutoff = datetime(2024, 2, 14)
+        assert result["cutoff"] == cutoff.isoformat()
+        assert "error" not in result
+        assert result["chunks_dropped"] == 1
+        # Jan 20 .. Feb 14 at 48 readings a day
+        assert result["rows_purged"] == 25 * 48
+        assert result["rows_rolled_up"] == result["rows_purged"]
+
+        store = get_sensor_reading_store()
+        assert store.existing_chunks(db_session) == ["iot_sensor_readings_p202402", "iot_sensor_readings_p202403"]
+        remaining = store.select_readings(db_session, [sensor_key], datetime(2024, 1, 1), datetime(2024, 4, 1))
+        assert min(ts for _, ts, _ in remaining).replace(tzinfo=None) == cutoff
+
+        hourly = db_session.query(DataRollup).filter(DataRollup.granularity == "hour").all()
+        daily = db_session.query(DataRollup).filter(DataRollup.granularity == "day").all()
+        assert len(hourly) == 25 * 24
+        assert len(daily) == 25
+        assert {row.count for row in hourly} == {2}
+        assert {row.count for row in daily} == {48}
+        day = daily[0]
+        assert (day.value_min, day.value_max, day.value_sum) == (0.0, 47.0, float(sum(range(48))))
+        assert day.dimensions == {"sensor_key": sensor_key}
+
+        # A second run has nothing left to roll up or purge
+        again = service.run(now=datetime(2024, 3, 15, 13, 30))["iot_sensor_readings"]
+        assert again["rows_purged"] == 0
+        assert db_session.query(DataRollup).count() == len(hourly) + len(daily)
+        metrics = service.get_status()["policies"][0]["metrics"]
+        assert metrics["runs"] == 2
+        assert metrics["rows_purged"] == 25 * 48
+
+
+class TestChunkedPurge:
+    def _logs(self, db_session, count, ts):
+        db_session.add_all([
+            SystemLog(log_level="INFO" if i % 2 else "ERROR", message=f"m{i}", service="api", timestamp=ts + timedelta(minutes=i))
+            for i in range(count)
+        ])
+        db_session.commit()
+
+    def test_purge_before_deletes_in_chunks(self, db_session):
+        self._logs(db_session, 23, datetime(2024, 1, 1))
+        self._logs(db_session, 4, datetime(2024, 6, 1))
+        deleted = purge_before(db_session, SystemLog.__table__, SystemLog.timestamp, datetime(2024, 3, 1), chunk_size=5)
+        assert deleted == 23
+        assert db_session.query(SystemLog).count() == 4
+
+    def test_policy_rolls_up_dimensions(self, db_session):
+        self._logs(db_session, 10, datetime(2024, 1, 1, 8))
+        policy = RetentionPolicy("system_logs", SystemLog.__table__, "timestamp", 90, dimensions=("service", "log_level"))
+        result = _service(db_session, [policy], chunk_size=3).run(now=datetime(2024, 6, 1))["system_logs"]
+        assert result["rows_purged"] == 10
+        hourly = {
+            row.dimension_key: row.count
+            for row in db_session.query(DataRollup).filter(DataRollup.granularity == "hour")
+        }
+        assert hourly == {"api|ERROR": 5, "api|INFO": 5}
+
+    def test_late_rows_added_to_rolled_up_buckets(self, db_session):
+        policy = RetentionPolicy("system_logs", SystemLog.__table__, "timestamp", 90, dimensions=("service", "log_level"))
+        service = _service(db_session, [policy], chunk_size=3)
+        self._logs(db_session, 4, datetime(2024, 1, 2, 8))
+        service.run(now=datetime(2024, 6, 1))
+        # Synced late: older than the hour already rolled up, and inside it
+        self._logs(db_session, 2, datetime(2024, 1, 1, 8))
+        self._logs(db_session, 2, datetime(2024, 1, 2, 8, 30))
+        result = service.run(now=datetime(2024, 6, 1))["system_logs"]
+
+        assert result["rows_purged"] == result["rows_rolled_up"] == 4
+        assert db_session.query(SystemLog).count() == 0
+        rollups = {
+            (row.granularity, row.bucket_start.day, row.dimension_key): row.count
+            for row in db_session.query(DataRollup)
+        }
+        assert rollups == {
+            ("hour", 1, "api|ERROR"): 1, ("hour", 1, "api|INFO"): 1,
+            ("day", 1, "api|ERROR"): 1, ("day", 1, "api|INFO"): 1,
+            ("hour", 2, "api|ERROR"): 3, ("hour", 2, "api|INFO"): 3,
+            ("day", 2, "api|ERROR"): 3, ("day", 2, "api|INFO"): 3,
+        }
+
+    def test_unknown_policy_rejected(self, db_session):
+        with pytest.raises(ValueError):
+            _service(db_session, []).run(["nope"])
+
+
+def test_manual_run_requires_admin():
+    route = next(r for r in router.routes if r.path.endswith("/retention/run"))
+    assert require_admin_role in [dependency.call for dependency in route.dependant.dependencies]
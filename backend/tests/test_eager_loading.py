@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+
+from models import (
+    Camera, Guest, Handover, HandoverChecklistItem, IoTEnvironmentalAlert, IoTEnvironmentalData, LostFoundItem,
+    Property, SensorType, User, UserRole, UserRoleEnum
+)
+from services import handover_service, lost_found_service, patrol_service
+from services.handover_service import HandoverService
+from services.iot_environmental_service import IoTEnvironmentalService
+from services.lost_found_service import LostFoundService
+from services.patrol_service import PatrolService
+
+ROWS = 12
+
+
+@pytest.fixture
+def owner(db_session):
+    prop = Property(
+        property_name="Eager Prop", address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC"
+    )
+    user = User(email="owner@example.com", username="owner", password_hash="x", first_name="Own", last_name="Er")
+    db_session.add_all([prop, user])
+    db_session.flush()
+    db_session.add(UserRole(user_id=user.user_id, property_id=prop.property_id, role_name=UserRoleEnum.MANAGER))
+    db_session.commit()
+    return user.user_id, prop.property_id
+
+
+@pytest.fixture
+def shared_session(db_session, monkeypatch):
+    """Point the SessionLocal-based services at the test session."""
+    for module in (handover_service, lost_found_service, patrol_service):
+        monkeypatch.setattr(module, "SessionLocal", lambda: db_session)
+    return db_session
+
+
+class TestNoNPlusOne:
+    def test_iot_alert_list(self, db_session, owner, query_counter):
+        user_id, property_id = owner
+        for i in range(ROWS):
+            camera = Camera(name=f"cam-{i}", location={}, ip_address="10.0.0.1", stream_url="rtsp://x")
+            db_session.add(camera)
+            db_session.flush()
+            db_session.add(IoTEnvironmentalAlert(
+                property_id=property_id, sensor_id=f"s-{i}", alert_type="temperature",
+                message="hot", location={}, camera_id=camera.camera_id
+            ))
+        db_session.commit()
+        db_session.expire_all()
+
+        query_counter.reset()
+        alerts = IoTEnvironmentalService(db_session).list_alerts(user_id)
+        assert {alert.camera_name for alert in alerts} == {f"cam-{i}" for i in range(ROWS)}
+        query_counter.assert_per_row(len(alerts))
+
+    def test_iot_sensor_readings(self, db_session, owner, query_counter):
+        user_id, property_id = owner
+        for i in range(ROWS):
+            camera = Camera(name=f"cam-{i}", location={}, ip_address="10.0.0.1", stream_url="rtsp://x")
+            db_session.add(camera)
+            db_session.flush()
+            db_session.add(IoTEnvironmentalData(
+                property_id=property_id, sensor_id=f"s-{i}", sensor_type=SensorType.TEMPERATURE,
+                location={}, value=21.0, camera_id=camera.camera_id
+            ))
+        db_session.commit()
+        db_session.expire_all()
+
+        query_counter.reset()
+        readings = IoTEnvironmentalService(db_session).list_sensor_readings(user_id)
+        assert {reading.camera_name for reading in readings} == {f"cam-{i}" for i in range(ROWS)}
+        query_counter.assert_per_row(len(readings))
+
+    def test_lost_found_items(self, shared_session, owner, query_counter):
+        user_id, property_id = owner
+        for i in range(ROWS):
+            guest = Guest(property_id=property_id, first_name="G", last_name=str(i))
+            shared_session.add(guest)
+            shared_session.flush()
+            shared_session.add(LostFoundItem(
+                property_id=property_id, item_type="bag", description="black", found_by=user_id,
+                ai_matched_guest_id=guest.guest_id
+            ))
+        shared_session.commit()
+        shared_session.expire_all()
+
+        query_counter.reset()
+        items = asyncio.run(LostFoundService.get_items(user_id))
+        assert len(items) == ROWS
+        assert all(item.finder_name == "Own Er" and item.ai_matched_guest_name for item in items)
+        query_counter.assert_per_row(len(items))
+
+    def test_officers(self, shared_session, owner, query_counter):
+        _, property_id = owner
+        for i in range(ROWS):
+            officer = User(email=f"o{i}@example.com", username=f"officer{i}", password_hash="x", first_name="O", last_name=str(i))
+            shared_session.add(officer)
+            shared_session.flush()
+            shared_session.add(UserRole(user_id=officer.user_id, property_id=property_id, role_name=UserRoleEnum.SECURITY_OFFICER))
+        shared_session.commit()
+        shared_session.expire_all()
+
+        query_counter.reset()
+        officers = asyncio.run(PatrolService.get_officers(None))
+        assert len(officers) == ROWS
+        assert all(officer.roles for officer in officers)
+        query_counter.assert_per_row(len(officers))
+
+    def test_handovers(self, shared_session, owner, query_counter):
+        user_id, property_id = owner
+        for i in range(ROWS):
+            handover = Handover(
+                property_id=property_id, shiftType="morning", handoverFrom="a", handoverTo="b",
+                handoverDate=datetime(2024, 1, 1) + timedelta(days=i), startTime="06:00", endTime="14:00"
+            )
+            shared_session.add(handover)
+            shared_session.flush()
+            shared_session.add(HandoverChecklistItem(handover_id=handover.handover_id, title="keys", category="general"))
+        shared_session.commit()
+        shared_session.expire_all()
+
+        query_counter.reset()
+        handovers = asyncio.run(HandoverService.get_handovers(user_id))
+        assert len(handovers) == ROWS
+        assert all(len(handover.checklist_items) == 1 for handover in handovers)
+        query_counter.assert_per_row(len(handovers))
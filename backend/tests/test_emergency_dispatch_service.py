@@ -0,0 +1,104 @@
+import asyncio
+import httpx
+import pytest
+
+from services.emergency_dispatch_service import EmergencyDispatchEngine, HardwareBridgeClient
+from utils.circuit_breaker import CircuitState, get_hardware_bridge_circuit_breaker
+
+
+class FakeBridgeClient:
+    def __init__(self, failures_per_point=None, always_fail=()):
+        self.failures_per_point = dict(failures_per_point or {})
+        self.always_fail = set(always_fail)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def send_mode(self, point_id, mode, payload):
+        self.calls.append((point_id, mode, payload.get("target_status")))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            if point_id in self.always_fail:
+                raise ConnectionError("controller offline")
+            if self.failures_per_point.get(point_id, 0) > 0:
+                self.failures_per_point[point_id] -= 1
+                raise ConnectionError("transient")
+            return {"acknowledged": True, "bridge_status": "ok"}
+        finally:
+            self.in_flight -= 1
+
+
+class TestEmergencyDispatchEngine:
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency_and_acks(self):
+        client = FakeBridgeClient()
+        engine = EmergencyDispatchEngine(client_factory=lambda: client, concurrency=16, retry_backoff_seconds=0)
+        point_ids = [f"ap-{i}" for i in range(500)]
+        dispatch = engine.create_dispatch("prop-1", "lockdown", point_ids)
+
+        await engine.run(dispatch, target_statuses={point_id: "disabled" for point_id in point_ids})
+
+        assert dispatch.counts["acknowledged"] == 500
+        assert dispatch.completed_at is not None
+        assert 1 < client.max_in_flight <= 16
+        assert all(call[1] == "lockdown" and call[2] == "disabled" for call in client.calls)
+        assert engine.get_dispatch(dispatch.dispatch_id) is dispatch
+
+    @pytest.mark.asyncio
+    async def test_retries_and_failures(self):
+        client = FakeBridgeClient(failures_per_point={"ap-1": 2}, always_fail={"ap-2"})
+        engine = EmergencyDispatchEngine(client_factory=lambda: client, max_attempts=3, retry_backoff_seconds=0)
+        dispatch = engine.create_dispatch("prop-1", "unlock", ["ap-1", "ap-2", "ap-3"])
+        progress = []
+
+        async def on_progress(snapshot):
+            progress.append(snapshot)
+
+        await engine.run(dispatch, on_progress=on_progress)
+
+        assert dispatch.points["ap-1"]["status"] == "acknowledged"
+        assert dispatch.points["ap-1"]["attempts"] == 3
+        assert dispatch.points["ap-2"]["status"] == "failed"
+        assert dispatch.points["ap-2"]["error"] == "controller offline"
+        assert dispatch.points["ap-3"]["attempts"] == 1
+        assert progress[-1]["completed_at"] is not None
+        assert progress[-1]["acknowledged"] == 2
+
+    @pytest.mark.asyncio
+    async def test_unconfigured_bridge(self, monkeypatch):
+        monkeypatch.delenv("HARDWARE_BRIDGE_URL", raising=False)
+        engine = EmergencyDispatchEngine(client_factory=HardwareBridgeClient)
+        dispatch = engine.create_dispatch("prop-1", "lockdown", ["ap-1"])
+
+        await engine.run(dispatch)
+
+        assert dispatch.points["ap-1"]["status"] == "not_configured"
+
+    @pytest.mark.asyncio
+    async def test_offline_controllers_do_not_fail_the_rest(self):
+        offline = {f"ap-{i}" for i in range(10)}
+
+        def bridge(request):
+            point_id = request.url.path.split("/")[-2]
+            return httpx.Response(503 if point_id in offline else 200, json={"acknowledged": True})
+
+        transport = httpx.MockTransport(bridge)
+        engine = EmergencyDispatchEngine(
+            client_factory=lambda: HardwareBridgeClient("http://bridge", transport=transport),
+            concurrency=4, retry_backoff_seconds=0,
+        )
+        dispatch = engine.create_dispatch("prop-1", "lockdown", [f"ap-{i}" for i in range(40)])
+
+        await engine.run(dispatch)
+
+        assert (dispatch.counts["failed"], dispatch.counts["acknowledged"]) == (10, 30)
+        # Locker release shares this breaker; a dead rack must not open it
+        assert get_hardware_bridge_circuit_breaker().state == CircuitState.CLOSED
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import os
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from services import evidence_file_service, evidence_integrity_service
+from services.evidence_file_service import EvidenceFileService
+from services.evidence_integrity_service import (
+    EvidenceIntegrityScanner, IoBudget, hash_file, merkle_leaf, merkle_proof, merkle_root, verify_merkle_proof
+)
+from services.evidence_preview_service import EvidencePreviewService
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(EvidenceFileService, "EVIDENCE_STORAGE_PATH", str(tmp_path / "evidence"))
+    monkeypatch.setattr(EvidenceFileService, "THUMBNAIL_STORAGE_PATH", str(tmp_path / "thumbnails"))
+    service = EvidenceFileService()
+    service.previews = EvidencePreviewService(service.THUMBNAIL_STORAGE_PATH, executor=ThreadPoolExecutor(1))
+    service.integrity = _scanner(service)
+    yield service
+    service.previews.shutdown()
+    asyncio.run(service.integrity.stop())
+
+
+def _scanner(service, **kwargs):
+    kwargs.setdefault("bytes_per_second", 0)
+    return EvidenceIntegrityScanner(service.EVIDENCE_STORAGE_PATH, executor=ThreadPoolExecutor(2), **kwargs)
+
+
+def _upload(service, data, case_id=None, name="clip.mp4"):
+    return asyncio.run(service.upload_evidence_file(data, name, "ev-1", "user-1", case_id=case_id))
+
+
+class TestHashing:
+    @pytest.mark.parametrize("size", [0, 1, 4 * 1024 * 1024 + 3])
+    def test_buffered_and_mmap_paths_agree(self, tmp_path, monkeypatch, size):
+        path = tmp_path / "blob"
+        data = os.urandom(size)
+        path.write_bytes(data)
+        assert hash_file(str(path), buffer_size=64 * 1024) == hashlib.sha256(data).hexdigest()
+        monkeypatch.setattr(evidence_integrity_service, "MMAP_THRESHOLD", 1)
+        assert hash_file(str(path), buffer_size=64 * 1024) == hashlib.sha256(data).hexdigest()
+
+    def test_io_budget_sleeps_off_overdraft(self, monkeypatch):
+        clock = [100.0]
+        slept = []
+        monkeypatch.setattr(evidence_integrity_service.time, "monotonic", lambda: clock[0])
+        monkeypatch.setattr(evidence_integrity_service.time, "sleep", slept.append)
+
+        budget = IoBudget(bytes_per_second=1000)
+        assert budget.acquire(1000) == 0.0  # the first second's burst
+        assert budget.acquire(500) == 0.5
+        clock[0] += 0.5  # time spent sleeping refills the debt exactly
+        assert budget.acquire(1000) == 1.0
+        assert slept == [0.5, 1.0]
+        assert IoBudget(bytes_per_second=0).acquire(10 ** 12) == 0.0
+
+
+class TestMerkle:
+    @pytest.mark.parametrize("count", range(1, 8))
+    def test_every_leaf_proves_against_root(self, count):
+        leaves = [merkle_leaf(f"file-{i}", f"{i:064x}", i) for i in range(count)]
+        root = merkle_root(leaves)
+        for index, leaf in enumerate(leaves):
+            assert verify_merkle_proof(leaf, merkle_proof(leaves, index), root)
+        forged = merkle_leaf("file-0", f"{99:064x}", 0)
+        assert not verify_merkle_proof(forged, merkle_proof(leaves, 0), root)
+
+
+class TestIntegrityScanner:
+    def test_rolling_passes_resume_from_persisted_cursor(self, service):
+        records = [_upload(service, os.urandom(2048 + i)) for i in range(5)]
+        hashes = sorted(record["file_hash"] for record in records)
+
+        first = _scanner(service, batch_files=2).scan()
+        assert first["verified"] == 2 and not first["pass_completed"]
+        assert first["cursor"] == hashes[1]
+
+        # A restarted process picks up where the last one stopped
+        resumed = _scanner(service, batch_files=2)
+        assert resumed.scan()["cursor"] == hashes[3]
+        last = resumed.scan()
+        assert last["verified"] == 1 and last["pass_completed"]
+        status = resumed.get_status()
+        assert (status["cursor"], status["passes_completed"], status["objects_verified"]) == ("", 1, 5)
+        assert status["failures"] == []
+
+        # The next pass starts over
+        assert resumed.scan()["cursor"] == hashes[1]
+
+    def test_corruption_detected_and_not_trusted_from_cache(self, service):
+        record = _upload(service, os.urandom(4096))
+        assert service.verify_file_integrity(record, trust_unchanged=True)
+
+        object_path = service._object_path(service.EVIDENCE_STORAGE_PATH, record["file_hash"])
+        info = os.stat(object_path)
+        os.chmod(object_path, 0o644)
+        with open(object_path, "r+b") as f:
+            f.write(b"\x00")
+        # Silent corruption: same inode, size and mtime
+        os.utime(object_path, ns=(info.st_atime_ns, info.st_mtime_ns))
+
+        report = service.integrity.scan()
+        assert report["failed"] == [record["file_hash"]]
+        assert service.integrity.get_status()["failures"][0]["file_hash"] == record["file_hash"]
+        assert not service.verify_file_integrity(record, trust_unchanged=True)
+
+    @pytest.mark.parametrize("scanned", [True, False])
+    def test_upload_replaces_corrupted_object(self, service, scanned):
+        data = os.urandom(4096)
+        original = _upload(service, data)
+        object_path = service._object_path(service.EVIDENCE_STORAGE_PATH, original["file_hash"])
+        os.chmod(object_path, 0o644)
+        with open(object_path, "r+b") as f:
+            f.write(b"\x00")
+        if scanned:
+            assert service.integrity.scan()["failed"] == [original["file_hash"]]
+
+        fresh = _upload(service, data)
+        assert not fresh["deduplicated"]
+        assert service.verify_file_integrity(fresh)
+        assert not service.integrity.has_failed(fresh["file_hash"])
+        # The earlier upload still holds the corrupted copy and keeps failing
+        assert not service.verify_file_integrity(original)
+        assert _upload(service, data)["deduplicated"]
+
+    def test_duplicate_upload_trusts_recent_verification(self, service, monkeypatch):
+        data = os.urandom(4096)
+        content_hash = _upload(service, data)["file_hash"]
+        hashed = []
+        monkeypatch.setattr(evidence_file_service, "hash_file", lambda path: hashed.append(path) or hash_file(path))
+
+        # Without a verification on record the object is re-hashed once
+        assert _upload(service, data)["deduplicated"]
+        assert _upload(service, data)["deduplicated"]
+        assert len(hashed) == 1
+
+        # A stale verification no longer vouches for it
+        service.integrity._load_state()["objects"][content_hash]["verified_at"] = "2000-01-01T00:00:00+00:00"
+        assert _upload(service, data)["deduplicated"]
+        assert len(hashed) == 2
+
+    def test_scan_in_process_pool(self, service):
+        record = _upload(service, os.urandom(4096))
+        scanner = EvidenceIntegrityScanner(service.EVIDENCE_STORAGE_PATH, bytes_per_second=0, max_workers=1)
+        try:
+            assert scanner.scan()["verified"] == 1
+        finally:
+            asyncio.run(scanner.stop())
+        assert not scanner.has_failed(record["file_hash"])
+
+
+class TestCaseManifest:
+    def test_case_proof_without_rereading_files(self, service, monkeypatch):
+        records = [_upload(service, os.urandom(1024 + i), case_id="case/42") for i in range(3)]
+        _upload(service, os.urandom(1024), case_id="other")
+
+        proof = service.integrity.case_proof("case/42")
+        assert [leaf["file_id"] for leaf in proof["leaves"]] == sorted(r["file_id"] for r in records)
+        assert proof["manifest_consistent"]
+        assert not proof["verified"] and len(proof["unverified"]) == 3
+
+        service.integrity.scan()
+        monkeypatch.setattr(evidence_integrity_service, "hash_file", lambda *args: pytest.fail("re-read"))
+        target = records[1]
+        proof = service.integrity.case_proof("case/42", target["file_id"])
+        assert proof["verified"] and proof["oldest_verification"]
+        assert verify_merkle_proof(proof["leaf"], proof["audit_path"], proof["root"])
+        with pytest.raises(ValueError):
+            service.integrity.case_proof("other", target["file_id"])
+
+    def test_deleting_uploads_updates_manifest(self, service):
+        first = _upload(service, os.urandom(1024), case_id="case-1")
+        second = _upload(service, os.urandom(1024), case_id="case-1")
+        root = service.integrity.case_proof("case-1")["root"]
+
+        assert service.delete_evidence_file(first)
+        proof = service.integrity.case_proof("case-1")
+        assert [leaf["file_id"] for leaf in proof["leaves"]] == [second["file_id"]]
+        assert proof["root"] != root
+
+        assert service.delete_evidence_file(second)
+        assert service.integrity.case_proof("case-1") is None
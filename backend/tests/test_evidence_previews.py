@@ -0,0 +1,154 @@
+import asyncio
+import io
+import os
+import shutil
+import subprocess
+import pytest
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+
+from services import evidence_preview_service
+from services.evidence_file_service import EvidenceFileService
+from services.evidence_preview_service import EvidencePreviewService, render_preview
+
+
+class HeldExecutor:
+    """Executor that queues work until release(), to observe requests racing a render."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, fn, args))
+        return future
+
+    def release(self):
+        for future, fn, args in self.jobs:
+            future.set_result(fn(*args))
+        self.jobs = []
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def _jpeg(width=1600, height=1200):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "navy").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def make_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(EvidenceFileService, "EVIDENCE_STORAGE_PATH", str(tmp_path / "evidence"))
+    monkeypatch.setattr(EvidenceFileService, "THUMBNAIL_STORAGE_PATH", str(tmp_path / "thumbnails"))
+
+    def make(executor):
+        service = EvidenceFileService()
+        service.previews = EvidencePreviewService(service.THUMBNAIL_STORAGE_PATH, executor=executor)
+        return service
+    return make
+
+
+def _upload(service, data, filename):
+    return asyncio.run(service.upload_evidence_file(data, filename, "ev-1", "user-1"))
+
+
+class TestEvidencePreviews:
+    def test_upload_returns_before_thumbnail_renders(self, make_service):
+        executor = HeldExecutor()
+        service = make_service(executor)
+        record = _upload(service, _jpeg(), "cctv.jpg")
+
+        assert os.path.exists(record["file_path"])
+        assert len(executor.jobs) == 1
+        assert not os.path.exists(record["thumbnail_path"])
+        assert service.get_thumbnail_url(record["file_id"], record) == f"/api/evidence/thumbnails/{record['file_id']}"
+
+        executor.release()
+        with Image.open(record["thumbnail_path"]) as thumb:
+            assert max(thumb.size) == 300
+
+    def test_sizes_render_lazily_and_are_cached(self, make_service):
+        executor = ThreadPoolExecutor(2)
+        service = make_service(executor)
+        record = _upload(service, _jpeg(), "cctv.jpg")
+        executor.shutdown(wait=True)
+        service.previews = EvidencePreviewService(service.THUMBNAIL_STORAGE_PATH, executor=HeldExecutor())
+
+        # The upload's thumbnail is already cached: served without new work
+        assert asyncio.run(service.get_preview(record)) == record["thumbnail_path"]
+        assert service.previews._executor.jobs == []
+
+        async def request_twice():
+            first = asyncio.ensure_future(service.get_preview(record, "medium"))
+            second = asyncio.ensure_future(service.get_preview(record, "medium"))
+            await asyncio.sleep(0)
+            # Both requests wait on a single render
+            assert len(service.previews._executor.jobs) == 1
+            service.previews._executor.release()
+            return await first, await second
+
+        first, second = asyncio.run(request_twice())
+        assert first == second == service.previews.preview_path(record["file_hash"], "medium")
+        with Image.open(first) as preview:
+            assert preview.size == (800, 600)
+        with pytest.raises(ValueError):
+            asyncio.run(service.get_preview(record, "huge"))
+
+    def test_duplicate_content_shares_previews_until_last_delete(self, make_service):
+        executor = ThreadPoolExecutor(1)
+        service = make_service(executor)
+        data = _jpeg(640, 480)
+        first = _upload(service, data, "a.jpg")
+        second = _upload(service, data, "b.jpg")
+        executor.shutdown(wait=True)
+
+        assert first["thumbnail_path"] == second["thumbnail_path"]
+        assert os.path.exists(first["thumbnail_path"])
+        service.delete_evidence_file(first)
+        assert os.path.exists(second["thumbnail_path"])
+        service.delete_evidence_file(second)
+        assert not os.path.exists(second["thumbnail_path"])
+
+    def test_documents_have_no_preview(self, make_service):
+        executor = HeldExecutor()
+        service = make_service(executor)
+        record = _upload(service, b"%PDF-1.4", "report.pdf")
+        assert record["thumbnail_path"] is None
+        assert executor.jobs == []
+        assert asyncio.run(service.get_preview(record)) is None
+
+    def test_videos_without_ffmpeg_have_no_thumbnail(self, make_service, monkeypatch):
+        monkeypatch.setattr(evidence_preview_service.shutil, "which", lambda name: None)
+        executor = HeldExecutor()
+        service = make_service(executor)
+        video = _upload(service, b"not really a video", "clip.mp4")
+        assert video["thumbnail_path"] is None
+        assert service.get_thumbnail_url(video["file_id"], video) is None
+        assert executor.jobs == []
+        # Photos do not need ffmpeg
+        assert _upload(service, _jpeg(), "cctv.jpg")["thumbnail_path"] is not None
+
+    def test_jpeg_draft_decode_in_process_pool(self, tmp_path):
+        source = tmp_path / "big.jpg"
+        source.write_bytes(_jpeg(4000, 3000))
+        previews = EvidencePreviewService(str(tmp_path / "cache"), max_workers=1)
+        try:
+            path = asyncio.run(previews.get_preview(str(source), "ab" * 32, "image", "thumb"))
+        finally:
+            previews.shutdown()
+        with Image.open(path) as thumb:
+            assert thumb.size == (300, 225)
+
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+    def test_video_poster_frame(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=2:size=640x360:rate=10", str(source)],
+            check=True,
+        )
+        dest = tmp_path / "poster.jpg"
+        assert render_preview(str(source), "video", (300, 300), str(dest))
+        with Image.open(dest) as poster:
+            assert poster.size == (300, 169)
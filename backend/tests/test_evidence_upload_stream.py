@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import io
+import os
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from services import evidence_file_service
+from services.evidence_file_service import EvidenceFileService
+from services.evidence_preview_service import EvidencePreviewService
+
+
+class RecordingUpload:
+    """Async read(size) source that remembers the largest read requested."""
+
+    def __init__(self, data: bytes, size=None):
+        self._stream = io.BytesIO(data)
+        self.size = size
+        self.largest_read = 0
+        self.bytes_read = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        self.largest_read = max(self.largest_read, size)
+        chunk = self._stream.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(EvidenceFileService, "EVIDENCE_STORAGE_PATH", str(tmp_path / "evidence"))
+    monkeypatch.setattr(EvidenceFileService, "THUMBNAIL_STORAGE_PATH", str(tmp_path / "thumbnails"))
+    monkeypatch.setattr(EvidenceFileService, "UPLOAD_CHUNK_SIZE", 1024)
+    service = EvidenceFileService()
+    service.previews = EvidencePreviewService(service.THUMBNAIL_STORAGE_PATH, executor=ThreadPoolExecutor(2))
+    yield service
+    service.previews.shutdown()
+
+
+def _upload(service, source, filename="clip.mp4"):
+    return asyncio.run(service.upload_evidence_stream(source, filename, "ev-1", "user-1"))
+
+
+class TestEvidenceUploadStream:
+    def test_streams_in_chunks_and_hashes_while_writing(self, service):
+        data = os.urandom(10 * 1024 + 17)
+        source = RecordingUpload(data)
+        record = _upload(service, source)
+
+        assert source.largest_read == 1024
+        assert record["file_size"] == len(data)
+        assert record["file_hash"] == hashlib.sha256(data).hexdigest()
+        with open(record["file_path"], "rb") as f:
+            assert f.read() == data
+        # Only the upload's link and the content object remain; the temp spool is gone
+        assert sorted(os.listdir(service.EVIDENCE_STORAGE_PATH)) == [os.path.basename(record["file_path"]), "objects"]
+        assert service.verify_file_integrity(record)
+
+    def test_size_limit_enforced_while_streaming(self, service, monkeypatch):
+        monkeypatch.setattr(EvidenceFileService, "MAX_FILE_SIZE", 4 * 1024)
+        source = RecordingUpload(os.urandom(64 * 1024))
+        with pytest.raises(ValueError):
+            _upload(service, source)
+        # Stopped right after crossing the limit, and nothing is left behind
+        assert source.bytes_read == 5 * 1024
+        assert os.listdir(service.EVIDENCE_STORAGE_PATH) == []
+
+    def test_declared_size_rejected_before_reading(self, service, monkeypatch):
+        monkeypatch.setattr(EvidenceFileService, "MAX_FILE_SIZE", 4 * 1024)
+        source = RecordingUpload(b"x" * 10, size=8 * 1024)
+        with pytest.raises(ValueError):
+            _upload(service, source)
+        assert source.bytes_read == 0
+
+    def test_disallowed_extension_not_read(self, service):
+        source = RecordingUpload(b"#!/bin/sh")
+        with pytest.raises(ValueError):
+            _upload(service, source, filename="run.sh")
+        assert source.bytes_read == 0
+
+    def test_sync_streams_and_bytes_still_accepted(self, service):
+        data = b"%PDF-1.4 report" * 200
+        from_file = _upload(service, io.BytesIO(data), filename="report.pdf")
+        from_bytes = asyncio.run(service.upload_evidence_file(data, "report.pdf", "ev-2", "user-1"))
+        assert from_file["file_hash"] == from_bytes["file_hash"] == hashlib.sha256(data).hexdigest()
+        assert from_bytes["mime_type"] == "application/pdf"
+
+
+class TestEvidenceObjectStore:
+    def test_identical_uploads_share_one_object(self, service):
+        data = os.urandom(8 * 1024)
+        first = _upload(service, RecordingUpload(data))
+        second = asyncio.run(service.upload_evidence_stream(RecordingUpload(data), "copy.mp4", "ev-2", "user-2"))
+
+        # Separate uploads (ids, paths, custody) over the same bytes on disk
+        assert first["file_id"] != second["file_id"]
+        assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+        assert os.path.samefile(first["file_path"], second["file_path"])
+        assert service.get_reference_count(first["file_hash"]) == 2
+        stats = service.get_storage_stats()
+        assert (stats["objects"], stats["references"]) == (1, 2)
+        assert (stats["stored_bytes"], stats["saved_bytes"]) == (len(data), len(data))
+        assert service.verify_file_integrity(second)
+
+    def test_object_removed_with_last_reference(self, service):
+        data = os.urandom(4096)
+        first = _upload(service, RecordingUpload(data))
+        second = _upload(service, RecordingUpload(data))
+
+        assert service.delete_evidence_file(first)
+        assert not os.path.exists(first["file_path"])
+        assert service.get_reference_count(first["file_hash"]) == 1
+        assert service.verify_file_integrity(second)
+
+        assert service.delete_evidence_file(second)
+        assert service.get_reference_count(first["file_hash"]) == 0
+        assert service.get_storage_stats()["objects"] == 0
+
+    def test_failed_upload_leaves_shared_object_alone(self, service, monkeypatch):
+        data = os.urandom(4096)
+        kept = _upload(service, RecordingUpload(data))
+        monkeypatch.setattr(evidence_file_service, "preview_kind", lambda *args: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            _upload(service, RecordingUpload(data))
+        assert service.get_reference_count(kept["file_hash"]) == 1
+        assert service.verify_file_integrity(kept)
@@ -0,0 +1,87 @@
+import pytest
+from datetime import datetime, timedelta
+
+from models import IoTEnvironmentalAlert, SensorType, ThreatSeverity
+from schemas import IoTEnvironmentalDataCreate, SensorAlertCreate, SensorAlertUpdate
+from services import iot_alert_state, sensor_rolling_stats
+from services.iot_environmental_service import IoTEnvironmentalService
+from services.push_notification_service import PushNotificationService
+from services.sensor_rolling_stats import SensorStatsEngine
+
+
+class TestThresholdHysteresis:
+    def test_status_stays_critical_inside_margin(self):
+        # band 40..60 -> 5% margin of 1.0
+        assert iot_alert_state.threshold_status(61.0, 40.0, 60.0, "normal") == "critical"
+        assert iot_alert_state.threshold_status(59.5, 40.0, 60.0, "critical") == "critical"
+        assert iot_alert_state.threshold_status(58.5, 40.0, 60.0, "critical") == "normal"
+        assert iot_alert_state.threshold_status(59.5, 40.0, 60.0, "normal") == "normal"
+        assert iot_alert_state.threshold_status(40.5, 40.0, 60.0, "critical") == "critical"
+
+
+class TestAlertRollup:
+    @pytest.fixture(autouse=True)
+    def quiet_stats(self, monkeypatch):
+        monkeypatch.setattr(sensor_rolling_stats, "_engine", SensorStatsEngine())
+
+    @pytest.fixture
+    def pushes(self, monkeypatch):
+        sent = []
+        monkeypatch.setattr(
+            PushNotificationService, "send_environmental_alert",
+            lambda self, **kwargs: sent.append(kwargs) or {}
+        )
+        return sent
+
+    @pytest.fixture
+    def service(self, db_session):
+        from services.system_admin_service import SystemAdminService
+        from schemas import PropertyCreate, PropertyType
+
+        SystemAdminService(db_session).create_property(
+            PropertyCreate(
+                property_name="Pool Prop", property_type=PropertyType.HOTEL,
+                address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC"
+            ),
+            creator_id="system"
+        )
+        return IoTEnvironmentalService(db_session)
+
+    def _reading(self, value, minute):
+        return IoTEnvironmentalDataCreate(
+            sensor_id="hum-pool", sensor_type=SensorType.HUMIDITY, location="Pool",
+            value=value, threshold_min=30.0, threshold_max=70.0,
+            timestamp=datetime(2024, 6, 1) + timedelta(minutes=minute)
+        )
+
+    def test_flapping_sensor_rolls_up_into_one_alert(self, service, db_session, pushes):
+        for minute, value in enumerate([71.0, 69.5, 71.0, 65.0, 72.0, 50.0, 73.0]):
+            service.record_sensor_data(self._reading(value, minute), None)
+
+        alert = db_session.query(IoTEnvironmentalAlert).one()
+        assert alert.alert_type == "humidity"
+        assert alert.severity == ThreatSeverity.CRITICAL
+        # 69.5 stays critical through hysteresis; 65 and 50 clear, so three crossings
+        assert alert.occurrence_count == 3
+        assert len(pushes) == 1
+
+    def test_resolved_alert_reopens_within_refire_interval(self, service, db_session, pushes, monkeypatch):
+        alert_payload = SensorAlertCreate(
+            sensor_id="hum-pool", alert_type="humidity", severity=ThreatSeverity.MEDIUM,
+            description="High humidity", location="Pool"
+        )
+        first = service.create_alert(alert_payload, None)
+        service.update_alert(str(first.alert_id), SensorAlertUpdate(resolved=True), None)
+
+        reopened = service.create_alert(alert_payload.model_copy(update={"severity": ThreatSeverity.HIGH}), None)
+        assert reopened.alert_id == first.alert_id
+        assert reopened.resolved is False
+        assert reopened.occurrence_count == 2
+        assert reopened.severity == ThreatSeverity.HIGH
+
+        service.update_alert(str(first.alert_id), SensorAlertUpdate(resolved=True), None)
+        monkeypatch.setattr(iot_alert_state, "ALERT_REFIRE_SECONDS", 0)
+        fresh = service.create_alert(alert_payload, None)
+        assert fresh.alert_id != first.alert_id
+        assert db_session.query(IoTEnvironmentalAlert).count() == 2
+        assert pushes == []
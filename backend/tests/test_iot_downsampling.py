@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+
+from models import SensorType
+from services import iot_environmental_service
+from services.iot_downsampling import lttb, lttb_indices
+from services.iot_environmental_service import IoTEnvironmentalService
+from services.iot_timeseries_store import get_sensor_reading_store
+
+
+class TestLTTB:
+    def test_keeps_endpoints_and_spikes(self):
+        x = np.arange(10000, dtype=float)
+        y = np.sin(x / 500.0)
+        y[4321] = 25.0
+        xs, ys = lttb(x, y, 200)
+        assert len(xs) == 200
+        assert xs[0] == 0 and xs[-1] == 9999
+        assert 25.0 in ys
+        assert np.all(np.diff(xs) > 0)
+
+    def test_short_series_unchanged(self):
+        assert list(lttb_indices(np.arange(5.0), np.arange(5.0), 10)) == [0, 1, 2, 3, 4]
+
+
+class TestSensorSeries:
+    @pytest.fixture
+    def service(self, db_session):
+        from services.system_admin_service import SystemAdminService
+        from schemas import PropertyCreate, PropertyType
+
+        prop = SystemAdminService(db_session).create_property(
+            PropertyCreate(
+                property_name="Chart Prop", property_type=PropertyType.HOTEL,
+                address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC"
+            ),
+            creator_id="system"
+        )
+        store = get_sensor_reading_store()
+        key = store.get_sensor_key(db_session, prop.property_id, "temp-1", SensorType.TEMPERATURE)
+        start = datetime(2024, 1, 25)
+        # 3000 readings, one every 10 minutes, spanning two monthly chunks
+        store.append(db_session, [
+            (key, start + timedelta(minutes=10 * i), 20.0 + (15.0 if i == 1500 else np.sin(i / 50.0)))
+            for i in range(3000)
+        ])
+        db_session.commit()
+        return IoTEnvironmentalService(db_session)
+
+    def _series(self, service, points, method):
+        result = service.get_sensor_series(["temp-1"], datetime(2024, 1, 1), datetime(2024, 3, 1), points, method, None)
+        assert len(result["series"]) == 1
+        return result["series"][0]
+
+    def test_lttb_from_raw_and_from_buckets(self, service, monkeypatch):
+        series = self._series(service, 300, "lttb")
+        assert series["raw_count"] == 3000
+        assert series["method"] == "lttb"
+        assert len(series["values"]) == 300
+        assert max(series["values"]) == pytest.approx(35.0)
+        assert series["timestamps"][0] == datetime(2024, 1, 25)
+
+        monkeypatch.setattr(iot_environmental_service, "LTTB_RAW_FACTOR", 1)
+        bucketed = self._series(service, 300, "lttb")
+        assert len(bucketed["values"]) <= 300
+        assert max(bucketed["values"]) > 25.0
+
+    def test_average_buckets_carry_min_max(self, service):
+        series = self._series(service, 100, "average")
+        assert series["method"] == "average"
+        assert 0 < len(series["values"]) <= 100
+        assert max(series["max_values"]) == pytest.approx(35.0)
+        assert all(low <= mean <= high for low, mean, high in zip(series["min_values"], series["values"], series["max_values"]))
+
+    def test_few_readings_returned_raw(self, service):
+        series = self._series(service, 5000, "average")
+        assert series["method"] == "raw"
+        assert len(series["values"]) == 3000
@@ -0,0 +1,123 @@
+import pytest
+from datetime import datetime
+
+from models import IoTSensorLatest, SensorType
+from schemas import IoTEnvironmentalDataCreate
+from services.iot_environmental_service import IoTEnvironmentalService
+from services.iot_timeseries_store import get_sensor_reading_store, chunk_name
+
+
+class TestIoTTimeSeriesStore:
+    @pytest.fixture
+    def property_id(self, db_session):
+        from services.system_admin_service import SystemAdminService
+        from schemas import PropertyCreate, PropertyType
+
+        prop = SystemAdminService(db_session).create_property(
+            PropertyCreate(
+                property_name="IoT Prop", property_type=PropertyType.HOTEL,
+                address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC"
+            ),
+            creator_id="system"
+        )
+        return prop.property_id
+
+    @pytest.fixture
+    def service(self, db_session):
+        return IoTEnvironmentalService(db_session)
+
+    def _record(self, service, sensor_id, sensor_type, value, timestamp, label="Pool"):
+        return service.record_sensor_data(
+            IoTEnvironmentalDataCreate(
+                sensor_id=sensor_id, sensor_type=sensor_type, location=label,
+                value=value, timestamp=timestamp
+            ),
+            None
+        )
+
+    def test_history_is_appended_not_overwritten(self, service, db_session, property_id):
+        self._record(service, "temp-1", SensorType.TEMPERATURE, 20.0, datetime(2024, 1, 31, 23, 0))
+        self._record(service, "temp-1", SensorType.TEMPERATURE, 22.0, datetime(2024, 2, 1, 1, 0))
+        self._record(service, "temp-1", SensorType.TEMPERATURE, 24.0, datetime(2024, 2, 1, 2, 0))
+        # Late, out-of-order reading does not move the latest value backwards
+        self._record(service, "temp-1", SensorType.TEMPERATURE, 10.0, datetime(2024, 1, 15, 0, 0))
+
+        store = get_sensor_reading_store()
+        assert chunk_name(datetime(2024, 1, 1)) in store.existing_chunks(db_session)
+        assert chunk_name(datetime(2024, 2, 1)) in store.existing_chunks(db_session)
+
+        latest = db_session.query(IoTSensorLatest).filter(IoTSensorLatest.sensor_id == "temp-1").one()
+        assert latest.value == 24.0
+
+        readings = store.select_readings(db_session, [latest.sensor_key], datetime(2024, 1, 1), datetime(2024, 3, 1))
+        assert [value for _, _, value in readings] == [10.0, 20.0, 22.0, 24.0]
+
+    def test_report_averages_history(self, service, property_id):
+        for hour, value in enumerate([20.0, 22.0, 24.0]):
+            self._record(service, "temp-1", SensorType.TEMPERATURE, value, datetime(2024, 3, 1, hour))
+        self._record(service, "hum-1", SensorType.HUMIDITY, 50.0, datetime(2024, 3, 1, 1), label="Lobby")
+        self._record(service, "hum-1", SensorType.HUMIDITY, 70.0, datetime(2024, 3, 1, 2), label="Lobby")
+
+        report = service.get_environmental_report(datetime(2024, 3, 1), datetime(2024, 3, 2), None, None)
+        assert report == {"temperature": 22.0, "humidity": 60.0, "air_quality": 0.0}
+
+        window = service.get_environmental_report(datetime(2024, 3, 1, 1), datetime(2024, 3, 1, 3), None, None)
+        assert window["temperature"] == 23.0
+
+        pool_only = service.get_environmental_report(datetime(2024, 3, 1), datetime(2024, 3, 2), "Pool", None)
+        assert pool_only["humidity"] == 0.0
+        assert pool_only["temperature"] == 22.0
+
+    def test_batch_ingest_appends_all_and_keeps_newest(self, service, db_session, property_id):
+        rows = IoTEnvironmentalService.parse_sensor_batch_csv(
+            "sensor_id,sensor_type,value,timestamp\n"
+            "temp-1,temperature,21.5,2024-04-01T00:00:00\n"
+            "temp-1,temperature,23.5,2024-04-01T02:00:00\n"
+            "temp-1,temperature,22.5,2024-04-01T01:00:00\n"
+            "hum-1,humidity,55,2024-04-01T00:30:00\n"
+        )
+        readings = [IoTEnvironmentalDataCreate(**row) for row in rows]
+
+        result = service.record_sensor_data_batch(readings, None)
+        assert result["accepted"] == 4
+        assert {sensor["sensor_id"] for sensor in result["sensors"]} == {"temp-1", "hum-1"}
+
+        latest = db_session.query(IoTSensorLatest).filter(IoTSensorLatest.sensor_id == "temp-1").one()
+        assert latest.value == 23.5
+        store = get_sensor_reading_store()
+        readings = store.select_readings(db_session, [latest.sensor_key], datetime(2024, 4, 1), datetime(2024, 4, 2))
+        assert [value for _, _, value in readings] == [21.5, 22.5, 23.5]
+
+        sensors = service.list_sensor_readings(None)
+        assert {sensor.sensor_id: sensor.value for sensor in sensors} == {"temp-1": 23.5, "hum-1": 55.0}
+
+    def test_csv_batch_requires_header(self):
+        from fastapi import HTTPException
+
+        with pytest.raises(HTTPException):
+            IoTEnvironmentalService.parse_sensor_batch_csv("temp-1,temperature,21.5\n")
+
+    def test_sensor_key_lookup_updates_type_only_when_changed(self, db_session, property_id):
+        from sqlalchemy import event
+
+        store = get_sensor_reading_store()
+        key = store.get_sensor_key(db_session, property_id, "multi-1", SensorType.TEMPERATURE)
+        updates = []
+
+        def count_updates(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("UPDATE"):
+                updates.append(statement)
+
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", count_updates)
+        try:
+            # A cold cache (another process) with the same type issues no UPDATE
+            store._sensor_keys.clear()
+            assert store.get_sensor_key(db_session, property_id, "multi-1", SensorType.TEMPERATURE) == key
+            assert updates == []
+            assert store.get_sensor_key(db_session, property_id, "multi-1", SensorType.HUMIDITY) == key
+            assert len(updates) == 1
+        finally:
+            event.remove(engine, "before_cursor_execute", count_updates)
+        latest = db_session.query(IoTSensorLatest).filter(IoTSensorLatest.sensor_key == key).one()
+        assert latest.sensor_type == SensorType.HUMIDITY
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from api import media_response as media
+from api.media_response import IMMUTABLE_CACHE_CONTROL, media_response
+from services.evidence_file_service import EvidenceFileService
+
+CONTENT = bytes(range(256)) * 4096  # 1 MB
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(CONTENT)
+    return path
+
+
+@pytest.fixture
+def client(clip):
+    app = FastAPI()
+
+    @app.get("/evidence")
+    def evidence(request: Request):
+        return media_response(
+            request, str(clip), media_type="video/mp4", filename="clip.mp4",
+            content_hash=hashlib.sha256(CONTENT).hexdigest(), cache_control=IMMUTABLE_CACHE_CONTROL,
+        )
+
+    @app.get("/export")
+    def export(request: Request):
+        return media_response(request, str(clip), media_type="video/mp4")
+
+    @app.get("/missing")
+    def missing(request: Request):
+        return media_response(request, str(clip) + ".gone")
+
+    return TestClient(app)
+
+
+class TestMediaResponse:
+    def test_strong_etag_from_content_hash(self, client):
+        response = client.get("/evidence")
+        assert response.status_code == 200
+        assert response.content == CONTENT
+        assert response.headers["etag"] == f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["accept-ranges"] == "bytes"
+        # Without a stored hash the validator is weak
+        assert client.get("/export").headers["etag"].startswith('W/"')
+
+    def test_conditional_get_answers_not_modified(self, client):
+        first = client.get("/evidence")
+        etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+        for headers in ({"If-None-Match": etag}, {"If-None-Match": f'"other", W/{etag}'},
+                        {"If-Modified-Since": last_modified}):
+            response = client.get("/evidence", headers=headers)
+            assert response.status_code == 304
+            assert response.content == b""
+            assert response.headers["etag"] == etag
+        assert client.get("/evidence", headers={"If-None-Match": '"other"'}).status_code == 200
+        # If-None-Match wins over If-Modified-Since
+        assert client.get(
+            "/evidence", headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified}
+        ).status_code == 200
+
+    def test_byte_ranges_for_scrubbing(self, client):
+        response = client.get("/evidence", headers={"Range": "bytes=1000-1999"})
+        assert response.status_code == 206
+        assert response.content == CONTENT[1000:2000]
+        assert response.headers["content-range"] == f"bytes 1000-1999/{len(CONTENT)}"
+
+        tail = client.get("/evidence", headers={"Range": "bytes=600000-"})
+        assert tail.content == CONTENT[600000:]
+
+        etag = tail.headers["etag"]
+        assert client.get("/evidence", headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+        # A stale validator gets the whole (changed) file instead of a mismatched slice
+        assert client.get("/evidence", headers={"Range": "bytes=0-9", "If-Range": '"old"'}).status_code == 200
+        assert client.get("/evidence", headers={"Range": f"bytes={len(CONTENT)}-"}).status_code == 416
+
+    def test_offload_to_web_server(self, client, clip, monkeypatch):
+        monkeypatch.setattr(media, "MEDIA_OFFLOAD_ROOT", clip.parent)
+        monkeypatch.setattr(media, "MEDIA_OFFLOAD", "x-accel")
+        response = client.get("/evidence")
+        assert response.status_code == 200
+        assert response.content == b""
+        assert response.headers["x-accel-redirect"] == "/protected-media/clip.mp4"
+        assert response.headers["content-type"] == "video/mp4"
+        assert 'filename="clip.mp4"' in response.headers["content-disposition"]
+        assert response.headers["etag"] == f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+        # Conditional requests are still answered here
+        assert client.get("/evidence", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+        monkeypatch.setattr(media, "MEDIA_OFFLOAD", "x-sendfile")
+        assert client.get("/evidence").headers["x-sendfile"] == str(clip.resolve())
+
+        # Files outside the offload root are served by Python
+        monkeypatch.setattr(media, "MEDIA_OFFLOAD_ROOT", clip.parent / "elsewhere")
+        assert client.get("/evidence").content == CONTENT
+
+    def test_missing_file_is_404(self, client):
+        assert client.get("/missing").status_code == 404
+
+
+class TestIntegrityCheckCache:
+    def test_unchanged_file_is_not_rehashed(self, clip, monkeypatch):
+        service = EvidenceFileService.__new__(EvidenceFileService)
+        service.EVIDENCE_STORAGE_PATH = str(clip.parent / "evidence")
+        service.THUMBNAIL_STORAGE_PATH = str(clip.parent / "thumbnails")
+        service.__init__()
+        record = {"file_id": "f", "file_path": str(clip), "file_hash": hashlib.sha256(CONTENT).hexdigest()}
+        hashed = []
+        original = EvidenceFileService._calculate_file_hash
+        monkeypatch.setattr(
+            EvidenceFileService, "_calculate_file_hash", lambda self, path: hashed.append(path) or original(self, path)
+        )
+
+        assert service.verify_file_integrity(record, trust_unchanged=True)
+        assert service.verify_file_integrity(record, trust_unchanged=True)
+        assert len(hashed) == 1
+        # Full checks always re-read
+        assert service.verify_file_integrity(record)
+        assert len(hashed) == 2
+
+        clip.write_bytes(CONTENT[::-1])
+        os.utime(clip, ns=(0, 10 ** 9))
+        assert not service.verify_file_integrity(record, trust_unchanged=True)
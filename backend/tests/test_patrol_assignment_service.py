@@ -0,0 +1,158 @@
+import itertools
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+from api import auth_dependencies
+from api.patrol_endpoints import _accessible_property_id
+from models import AgentLocation, Patrol, PatrolRoute, PatrolStatus, PatrolTemplate, Property, User, UserRole, UserRoleEnum
+from services.patrol_assignment_service import PatrolAssignmentEngine, get_patrol_assignment_engine, min_cost_assignment
+from services.patrol_service import PatrolService
+
+MONDAY = date(2024, 1, 1)
+
+
+class TestMinCostAssignment:
+    @pytest.mark.parametrize("shape", [(4, 4), (3, 5), (6, 2)])
+    def test_matches_brute_force(self, shape):
+        rng = np.random.default_rng(sum(shape))
+        for _ in range(20):
+            cost = rng.random(shape) * 10
+            rows, cols = min_cost_assignment(cost)
+            n_rows, n_cols = shape
+            if n_rows >= n_cols:
+                best = min(sum(cost[p[j], j] for j in range(n_cols)) for p in itertools.permutations(range(n_rows), n_cols))
+            else:
+                best = min(sum(cost[i, p[i]] for i in range(n_rows)) for p in itertools.permutations(range(n_cols), n_rows))
+            assert len(set(rows.tolist())) == len(rows) == min(shape)
+            assert len(set(cols.tolist())) == len(cols)
+            assert cost[rows, cols].sum() == pytest.approx(best)
+
+
+class TestShiftAssignment:
+    @pytest.fixture
+    def shift(self, db_session):
+        prop = Property(property_name="Assign Prop", address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC")
+        db_session.add(prop)
+        db_session.flush()
+
+        def officer(name, specializations):
+            user = User(email=f"{name}@example.com", username=name, password_hash="x", first_name=name, last_name="O")
+            db_session.add(user)
+            db_session.flush()
+            db_session.add(UserRole(
+                user_id=user.user_id, property_id=prop.property_id, role_name=UserRoleEnum.SECURITY_OFFICER,
+                permissions={"specializations": specializations}
+            ))
+            return user.user_id
+
+        handler = officer("handler", ["k9"])
+        nearby = officer("nearby", [])
+        tired = officer("tired", ["k9"])
+
+        def template(name, lat, lng, required, days=("monday",)):
+            route = PatrolRoute(
+                property_id=prop.property_id, name=f"{name} route",
+                checkpoints=[{"id": "c1", "coordinates": {"lat": lat, "lng": lng}}]
+            )
+            db_session.add(route)
+            db_session.flush()
+            item = PatrolTemplate(
+                property_id=prop.property_id, name=name, route_id=route.route_id,
+                schedule={"startTime": "08:00", "endTime": "12:00", "days": list(days),
+                          "requiredSpecializations": required}
+            )
+            db_session.add(item)
+            db_session.flush()
+            return item.template_id
+
+        k9_patrol = template("k9 sweep", 40.0, -73.0, ["k9"])
+        lobby_patrol = template("lobby", 40.01, -73.0, [])
+        template("weekend", 40.0, -73.0, [], days=("saturday",))
+
+        now = datetime.utcnow()
+        db_session.add(AgentLocation(agent_id=nearby, latitude=40.0101, longitude=-73.0, timestamp=now))
+        db_session.add(AgentLocation(agent_id=handler, latitude=40.0, longitude=-73.0, timestamp=now))
+        db_session.add(Patrol(
+            property_id=prop.property_id, guard_id=tired, route={}, status=PatrolStatus.ACTIVE,
+            started_at=now - timedelta(hours=11)
+        ))
+        db_session.commit()
+        return {
+            "property_id": prop.property_id, "handler": handler, "nearby": nearby, "tired": tired,
+            "k9": k9_patrol, "lobby": lobby_patrol,
+        }
+
+    def test_solves_whole_shift(self, db_session, shift):
+        result = PatrolAssignmentEngine().solve_shift(db_session, shift["property_id"], MONDAY, "07:00", "15:00")
+        assigned = {a["patrolId"]: a["officerId"] for a in result["assignments"]}
+        assert assigned == {shift["k9"]: shift["handler"], shift["lobby"]: shift["nearby"]}
+        assert result["unassignedPatrols"] == []
+        k9 = next(a for a in result["assignments"] if a["patrolId"] == shift["k9"])
+        assert "Has all required specializations" in k9["reasoning"]
+
+    def test_cost_components(self, db_session, shift):
+        engine = PatrolAssignmentEngine()
+        inputs = engine.shift_inputs(db_session, shift["property_id"], MONDAY)
+        officers = [o["id"] for o in inputs.officers]
+        tired = officers.index(shift["tired"])
+        assert inputs.active_patrols[tired] == 1
+        assert inputs.hours_worked[tired] == pytest.approx(11, abs=0.01)
+        components = engine.cost_components(inputs)
+        nearby = officers.index(shift["nearby"])
+        assert components["specialization"][nearby].tolist() == [40.0, 0.0]
+        assert components["total"][tired].min() > components["total"][nearby].max() - 40.0
+        # Inputs are cached per shift
+        assert engine.shift_inputs(db_session, shift["property_id"], MONDAY) is inputs
+
+    def test_overnight_windows_and_bad_times(self, db_session, shift):
+        engine = PatrolAssignmentEngine()
+        night = db_session.query(PatrolTemplate).filter(PatrolTemplate.template_id == shift["lobby"]).one()
+        night.schedule = {**night.schedule, "startTime": "22:00", "endTime": "06:00"}
+        db_session.commit()
+
+        late = engine.solve_shift(db_session, shift["property_id"], MONDAY, "23:00", "07:00")
+        assert {a["patrolId"] for a in late["assignments"]} == {shift["lobby"]}
+        # Monday's night patrol starts at 22:00, not in the early hours of Monday
+        early = engine.solve_shift(db_session, shift["property_id"], MONDAY, "05:00", "09:00")
+        assert {a["patrolId"] for a in early["assignments"]} == {shift["k9"]}
+        with pytest.raises(ValueError):
+            engine.solve_shift(db_session, shift["property_id"], MONDAY, "8am", "12:00")
+
+    def test_template_writes_invalidate_cached_inputs(self, db_session, shift):
+        engine = get_patrol_assignment_engine()
+        inputs = engine.shift_inputs(db_session, shift["property_id"], MONDAY)
+        assert engine.shift_inputs(db_session, shift["property_id"], MONDAY) is inputs
+        PatrolService._invalidate_shift_inputs(shift["property_id"])
+        assert engine.shift_inputs(db_session, shift["property_id"], MONDAY) is not inputs
+
+    def test_rank_officers_for_ad_hoc_patrol(self, db_session, shift):
+        ranked = PatrolAssignmentEngine().rank_officers(db_session, shift["property_id"], {
+            "requiredSpecializations": ["k9"],
+            "checkpoints": [{"coordinates": {"lat": 40.0, "lng": -73.0}}],
+        })
+        # The tired officer has the skill but an active patrol and 11 hours on duty
+        assert [m["officerId"] for m in ranked] == [shift["handler"], shift["nearby"], shift["tired"]]
+        assert ranked[0]["matchScore"] > ranked[-1]["matchScore"]
+
+
+def test_endpoints_only_read_accessible_properties(db_session, monkeypatch):
+    monkeypatch.setattr(auth_dependencies, "SessionLocal", sessionmaker(bind=db_session.get_bind()))
+    own, other = (
+        Property(property_name=name, address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC")
+        for name in ("Own", "Other")
+    )
+    user = User(email="sup@example.com", username="sup", password_hash="x", first_name="S", last_name="U")
+    db_session.add_all([own, other, user])
+    db_session.flush()
+    db_session.add(UserRole(user_id=user.user_id, property_id=own.property_id, role_name=UserRoleEnum.SECURITY_OFFICER))
+    db_session.commit()
+
+    assert _accessible_property_id({}, user, db_session) == own.property_id
+    assert _accessible_property_id({"property_id": own.property_id}, user, db_session) == own.property_id
+    with pytest.raises(HTTPException) as denied:
+        _accessible_property_id({"property_id": other.property_id}, user, db_session)
+    assert denied.value.status_code == 403
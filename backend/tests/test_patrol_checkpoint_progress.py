@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+
+from models import Patrol, PatrolCheckpointProgress, PatrolStatus, Property, User, UserRole, UserRoleEnum
+from services import patrol_service
+from services.patrol_service import PatrolService
+
+CHECKPOINTS = [{"id": "lobby", "name": "Lobby"}, {"id": "roof", "name": "Roof"}]
+
+
+@pytest.fixture
+def patrol(db_session, monkeypatch):
+    monkeypatch.setattr(patrol_service, "SessionLocal", lambda: db_session)
+    prop = Property(
+        property_name="Progress Prop", address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC"
+    )
+    user = User(email="guard@example.com", username="guard", password_hash="x", first_name="Gu", last_name="Ard")
+    db_session.add_all([prop, user])
+    db_session.flush()
+    db_session.add(UserRole(user_id=user.user_id, property_id=prop.property_id, role_name=UserRoleEnum.MANAGER))
+    item = Patrol(
+        property_id=prop.property_id, guard_id=user.user_id, route={}, status=PatrolStatus.ACTIVE,
+        checkpoints=list(CHECKPOINTS)
+    )
+    db_session.add(item)
+    db_session.commit()
+    return item
+
+
+def _check_in(patrol, checkpoint_id, **payload):
+    return asyncio.run(PatrolService.check_in_checkpoint(patrol.patrol_id, checkpoint_id, payload, patrol.guard_id))
+
+
+class TestCheckpointProgress:
+    def test_check_in_inserts_progress_row(self, db_session, patrol):
+        response = _check_in(patrol, "lobby", notes="all clear", completed_at="2024-01-01T08:00:00Z")
+
+        rows = db_session.query(PatrolCheckpointProgress).all()
+        assert [(row.checkpoint_id, row.notes) for row in rows] == [("lobby", "all clear")]
+        # The patrol JSON itself is no longer rewritten
+        stored = db_session.query(Patrol).filter(Patrol.patrol_id == patrol.patrol_id).one()
+        assert stored.checkpoints == CHECKPOINTS
+
+        lobby, roof = response.checkpoints
+        assert lobby["status"] == "completed"
+        assert lobby["completedAt"].startswith("2024-01-01T08:00:00")
+        assert lobby["completedBy"] == patrol.guard_id
+        assert roof == CHECKPOINTS[1]
+
+    def test_repeated_check_in_is_idempotent(self, db_session, patrol):
+        _check_in(patrol, "lobby", request_id="req-1")
+        _check_in(patrol, "lobby", request_id="req-1")
+        _check_in(patrol, "lobby")
+        # A retried request id is answered from the stored row even for another checkpoint
+        response = _check_in(patrol, "roof", request_id="req-1")
+
+        assert db_session.query(PatrolCheckpointProgress).count() == 1
+        assert [cp.get("status") for cp in response.checkpoints] == ["completed", None]
+
+    def test_get_patrols_loads_progress_in_one_query(self, db_session, patrol, query_counter):
+        _check_in(patrol, "roof")
+        db_session.expire_all()
+
+        query_counter.reset()
+        patrols = asyncio.run(PatrolService.get_patrols(patrol.guard_id))
+        assert [cp.get("status") for cp in patrols[0].checkpoints] == [None, "completed"]
+        assert patrols[0].guard_name == "Gu Ard"
+        # role, patrols, progress, guard, property
+        assert query_counter.count <= 5
+
+    def test_unknown_checkpoint_rejected(self, db_session, patrol):
+        with pytest.raises(ValueError, match="Checkpoint not found"):
+            _check_in(patrol, "basement")
+        assert db_session.query(PatrolCheckpointProgress).count() == 0
+
+    def test_inactive_patrol_rejected(self, db_session, patrol):
+        patrol.status = PatrolStatus.COMPLETED
+        db_session.commit()
+        with pytest.raises(ValueError, match="only allowed for active patrols"):
+            _check_in(patrol, "lobby")
@@ -0,0 +1,100 @@
+import itertools
+import time
+
+import numpy as np
+
+from services.patrol_route_optimizer import PatrolRouteOptimizer, travel_time_matrix
+
+
+def _checkpoint(i, lat, lng, floor=0, **extra):
+    return {"id": f"cp{i}", "coordinates": {"lat": lat, "lng": lng}, "floor": floor, "estimatedTime": 1, **extra}
+
+
+def _path_time(checkpoints, sequence):
+    index = {cp["id"]: cp for cp in checkpoints}
+    ordered = [index[cp_id] for cp_id in sequence]
+    lat = np.array([cp["coordinates"]["lat"] for cp in ordered])
+    lng = np.array([cp["coordinates"]["lng"] for cp in ordered])
+    floors = np.array([float(cp["floor"]) for cp in ordered])
+    travel = travel_time_matrix(lat, lng, floors)
+    return float(sum(travel[k, k + 1] for k in range(len(ordered) - 1)))
+
+
+class TestPatrolRouteOptimizer:
+    def test_matches_brute_force_on_small_route(self):
+        rng = np.random.default_rng(7)
+        checkpoints = [_checkpoint(i, 40 + rng.random() * 0.002, -73 + rng.random() * 0.002) for i in range(8)]
+        result = PatrolRouteOptimizer().optimize({"id": "r1", "checkpoints": checkpoints})
+
+        assert result["optimizedSequence"][0] == "cp0"
+        assert sorted(result["optimizedSequence"]) == sorted(cp["id"] for cp in checkpoints)
+        best = min(
+            _path_time(checkpoints, ["cp0"] + [f"cp{i}" for i in perm])
+            for perm in itertools.permutations(range(1, 8))
+        )
+        assert _path_time(checkpoints, result["optimizedSequence"]) <= best * 1.0001
+        assert result["optimizedDuration"] <= result["originalDuration"]
+
+    def test_floor_changes_are_grouped(self):
+        # Alternating floors in the input; the optimized route changes floor once
+        checkpoints = [_checkpoint(i, 40.0, -73 + i * 0.00001, floor=i % 2) for i in range(10)]
+        result = PatrolRouteOptimizer().optimize({"id": "r2", "checkpoints": checkpoints})
+        floors = [int(sequence_id[2:]) % 2 for sequence_id in result["optimizedSequence"]]
+        assert sum(a != b for a, b in zip(floors, floors[1:])) == 1
+        assert result["timeSaved"] > 0
+
+    def test_critical_checkpoint_time_window(self):
+        # A line of checkpoints heading east; the critical one is at the far east end,
+        # ~11 minutes' walk from the start but ~30 minutes when visiting the others first
+        checkpoints = [_checkpoint(i, 40.0, -73 + i * 0.0005) for i in range(20)]
+        checkpoints.append(_checkpoint(20, 40.0, -73 + 20 * 0.0005, isCritical=True))
+        plain = PatrolRouteOptimizer().optimize(
+            {"id": "r3", "checkpoints": checkpoints}, {"criticalWithinMinutes": 1000}
+        )
+        assert plain["optimizedSequence"][-1] == "cp20"
+
+        urgent = PatrolRouteOptimizer().optimize(
+            {"id": "r3", "checkpoints": checkpoints}, {"criticalWithinMinutes": 15}
+        )
+        assert urgent["optimizedSequence"][-1] != "cp20"
+        assert urgent["lateCheckpoints"] == []
+        assert urgent["optimizedDuration"] > plain["optimizedDuration"]
+
+    def test_return_to_start_does_not_revisit_start_window(self):
+        checkpoints = [_checkpoint(i, 40 + i * 0.0003, -73.0) for i in range(6)]
+        checkpoints[0].update(isCritical=True, timeWindow={"start": 0, "end": 5})
+        result = PatrolRouteOptimizer().optimize(
+            {"id": "r7", "checkpoints": checkpoints}, {"returnToStart": True}
+        )
+        assert result["lateCheckpoints"] == []
+        assert "All 1 time-windowed checkpoints reached on time" in result["reasoning"]
+        # Walk out and back, with each checkpoint's service time counted once
+        tour = _path_time(checkpoints, result["optimizedSequence"] + ["cp0"])
+        assert result["optimizedDuration"] == round((tour + 6 * 60) / 60, 1)
+
+    def test_results_memoized_per_version(self):
+        checkpoints = [_checkpoint(i, 40 + i * 0.0001, -73.0) for i in range(5)]
+        optimizer = PatrolRouteOptimizer()
+        assert optimizer.optimize({"id": "r4", "version": 1, "checkpoints": checkpoints})["cached"] is False
+        assert optimizer.optimize({"id": "r4", "version": 1, "checkpoints": checkpoints})["cached"] is True
+        assert optimizer.optimize({"id": "r4", "version": 2, "checkpoints": checkpoints})["cached"] is False
+
+    def test_checkpoints_without_coordinates_kept_at_end(self):
+        checkpoints = [_checkpoint(i, 40 + i * 0.0001, -73.0) for i in range(4)]
+        checkpoints.insert(1, {"id": "manual", "estimatedTime": 2})
+        result = PatrolRouteOptimizer().optimize({"id": "r5", "checkpoints": checkpoints})
+        assert result["optimizedSequence"][-1] == "manual"
+        assert len(result["optimizedSequence"]) == 5
+
+    def test_large_route_within_budget(self):
+        rng = np.random.default_rng(3)
+        checkpoints = [
+            _checkpoint(i, 40 + rng.random() * 0.005, -73 + rng.random() * 0.005, floor=int(rng.integers(0, 5)),
+                        isCritical=bool(rng.random() < 0.02))
+            for i in range(500)
+        ]
+        started = time.perf_counter()
+        result = PatrolRouteOptimizer().optimize({"id": "r6", "checkpoints": checkpoints})
+        assert time.perf_counter() - started < 0.4
+        assert len(set(result["optimizedSequence"])) == 500
+        assert result["optimizedDuration"] < result["originalDuration"] / 2
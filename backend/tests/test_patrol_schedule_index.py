@@ -0,0 +1,133 @@
+import asyncio
+import random
+import pytest
+from fastapi import HTTPException
+
+from models import PatrolRoute, Property, User
+from schemas import PatrolTemplateCreate, PatrolTemplateUpdate
+from services import patrol_service
+from services.patrol_schedule_index import IntervalTree, ScheduleEntry
+from services.patrol_service import PatrolService
+
+
+O1 = "00000000-0000-0000-0000-000000000001"
+O2 = "00000000-0000-0000-0000-000000000002"
+
+
+def _schedule(start, end, days=("monday",)):
+    return {"startTime": start, "endTime": end, "days": list(days)}
+
+
+class TestIntervalTree:
+    def test_matches_pairwise_scan(self):
+        rng = random.Random(5)
+        entries = []
+        for i in range(300):
+            start = rng.randrange(0, 1400)
+            end = rng.randrange(start + 1, 1441)
+            entries.append(ScheduleEntry(
+                f"t{i}", "r", [], _schedule(f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}")
+            ))
+        tree = IntervalTree(entries)
+        for _ in range(200):
+            start = rng.randrange(0, 1400)
+            end = rng.randrange(start + 1, 1441)
+            expected = {e.template_id for e in entries if max(e.start, start) < min(e.end, end)}
+            assert {e.template_id for e in tree.overlapping(start, end)} == expected
+
+    def test_touching_windows_do_not_overlap(self):
+        tree = IntervalTree([ScheduleEntry("a", "r", [], _schedule("08:00", "12:00"))])
+        assert list(tree.overlapping(12 * 60, 13 * 60)) == []
+        assert list(tree.overlapping(7 * 60, 8 * 60)) == []
+        assert len(list(tree.overlapping(11 * 60, 13 * 60))) == 1
+
+
+class TestScheduleConflicts:
+    @pytest.fixture
+    def setup(self, db_session, monkeypatch):
+        monkeypatch.setattr(patrol_service, "SessionLocal", lambda: db_session)
+        prop = Property(property_name="Sched Prop", address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC")
+        user = User(email="sched@example.com", username="sched", password_hash="x", first_name="S", last_name="C")
+        db_session.add_all([prop, user])
+        db_session.flush()
+        routes = [PatrolRoute(property_id=prop.property_id, name=f"route {i}", checkpoints=[]) for i in range(2)]
+        db_session.add_all(routes)
+        db_session.commit()
+        return {
+            "property_id": prop.property_id, "user_id": user.user_id,
+            "route_a": routes[0].route_id, "route_b": routes[1].route_id,
+        }
+
+    def _create(self, setup, route, schedule, officers=()):
+        return asyncio.run(PatrolService.create_template(PatrolTemplateCreate(
+            property_id=setup["property_id"], name="t", route_id=route, schedule=schedule,
+            assigned_officers=list(officers)
+        ), setup["user_id"]))
+
+    def test_create_checks_route_and_officer_overlap(self, setup):
+        self._create(setup, setup["route_a"], _schedule("08:00", "12:00", ["monday", "tuesday"]), [O1])
+
+        with pytest.raises(HTTPException, match="conflicts"):
+            self._create(setup, setup["route_a"], _schedule("11:00", "13:00", ["tuesday"]))
+        with pytest.raises(HTTPException, match="conflicts"):
+            self._create(setup, setup["route_b"], _schedule("09:00", "10:00"), [O1])
+        # Other route and officer, another day, or back-to-back windows are fine
+        self._create(setup, setup["route_b"], _schedule("09:00", "10:00"), [O2])
+        self._create(setup, setup["route_a"], _schedule("08:00", "12:00", ["friday"]), [O1])
+        self._create(setup, setup["route_a"], _schedule("12:00", "14:00", ["monday"]), [O1])
+
+    def test_index_invalidated_on_template_writes(self, setup):
+        first = self._create(setup, setup["route_a"], _schedule("08:00", "12:00"))
+        with pytest.raises(HTTPException):
+            self._create(setup, setup["route_a"], _schedule("10:00", "11:00"))
+
+        asyncio.run(PatrolService.update_template(
+            str(first.template_id), PatrolTemplateUpdate(schedule=_schedule("13:00", "15:00")), setup["user_id"]
+        ))
+        self._create(setup, setup["route_a"], _schedule("10:00", "11:00"))
+
+        asyncio.run(PatrolService.delete_template(str(first.template_id), setup["user_id"]))
+        self._create(setup, setup["route_a"], _schedule("14:00", "16:00"))
+
+    def test_update_does_not_conflict_with_itself(self, setup):
+        first = self._create(setup, setup["route_a"], _schedule("08:00", "12:00"))
+        updated = asyncio.run(PatrolService.update_template(
+            str(first.template_id), PatrolTemplateUpdate(schedule=_schedule("09:00", "12:00")), setup["user_id"]
+        ))
+        assert updated.schedule["startTime"] == "09:00"
+
+    def test_validate_week(self, db_session, setup):
+        stored = self._create(setup, setup["route_a"], _schedule("08:00", "12:00"), [O1])
+        result = PatrolService.validate_week_schedule(db_session, setup["property_id"], [
+            # Replaces the stored template, so only the batch is compared
+            {"template_id": str(stored.template_id), "route_id": setup["route_a"], "schedule": _schedule("06:00", "07:00")},
+            {"name": "night", "route_id": setup["route_b"], "assigned_officers": [O1], "schedule": _schedule("09:00", "10:00")},
+            {"name": "double", "route_id": setup["route_b"], "schedule": _schedule("09:30", "11:00", ["monday"])},
+            {"name": "broken", "route_id": setup["route_b"], "schedule": _schedule("10:00", "09:00")},
+        ])
+
+        assert result["valid"] is False
+        replaced, night, double, broken = result["templates"]
+        assert replaced["conflicts"] == [] and replaced["errors"] == []
+        assert [c["index"] for c in night["conflicts"]] == [2]
+        assert [c["index"] for c in double["conflicts"]] == [1]
+        assert double["conflicts"][0]["shared"] == ["route"]
+        assert broken["errors"] == ["Schedule end time must be after start time"]
+
+        result = PatrolService.validate_week_schedule(db_session, setup["property_id"], [
+            {"route_id": setup["route_b"], "assigned_officers": [O1], "schedule": _schedule("11:00", "13:00")},
+        ])
+        assert result["templates"][0]["conflicts"][0]["templateId"] == str(stored.template_id)
+        assert result["templates"][0]["conflicts"][0]["shared"] == [f"officers: {O1}"]
+
+    def test_validate_week_rejects_malformed_items(self, db_session, setup):
+        with pytest.raises(HTTPException) as rejected:
+            PatrolService.validate_week_schedule(db_session, setup["property_id"], ["monday"])
+        assert rejected.value.status_code == 400
+
+        result = PatrolService.validate_week_schedule(db_session, setup["property_id"], [
+            {"route_id": setup["route_a"], "schedule": ["08:00", "12:00"]},
+            {"route_id": setup["route_a"], "assigned_officers": O1, "schedule": _schedule("08:00", "12:00")},
+        ])
+        assert result["templates"][0]["errors"] == ["Schedule must be an object"]
+        assert result["templates"][1]["errors"] == ["assigned_officers must be a list"]
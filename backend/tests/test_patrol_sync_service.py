@@ -0,0 +1,191 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+from models import (
+    AgentLocation, AgentStatus, Patrol, PatrolCheckpointProgress, PatrolStatus, PatrolSubmission,
+    PatrolSyncCursor, Property, SystemLog, User
+)
+from services.agent_location_buffer import AgentLocationBuffer
+from services.patrol_service import PatrolService
+from services.patrol_sync_service import PatrolSyncService
+
+CHECKPOINTS = [{"id": "lobby"}, {"id": "roof"}, {"id": "garage"}]
+
+
+@pytest.fixture
+def patrol(db_session):
+    prop = Property(property_name="Sync Prop", address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC")
+    user = User(email="agent@example.com", username="agent", password_hash="x", first_name="A", last_name="G")
+    db_session.add_all([prop, user])
+    db_session.flush()
+    item = Patrol(property_id=prop.property_id, guard_id=user.user_id, route={}, checkpoints=list(CHECKPOINTS))
+    db_session.add(item)
+    db_session.commit()
+    return item
+
+
+@pytest.fixture
+def locations(db_session, tmp_path):
+    return AgentLocationBuffer(session_factory=sessionmaker(bind=db_session.get_bind()), log_dir=tmp_path, fsync=False)
+
+
+def _service(db_session, patrol, locations=None):
+    return PatrolSyncService(
+        db_session, device_id="phone-1", agent_id=patrol.guard_id, user_id=patrol.guard_id, location_buffer=locations
+    )
+
+
+def _journal(patrol_id):
+    return [
+        {"seq": 1, "type": "status", "patrol_id": patrol_id, "status": "active", "timestamp": "2024-01-01T08:00:00Z"},
+        {"seq": 2, "type": "location", "patrol_id": patrol_id, "latitude": 40.0, "longitude": -73.0,
+         "timestamp": "2024-01-01T08:01:00Z"},
+        {"seq": 3, "type": "check_in", "patrol_id": patrol_id, "checkpoint_id": "lobby", "notes": "ok"},
+        {"seq": 4, "type": "observation", "patrol_id": patrol_id, "observations": {"door": "open"}},
+        {"seq": 5, "type": "check_in", "patrol_id": patrol_id, "checkpoint_id": "roof"},
+        {"seq": 6, "type": "location", "latitude": 40.1, "longitude": -73.1, "timestamp": "2024-01-01T08:30:00Z"},
+    ]
+
+
+class TestPatrolSync:
+    def test_applies_journal_in_one_call(self, db_session, patrol, locations):
+        result = _service(db_session, patrol, locations).sync(_journal(patrol.patrol_id), {patrol.patrol_id: 0})
+
+        outcome = result["patrols"][patrol.patrol_id]
+        assert outcome["status"] == "ok"
+        assert (outcome["acked"], outcome["applied"], outcome["rejected"]) == (5, 5, [])
+        # One version bump per synced patrol, and the device's view was current
+        assert outcome["version"] == 1
+        assert "patrol" not in outcome
+        assert result["agent"]["acked"] == 6
+
+        stored = db_session.query(Patrol).filter(Patrol.patrol_id == patrol.patrol_id).one()
+        assert stored.status == PatrolStatus.ACTIVE and stored.version == 1
+        assert {row.checkpoint_id for row in db_session.query(PatrolCheckpointProgress).all()} == {"lobby", "roof"}
+        assert db_session.query(PatrolSubmission).count() == 1
+        # Locations go through the write-behind buffer
+        assert len(locations.pending_locations(patrol.guard_id)) == 2
+        locations.flush()
+        assert db_session.query(AgentLocation).count() == 2
+        agent = db_session.query(AgentStatus).filter(AgentStatus.agent_id == patrol.guard_id).one()
+        assert agent.current_latitude == 40.1
+        # Same audit trail as the single-op endpoints
+        audit = [(log.message, log.log_metadata) for log in db_session.query(SystemLog).all()]
+        checkins = [meta for message, meta in audit if message == "patrol_checkpoint_checkin"]
+        assert [meta["request_id"] for meta in checkins] == ["phone-1:3", "phone-1:5"]
+        assert [meta for message, meta in audit if message == "patrol_status_changed"] == [
+            {"from": str(PatrolStatus.PLANNED), "to": str(PatrolStatus.ACTIVE)}
+        ]
+
+    def test_retried_upload_is_applied_once(self, db_session, patrol, locations):
+        service = _service(db_session, patrol, locations)
+        service.sync(_journal(patrol.patrol_id), {patrol.patrol_id: 0})
+        retry = service.sync(_journal(patrol.patrol_id) + [
+            {"seq": 7, "type": "check_in", "patrol_id": patrol.patrol_id, "checkpoint_id": "garage"},
+        ], {patrol.patrol_id: 1})
+
+        outcome = retry["patrols"][patrol.patrol_id]
+        assert (outcome["duplicates"], outcome["applied"], outcome["acked"], outcome["version"]) == (5, 1, 7, 2)
+        assert retry["agent"]["duplicates"] == 1
+        assert db_session.query(PatrolCheckpointProgress).count() == 3
+        assert db_session.query(PatrolSubmission).count() == 1
+        assert len(locations.pending_locations(patrol.guard_id)) == 2
+
+    def test_large_location_journal_is_buffered_in_batches(self, db_session, patrol, locations):
+        journal = [
+            {"seq": seq, "type": "location", "latitude": 40.0, "longitude": -73.0,
+             "timestamp": f"2024-01-01T08:{seq // 60 % 60:02d}:{seq % 60:02d}Z"}
+            for seq in range(1, 1501)
+        ]
+        result = _service(db_session, patrol, locations).sync(journal)
+        assert (result["agent"]["acked"], result["agent"]["applied"]) == (1500, 1500)
+        locations.flush()
+        assert db_session.query(AgentLocation).count() == 1500
+
+    def test_invalid_operations_rejected_and_acknowledged(self, db_session, patrol):
+        result = _service(db_session, patrol).sync([
+            {"seq": 1, "type": "status", "patrol_id": patrol.patrol_id, "status": "active"},
+            {"seq": 2, "type": "check_in", "patrol_id": patrol.patrol_id, "checkpoint_id": "basement"},
+            {"seq": 3, "type": "check_in", "patrol_id": patrol.patrol_id, "checkpoint_id": "lobby"},
+            {"seq": 4, "type": "status", "patrol_id": patrol.patrol_id, "status": "planned"},
+            {"seq": 1, "type": "check_in", "patrol_id": "missing", "checkpoint_id": "lobby"},
+        ], {patrol.patrol_id: 0})
+
+        outcome = result["patrols"][patrol.patrol_id]
+        assert [r["seq"] for r in outcome["rejected"]] == [2, 4]
+        assert outcome["rejected"][0]["error"] == "Checkpoint not found"
+        assert outcome["acked"] == 4
+        assert outcome["patrol"]["checkpoints"].keys() == {"lobby"}
+        assert result["patrols"]["missing"]["rejected"] == [{"seq": 1, "error": "Patrol not found"}]
+
+    def test_stale_base_version_refuses_status_change(self, db_session, patrol):
+        patrol.status = PatrolStatus.ACTIVE
+        patrol.version = 3
+        db_session.commit()
+        result = _service(db_session, patrol).sync([
+            {"seq": 1, "type": "status", "patrol_id": patrol.patrol_id, "status": "completed"},
+            {"seq": 2, "type": "check_in", "patrol_id": patrol.patrol_id, "checkpoint_id": "lobby"},
+        ], {patrol.patrol_id: 1})
+
+        outcome = result["patrols"][patrol.patrol_id]
+        assert [r["seq"] for r in outcome["rejected"]] == [1]
+        assert "updated elsewhere" in outcome["rejected"][0]["error"]
+        assert outcome["version"] == 4
+        assert outcome["patrol"]["status"] == "active"
+
+    def test_completion_requires_started_patrol(self, db_session, patrol):
+        patrol.status = PatrolStatus.ACTIVE
+        db_session.commit()
+        result = _service(db_session, patrol).sync([
+            {"seq": 1, "type": "status", "patrol_id": patrol.patrol_id, "status": "completed"},
+        ], {patrol.patrol_id: 0})
+
+        outcome = result["patrols"][patrol.patrol_id]
+        assert outcome["rejected"] == [{"seq": 1, "error": "Patrol must be started before completion"}]
+        assert outcome["patrol"]["status"] == "active"
+
+    def test_concurrent_writer_rolls_stream_back(self, db_session, patrol, monkeypatch):
+        patrol.status = PatrolStatus.ACTIVE
+        db_session.commit()
+        original = PatrolService._add_checkpoint_progress
+
+        def racing(db, item, *args):
+            # Someone else updates the patrol between our read and our compare-and-swap
+            db.query(Patrol).filter(Patrol.patrol_id == item.patrol_id).update({Patrol.version: 9})
+            return original(db, item, *args)
+
+        monkeypatch.setattr(PatrolService, "_add_checkpoint_progress", staticmethod(racing))
+        result = _service(db_session, patrol).sync([
+            {"seq": 1, "type": "check_in", "patrol_id": patrol.patrol_id, "checkpoint_id": "lobby"},
+        ])
+
+        assert result["patrols"][patrol.patrol_id] == {"status": "retry"}
+        assert db_session.query(PatrolCheckpointProgress).count() == 0
+        assert db_session.query(SystemLog).count() == 0
+        assert db_session.query(PatrolSyncCursor).count() == 0
+
+    def test_other_properties_patrols_are_not_changed(self, db_session, patrol):
+        service = PatrolSyncService(
+            db_session, device_id="phone-1", agent_id=patrol.guard_id, user_id=patrol.guard_id,
+            property_ids=["another-property"]
+        )
+        result = service.sync([
+            {"seq": 1, "type": "status", "patrol_id": patrol.patrol_id, "status": "active"},
+        ], {patrol.patrol_id: 0})
+
+        assert result["patrols"][patrol.patrol_id]["rejected"] == [{"seq": 1, "error": "Patrol not found"}]
+        assert db_session.query(Patrol).filter(Patrol.patrol_id == patrol.patrol_id).one().status == PatrolStatus.PLANNED
+
+    def test_reports_patrols_changed_elsewhere(self, db_session, patrol):
+        patrol.version = 2
+        db_session.commit()
+        result = _service(db_session, patrol).sync([], {patrol.patrol_id: 1})
+        assert result["patrols"][patrol.patrol_id]["status"] == "changed"
+        assert result["patrols"][patrol.patrol_id]["version"] == 2
+
+    def test_rejects_malformed_journal(self, db_session, patrol):
+        with pytest.raises(HTTPException):
+            _service(db_session, patrol).sync([{"seq": "1", "type": "check_in"}])
+        with pytest.raises(HTTPException):
+            _service(db_session, patrol).sync([{"seq": 1, "type": "check_in"}])
@@ -0,0 +1,199 @@
+import asyncio
+import io
+import shutil
+import subprocess
+import time
+import zipfile
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import sessionmaker
+
+from models import RecordingExportJob
+from services import recording_export_service as export_module
+from services.recording_export_service import (
+    RecordingExportService, build_ffmpeg_command, export_mode, parse_progress
+)
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="ffmpeg not installed"
+)
+
+
+@pytest.fixture
+def service(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(RecordingExportService, "RECORDINGS_STORAGE_PATH", str(tmp_path / "recordings"))
+    monkeypatch.setattr(RecordingExportService, "EXPORTS_STORAGE_PATH", str(tmp_path / "exports"))
+    service = RecordingExportService(
+        sessionmaker(bind=db_session.get_bind()), transcode_workers=1, copy_workers=1, progress_interval=0.05
+    )
+    yield service
+    service.stop()
+
+
+def _recording(tmp_path, name="rec-1.mp4"):
+    path = tmp_path / "recordings" / name
+    path.write_bytes(b"not really a video")
+    return str(path)
+
+
+def _add_job(db_session, **values):
+    values.setdefault("attempts", 1)
+    job = RecordingExportJob(
+        recording_id="rec-1", format="mp4", quality="high", mode="transcode", source="/tmp/rec-1.mov",
+        progress=0.0, created_at=datetime.now(timezone.utc), **values
+    )
+    db_session.add(job)
+    db_session.commit()
+    return job.export_id
+
+
+class TestFfmpegCommands:
+    def test_progress_from_out_time(self):
+        assert parse_progress("out_time_us=15000000\n", 60.0) == 25.0
+        assert parse_progress("out_time_ms=15000000", 60.0) == 25.0  # also microseconds
+        assert parse_progress("out_time_us=N/A", 60.0) is None
+        assert parse_progress("out_time_us=90000000", 60.0) == 99.0  # only "end" means done
+        assert parse_progress("out_time_us=1000000", None) is None
+        assert parse_progress("frame=120", 60.0) is None
+        assert parse_progress("progress=end", None) == 100.0
+
+    def test_copy_or_transcode(self):
+        assert export_mode("a/cam.mp4", "mp4", "high") == "copy"
+        assert export_mode("a/cam.mp4", "mp4", "low") == "transcode"
+        assert export_mode("a/cam.mov", "mp4", "high") == "transcode"
+        assert export_mode("rtsp://cam/stream", "webm", "original") == "copy"
+
+        copy = build_ffmpeg_command("ffmpeg", "in.mp4", "out.part", "mp4", "high", "copy")
+        assert copy[copy.index("-c") + 1] == "copy" and "-threads" not in copy
+        assert copy[-3:] == ["-f", "mp4", "out.part"]
+
+        webm = build_ffmpeg_command("ffmpeg", "in.mp4", "out.part", "webm", "medium", "transcode", threads=3)
+        assert webm[webm.index("-c:v") + 1] == "libvpx-vp9"
+        assert webm[webm.index("-threads") + 1] == "3"
+        assert "min(720,ih)" in webm[webm.index("-vf") + 1]
+        assert "-movflags" not in webm
+
+
+class TestExportJobs:
+    def test_requests_return_pending_job_at_once(self, service, tmp_path):
+        source = _recording(tmp_path)
+        job = asyncio.run(service.export_recording("rec-1", "mp4", "low", user_id="user-1"))
+        assert (job["status"], job["mode"], job["progress"]) == ("pending", "transcode", 0.0)
+
+        stored = service.get_export_status(job["export_id"])
+        assert stored["status"] == "pending"
+        assert service.list_user_exports("user-1")[0]["export_id"] == job["export_id"]
+        assert service._queues["transcode"].get_nowait() == job["export_id"]
+
+        missing = asyncio.run(service.export_recording("rec-404", "mp4", "high"))
+        assert missing["status"] == "failed" and missing["error_message"] == "Recording source not found"
+        with pytest.raises(ValueError):
+            asyncio.run(service.export_recording("rec-1", "mkv", source=source))
+
+    def test_cancel_pending_job(self, service, tmp_path):
+        job = asyncio.run(service.export_recording("rec-1", "mp4", "high", source=_recording(tmp_path)))
+        cancelled = service.cancel_export(job["export_id"])
+        assert cancelled["status"] == "cancelled"
+        # The queued copy is skipped by the worker
+        assert service._claim(job["export_id"]) is None
+        with pytest.raises(ValueError):
+            service.cancel_export(job["export_id"])
+        assert service.cancel_export("unknown") is None
+
+    def test_missing_ffmpeg_fails_job(self, service, tmp_path, monkeypatch):
+        monkeypatch.setattr(export_module.shutil, "which", lambda name: None)
+        job = asyncio.run(service.export_recording("rec-1", "mp4", "high", source=_recording(tmp_path)))
+        service._run(job["export_id"])
+        failed = service.get_export_status(job["export_id"])
+        assert (failed["status"], failed["error_message"], failed["attempts"]) == ("failed", "FFmpeg is not installed", 1)
+
+    def test_restart_recovery(self, service, db_session, monkeypatch):
+        monkeypatch.setattr(export_module, "_pid_alive", lambda pid: pid != 4242)
+        now = datetime.now(timezone.utc)
+        host = export_module.socket.gethostname()
+        stale = _add_job(db_session, status="processing", worker_id="other-host:1", heartbeat_at=now - timedelta(hours=1))
+        dead = _add_job(db_session, status="processing", worker_id=f"{host}:4242", heartbeat_at=now)
+        alive = _add_job(db_session, status="processing", worker_id="other-host:2", heartbeat_at=now)
+        exhausted = _add_job(db_session, status="processing", worker_id="other-host:3", attempts=3)
+        pending = _add_job(db_session, status="pending", attempts=0)
+
+        assert service.recover() == 3
+        statuses = {export_id: service.get_export_status(export_id)["status"] for export_id in
+                    (stale, dead, alive, exhausted, pending)}
+        assert statuses == {stale: "pending", dead: "pending", alive: "processing",
+                            exhausted: "failed", pending: "pending"}
+        queued = []
+        while not service._queues["transcode"].empty():
+            queued.append(service._queues["transcode"].get_nowait())
+        assert sorted(queued) == sorted([stale, dead, pending])
+
+        # Already queued jobs are not queued twice
+        service._queued.update(queued)
+        service.recover()
+        assert service._queues["transcode"].empty()
+
+    def test_batch_download_streams_exports_as_they_finish(self, service, tmp_path):
+        sources = {rid: _recording(tmp_path, f"{rid}.mp4") for rid in ("rec-1", "rec-2", "rec-3")}
+        batch = asyncio.run(service.export_recordings_batch(list(sources), "mp4", "high", sources=sources))
+        assert (batch["status"], batch["total_count"]) == ("pending", 3)
+        first, second, third = batch["exports"]
+
+        def complete(job, content):
+            output = tmp_path / "exports" / f"{job['recording_id']}.mp4"
+            output.write_bytes(content)
+            service._transition(job["export_id"], ("pending",), status="completed", progress=100.0,
+                                file_path=str(output), file_size=len(content))
+
+        complete(first, b"first export")
+
+        async def download():
+            entries = service.batch_archive_entries(batch["batch_id"], poll_seconds=0.01)
+            # The first recording is available while the others are still queued
+            assert (await entries.__anext__())[0] == "recording_rec-1.mp4"
+            assert service.get_batch_status(batch["batch_id"])["status"] == "processing"
+
+            service.cancel_export(second["export_id"])
+            asyncio.get_running_loop().call_later(0.05, complete, third, b"third export")
+            assert [name async for name, _ in entries] == ["recording_rec-3.mp4"]
+            return b"".join([chunk async for chunk in service.stream_batch_archive(batch["batch_id"])])
+
+        archive = asyncio.run(download())
+        with zipfile.ZipFile(io.BytesIO(archive)) as zipped:
+            assert sorted(zipped.namelist()) == ["recording_rec-1.mp4", "recording_rec-3.mp4"]
+            assert zipped.read("recording_rec-3.mp4") == b"third export"
+        with pytest.raises(ValueError):
+            service.stream_batch_archive(batch["batch_id"], compression="bzip2")
+
+    def test_batch_download_stops_waiting_when_nothing_finishes(self, service, tmp_path):
+        sources = {rid: _recording(tmp_path, f"{rid}.mp4") for rid in ("rec-1", "rec-2")}
+        batch = asyncio.run(service.export_recordings_batch(list(sources), "mp4", "high", sources=sources))
+        first = batch["exports"][0]
+        output = tmp_path / "exports" / "rec-1.mp4"
+        output.write_bytes(b"first export")
+        service._transition(first["export_id"], ("pending",), status="completed", progress=100.0,
+                            file_path=str(output), file_size=12)
+
+        async def download():
+            entries = service.batch_archive_entries(batch["batch_id"], poll_seconds=0.01, max_wait_seconds=0.05)
+            return [name async for name, _ in entries]
+
+        assert asyncio.run(download()) == ["recording_rec-1.mp4"]
+
+
+@requires_ffmpeg
+class TestFfmpegWorkers:
+    def test_transcode_runs_with_progress(self, service, tmp_path):
+        source = str(tmp_path / "recordings" / "rec-1.mp4")
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=3:size=320x240:rate=15", source],
+            check=True,
+        )
+        service.start()
+        job = asyncio.run(service.export_recording("rec-1", "webm", "low", source=source))
+        deadline = time.monotonic() + 60
+        while service.get_export_status(job["export_id"])["status"] in ("pending", "processing"):
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+        done = service.get_export_status(job["export_id"])
+        assert (done["status"], done["progress"]) == ("completed", 100.0)
+        assert done["file_size"] > 0 and not done["file_path"].endswith(".part")
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+
+from models import IoTEnvironmentalAlert, SensorType
+from schemas import IoTEnvironmentalDataCreate
+from services import sensor_rolling_stats
+from services.iot_environmental_service import IoTEnvironmentalService
+from services.sensor_rolling_stats import SensorStatsEngine
+
+
+class TestSensorStatsEngine:
+    def test_batch_matches_sequential_scoring(self):
+        rng = np.random.default_rng(7)
+        keys = list(rng.integers(0, 5, size=300))
+        values = rng.normal(20.0, 2.0, size=300)
+        timestamps = rng.permutation(300).astype(float)
+
+        batched = SensorStatsEngine(window_size=16, capacity=2)
+        scores = batched.score(keys, values, timestamps)
+
+        sequential = SensorStatsEngine(window_size=16, capacity=2)
+        for i in np.argsort(timestamps):
+            single = sequential.score([keys[i]], [values[i]], [timestamps[i]])
+            for name in ("z_score", "ewma", "rate_of_change", "rolling_min", "rolling_max"):
+                assert single[name][0] == pytest.approx(scores[name][i], nan_ok=True)
+
+            earlier = [v for t, k, v in sorted(zip(timestamps, keys, values)) if k == keys[i] and t < timestamps[i]]
+            if len(earlier) > 1:
+                assert scores["mean"][i] == pytest.approx(np.mean(earlier))
+                assert scores["std"][i] == pytest.approx(np.std(earlier, ddof=1))
+                assert scores["rolling_max"][i] == pytest.approx(max(earlier[-16:]))
+
+        for key in set(keys):
+            mine = [v for k, v, _ in sorted(zip(keys, values, timestamps), key=lambda r: r[2]) if k == key]
+            snapshot = batched.snapshot(key)
+            assert snapshot["count"] == len(mine)
+            assert snapshot["mean"] == pytest.approx(np.mean(mine))
+            assert snapshot["std"] == pytest.approx(np.std(mine, ddof=1))
+            assert snapshot["rolling_min"] == pytest.approx(min(mine[-16:]))
+            assert snapshot["rolling_max"] == pytest.approx(max(mine[-16:]))
+            assert snapshot["last_value"] == mine[-1]
+
+    def test_rate_of_change_and_ewma(self):
+        engine = SensorStatsEngine(alpha=0.5)
+        scores = engine.score(["a", "a", "a"], [10.0, 14.0, 12.0], [0.0, 2.0, 4.0])
+        assert np.isnan(scores["rate_of_change"][0])
+        assert list(scores["rate_of_change"][1:]) == [2.0, -1.0]
+        assert list(scores["ewma"][1:]) == [10.0, 12.0]
+        assert engine.snapshot("a")["ewma"] == 12.0
+
+    def test_detects_outliers_only_after_warmup(self):
+        engine = SensorStatsEngine(min_samples=10, z_threshold=4.0)
+        values = [20.0 + 0.1 * (i % 5) for i in range(20)]
+        assert engine.detect(["t"] * 20, values, list(range(20))) == []
+
+        anomalies = engine.detect(["t"], [35.0], [21.0])
+        assert len(anomalies) == 1
+        assert anomalies[0]["anomaly_type"] == "statistical_outlier"
+        assert anomalies[0]["z_score"] > 4.0
+
+        fresh = SensorStatsEngine(min_samples=10)
+        assert fresh.detect(["t", "t"], [20.0, 35.0], [0.0, 1.0]) == []
+
+
+class TestStatisticalSensorAlerts:
+    @pytest.fixture(autouse=True)
+    def fresh_engine(self, monkeypatch):
+        monkeypatch.setattr(sensor_rolling_stats, "_engine", SensorStatsEngine(min_samples=10))
+
+    @pytest.fixture
+    def property_id(self, db_session):
+        from services.system_admin_service import SystemAdminService
+        from schemas import PropertyCreate, PropertyType
+
+        prop = SystemAdminService(db_session).create_property(
+            PropertyCreate(
+                property_name="Stats Prop", property_type=PropertyType.HOTEL,
+                address={}, contact_info={}, room_count=1, capacity=1, timezone="UTC"
+            ),
+            creator_id="system"
+        )
+        return prop.property_id
+
+    def test_batch_ingest_raises_alert_for_outlier(self, db_session, property_id):
+        service = IoTEnvironmentalService(db_session)
+        start = datetime(2024, 5, 1)
+        readings = [
+            IoTEnvironmentalDataCreate(
+                sensor_id="temp-1", sensor_type=SensorType.TEMPERATURE, location="Kitchen",
+                value=21.0 + 0.2 * (i % 3), timestamp=start + timedelta(minutes=i)
+            )
+            for i in range(30)
+        ]
+        service.record_sensor_data_batch(readings, None)
+        assert db_session.query(IoTEnvironmentalAlert).count() == 0
+
+        service.record_sensor_data(
+            IoTEnvironmentalDataCreate(
+                sensor_id="temp-1", sensor_type=SensorType.TEMPERATURE, location="Kitchen",
+                value=45.0, timestamp=start + timedelta(minutes=31)
+            ),
+            None
+        )
+        alert = db_session.query(IoTEnvironmentalAlert).one()
+        assert alert.sensor_id == "temp-1"
+        assert alert.alert_type == "statistical_outlier"
+        assert alert.location == {"label": "Kitchen"}
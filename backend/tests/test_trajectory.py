@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import sessionmaker
+
+from models import AgentLocation
+from services import mobile_agent_service
+from services.agent_location_buffer import AgentLocationBuffer
+from services.mobile_agent_service import MobileAgentService
+from services.trajectory import (
+    decode_polyline, douglas_peucker, encode_polyline, simplify_track, stationary_clusters, visvalingam
+)
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+METRE_LAT = 1 / 111195.0
+
+
+def _patrol_track(seconds=3600, interval=5, seed=7):
+    """Walk east, stand at a post, walk north, stand again; ~3 m GPS jitter throughout."""
+    rng = np.random.default_rng(seed)
+    count = seconds // interval
+    quarter = count // 4
+    xy = np.zeros((count, 2))
+    xy[:quarter, 0] = np.linspace(0, 400, quarter)
+    xy[quarter:, 0] = 400
+    xy[2 * quarter:3 * quarter, 1] = np.linspace(0, 300, quarter)
+    xy[3 * quarter:, 1] = 300
+    xy += rng.normal(0, 1.5, xy.shape)
+    lat = 40.0 + xy[:, 1] * METRE_LAT
+    lng = -73.0 + xy[:, 0] * METRE_LAT / np.cos(np.radians(40.0))
+    return lat, lng, np.arange(count, dtype=float) * interval
+
+
+class TestSimplification:
+    def test_straight_line_keeps_endpoints(self):
+        xy = np.column_stack([np.arange(50.0), np.arange(50.0) * 0.5])
+        for simplify in (douglas_peucker, visvalingam):
+            assert np.flatnonzero(simplify(xy, 1.0)).tolist() == [0, 49]
+
+    def test_deviation_beyond_tolerance_is_kept(self):
+        xy = np.array([[0, 0], [10, 0], [20, 8], [30, 0], [40, 0.2], [50, 0]], dtype=float)
+        for simplify in (douglas_peucker, visvalingam):
+            kept = np.flatnonzero(simplify(xy, 2.0)).tolist()
+            assert 2 in kept and 4 not in kept
+            assert kept[0] == 0 and kept[-1] == 5
+
+    def test_forced_points_survive(self):
+        xy = np.column_stack([np.arange(10.0), np.zeros(10)])
+        keep = np.zeros(10, dtype=bool)
+        keep[4] = True
+        for simplify in (douglas_peucker, visvalingam):
+            assert np.flatnonzero(simplify(xy, 1.0, keep=keep)).tolist() == [0, 4, 9]
+
+    def test_stationary_run_becomes_one_stop(self):
+        xy = np.array([[0, 0], [50, 0], [51, 1], [49, -1], [50, 2], [100, 0]], dtype=float)
+        epoch = np.array([0, 10, 40, 70, 100, 110], dtype=float)
+        assert stationary_clusters(xy, epoch, radius=5, min_dwell_seconds=60) == [(1, 4)]
+        assert stationary_clusters(xy, epoch, radius=5, min_dwell_seconds=120) == []
+
+    def test_patrol_track_shrinks_twenty_fold(self):
+        lat, lng, epoch = _patrol_track()
+        result = simplify_track(lat, lng, epoch, tolerance=5.0)
+
+        assert len(lat) / len(result["lat"]) >= 20
+        assert result["epoch_seconds"][0] == 0
+        assert np.all(np.diff(result["epoch_seconds"]) > 0)
+        # Both posts show up as stops with most of their quarter-hour dwell
+        stops = result["dwell_seconds"][result["dwell_seconds"] > 0]
+        assert len(stops) >= 2
+        assert stops.sum() >= 1500
+
+    def test_unknown_method_rejected(self):
+        with pytest.raises(ValueError):
+            simplify_track([40.0], [-73.0], [0.0], method="bezier")
+
+
+class TestPolyline:
+    def test_matches_reference_encoding(self):
+        coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        encoded = encode_polyline(*zip(*coords))
+        assert encoded == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+        assert decode_polyline(encoded) == pytest.approx(coords)
+
+    def test_roundtrip_within_precision(self):
+        lat, lng, _ = _patrol_track(seconds=600)
+        decoded = np.array(decode_polyline(encode_polyline(lat, lng)))
+        assert np.abs(decoded - np.column_stack([lat, lng])).max() <= 0.5e-5 + 1e-12
+
+
+class TestAgentTrajectory:
+    @pytest.fixture
+    def buffer(self, db_session, tmp_path, monkeypatch):
+        buffer = AgentLocationBuffer(session_factory=sessionmaker(bind=db_session.get_bind()), log_dir=tmp_path, fsync=False)
+        monkeypatch.setattr(mobile_agent_service, "get_location_buffer", lambda: buffer)
+        return buffer
+
+    def test_merges_stored_and_pending_fixes(self, db_session, buffer):
+        lat, lng, epoch = _patrol_track(seconds=1800)
+        start = NOW - timedelta(hours=1)
+        stamps = [start + timedelta(seconds=s) for s in epoch.tolist()]
+        half = len(lat) // 2
+        db_session.add_all([
+            AgentLocation(agent_id="agent-1", latitude=lat[i], longitude=lng[i], timestamp=stamps[i])
+            for i in range(half)
+        ])
+        db_session.commit()
+        buffer.record("agent-1", [
+            {"latitude": lat[i], "longitude": lng[i], "timestamp": stamps[i].isoformat()}
+            for i in range(half, len(lat))
+        ])
+
+        result = MobileAgentService.get_agent_trajectory(db_session, "agent-1", hours=2)
+        assert result["raw_count"] == len(lat)
+        assert result["point_count"] == len(result["points"]) < len(lat) / 10
+        assert result["points"][0]["timestamp"] == stamps[0].isoformat()
+        assert any("dwellSeconds" in point for point in result["points"])
+
+        encoded = MobileAgentService.get_agent_trajectory(db_session, "agent-1", hours=2, encoding="polyline")
+        assert "points" not in encoded
+        assert len(decode_polyline(encoded["polyline"])) == encoded["point_count"] == result["point_count"]
+        assert encoded["start"] == stamps[0].isoformat()
+        assert encoded["time_deltas"][0] == 0
+        assert sum(encoded["time_deltas"]) == pytest.approx(
+            (datetime.fromisoformat(result["points"][-1]["timestamp"]) - stamps[0]).total_seconds()
+        )
+        assert [stop["index"] for stop in encoded["stops"]] == [
+            i for i, point in enumerate(result["points"]) if "dwellSeconds" in point
+        ]
+
+    def test_empty_history(self, db_session, buffer):
+        result = MobileAgentService.get_agent_trajectory(db_session, "nobody", encoding="polyline")
+        assert (result["raw_count"], result["point_count"], result["polyline"], result["start"]) == (0, 0, "", None)
+
+    def test_rejects_unknown_encoding(self, db_session, buffer):
+        with pytest.raises(ValueError):
+            MobileAgentService.get_agent_trajectory(db_session, "agent-1", encoding="csv")
@@ -0,0 +1,66 @@
+import io
+import os
+import zipfile
+import pytest
+
+from utils.zip_stream import stream_zip
+
+
+def _files(tmp_path, contents):
+    paths = []
+    for i, data in enumerate(contents):
+        path = tmp_path / f"clip-{i}.mp4"
+        path.write_bytes(data)
+        paths.append((f"recording_{i}.mp4", str(path)))
+    return paths
+
+
+class TestStreamZip:
+    @pytest.mark.parametrize("compression", ["stored", "deflate"])
+    def test_archive_round_trips(self, tmp_path, compression):
+        contents = [os.urandom(300 * 1024), b"a" * 200 * 1024, b""]
+        archive = b"".join(stream_zip(_files(tmp_path, contents), compression=compression, chunk_size=64 * 1024))
+
+        with zipfile.ZipFile(io.BytesIO(archive)) as zipped:
+            assert zipped.testzip() is None
+            for i, data in enumerate(contents):
+                info = zipped.getinfo(f"recording_{i}.mp4")
+                assert zipped.read(info) == data
+                # Sizes and CRC follow the data, so nothing is patched after the fact
+                assert info.flag_bits & 0x08
+        if compression == "deflate":
+            assert len(archive) < sum(map(len, contents))
+
+    def test_memory_bounded_by_chunk_size(self, tmp_path):
+        chunks = list(stream_zip(_files(tmp_path, [os.urandom(1024 * 1024)]), chunk_size=32 * 1024))
+        assert len(chunks) > 30
+        assert max(len(chunk) for chunk in chunks) < 33 * 1024
+
+    def test_entries_consumed_lazily(self, tmp_path):
+        files = _files(tmp_path, [b"one", b"two"])
+        produced = []
+
+        def entries():
+            for entry in files:
+                produced.append(entry[0])
+                yield entry
+
+        stream = stream_zip(entries())
+        first = next(stream)
+        assert produced == ["recording_0.mp4"]
+        with zipfile.ZipFile(io.BytesIO(first + b"".join(stream))) as zipped:
+            assert zipped.namelist() == ["recording_0.mp4", "recording_1.mp4"]
+
+    def test_zip64_records(self, tmp_path, monkeypatch):
+        # Same code path as a >4 GiB export, without writing one
+        monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1024)
+        data = os.urandom(64 * 1024)
+        archive = b"".join(stream_zip(_files(tmp_path, [data, data])))
+        assert b"PK\x06\x06" in archive  # ZIP64 end of central directory
+        monkeypatch.undo()
+        with zipfile.ZipFile(io.BytesIO(archive)) as zipped:
+            assert [zipped.read(name) for name in zipped.namelist()] == [data, data]
+
+    def test_unknown_compression(self, tmp_path):
+        with pytest.raises(ValueError):
+            list(stream_zip(_files(tmp_path, [b"x"]), compression="bzip2"))
@@ -0,0 +1,91 @@
+"""
+Streaming ZIP writer.
+Builds a ZIP archive chunk by chunk from files on disk, for StreamingResponse bodies.
+
+zipfile writes to an unseekable sink here, so every entry gets a data descriptor (CRC
+and sizes follow the data) and nothing has to be rewritten in place; ZIP64 records are
+added automatically for large entries, large offsets and many entries. Only one read
+chunk (plus the deflate window) is held at a time, whatever the archive size.
+"""
+import io
+import zipfile
+from typing import Iterable, Iterator, List, Tuple
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+COMPRESSION_METHODS = {"stored": zipfile.ZIP_STORED, "deflate": zipfile.ZIP_DEFLATED}
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable target for ZipFile; drained after every write."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStreamWriter:
+    """Incremental ZIP writer: ``add`` yields one entry's bytes, ``close`` the trailer."""
+
+    def __init__(self, compression: str = "stored", chunk_size: int = ZIP_CHUNK_SIZE):
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError(f"compression must be one of {', '.join(COMPRESSION_METHODS)}")
+        self.method = COMPRESSION_METHODS[compression]
+        self.chunk_size = chunk_size
+        self._sink = _ZipSink()
+        self._archive = zipfile.ZipFile(self._sink, "w", compression=self.method, allowZip64=True)
+
+    def add(self, arcname: str, path: str) -> Iterator[bytes]:
+        # The size is known up front, so zipfile picks ZIP64 headers when needed
+        info = zipfile.ZipInfo.from_file(path, arcname)
+        info.compress_type = self.method
+        with open(path, "rb") as source, self._archive.open(info, "w") as target:
+            while True:
+                chunk = source.read(self.chunk_size)
+                if not chunk:
+                    break
+                target.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        data = self._sink.drain()
+        if data:
+            yield data
+
+    def close(self) -> bytes:
+        """Central directory (and ZIP64 end records)."""
+        self._archive.close()
+        return self._sink.drain()
+
+
+def stream_zip(
+    entries: Iterable[Tuple[str, str]],
+    compression: str = "stored",
+    chunk_size: int = ZIP_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of (archive name, file path) entries. ``entries`` may be a lazy
+    iterator: each entry is written when it is produced, so the response can start before
+    the last file exists.
+    """
+    writer = ZipStreamWriter(compression, chunk_size)
+    for arcname, path in entries:
+        yield from writer.add(arcname, path)
+    data = writer.close()
+    if data:
+        yield data